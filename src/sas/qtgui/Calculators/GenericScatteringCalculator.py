@@ -28,8 +28,11 @@ import sas.qtgui.Utilities.GuiUtils as GuiUtils
 from sas.qtgui.Utilities.TabbedModelEditor import TabbedModelEditor
 from sas.qtgui.Utilities.GenericReader import GenReader
 from sasdata.dataloader.data_info import Detector, Source
+from sas.system import config
 from sas.system.version import __version__
 from sas.sascalc.calculator import sas_gen
+from sas.sascalc.calculator.debye_cache import DebyeHistogramCache
+from sas.sascalc.calculator.sld_cache import SLDFileCache
 from sas.sascalc.fit import models
 from sas.sascalc.calculator.geni import radius_of_gyration, create_beta_plot, f_of_q
 import sas.sascalc.calculator.gsc_model as gsc_model
@@ -63,10 +66,16 @@ class GenericScatteringCalculator(QtWidgets.QDialog, Ui_GenericScatteringCalcula
         self.manager = parent
         self.communicator = self.manager.communicator()
         self.model = sas_gen.GenSAS()
+        if config.GSC_DEBYE_HISTOGRAM_CACHE:
+            self.model.histogram_cache = DebyeHistogramCache(persist=config.GSC_DEBYE_HISTOGRAM_PERSIST)
         self.omf_reader = sas_gen.OMFReader()
         self.sld_reader = sas_gen.SLDReader()
         self.pdb_reader = sas_gen.PDBReader()
         self.vtk_reader = sas_gen.VTKReader()
+        if config.GSC_SLD_FILE_CACHE:
+            file_cache = SLDFileCache(max_bytes=config.GSC_SLD_FILE_CACHE_MAX_MB*2**20)
+            for reader in (self.omf_reader, self.sld_reader, self.pdb_reader, self.vtk_reader):
+                reader.cache = file_cache
         self.reader = None
         # sld data for nuclear and magnetic cases
         self.nuc_sld_data = None
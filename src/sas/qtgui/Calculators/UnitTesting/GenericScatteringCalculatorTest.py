@@ -20,6 +20,9 @@ from sas.qtgui.MainWindow.DataManager import DataManager
 from sas.qtgui.MainWindow.GuiManager import GuiManager
 from sas.qtgui.Utilities.GuiUtils import *
 from sas.sascalc.calculator import sas_gen
+from sas.sascalc.calculator.debye_cache import DebyeHistogramCache
+from sas.sascalc.calculator.sld_cache import SLDFileCache
+from sas.system import config
 
 
 class GenericScatteringCalculatorTest:
@@ -99,6 +102,28 @@ class GenericScatteringCalculatorTest:
         assert not widget.cmdDraw.isEnabled()
         assert not widget.cmdDrawpoints.isEnabled()
 
+    def testHistogramCache(self, widget, mocker):
+        """Test the Debye histograms are only kept if set in the config"""
+        assert widget.model.histogram_cache is None
+        mocker.patch.object(config, 'GSC_DEBYE_HISTOGRAM_CACHE', True)
+        mocker.patch.object(config, 'GSC_DEBYE_HISTOGRAM_PERSIST', True)
+        w = GenericScatteringCalculator(widget.manager)
+        assert isinstance(w.model.histogram_cache, DebyeHistogramCache)
+        assert w.model.histogram_cache.persist
+        w.close()
+
+    def testFileCache(self, widget, mocker):
+        """Test the parsed files are only cached if set in the config"""
+        assert widget.pdb_reader.cache is None
+        mocker.patch.object(config, 'GSC_SLD_FILE_CACHE', True)
+        mocker.patch.object(config, 'GSC_SLD_FILE_CACHE_MAX_MB', 10)
+        w = GenericScatteringCalculator(widget.manager)
+        readers = (w.omf_reader, w.sld_reader, w.pdb_reader, w.vtk_reader)
+        assert isinstance(w.pdb_reader.cache, SLDFileCache)
+        assert all(reader.cache is w.pdb_reader.cache for reader in readers)
+        assert w.pdb_reader.cache.max_bytes == 10*2**20
+        w.close()
+
     def testHelpButton(self, widget, mocker):
         """ Assure help file is shown """
         mocker.patch.object(widget.manager, 'showHelp', create=True)
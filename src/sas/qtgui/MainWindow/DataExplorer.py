@@ -5,6 +5,7 @@ import os
 import time
 import logging
 import copy
+import collections
 
 from PySide6 import QtCore
 from PySide6 import QtGui
@@ -14,6 +15,7 @@ from twisted.internet import threads
 
 # SASCALC
 from sasdata.dataloader.loader import Loader
+from sas.sascalc.data_util.parallel_load import load_files
 
 # QTGUI
 import sas.qtgui.Utilities.GuiUtils as GuiUtils
@@ -35,6 +37,11 @@ from sas import config
 
 logger = logging.getLogger(__name__)
 
+# Data sets added to the model at each tick of the event loop while loading
+MODEL_INSERT_CHUNK = 50
+# Milliseconds between checks for newly read data sets while loading
+MODEL_INSERT_INTERVAL = 50
+
 
 class DataExplorerWindow(DroppableDataLoadWidget):
     # The controller which is responsible for managing signal slots connections
@@ -60,8 +67,16 @@ class DataExplorerWindow(DroppableDataLoadWidget):
         self.manager = manager if manager is not None else DataManager()
         self.txt_widget = QtWidgets.QTextEdit(None)
 
-        # Be careful with twisted threads.
-        self.mutex = QtCore.QMutex()
+        # Data sets read by the loading threads, added to the model by the timer,
+        # and the outputs of the loads to announce once they are in the model
+        self._pending_items = collections.deque()
+        self._completed_loads = []
+        self._active_loads = 0
+        self._load_cancelled = False
+        self._load_text = None
+        self._insert_timer = QtCore.QTimer(self)
+        self._insert_timer.setInterval(MODEL_INSERT_INTERVAL)
+        self._insert_timer.timeout.connect(self.insertPendingItems)
 
         # Plot widgets {name:widget}, required to keep track of plots shown as MDI subwindows
         self.plot_widgets = {}
@@ -228,7 +243,14 @@ class DataExplorerWindow(DroppableDataLoadWidget):
         Threaded file load
         """
         self.default_load_location = os.path.dirname(url[0])
-        load_thread = threads.deferToThread(self.readData, url)
+        if not self._active_loads:
+            self._load_cancelled = False
+            # The Load button cancels the loading until it is complete
+            self._load_text = self.cmdLoad.text()
+            self.cmdLoad.setText("Cancel")
+            self._insert_timer.start()
+        self._active_loads += 1
+        load_thread = threads.deferToThread(self.readData, url, queue_items=True)
         load_thread.addCallback(self.loadComplete)
         load_thread.addErrback(self.loadFailed)
 
@@ -240,6 +262,9 @@ class DataExplorerWindow(DroppableDataLoadWidget):
         Called when the "Load" button pressed.
         Opens the Qt "Open File..." dialog
         """
+        if self._active_loads:
+            self.cancelLoad()
+            return
         path_str = self.chooseFiles()
         if not path_str:
             return
@@ -293,7 +318,7 @@ class DataExplorerWindow(DroppableDataLoadWidget):
         kwargs = {
             'parent'    : self,
             'caption'   : 'Open Project',
-            'filter'    : 'Project Files (*.json);;Old Project Files (*.svs);;All files (*.*)'
+            'filter'    : 'Project Files (*.sasproj *.json);;Old Project Files (*.svs);;All files (*.*)'
         }
         filename = QtWidgets.QFileDialog.getOpenFileName(**kwargs)[0]
         if filename:
@@ -326,7 +351,7 @@ class DataExplorerWindow(DroppableDataLoadWidget):
         """
         parent = self
         caption = 'Save Project'
-        filter = 'Project (*.json)'
+        filter = 'Project (*.%s);;Legacy JSON Project (*.json)' % GuiUtils.PROJECT_EXTENSION
         directory = self.default_project_location
         name_tuple = QtWidgets.QFileDialog.getSaveFileName(parent, caption, directory, filter, "")
         filename = name_tuple[0]
@@ -335,7 +360,7 @@ class DataExplorerWindow(DroppableDataLoadWidget):
         self.default_project_location = os.path.dirname(filename)
         _, extension = os.path.splitext(filename)
         if not extension:
-            filename = '.'.join((filename, 'json'))
+            filename = '.'.join((filename, GuiUtils.PROJECT_EXTENSION))
         self.communicator.statusBarUpdateSignal.emit("Saving Project... %s\n" % os.path.basename(filename))
 
         return filename
@@ -512,6 +537,14 @@ class DataExplorerWindow(DroppableDataLoadWidget):
                 msg = "Error while converting the project file: " + str(ex)
                 logging.error(msg)
                 pass
+        elif GuiUtils.isProjectContainer(filename):
+            try:
+                # the arrays are read rather than mapped, so the project
+                # can be saved over the file it was opened from
+                all_data = GuiUtils.readProjectFile(filename)
+            except Exception as ex:
+                logging.error("Project load failed with " + str(ex))
+                return
         else:
             with open(filename, 'r') as infile:
                 try:
@@ -1342,11 +1375,15 @@ class DataExplorerWindow(DroppableDataLoadWidget):
 
         return paths
 
-    def readData(self, path):
+    def readData(self, path, queue_items=False):
         """
         verbatim copy-paste from
         ``sasgui.guiframe.local_perspectives.data_loader.data_loader.py``
         slightly modified for clarity
+
+        The files are read in worker processes when there are many of them.
+        With *queue_items*, the data sets are left for the GUI thread to add
+        to the model, otherwise they are added as each file is read.
         """
         message = ""
         log_msg = ''
@@ -1355,14 +1392,18 @@ class DataExplorerWindow(DroppableDataLoadWidget):
         data_error = False
         error_message = ""
         number_of_files = len(path)
+        basename = ""
         self.communicator.progressBarUpdateSignal.emit(0)
 
+        extension_list = config.PLUGIN_STATE_EXTENSIONS.copy()
+        if config.APPLICATION_STATE_EXTENSION is not None:
+            extension_list.append(config.APPLICATION_STATE_EXTENSION)
+
+        # Files to read, with their index in path
+        to_read = []
         for index, p_file in enumerate(path):
             basename = os.path.basename(p_file)
             _, extension = os.path.splitext(basename)
-            extension_list = config.PLUGIN_STATE_EXTENSIONS.copy()
-            if config.APPLICATION_STATE_EXTENSION is not None:
-                extension_list.append(config.APPLICATION_STATE_EXTENSION)
 
             if extension.lower() in extension_list:
                 any_error = True
@@ -1373,45 +1414,51 @@ class DataExplorerWindow(DroppableDataLoadWidget):
                 error_message = log_msg + "\n"
                 logging.info(log_msg)
                 continue
+            to_read.append(index)
 
-            try:
-                message = "Loading Data... " + str(basename) + "\n"
-
-                # change this to signal notification in GuiManager
-                self.communicator.statusBarUpdateSignal.emit(message)
-
-                output_objects = self.loader.load(p_file)
-
-                for item in output_objects:
-                    # cast sasdata.dataloader.data_info.Data1D into
-                    # sasgui.guiframe.dataFitting.Data1D
-                    # TODO : Fix it
-                    new_data = self.manager.create_gui_data(item, p_file)
-                    output[new_data.id] = new_data
-
-                    # Model update should be protected
-                    self.mutex.lock()
-                    self.updateModel(new_data, new_data.name)
-                    #self.model.reset()
-                    QtWidgets.QApplication.processEvents()
-                    self.mutex.unlock()
-
-                    if hasattr(item, 'errors'):
-                        for error_data in item.errors:
-                            data_error = True
-                            error_message += "\tError: {0}\n".format(error_data)
-                    else:
-
-                        logging.error("Loader returned an invalid object:\n %s" % str(item))
-                        data_error = True
+        files = load_files([path[index] for index in to_read], loader=self.loader,
+                           is_cancelled=lambda: self._load_cancelled)
+        loaded = 0
+        for read_index, p_file, output_objects, load_error in files:
+            loaded += 1
+            basename = os.path.basename(p_file)
+            message = "Loading Data... " + str(basename) + "\n"
 
-            except Exception as ex:
-                logging.error(str(ex) + str(sys.exc_info()[1]))
+            # change this to signal notification in GuiManager
+            self.communicator.statusBarUpdateSignal.emit(message)
 
+            if load_error is not None:
+                logging.error(load_error)
                 any_error = True
+
+            new_items = []
+            for item in output_objects:
+                # cast sasdata.dataloader.data_info.Data1D into
+                # sasgui.guiframe.dataFitting.Data1D
+                # TODO : Fix it
+                new_data = self.manager.create_gui_data(item, p_file)
+                output[new_data.id] = new_data
+                new_items.append(new_data)
+
+                if hasattr(item, 'errors'):
+                    for error_data in item.errors:
+                        data_error = True
+                        error_message += "\tError: {0}\n".format(error_data)
+                else:
+
+                    logging.error("Loader returned an invalid object:\n %s" % str(item))
+                    data_error = True
+
+            # The model is only changed in the GUI thread
+            if queue_items:
+                self._pending_items.extend(new_items)
+            elif new_items:
+                self.addDataToModel(new_items)
+
             if any_error or data_error or error_message != "":
                 if error_message == "":
-                    error = "Error: " + str(sys.exc_info()[1]) + "\n"
+                    last_error = load_error.strip().splitlines()[-1] if load_error else ""
+                    error = "Error: " + last_error + "\n"
                     error += "while loading Data: \n%s\n" % str(basename)
                     error_message += "The data file you selected could not be loaded.\n"
                     error_message += "Make sure the content of your file"
@@ -1426,10 +1473,12 @@ class DataExplorerWindow(DroppableDataLoadWidget):
                 else:
                     error_message += "%s\n" % str(p_file)
 
-            current_percentage = int(100.0* index/number_of_files)
+            current_percentage = int(100.0* to_read[read_index]/number_of_files)
             self.communicator.progressBarUpdateSignal.emit(current_percentage)
 
-        if any_error or error_message:
+        if loaded < len(to_read):
+            message = "Loading Data Cancelled after %d of %d files. " % (loaded, len(to_read))
+        elif any_error or error_message:
             logging.error(error_message)
             status_bar_message = "Errors occurred while loading %s" % format(basename)
             self.communicator.statusBarUpdateSignal.emit(status_bar_message)
@@ -1443,6 +1492,35 @@ class DataExplorerWindow(DroppableDataLoadWidget):
 
         return output, message
 
+    def cancelLoad(self):
+        """
+        Stop reading the files being loaded.
+        The data sets already read are kept.
+        """
+        self._load_cancelled = True
+        self.communicator.statusBarUpdateSignal.emit("Cancelling the data loading...")
+
+    def insertPendingItems(self):
+        """
+        Add the data sets read by the loading threads to the model,
+        MODEL_INSERT_CHUNK at a time so the GUI stays responsive.
+        """
+        data_list = []
+        while self._pending_items and len(data_list) < MODEL_INSERT_CHUNK:
+            data_list.append(self._pending_items.popleft())
+        if data_list:
+            self.addDataToModel(data_list)
+
+        if self._pending_items:
+            # Come back as soon as the pending events are processed
+            self._insert_timer.setInterval(0)
+            return
+        self._insert_timer.setInterval(MODEL_INSERT_INTERVAL)
+
+        # All the data of the completed loads is now in the model
+        while self._completed_loads:
+            self.loadComplete(self._completed_loads.pop(0))
+
     def getWlist(self):
         """
         Wildcards of files we know the format of.
@@ -1969,6 +2047,11 @@ class DataExplorerWindow(DroppableDataLoadWidget):
         Post message to status bar and update the data manager
         """
         assert isinstance(output, tuple)
+        if self._pending_items:
+            # Wait for the data sets still queued to be in the model
+            self._completed_loads.append(output)
+            return
+        self.endLoad()
         self.communicator.progressBarUpdateSignal.emit(-1)
 
         output_data = output[0]
@@ -1980,12 +2063,45 @@ class DataExplorerWindow(DroppableDataLoadWidget):
 
     def loadFailed(self, reason):
         print("File Load Failed with:\n", reason)
-        pass
+        self.endLoad()
+
+    def endLoad(self):
+        """
+        Restore the Load button once all the threaded loads are over
+        """
+        if not self._active_loads:
+            return
+        self._active_loads -= 1
+        if not self._active_loads:
+            self._insert_timer.stop()
+            # Data sets left by a failed load
+            if self._pending_items:
+                self.addDataToModel(list(self._pending_items))
+                self._pending_items.clear()
+            self.cmdLoad.setText(self._load_text)
 
     def updateModel(self, data, p_file):
         """
         Add data and Info fields to the model item
         """
+        # New row in the model
+        self.model.beginResetModel()
+        self.model.appendRow(self.createModelItem(data, p_file))
+        self.model.endResetModel()
+
+    def addDataToModel(self, data_list):
+        """
+        Add a row for each of the data sets, with a single model reset
+        """
+        self.model.beginResetModel()
+        for data in data_list:
+            self.model.appendRow(self.createModelItem(data, data.name))
+        self.model.endResetModel()
+
+    def createModelItem(self, data, p_file):
+        """
+        Create the model item with the data and its Info fields
+        """
         # Structure of the model
         # checkbox + basename
         #     |-------> Data.D object
@@ -2021,10 +2137,7 @@ class DataExplorerWindow(DroppableDataLoadWidget):
         # Caption for the theories
         checkbox_item.setChild(2, QtGui.QStandardItem("FIT RESULTS"))
 
-        # New row in the model
-        self.model.beginResetModel()
-        self.model.appendRow(checkbox_item)
-        self.model.endResetModel()
+        return checkbox_item
 
     def updateModelFromPerspective(self, model_item):
         """
@@ -839,8 +839,12 @@ class GuiManager:
         final_data['batch_grid'] = self.grid_window.data_dict
         final_data['visible_perspective'] = self._current_perspective.name
 
-        with open(filename, 'w') as outfile:
-            GuiUtils.saveData(outfile, final_data)
+        if os.path.splitext(filename)[1].lower() == '.json':
+            # legacy format, with the arrays written as JSON lists
+            with open(filename, 'w') as outfile:
+                GuiUtils.saveData(outfile, final_data)
+        else:
+            GuiUtils.saveProjectFile(filename, final_data)
 
     def actionSave_Analysis(self):
         """
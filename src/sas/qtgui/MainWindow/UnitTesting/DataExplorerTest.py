@@ -491,6 +491,42 @@ class DataExplorerTest:
         model_name = form.model.data(model_item)
         assert model_name == filename[0]
 
+    def testReadDataQueued(self, form, mocker):
+        """
+        Test the data sets queued for the GUI thread by readData()
+        """
+        filename = ["cyl_400_20.txt", "P123_D2O_10_percent.dat"]
+        mocker.patch.object(form.manager, 'add_data')
+        mocker.patch('sas.qtgui.MainWindow.DataExplorer.MODEL_INSERT_CHUNK', 1)
+        spy_data_received = QtSignalSpy(form, form.communicator.fileDataReceivedSignal)
+
+        output = form.readData(filename, queue_items=True)
+
+        # Nothing is added to the model by the loading thread
+        assert form.model.rowCount() == 0
+        assert len(form._pending_items) == 2
+
+        # The data is announced once all of it is in the model
+        form.loadComplete(output)
+        assert spy_data_received.count() == 0
+        form.insertPendingItems()
+        assert form.model.rowCount() == 1
+        assert spy_data_received.count() == 0
+        form.insertPendingItems()
+        assert form.model.rowCount() == 2
+        assert spy_data_received.count() == 1
+
+    def testCancelLoad(self, form):
+        """
+        Test cancelling the files being read
+        """
+        form.cancelLoad()
+        output, message = form.readData(["cyl_400_20.txt"])
+
+        assert output == {}
+        assert "Cancelled" in message
+        assert form.model.rowCount() == 0
+
     def skip_testDisplayHelp(self, form): # Skip due to help path change
         """
         Test that the Help window gets shown correctly
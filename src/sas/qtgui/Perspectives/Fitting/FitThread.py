@@ -32,7 +32,8 @@ class FitThread(CalcThread):
                  updatefn=None,
                  yieldtime=0.03,
                  worktime=0.03,
-                 reset_flag=False):
+                 reset_flag=False,
+                 batch_workers=1):
         CalcThread.__init__(self,
                             completefn,
                             updatefn,
@@ -48,6 +49,9 @@ class FitThread(CalcThread):
         self.updatefn = updatefn
         #Relative error desired in the sum of squares.
         self.reset_flag = reset_flag
+        # Worker processes for independent fits: 1 fits in this thread,
+        # 0 uses all the cores
+        self.batch_workers = batch_workers
 
     def isquit(self):
         """
@@ -59,6 +63,18 @@ class FitThread(CalcThread):
             msg = "Fitting: terminated by the user."
             raise KeyboardInterrupt(msg)
 
+    def compute_batch(self):
+        """
+        Fit the independent data sets in worker processes
+        """
+        from sas.sascalc.fit.BatchFitting import batch_fit
+        result = [None]*len(self.fitter)
+        for index, fit_result in batch_fit(self.fitter, handler=self.handler,
+                                           curr_thread=self,
+                                           max_workers=self.batch_workers):
+            result[index] = fit_result
+        return result
+
     def compute(self):
         """
         Perform a fit
@@ -73,10 +89,13 @@ class FitThread(CalcThread):
             list_fit_function = ['fit']*fitter_size
             list_q = [None]*fitter_size
 
-            inputs = list(zip(list_map_get_attr, self.fitter, list_fit_function,
-                         list_q, list_q, list_handler, list_curr_thread,
-                         list_reset_flag))
-            result = list(map(map_apply, inputs))
+            if self.batch_workers != 1 and fitter_size > 1 and not self.reset_flag:
+                result = self.compute_batch()
+            else:
+                inputs = list(zip(list_map_get_attr, self.fitter, list_fit_function,
+                             list_q, list_q, list_handler, list_curr_thread,
+                             list_reset_flag))
+                result = list(map(map_apply, inputs))
             results = (result, time.time()-self.starttime)
             if self.handler:
                 self.completefn(results)
@@ -1965,7 +1965,8 @@ class FittingWidget(QtWidgets.QWidget, Ui_FittingWidgetUI):
                                   page_id=[[self.page_id]],
                                   updatefn=updater,
                                   completefn=completefn,
-                                  reset_flag=self.is_chain_fitting)
+                                  reset_flag=self.is_chain_fitting,
+                                  batch_workers=config.FITTING_BATCH_WORKERS)
 
         if config.USING_TWISTED:
             # start the trhrhread with twisted
@@ -2203,6 +2204,10 @@ class FittingWidget(QtWidgets.QWidget, Ui_FittingWidgetUI):
                             qmax=qmax)
             fitter_single.select_problem_for_fit(id=fit_id, value=1)
             fitter_single.set_weight_increase(fit_id, weight_increase)
+            if config.FITTING_CHECKPOINT_INTERVAL > 0:
+                fitter_single.set_checkpoint(interval=config.FITTING_CHECKPOINT_INTERVAL)
+            fitter_single.set_early_stop(config.FITTING_EARLY_STOP_STEPS,
+                                         config.FITTING_EARLY_STOP_TOLERANCE)
             if fitter is None:
                 # Assign id to the new fitter only
                 fitter_single.fitter_id = [self.page_id]
@@ -7,14 +7,15 @@ import numpy
 import math
 from sas.sascalc.data_util.calcthread import CalcThread
 from sas.sascalc.fit.MultiplicationModel import MultiplicationModel
+from sas.sascalc.fit.centrosymmetry import is_centrosymmetric, eval_half_plane
 from sas import config
 
 class Calc2D(CalcThread):
     """
     Compute 2D model
-    This calculation assumes a 2-fold symmetry of the model
-    where points are computed for one half of the detector
-    and I(qx, qy) = I(-qx, -qy) is assumed.
+    When the model has a 2-fold symmetry, I(qx, qy) = I(-qx, -qy),
+    points are computed for one half of the detector and copied
+    to their mirror points.
     """
     def __init__(self, data, model, smearer, qmin, qmax, page_id,
                  state=None,
@@ -85,6 +86,11 @@ class Calc2D(CalcThread):
             # Calculate smeared Intensity
             #(by Gaussian averaging): DataLoader/smearing2d/Smearer2D()
             value = fn.get_value()
+        elif is_centrosymmetric(self.model):
+            # calculation w/o smearing on half of the detector
+            value = eval_half_plane(self.model.evalDistribution,
+                                    self.data.qx_data[index_model],
+                                    self.data.qy_data[index_model])
         else:
             # calculation w/o smearing
             value = self.model.evalDistribution([
@@ -161,8 +161,8 @@ class InversionTest:
         assert widget.stopButton.isEnabled()
         assert widget.batchResultsWindow is not None
         assert widget.batchResultsWindow.cmdHelp.isEnabled()
-        assert widget.batchResultsWindow.tblParams.columnCount() == 9
-        assert widget.batchResultsWindow.tblParams.rowCount() == 2
+        assert widget.batchResultsWindow.tblParams.model().columnCount() == 9
+        assert widget.batchResultsWindow.tblParams.model().rowCount() == 2
         # Test stop button
         widget.stopButton.click()
         assert widget.batchResultsWindow.isVisible()
@@ -1,19 +1,33 @@
 from typing import Optional, Tuple
-import time
+import math
 
 import numpy as np
-from scipy.interpolate import interp1d
-from scipy.special import jv as bessel
-from scipy.spatial.distance import cdist
 
 from sas.qtgui.Perspectives.ParticleEditor.datamodel.calculation import (
     SLDDefinition, MagnetismDefinition, AngularDistribution, QSample, CalculationParameters)
 
-from sas.qtgui.Perspectives.ParticleEditor.sampling.chunking import SingleChunk, pairwise_chunk_iterator
 from sas.qtgui.Perspectives.ParticleEditor.sampling.points import SpatialDistribution, PointGeneratorStepper
 
 from sas.qtgui.Perspectives.ParticleEditor.calculations.run_function import run_sld, run_magnetism
 
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Default limit, in bytes, on the temporary arrays used to evaluate a chunk of points
+MEMORY_BUDGET = 256 * 1024**2
+
+# Bytes per (direction, point, q) element used by the numpy evaluation: phase and its cosine/sine
+_BYTES_PER_ELEMENT = 16
+
+# Bytes per point and direction used by the numba evaluation: distance, phase and rotation
+_BYTES_PER_POINT = 40
+
+# Number of q values for which the phase factors are advanced by rotation before being recalculated
+ROTATION_STEPS = 32
+
+
 def scattering_via_fq(
         sld_definition: SLDDefinition,
         magnetism_definition: Optional[MagnetismDefinition],
@@ -21,34 +35,164 @@ def scattering_via_fq(
         point_generator: SpatialDistribution,
         q_sample: QSample,
         angular_distribution: AngularDistribution,
-        chunk_size=1_000_000) -> np.ndarray:
+        chunk_size=1_000_000,
+        memory_budget=MEMORY_BUDGET) -> np.ndarray:
+    """ Orientationally averaged intensity, from the amplitude of the particle in each sampled direction
+
+    The amplitudes are accumulated over the chunks of points, so chunk_size only limits the number of
+    points held at any one time. memory_budget is the approximate limit, in bytes, of the temporary arrays
+    used when evaluating a chunk.
+    """
 
     q_magnitudes = q_sample()
 
     direction_vectors, direction_weights = angular_distribution.sample_points_and_weights()
-    fq = np.zeros((angular_distribution.n_points, q_sample.n_points), dtype=complex)  # Dictionary for fq for all angles
+    direction_vectors = np.ascontiguousarray(direction_vectors, dtype=float)
+
+    # Real and imaginary parts of the amplitude for each direction and q
+    amplitude = FQAccumulator(direction_vectors, q_magnitudes, memory_budget=memory_budget)
 
     for x, y, z in PointGeneratorStepper(point_generator, chunk_size):
 
-        sld = run_sld(sld_definition, parameters, x, y, z).reshape(-1, 1)
+        sld = run_sld(sld_definition, parameters, x, y, z)
 
         # TODO: Magnetism
 
-        for direction_index, direction_vector in enumerate(direction_vectors):
+        amplitude.add(x, y, z, sld)
 
-            projected_distance = x*direction_vector[0] + y*direction_vector[1] + z*direction_vector[2]
+    return amplitude.intensity(direction_weights)
 
-            i_r_dot_q = np.multiply.outer(projected_distance, 1j*q_magnitudes)
 
-            if direction_index in fq:
-                fq[direction_index, :] = np.sum(sld*np.exp(i_r_dot_q), axis=0)
-            else:
-                fq[direction_index, :] += np.sum(sld*np.exp(i_r_dot_q), axis=0)
+class FQAccumulator:
+    """ Sum of sld * exp(i q d.r) over points r, for each direction d and q magnitude
+
+    Points can be added in any number of chunks, the amplitudes of all the chunks are summed.
+    """
+
+    def __init__(self, directions: np.ndarray, q: np.ndarray, memory_budget: int = MEMORY_BUDGET):
+        self.directions = np.ascontiguousarray(directions, dtype=float).reshape(-1, 3)
+        self.q = np.ascontiguousarray(q, dtype=float)
+        self.memory_budget = memory_budget
+
+        steps = np.diff(self.q)
+        self.evenly_spaced = len(steps) > 0 and bool(np.allclose(steps, steps[0], rtol=1e-9, atol=0))
+
+        self.real = np.zeros((self.directions.shape[0], len(self.q)))
+        self.imag = np.zeros((self.directions.shape[0], len(self.q)))
+
+    def add(self, x: np.ndarray, y: np.ndarray, z: np.ndarray, sld: np.ndarray):
+        """ Add the contribution of the points (x, y, z) with the given sld values """
+
+        x, y, z = (np.ascontiguousarray(v, dtype=float).reshape(-1) for v in (x, y, z))
+        sld = np.ascontiguousarray(np.broadcast_to(sld, x.shape), dtype=float)
+
+        # Points with no contrast don't contribute
+        keep = sld != 0
+        if not np.all(keep):
+            x, y, z, sld = x[keep], y[keep], z[keep], sld[keep]
+
+        if len(x) == 0:
+            return
+
+        if numba is not None:
+            # Each thread has its own temporaries, for one direction at a time
+            n_points_block = max(1, self.memory_budget // (_BYTES_PER_POINT * numba.get_num_threads()))
+            for start in range(0, len(x), n_points_block):
+                block = slice(start, start + n_points_block)
+                _accumulate_parallel(
+                    self.directions, x[block], y[block], z[block], sld[block],
+                    self.q, self.evenly_spaced, self.real, self.imag)
+        else:
+            self._accumulate_blocked(x, y, z, sld)
 
-    f_squared = fq.real**2 + fq.imag**2
-    f_squared *= direction_weights.reshape(-1,1)
+    def _accumulate_blocked(self, x: np.ndarray, y: np.ndarray, z: np.ndarray, sld: np.ndarray):
+        """ Numpy evaluation, on blocks of directions and points sized to fit in the memory budget """
 
-    return np.sum(f_squared, axis=0)
+        n_directions, n_q = self.real.shape
+        n_directions_block, n_points_block = block_sizes(n_directions, len(x), n_q, self.memory_budget)
 
+        positions = np.vstack((x, y, z))
 
+        for point_start in range(0, len(x), n_points_block):
+            point_slice = slice(point_start, point_start + n_points_block)
+            point_positions = positions[:, point_slice]
+            point_sld = sld[point_slice]
 
+            for direction_start in range(0, n_directions, n_directions_block):
+                direction_slice = slice(direction_start, direction_start + n_directions_block)
+
+                # q d.r for each direction, point and q
+                projected_distance = self.directions[direction_slice] @ point_positions
+                phase = np.multiply.outer(projected_distance, self.q)
+                trig = np.empty_like(phase)
+
+                np.cos(phase, out=trig)
+                self.real[direction_slice, :] += point_sld @ trig
+
+                np.sin(phase, out=trig)
+                self.imag[direction_slice, :] += point_sld @ trig
+
+    def intensity(self, direction_weights: np.ndarray) -> np.ndarray:
+        """ Weighted sum of |F(q)|^2 over the directions """
+        f_squared = self.real**2 + self.imag**2
+        return np.asarray(direction_weights, dtype=float) @ f_squared
+
+
+def block_sizes(n_directions: int, n_points: int, n_q: int, memory_budget: int) -> Tuple[int, int]:
+    """ Number of directions and of points to evaluate together, so that the
+    (directions, points, q) temporaries stay within memory_budget bytes"""
+
+    n_elements = max(1, memory_budget // (_BYTES_PER_ELEMENT * max(n_q, 1)))
+
+    if n_elements >= n_points:
+        return max(1, min(n_directions, n_elements // n_points)), n_points
+    else:
+        return 1, n_elements
+
+
+if numba is not None:
+
+    @numba.njit(parallel=True, fastmath={'reassoc', 'contract'}, cache=True)
+    def _accumulate_parallel(directions, x, y, z, sld, q, evenly_spaced, real, imag):
+        """ Add the amplitudes of the points to real and imag, in parallel over the directions
+
+        For evenly spaced q, exp(i q d.r) is advanced from one q to the next by multiplying
+        by exp(i dq d.r), and recalculated every ROTATION_STEPS values to stop errors building up.
+        """
+        n_points = x.shape[0]
+        n_q = q.shape[0]
+
+        for i in numba.prange(directions.shape[0]):
+            distance = x*directions[i, 0] + y*directions[i, 1] + z*directions[i, 2]
+
+            if evenly_spaced:
+                step = q[1] - q[0] if n_q > 1 else 0.0
+                rotation_real = np.cos(step*distance)
+                rotation_imag = np.sin(step*distance)
+
+                for block_start in range(0, n_q, ROTATION_STEPS):
+                    phase_real = np.cos(q[block_start]*distance)
+                    phase_imag = np.sin(q[block_start]*distance)
+
+                    for k in range(block_start, min(block_start + ROTATION_STEPS, n_q)):
+                        sum_real = 0.0
+                        sum_imag = 0.0
+                        for j in range(n_points):
+                            sum_real += sld[j]*phase_real[j]
+                            sum_imag += sld[j]*phase_imag[j]
+                            rotated = phase_real[j]*rotation_real[j] - phase_imag[j]*rotation_imag[j]
+                            phase_imag[j] = phase_real[j]*rotation_imag[j] + phase_imag[j]*rotation_real[j]
+                            phase_real[j] = rotated
+                        real[i, k] += sum_real
+                        imag[i, k] += sum_imag
+
+            else:
+                for k in range(n_q):
+                    sum_real = 0.0
+                    sum_imag = 0.0
+                    for j in range(n_points):
+                        phase = q[k]*distance[j]
+                        sum_real += sld[j]*math.cos(phase)
+                        sum_imag += sld[j]*math.sin(phase)
+                    real[i, k] += sum_real
+                    imag[i, k] += sum_imag
@@ -98,7 +98,7 @@ class PointGeneratorStepper:
     """ Generate batches of step_size points from a PointGenerator instance
     """
 
-    def __init__(self, point_generator: SpatialDistribution, step_size: int, bootstrap_sections: int):
+    def __init__(self, point_generator: SpatialDistribution, step_size: int, bootstrap_sections: int = 1):
         self.point_generator = point_generator
         self.step_size = step_size
 
@@ -0,0 +1,45 @@
+from pytest import mark
+import numpy as np
+
+from sas.qtgui.Perspectives.ParticleEditor.calculations.fq import FQAccumulator, block_sizes
+from sas.qtgui.Perspectives.ParticleEditor.sampling.geodesic import Geodesic
+
+
+def direct_amplitude(directions, q, x, y, z, sld):
+    """ Amplitude for each direction and q, one term at a time"""
+    return np.array([[np.sum(sld*np.exp(1j*q_value*(d[0]*x + d[1]*y + d[2]*z))) for q_value in q]
+                     for d in directions])
+
+
+@mark.parametrize("is_log", [True, False])
+@mark.parametrize("n_chunks", [1, 7])
+def test_accumulated_amplitude(is_log, n_chunks):
+    """ Amplitudes summed over chunks should match the direct sum over all the points"""
+    rng = np.random.default_rng(0)
+    x, y, z = rng.uniform(-50, 50, (3, 500))
+    sld = rng.uniform(-1, 2, 500)
+
+    directions, weights = Geodesic.by_divisions(2)
+    q = np.geomspace(1e-3, 0.5, 70) if is_log else np.linspace(1e-3, 0.5, 70)
+
+    accumulator = FQAccumulator(directions, q, memory_budget=100_000)
+    for chunk in np.array_split(np.arange(500), n_chunks):
+        accumulator.add(x[chunk], y[chunk], z[chunk], sld[chunk])
+
+    expected = direct_amplitude(directions, q, x, y, z, sld)
+
+    assert np.allclose(accumulator.real + 1j*accumulator.imag, expected, rtol=0, atol=1e-10*np.abs(expected).max())
+    assert np.allclose(accumulator.intensity(weights), weights @ np.abs(expected)**2, rtol=1e-10)
+
+
+@mark.parametrize("n_points", [1, 1000, 10**6])
+@mark.parametrize("memory_budget", [1, 10**5, 10**9])
+def test_block_sizes(n_points, memory_budget):
+    """ Blocks should cover the points and stay within the budget, when possible"""
+    n_directions, n_q = 252, 100
+    n_directions_block, n_points_block = block_sizes(n_directions, n_points, n_q, memory_budget)
+
+    assert 1 <= n_directions_block <= n_directions
+    assert 1 <= n_points_block <= n_points
+    if memory_budget >= 16 * n_q:
+        assert 16 * n_directions_block * n_points_block * n_q <= memory_budget
@@ -1,6 +1,7 @@
 import sys
 import numpy
 import string
+import weakref
 
 from collections import OrderedDict
 
@@ -60,6 +61,137 @@ WEIGHTS = ['light', 'normal', 'bold']
 FONTS = ['sans-serif', 'serif', 'cursive', 'fantasy', 'monospace']
 
 
+# Number of detector geometries for which the pixel map is kept
+PIXEL_MAP_CACHE_SIZE = 8
+
+# Offsets (row, column) of the neighbours averaged to fill an empty pixel,
+# in the order they are summed
+FILL_NEIGHBOURS = ((-1, 0), (0, -1), (1, 0), (0, 1),
+                   (-1, -1), (1, -1), (-1, 1), (1, 1))
+
+# Pixel maps by (id(qx_data), id(qy_data)), with weak references to check
+# that the arrays are still the same ones
+_pixel_maps = OrderedDict()
+
+
+class PixelMap(object):
+    """
+    Mapping of the detector points onto the ~ square bins of the image,
+    which depends only on qx_data and qy_data.
+
+    Building the image for a set of intensities is then a weighted
+    bincount followed by the filling of the empty pixels.
+    """
+    def __init__(self, qx_data, qy_data):
+        self.size = len(qx_data)
+        # get the x and y_bin arrays.
+        self.x_bins, self.y_bins = get_bins(qx_data, qy_data)
+        self.shape = (len(self.y_bins) - 1, len(self.x_bins) - 1)
+
+        # index of the bin of each point, as numpy.histogram2d
+        index_y = _bin_index(qy_data, self.y_bins)
+        index_x = _bin_index(qx_data, self.x_bins)
+        inside = (index_y >= 0) & (index_x >= 0)
+        # points which fall outside the bins are not used
+        self.points = None if inside.all() else numpy.flatnonzero(inside)
+        self.pixel_index = numpy.ravel_multi_index(
+            (index_y[inside], index_x[inside]), self.shape)
+
+        # number of points in each pixel
+        npixels = self.shape[0] * self.shape[1]
+        self.counts = numpy.bincount(self.pixel_index, minlength=npixels)
+
+        # Stencil of the empty pixels: each target pixel is filled with
+        # the average of its non-empty neighbours in the source pixels
+        empty_y, empty_x = numpy.nonzero(self.counts.reshape(self.shape) == 0)
+        targets, sources = [], []
+        for d_y, d_x in FILL_NEIGHBOURS:
+            n_y, n_x = empty_y + d_y, empty_x + d_x
+            valid = ((n_y >= 0) & (n_y < self.shape[0])
+                     & (n_x >= 0) & (n_x < self.shape[1]))
+            source = numpy.ravel_multi_index((n_y[valid], n_x[valid]), self.shape)
+            valid_source = self.counts[source] > 0
+            targets.append(numpy.flatnonzero(valid)[valid_source])
+            sources.append(source[valid_source])
+        self.fill_targets = numpy.ravel_multi_index((empty_y, empty_x), self.shape)
+        self.fill_target_index = numpy.concatenate(targets).astype(numpy.intp)
+        self.fill_sources = numpy.concatenate(sources).astype(numpy.intp)
+
+    def build(self, data):
+        """
+        Return the image of the 1d array *data*, with the values of the
+        points falling into the same pixel averaged, and the empty pixels
+        set to the average of their up-to next nearest neighbors.
+        """
+        data = numpy.asarray(data)
+        if data.size != self.size:
+            raise ValueError("data and the pixel map have different lengths")
+        if self.points is not None:
+            data = data[self.points]
+        image = numpy.bincount(self.pixel_index, weights=data,
+                               minlength=self.counts.size)
+        filled = self.counts > 0
+        # If count == 1, there is only one data point in the bin so
+        # that no normalization is required.
+        image[filled] /= self.counts[filled]
+        image[~filled] = numpy.nan
+
+        if len(self.fill_targets):
+            # neighbors which are not finite don't count
+            values = image[self.fill_sources]
+            finite = numpy.isfinite(values)
+            total = numpy.bincount(self.fill_target_index,
+                                   weights=numpy.where(finite, values, 0.0),
+                                   minlength=len(self.fill_targets))
+            count = numpy.bincount(self.fill_target_index, weights=finite,
+                                   minlength=len(self.fill_targets))
+            has_neighbors = count > 0
+            image[self.fill_targets[has_neighbors]] = (total[has_neighbors]
+                                                       / count[has_neighbors])
+
+        return image.reshape(self.shape)
+
+
+def _bin_index(values, edges):
+    """
+    Index of the bin of each value, with the last bin closed and -1 for
+    the values outside the bins, as numpy.histogram2d.
+    """
+    index = numpy.searchsorted(edges, values, side='right')
+    index[values == edges[-1]] -= 1
+    index -= 1
+    index[index >= len(edges) - 1] = -1
+    return index
+
+
+def get_pixel_map(qx_data, qy_data):
+    """
+    Return the PixelMap of the 1d arrays qx_data and qy_data.
+
+    The map is only calculated once for the same pair of arrays, so the
+    arrays shouldn't be modified in place once they have been plotted.
+    """
+    key = (id(qx_data), id(qy_data))
+    entry = _pixel_maps.get(key, None)
+    if entry is not None:
+        ref_x, ref_y, pixel_map = entry
+        if ref_x() is qx_data and ref_y() is qy_data \
+                and pixel_map.size == len(qx_data):
+            _pixel_maps.move_to_end(key)
+            return pixel_map
+        del _pixel_maps[key]
+
+    pixel_map = PixelMap(qx_data, qy_data)
+    _pixel_maps[key] = (weakref.ref(qx_data), weakref.ref(qy_data), pixel_map)
+    # forget the maps of the detectors which are no longer used
+    for stale in [k for k, (ref_x, ref_y, _) in _pixel_maps.items()
+                  if ref_x() is None or ref_y() is None]:
+        del _pixel_maps[stale]
+    while len(_pixel_maps) > PIXEL_MAP_CACHE_SIZE:
+        _pixel_maps.popitem(last=False)
+    return pixel_map
+
+
 def build_matrix(data, qx_data, qy_data):
     """
     Build a matrix for 2d plot from a vector
@@ -68,56 +200,15 @@ def build_matrix(data, qx_data, qy_data):
     data, qx_data, and qy_data
     where each one corresponds to z, x, or y axis values
 
+    The mapping of the points to the image is cached for the qx_data
+    and qy_data arrays, see get_pixel_map.
     """
     # No qx or qy given in a vector format
     if qx_data is None or qy_data is None \
             or qx_data.ndim != 1 or qy_data.ndim != 1:
         return data
 
-    # maximum # of loops to fillup_pixels
-    # otherwise, loop could never stop depending on data
-    max_loop = 1
-    # get the x and y_bin arrays.
-    x_bins, y_bins = get_bins(qx_data, qy_data)
-    # set zero to None
-
-    #Note: Can not use scipy.interpolate.Rbf:
-    # 'cause too many data points (>10000)<=JHC.
-    # 1d array to use for weighting the data point averaging
-    #when they fall into a same bin.
-    weights_data = numpy.ones([data.size])
-    # get histogram of ones w/len(data); this will provide
-    #the weights of data on each bins
-    weights, xedges, yedges = numpy.histogram2d(x=qy_data,
-                                                y=qx_data,
-                                                bins=[y_bins, x_bins],
-                                                weights=weights_data)
-    # get histogram of data, all points into a bin in a way of summing
-    image, xedges, yedges = numpy.histogram2d(x=qy_data,
-                                              y=qx_data,
-                                              bins=[y_bins, x_bins],
-                                              weights=data)
-    # Now, normalize the image by weights only for weights>1:
-    # If weight == 1, there is only one data point in the bin so
-    # that no normalization is required.
-    image[weights > 1] = image[weights > 1] / weights[weights > 1]
-    # Set image bins w/o a data point (weight==0) as None (was set to zero
-    # by histogram2d.)
-    image[weights == 0] = None
-
-    # Fill empty bins with 8 nearest neighbors only when at least
-    #one None point exists
-    loop = 0
-
-    # do while loop until all vacant bins are filled up up
-    #to loop = max_loop
-    while not(numpy.isfinite(image[weights == 0])).all():
-        if loop >= max_loop:  # this protects never-ending loop
-            break
-        image = fillupPixels(image=image, weights=weights)
-        loop += 1
-
-    return image
+    return get_pixel_map(qx_data, qy_data).build(data)
 
 def get_bins(qx_data, qy_data):
     """
@@ -218,7 +309,7 @@ def fillupPixels(image=None, weights=None):
                     numpy.isfinite(image[n_y + 1][n_x - 1]):
                     temp_image[n_y][n_x] += image[n_y + 1][n_x - 1]
                     weit[n_y][n_x] += 1
-                if n_y != len_y and n_x != len_x - 1 and \
+                if n_y != 0 and n_x != len_x - 1 and \
                     numpy.isfinite(image[n_y - 1][n_x + 1]):
                     temp_image[n_y][n_x] += image[n_y - 1][n_x + 1]
                     weit[n_y][n_x] += 1
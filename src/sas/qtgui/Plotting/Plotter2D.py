@@ -7,7 +7,7 @@ from PySide6 import QtWidgets
 
 from mpl_toolkits.mplot3d import Axes3D
 
-from sasdata.data_util.manipulations import CircularAverage
+from sas.qtgui.Plotting.SlicerBinning import CircularAverage
 
 from sas.qtgui.Plotting.PlotterData import Data1D
 from sas.qtgui.Plotting.PlotterData import Data2D
@@ -613,10 +613,10 @@ class Plotter2DWidget(PlotterBase):
         else:
             output = copy.deepcopy(data)
 
-        # get the x and y_bin arrays.
-        x_bins, y_bins = PlotUtilities.get_bins(self.qx_data, self.qy_data)
-        self.data0.x_bins = x_bins
-        self.data0.y_bins = y_bins
+        # get the x and y_bin arrays, kept with the cached pixel map.
+        pixel_map = PlotUtilities.get_pixel_map(self.qx_data, self.qy_data)
+        self.data0.x_bins = pixel_map.x_bins
+        self.data0.y_bins = pixel_map.y_bins
 
         zmin_temp = self.zmin
         # check scale
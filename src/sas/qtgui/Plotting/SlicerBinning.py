@@ -0,0 +1,485 @@
+"""
+Averaging of 2D data for the slicers, using an index cached per data set.
+
+The averagers in sasdata.data_util.manipulations go through every pixel of
+the data set in Python each time they are called, which is once per mouse
+event while a slicer is being dragged.  The classes here have the same
+interface and results, but use a SlicerIndex built once for the data set:
+the finite points sorted by |q|, by phi and by qx.  The points selected by
+the limits of a slicer are then found with binary searches, and the
+circular average is made of differences of cumulative sums of the sorted
+points.
+
+The index is kept for the arrays of the data set, see get_slicer_index, so
+the arrays shouldn't be modified in place once they have been averaged.
+"""
+import math
+from collections import OrderedDict
+import weakref
+
+import numpy as np
+
+from sasdata.dataloader.data_info import Data1D
+from sasdata.data_util import manipulations
+from sasdata.data_util.manipulations import Binning, flip_phi, get_dq_data
+
+# Number of data sets for which the index is kept
+SLICER_INDEX_CACHE_SIZE = 4
+
+# Attributes of Data2D from which the index is built
+_INDEXED_ARRAYS = ('data', 'err_data', 'qx_data', 'qy_data', 'q_data',
+                   'mask', 'dqx_data', 'dqy_data')
+
+# Indices by id(data2D), with a weak reference to the data set and the
+# arrays used to build the index
+_slicer_indices = OrderedDict()
+
+
+class SortedPoints(object):
+    """
+    Points of a SlicerIndex sorted by one of their coordinates.
+    """
+    def __init__(self, index, key):
+        order = np.argsort(key[index], kind='stable')
+        # index of the points in the arrays of the SlicerIndex
+        self.index = index[order]
+        # sorted coordinate of the points
+        self.key = key[self.index]
+        self._cumulative = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def range(self, low, high, include_low=True, include_high=True):
+        """
+        Return the start and stop positions of the points with
+        low <= key <= high, or low < key < high if the limits are excluded.
+        """
+        start = np.searchsorted(self.key, low, side='left' if include_low else 'right')
+        stop = np.searchsorted(self.key, high, side='right' if include_high else 'left')
+        return int(start), int(max(start, stop))
+
+    def bin_sums(self, name, values, edges):
+        """
+        Return the sums of *values* over the sorted points between
+        consecutive *edges*, as differences of cumulative sums.  *name*
+        identifies the values, the cumulative sums being calculated only
+        once.
+        """
+        total = self._cumulative.get(name, None)
+        if total is None:
+            # summed from the end, as the intensity usually falls with q,
+            # so the sums of the small values at high q are not lost in the
+            # rounding of the large ones
+            total = np.zeros(len(self.index) + 1)
+            np.cumsum(values[self.index][::-1], out=total[1:])
+            total = total[::-1]
+            self._cumulative[name] = total
+        return -np.diff(total[edges])
+
+    def bin_edges(self, start, stop, bin_index, nbins, approx):
+        """
+        Return the positions between start and stop at which
+        bin_index(key) reaches 1 to nbins-1, with *approx* the key values
+        at which this is expected.  The bin index must not decrease
+        with the key.
+        """
+        targets = np.arange(1, nbins)
+        position = np.searchsorted(self.key[start:stop], approx) + start
+        # the computed bin index may differ from the expected one
+        # for keys which are within rounding of the edges
+        while True:
+            down = position > start
+            down[down] = bin_index(self.key[position[down] - 1]) >= targets[down]
+            up = position < stop
+            up[up] = bin_index(self.key[position[up]]) < targets[up]
+            if not (down.any() or up.any()):
+                break
+            position[down] -= 1
+            position[up] += 1
+        return np.concatenate(([start], position, [stop]))
+
+
+class SlicerIndex(object):
+    """
+    Finite points of a Data2D with the values used by the averagers,
+    and the orders of the points used to select the regions of interest.
+    """
+    def __init__(self, data2D):
+        finite = np.isfinite(data2D.data)
+        self.data2D = weakref.ref(data2D)
+        self.size = int(np.count_nonzero(finite))
+
+        self.data = data2D.data[finite]
+        self.q = data2D.q_data[finite]
+        self.qx = data2D.qx_data[finite]
+        self.qy = data2D.qy_data[finite]
+        if data2D.mask is not None:
+            self.mask = np.asarray(data2D.mask[finite], dtype=bool)
+        else:
+            self.mask = np.ones(self.size, dtype=bool)
+        # [0, 2pi] angle, as manipulations
+        self.phi = np.arctan2(self.qy, self.qx) + math.pi
+        # the absolute intensity stands for the variance of points
+        # without an error
+        if data2D.err_data is not None:
+            err_data = data2D.err_data[finite]
+            self.variance = np.where(err_data == 0.0, np.abs(self.data), err_data*err_data)
+        else:
+            self.variance = np.abs(self.data)
+
+        self._has_dq = data2D.dqx_data is not None and data2D.dqy_data is not None
+        self._dq = None
+        self._sorted = {}
+
+    @property
+    def dq(self):
+        """
+        Resolution of each point for the 1D averages, or None
+        """
+        if self._has_dq and self._dq is None:
+            self._dq = get_dq_data(self.data2D())
+        return self._dq
+
+    def _points(self, masked):
+        return np.flatnonzero(self.mask) if masked else np.arange(self.size)
+
+    def by_q(self, masked=True):
+        """
+        Points sorted by |q|, only the unmasked ones if *masked*
+        """
+        return self._get_sorted(('q', masked), self.q, masked)
+
+    def by_phi(self):
+        """
+        Unmasked points sorted by phi
+        """
+        return self._get_sorted(('phi', True), self.phi, True)
+
+    def by_qx(self):
+        """
+        Unmasked points sorted by qx
+        """
+        return self._get_sorted(('qx', True), self.qx, True)
+
+    def _get_sorted(self, name, key, masked):
+        points = self._sorted.get(name, None)
+        if points is None:
+            points = SortedPoints(self._points(masked), key)
+            self._sorted[name] = points
+        return points
+
+
+def get_slicer_index(data2D):
+    """
+    Return the SlicerIndex of *data2D*.
+
+    The index is only built once for the same data arrays.
+    """
+    arrays = tuple(getattr(data2D, name, None) for name in _INDEXED_ARRAYS)
+    key = id(data2D)
+    entry = _slicer_indices.get(key, None)
+    if entry is not None:
+        ref, indexed_arrays, index = entry
+        if ref() is data2D and all(a is b for a, b in zip(arrays, indexed_arrays)):
+            _slicer_indices.move_to_end(key)
+            return index
+        del _slicer_indices[key]
+
+    index = SlicerIndex(data2D)
+    _slicer_indices[key] = (weakref.ref(data2D), arrays, index)
+    # forget the data sets which are no longer used
+    for stale in [k for k, (ref, _, _) in _slicer_indices.items() if ref() is None]:
+        del _slicer_indices[stale]
+    while len(_slicer_indices) > SLICER_INDEX_CACHE_SIZE:
+        _slicer_indices.popitem(last=False)
+    return index
+
+
+def _check_plottable_2D(data2D):
+    if data2D.__class__.__name__ not in ["Data2D", "plottable_2D"]:
+        raise RuntimeError("Ring averaging only take plottable_2D objects")
+
+
+class CircularAverage(manipulations.CircularAverage):
+    """
+    Perform circular averaging on 2D data
+
+    The data returned is the distribution of counts
+    as a function of Q
+    """
+    def __call__(self, data2D, ismask=False):
+        """
+        Perform circular averaging on the data
+
+        :param data2D: Data2D object
+        :return: Data1D object
+        """
+        index = get_slicer_index(data2D)
+        if index.size == 0:
+            msg = "Circular averaging: invalid q_data: no finite data"
+            raise RuntimeError(msg)
+
+        # Build array of Q intervals
+        nbins = int(math.ceil((self.r_max - self.r_min) / self.bin_width))
+
+        points = index.by_q(masked=ismask)
+        if len(points) and self.r_min >= self.r_max:
+            raise ValueError("Limit Error: min > max")
+        if nbins <= 0 or not len(points):
+            raise ValueError("Average Error: No points inside ROI to average...")
+
+        r_min, bin_width = self.r_min, self.bin_width
+        start, stop = points.range(r_min, self.r_max)
+        # the last bin also holds q = r_max
+        edges = points.bin_edges(
+            start, stop, lambda q: np.floor((q - r_min) / bin_width), nbins,
+            r_min + bin_width * np.arange(1, nbins))
+
+        y_counts = np.diff(edges).astype(float)
+        y = points.bin_sums('data', index.data, edges)
+        x = points.bin_sums('q', index.q, edges)
+        err_y = np.abs(points.bin_sums('variance', index.variance, edges))
+        dq_data = index.dq
+        if dq_data is not None:
+            err_x = points.bin_sums('dq', dq_data, edges)
+
+        # Average the sums
+        with np.errstate(divide='ignore', invalid='ignore'):
+            err_y = np.sqrt(err_y) / y_counts
+            err_y[err_y == 0] = np.average(err_y)
+            y = y / y_counts
+            x = x / y_counts
+        idx = (np.isfinite(y)) & (np.isfinite(x))
+
+        d_x = err_x[idx] / y_counts[idx] if dq_data is not None else None
+
+        if not idx.any():
+            msg = "Average Error: No points inside ROI to average..."
+            raise ValueError(msg)
+
+        return Data1D(x=x[idx], y=y[idx], dy=err_y[idx], dx=d_x)
+
+
+class Ring(manipulations.Ring):
+    """
+    Defines a ring on a 2D data set.
+    The ring is defined by r_min, r_max.
+
+    The data returned is the distribution of counts
+    around the ring as a function of phi.
+    """
+    def __call__(self, data2D):
+        """
+        Apply the ring to the data set.
+        Returns the angular distribution for a given q range
+
+        :param data2D: Data2D object
+
+        :return: Data1D object
+        """
+        _check_plottable_2D(data2D)
+        index = get_slicer_index(data2D)
+
+        points = index.by_q(masked=True)
+        start, stop = points.range(self.r_min, self.r_max)
+        selected = points.index[start:stop]
+
+        # Shift to apply to calculated phi values in order
+        # to center first bin at zero
+        nbins = self.nbins_phi
+        phi_shift = math.pi / nbins
+        i_phi = np.floor(nbins * (index.phi[selected] + phi_shift)
+                         / (2 * math.pi)).astype(int)
+        # Take care of the edge case at phi = 2pi.
+        i_phi[i_phi >= nbins] = 0
+
+        phi_counts = np.bincount(i_phi, minlength=nbins).astype(float)
+        phi_bins = np.bincount(i_phi, weights=index.data[selected], minlength=nbins)
+        phi_err = np.bincount(i_phi, weights=index.variance[selected], minlength=nbins)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            phi_bins = phi_bins / phi_counts
+            phi_err = np.sqrt(phi_err) / phi_counts
+        phi_values = 2.0 * math.pi / nbins * np.arange(nbins, dtype=float)
+
+        idx = (np.isfinite(phi_bins))
+
+        if not idx.any():
+            msg = "Average Error: No points inside ROI to average..."
+            raise ValueError(msg)
+
+        return Data1D(x=phi_values[idx], y=phi_bins[idx], dy=phi_err[idx])
+
+
+class _IndexedSector(object):
+    """
+    Sector averaging of manipulations._Sector using the slicer index.
+    """
+    def _agv(self, data2D, run='phi'):
+        """
+        Perform sector averaging.
+
+        :param data2D: Data2D object
+        :param run:  define the varying parameter ('phi' , or 'sector')
+
+        :return: Data1D object
+        """
+        _check_plottable_2D(data2D)
+        index = get_slicer_index(data2D)
+        is_phi = run.lower() == 'phi'
+
+        # Get the min and max into the region: 0 <= phi < 2Pi
+        phi_min = flip_phi(self.phi_min)
+        phi_max = flip_phi(self.phi_max)
+        # and for the opposite side sector, the "minor wing"
+        phi_min_minor = flip_phi(phi_min - math.pi)
+        phi_max_minor = flip_phi(phi_max - math.pi)
+
+        #  set up the bins by creating a binning object
+        if is_phi:
+            if phi_min > phi_max:
+                binning = Binning(phi_min, phi_max + 2 * np.pi, self.nbins, self.base)
+            else:
+                binning = Binning(phi_min, phi_max, self.nbins, self.base)
+        elif self.fold:
+            binning = Binning(self.r_min, self.r_max, self.nbins, self.base)
+        else:
+            binning = Binning(-self.r_max, self.r_max, self.nbins, self.base)
+
+        # Points within the main ROI
+        points = index.by_phi()
+        if phi_min > phi_max:
+            selected = [points.index[points.range(phi_min, 2 * math.pi, include_low=False)[0]:],
+                        points.index[:points.range(0, phi_max, include_high=False)[1]]]
+        else:
+            start, stop = points.range(phi_min, phi_max, include_high=False)
+            selected = [points.index[start:stop]]
+        main = np.concatenate(selected)
+
+        # and within the minor wing for sectors, unless already in the main ROI
+        minor = np.empty(0, dtype=main.dtype)
+        if run.lower() == 'sector':
+            if phi_min_minor > phi_max_minor:
+                selected = [
+                    points.index[points.range(phi_min_minor, 2 * math.pi, include_low=False)[0]:],
+                    points.index[:points.range(0, phi_max_minor, include_high=False)[1]]]
+            else:
+                start, stop = points.range(phi_min_minor, phi_max_minor,
+                                           include_low=False, include_high=False)
+                selected = [points.index[start:stop]]
+            minor = np.concatenate(selected)
+            phi = index.phi[minor]
+            if phi_min > phi_max:
+                in_main = (phi > phi_min) | (phi < phi_max)
+            else:
+                in_main = (phi >= phi_min) & (phi < phi_max)
+            minor = minor[~in_main]
+
+        selected = np.concatenate((main, minor))
+        q_value = index.q[selected]
+        in_range = (self.r_min <= q_value) & (q_value <= self.r_max)
+        selected = selected[in_range]
+        q_value = q_value[in_range]
+        if not self.fold:
+            # assign negative q to the qs in the minor wing
+            q_value[len(main) - np.count_nonzero(~in_range[:len(main)]):] *= -1
+
+        # Get the binning index
+        if is_phi:
+            value = index.phi[selected]
+            value = np.where(phi_min > value, value + 2 * np.pi, value)
+        else:
+            value = q_value
+        if binning.base:
+            temp_x = binning.n_bins * (np.log(value) / math.log(binning.base)
+                                       - math.log(binning.min, binning.base))
+            temp_y = math.log(binning.max, binning.base) - math.log(binning.min, binning.base)
+        else:
+            temp_x = binning.n_bins * (value - binning.min)
+            temp_y = binning.max - binning.min
+        i_bin = np.floor(temp_x / temp_y).astype(int)
+        # Take care of the edge case at phi = 2pi.
+        i_bin[i_bin == self.nbins] = self.nbins - 1
+
+        y_counts = np.bincount(i_bin, minlength=self.nbins).astype(float)
+        y = np.bincount(i_bin, weights=index.data[selected], minlength=self.nbins)
+        x = np.bincount(i_bin, weights=q_value, minlength=self.nbins)
+        y_err = np.bincount(i_bin, weights=index.variance[selected], minlength=self.nbins)
+        dq_data = index.dq
+        if dq_data is not None:
+            x_err = np.bincount(i_bin, weights=dq_data[selected], minlength=self.nbins)
+
+        # Organize the results
+        with np.errstate(divide='ignore', invalid='ignore'):
+            y = y/y_counts
+            y_err = np.sqrt(y_err)/y_counts
+            # Calculate x values at the center of the bin depending on the
+            # the type of averaging (phi or sector)
+            if is_phi:
+                step = (binning.max - binning.min) / self.nbins
+                x = (np.arange(self.nbins) + 0.5) * step + phi_min
+            else:
+                # set q to the average of the q values within each bin
+                x = x/y_counts
+
+        idx = (np.isfinite(y) & np.isfinite(y_err))
+        if dq_data is not None:
+            d_x = x_err[idx] / y_counts[idx]
+        else:
+            d_x = None
+        if not idx.any():
+            msg = "Average Error: No points inside sector of ROI to average..."
+            raise ValueError(msg)
+        return Data1D(x=x[idx], y=y[idx], dy=y_err[idx], dx=d_x)
+
+
+class SectorPhi(_IndexedSector, manipulations.SectorPhi):
+    """
+    Sector average as a function of phi.
+    I(phi) is return and the data is averaged over Q.
+    """
+
+
+class SectorQ(_IndexedSector, manipulations.SectorQ):
+    """
+    Sector average as a function of Q for both wings, folded together
+    or not depending on the fold attribute.
+    I(Q) is returned and the data is averaged over phi.
+    """
+
+
+class Boxsum(manipulations.Boxsum):
+    """
+    Perform the sum of counts in a 2D region of interest.
+    """
+    def _sum(self, data2D):
+        """
+        Perform the sum in the region of interest
+
+        :param data2D: Data2D object
+        :return: number of counts,
+            error on number of counts, number of entries summed
+        """
+        if len(data2D.detector) > 1:
+            msg = "Circular averaging: invalid number "
+            msg += "of detectors: %g" % len(data2D.detector)
+            raise RuntimeError(msg)
+        index = get_slicer_index(data2D)
+
+        points = index.by_qx()
+        start, stop = points.range(self.x_min, self.x_max, include_high=False)
+        selected = points.index[start:stop]
+        qy = index.qy[selected]
+        selected = selected[(self.y_min <= qy) & (self.y_max > qy)]
+
+        y = float(np.sum(index.data[selected]))
+        err_y = float(np.sum(index.variance[selected]))
+        y_counts = float(len(selected))
+        return y, err_y, y_counts
+
+
+class Boxavg(Boxsum, manipulations.Boxavg):
+    """
+    Perform the average of counts in a 2D region of interest.
+    """
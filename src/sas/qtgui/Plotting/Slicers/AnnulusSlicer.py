@@ -9,8 +9,8 @@ from sas.qtgui.Plotting.SlicerModel import SlicerModel
 class AnnulusInteractor(BaseInteractor, SlicerModel):
     """
     AnnulusInteractor plots a data1D average of an annulus area defined in a
-    Data2D object. The data1D averaging itself is performed in sasdata by
-    manipulations.py
+    Data2D object. The data1D averaging itself is performed by SlicerBinning.py,
+    with the same results as manipulations.py in sasdata
 
     This class uses the RingInteractor class to define two rings of radius
     r1 and r2 (Q1 and Q2). All Q points at a constant angle phi from the x-axis
@@ -101,7 +101,7 @@ class AnnulusInteractor(BaseInteractor, SlicerModel):
         if data is None:
             return
 
-        from sasdata.data_util.manipulations import Ring
+        from sas.qtgui.Plotting.SlicerBinning import Ring
         rmin = min(numpy.fabs(self.inner_circle.get_radius()),
                    numpy.fabs(self.outer_circle.get_radius()))
         rmax = max(numpy.fabs(self.inner_circle.get_radius()),
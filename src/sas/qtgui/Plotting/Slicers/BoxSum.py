@@ -4,7 +4,7 @@ from PySide6 import QtGui
 from sas.qtgui.Utilities.GuiUtils import formatNumber, toDouble
 
 from sas.qtgui.Plotting.Slicers.BaseInteractor import BaseInteractor
-from sasdata.data_util.manipulations import Boxavg, Boxsum
+from sas.qtgui.Plotting.SlicerBinning import Boxavg, Boxsum
 
 from sas.qtgui.Plotting.SlicerModel import SlicerModel
 
@@ -13,7 +13,7 @@ class BoxSumCalculator(BaseInteractor):
     """
     BoxSumCalculator Class computes properties (such as sum and average of
     intensities) from a rectangular area defined in a data2D object. The actual
-    calculations are done by manipulations.py
+    calculations are done by SlicerBinning.py
 
     This class uses three other classes, PointerInteractor to define the center
     of the rectangle, and VerticalDoubleLine and HorizontalDoubleLine to define
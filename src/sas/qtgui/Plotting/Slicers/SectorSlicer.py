@@ -11,8 +11,9 @@ MIN_PHI = 0.05
 class SectorInteractor(BaseInteractor, SlicerModel):
     """
     SectorInteractor plots a data1D average of a sector area defined in a
-    Data2D object. The data1D averaging itself is performed in sasdata by
-    manipulations.py. Sectors all go through a single point as (0,0).
+    Data2D object. The data1D averaging itself is performed by SlicerBinning.py,
+    with the same results as manipulations.py in sasdata. Sectors all go
+    through a single point as (0,0).
 
     This class uses two other classes, LineInteractor and SideInteractor, to
     define a sector centered around a main line defined by LineInteractor
@@ -142,7 +143,7 @@ class SectorInteractor(BaseInteractor, SlicerModel):
         if data is None:
             return
         # Averaging
-        from sasdata.data_util.manipulations import SectorQ
+        from sas.qtgui.Plotting.SlicerBinning import SectorQ
         radius = self.qmax
         phimin = -self.left_line.phi + self.main_line.theta
         phimax = self.left_line.phi + self.main_line.theta
@@ -15,7 +15,8 @@ class WedgeInteractor(BaseInteractor, SlicerModel):
     This WedgeInteractor is a cross between the SectorInteractor and the
     AnnulusInteractor. It plots a data1D average of a wedge area defined in a
     Data2D object, in either the Q direction or the Phi direction. The data1D
-    averaging itself is performed in sasdata by manipulations.py.
+    averaging itself is performed by SlicerBinning.py, with the same results as
+    manipulations.py in sasdata.
 
     This class uses three other classes, ArcInteractor (in ArcInteractor.py),
     RadiusInteractor (in RadiusInteractor.py), and LineInteractor
@@ -345,7 +346,7 @@ class WedgeInteractorQ(WedgeInteractor):
         super()._post_data()
 
     def _post_data(self, new_sector=None, nbins=None):
-        from sasdata.data_util.manipulations import SectorQ
+        from sas.qtgui.Plotting.SlicerBinning import SectorQ
         super()._post_data(SectorQ)
 
 
@@ -362,6 +363,6 @@ class WedgeInteractorPhi(WedgeInteractor):
         super()._post_data()
 
     def _post_data(self, new_sector=None, nbins=None):
-        from sasdata.data_util.manipulations import SectorPhi
+        from sas.qtgui.Plotting.SlicerBinning import SectorPhi
         super()._post_data(SectorPhi)
 
@@ -1,6 +1,8 @@
 import sys
 from collections import OrderedDict
 
+import numpy
+
 from sas.qtgui.UnitTesting.TestUtils import WarningTestNotImplemented
 
 # Tested module
@@ -15,7 +17,30 @@ class PlotUtilitiesTest:
 
     def testBuildMatrix(self):
         """ build matrix for 2d plot from a vector """
-        WarningTestNotImplemented()
+        qx, qy = (v.flatten() for v in numpy.meshgrid(numpy.linspace(-1, 1, 30),
+                                                        numpy.linspace(-1, 1, 20)))
+        # remove some points to leave empty pixels
+        keep = numpy.arange(qx.size) % 7 != 3
+        qx, qy = qx[keep], qy[keep]
+        data = numpy.random.default_rng(0).random(qx.size)
+
+        # reference image, using histogram2d
+        x_bins, y_bins = PlotUtilities.get_bins(qx, qy)
+        weights, _, _ = numpy.histogram2d(qy, qx, bins=[y_bins, x_bins])
+        image, _, _ = numpy.histogram2d(qy, qx, bins=[y_bins, x_bins], weights=data)
+        image[weights > 0] /= weights[weights > 0]
+        image[weights == 0] = None
+        image = PlotUtilities.fillupPixels(image=image, weights=weights)
+
+        output = PlotUtilities.build_matrix(data, qx, qy)
+        assert numpy.allclose(output, image, equal_nan=True)
+
+        # the pixel map is reused for the same arrays
+        pixel_map = PlotUtilities.get_pixel_map(qx, qy)
+        assert PlotUtilities.get_pixel_map(qx, qy) is pixel_map
+        assert PlotUtilities.get_pixel_map(qx.copy(), qy) is not pixel_map
+        assert numpy.allclose(PlotUtilities.build_matrix(2*data, qx, qy), 2*output,
+                              equal_nan=True)
 
     def testGetBins(self):
         """ test 1d arrays of the index with square binning """
@@ -0,0 +1,84 @@
+import numpy
+import pytest
+
+from sasdata.data_util import manipulations
+from sasdata.dataloader.data_info import Data2D, Detector
+
+# Tested module
+import sas.qtgui.Plotting.SlicerBinning as SlicerBinning
+
+
+class SlicerBinningTest:
+    '''Test the indexed averagers against the ones of sasdata'''
+
+    @pytest.fixture(autouse=True)
+    def data(self):
+        '''Create a 2D data set with masked, non finite and error free points'''
+        rng = numpy.random.default_rng(0)
+        qx, qy = (v.flatten() for v in numpy.meshgrid(numpy.linspace(-0.1, 0.1, 50),
+                                                       numpy.linspace(-0.08, 0.08, 40)))
+        q = numpy.sqrt(qx**2 + qy**2)
+        intensity = 1/(1 + (100*q)**2) * (1 + 0.1*rng.standard_normal(q.size))
+        intensity[rng.integers(0, q.size, 10)] = numpy.nan
+        err = 0.05*numpy.abs(intensity)
+        err[rng.integers(0, q.size, 10)] = 0.0
+        data = Data2D(data=intensity, err_data=err, qx_data=qx, qy_data=qy, q_data=q,
+                      mask=rng.random(q.size) > 0.1,
+                      dqx_data=0.001 + 0.01*q, dqy_data=0.002 + 0.005*q)
+        data.detector = [Detector()]
+        yield data
+
+    def assertSameAverage(self, expected, result):
+        for name in ('x', 'y', 'dy', 'dx'):
+            if getattr(expected, name) is None:
+                assert getattr(result, name) is None
+                continue
+            assert numpy.allclose(getattr(result, name), getattr(expected, name),
+                                  rtol=1e-10, atol=0, equal_nan=True)
+
+    @pytest.mark.parametrize("ismask", [False, True])
+    def testCircularAverage(self, data, ismask):
+        '''Test the circular average'''
+        expected = manipulations.CircularAverage(0.01, 0.12, 0.003)(data, ismask=ismask)
+        result = SlicerBinning.CircularAverage(0.01, 0.12, 0.003)(data, ismask=ismask)
+        self.assertSameAverage(expected, result)
+
+    def testRing(self, data):
+        '''Test the annulus average'''
+        expected = manipulations.Ring(r_min=0.01, r_max=0.05, nbins=36)(data)
+        result = SlicerBinning.Ring(r_min=0.01, r_max=0.05, nbins=36)(data)
+        self.assertSameAverage(expected, result)
+
+    @pytest.mark.parametrize("averager", ["SectorQ", "SectorPhi"])
+    @pytest.mark.parametrize("fold", [True, False])
+    @pytest.mark.parametrize("phi", [(0.3, 1.2), (5.9, 0.4), (0.1, 3.5)])
+    def testSector(self, data, averager, fold, phi):
+        '''Test the sector averages, with and without crossing phi = 0'''
+        results = []
+        for module in (manipulations, SlicerBinning):
+            sector = getattr(module, averager)(r_min=0.01, r_max=0.08, phi_min=phi[0],
+                                               phi_max=phi[1], nbins=15)
+            sector.fold = fold
+            results.append(sector(data))
+        self.assertSameAverage(*results)
+
+    def testBoxsum(self, data):
+        '''Test the sum and average over a box'''
+        limits = dict(x_min=-0.02, x_max=0.03, y_min=-0.01, y_max=0.05)
+        assert numpy.allclose(SlicerBinning.Boxsum(**limits)(data),
+                              manipulations.Boxsum(**limits)(data), rtol=1e-10)
+        assert numpy.allclose(SlicerBinning.Boxavg(**limits)(data),
+                              manipulations.Boxavg(**limits)(data), rtol=1e-10)
+
+    def testEmptyRegion(self, data):
+        '''Test the error raised when there is no point to average'''
+        with pytest.raises(ValueError):
+            SlicerBinning.Ring(r_min=1.0, r_max=2.0)(data)
+        assert SlicerBinning.Boxsum(x_min=1.0, x_max=2.0, y_min=1.0, y_max=2.0)(data) == (0, 0, 0)
+
+    def testIndexCache(self, data):
+        '''Test that the index is kept for the same data arrays'''
+        index = SlicerBinning.get_slicer_index(data)
+        assert SlicerBinning.get_slicer_index(data) is index
+        data.data = data.data.copy()
+        assert SlicerBinning.get_slicer_index(data) is not index
@@ -0,0 +1,308 @@
+"""
+Table model of the batch results shown in the GridPanel.
+
+The results are kept as one numpy array per column, and the cells are only
+formatted when the view asks for them, so a batch of many thousand fits
+doesn't create an item per cell.  Sorting and filtering permute the rows
+with numpy, and the export to CSV is written from the arrays.
+"""
+import numpy as np
+
+from PySide6 import QtCore, QtGui
+
+import sas.qtgui.Utilities.GuiUtils as GuiUtils
+from sas.qtgui.Plotting.PlotterData import Data1D
+
+# Rows formatted at a time when writing a table to file
+WRITE_CHUNK = 1000
+
+
+class BatchResults:
+    """
+    Columnar store of a batch results table.
+
+    Each column has a name, the array of its values, either float or str,
+    and optionally the array of the text shown for each value.  Without the
+    text, float values are shown with GuiUtils.formatNumber.  Error columns
+    are shown in italics.
+    """
+    ERROR_COLUMN_CAPTION = " (Err)"
+    # Columns with the data set names, of the fits and the P(r) inversions
+    NAME_COLUMNS = ("Data", "Filename")
+
+    def __init__(self):
+        self.names = []
+        self.values = []
+        self.texts = []
+        self.is_error = []
+
+    @property
+    def rowCount(self):
+        return len(self.values[0]) if self.values else 0
+
+    @property
+    def columnCount(self):
+        return len(self.names)
+
+    def addColumn(self, name, values, texts=None, is_error=False):
+        """
+        Append a column of *values*, shown as *texts* if given
+        """
+        values = np.asarray(values)
+        if values.dtype.kind not in 'fU':
+            values = values.astype(float if values.dtype.kind in 'biu' else str)
+        if self.values and len(values) != self.rowCount:
+            raise ValueError("Column %s has %d rows instead of %d"
+                             % (name, len(values), self.rowCount))
+        self.names.append(name)
+        self.values.append(values)
+        self.texts.append(None if texts is None else np.asarray(texts, dtype=str))
+        self.is_error.append(is_error)
+
+    def column(self, name):
+        """
+        Values of the column *name*
+        """
+        return self.values[self.names.index(name)]
+
+    def text(self, row, column):
+        """
+        Text shown for the value at *row* in *column*
+        """
+        texts = self.texts[column]
+        if texts is not None:
+            return str(texts[row])
+        value = self.values[column][row]
+        if self.values[column].dtype.kind == 'U':
+            return str(value)
+        return "" if np.isnan(value) else GuiUtils.formatNumber(value, high=True)
+
+    def rowOrder(self, rows, column, descending=False):
+        """
+        *rows* sorted on the values of *column*, with the missing values last
+        """
+        values = self.values[column][rows]
+        if values.dtype.kind == 'f':
+            # nan are sorted last either way
+            order = np.argsort(-values if descending else values, kind='stable')
+        else:
+            order = np.argsort(values, kind='stable')
+            if descending:
+                order = order[::-1]
+        return rows[order]
+
+    def matchRows(self, pattern):
+        """
+        Rows with *pattern* in their data set name, ignoring case
+
+        The name is the first of NAME_COLUMNS in the table; no rows match
+        if there is none.
+        """
+        names = [name for name in self.NAME_COLUMNS if name in self.names]
+        if not names:
+            return np.arange(0)
+        values = self.column(names[0]).astype(str)
+        return np.flatnonzero(np.char.find(np.char.lower(values), pattern.lower()) >= 0)
+
+    def write(self, fp, separator=",", rows=None):
+        """
+        Write the header and the values of *rows*, or all of them, to *fp*
+
+        Values are written at full precision, or as the text they were read
+        from, and missing values are left empty.
+        """
+        fp.write(separator.join(self.names) + separator + "\n")
+        if rows is None:
+            rows = np.arange(self.rowCount)
+        for start in range(0, len(rows), WRITE_CHUNK):
+            chunk = rows[start:start+WRITE_CHUNK]
+            columns = [self._columnText(column, chunk) for column in range(self.columnCount)]
+            lines = [separator.join(row) + separator for row in zip(*columns)]
+            if lines:
+                fp.write("\n".join(lines) + "\n")
+
+    def _columnText(self, column, rows):
+        texts = self.texts[column]
+        if texts is not None:
+            return texts[rows]
+        values = self.values[column][rows]
+        if values.dtype.kind == 'U':
+            return values
+        text = values.astype(str)
+        text[np.isnan(values)] = ""
+        return text
+
+    @classmethod
+    def fromFitResults(cls, data):
+        """
+        Table of the batch fit results *data*, a list with the FResult list
+        of each fit, as sent to BatchOutputPanel.
+
+        The columns are the chi2, the data name and the model parameters,
+        with the error of the fitted parameters after them.
+        """
+        table = cls()
+        model = data[0][0]
+
+        disperse_params = list(model.model.dispersion.keys())
+        magnetic_params = model.model.magnetic_params
+        optimized_params = model.param_list
+        # Create the main parameter list
+        param_list = [m for m in model.model.params.keys() if (m not in model.model.magnetic_params and ".width" not in m)]
+
+        # add fitted polydisp parameters
+        param_list += [m+".width" for m in disperse_params if m+".width" in optimized_params]
+
+        # add fitted magnetic params
+        param_list += [m for m in magnetic_params if m in optimized_params]
+
+        # Check if 2D model. If not, remove theta/phi
+        if isinstance(model.data.sas_data, Data1D):
+            if 'theta' in param_list:
+                param_list.remove('theta')
+            if 'phi' in param_list:
+                param_list.remove('phi')
+
+        results = [row[0] for row in data]
+        rows = len(results)
+        values = np.full((rows, len(param_list)), np.nan)
+        errors = np.full((rows, len(param_list)), np.nan)
+        column_index = dict((param, i) for i, param in enumerate(param_list))
+
+        # Rows fitted with the same parameters are filled together
+        groups = {}
+        for i_row, result in enumerate(results):
+            groups.setdefault(tuple(result.param_list), []).append(i_row)
+        for fitted, group in groups.items():
+            pairs = [(column_index[param], i) for i, param in enumerate(fitted) if param in column_index]
+            if pairs:
+                columns, indices = (list(v) for v in zip(*pairs))
+                pvec = np.array([np.asarray(results[i_row].pvec, dtype=float) for i_row in group])
+                # no errors when the covariance couldn't be calculated
+                stderr = np.array([np.full(len(fitted), np.nan) if results[i_row].stderr is None
+                                   else np.asarray(results[i_row].stderr, dtype=float) for i_row in group])
+                values[np.ix_(group, columns)] = pvec[:, indices]
+                errors[np.ix_(group, columns)] = stderr[:, indices]
+            # parameters which were not varied
+            for param in param_list:
+                if param not in fitted:
+                    values[group, column_index[param]] = [results[i_row].model.params[param] for i_row in group]
+
+        chi2 = np.array([result.fitness for result in results], dtype=float)
+        names = [str(result.data.sas_data.name) if hasattr(result.data, "sas_data") else ""
+                 for result in results]
+        table.addColumn("Chi2", chi2)
+        table.addColumn("Data", np.array(names, dtype=str))
+        fitted_params = set().union(*groups)
+        for i, param in enumerate(param_list):
+            table.addColumn(param, values[:, i])
+            if param in fitted_params:
+                table.addColumn(param + cls.ERROR_COLUMN_CAPTION, errors[:, i], is_error=True)
+        return table
+
+    @classmethod
+    def fromCSV(cls, csv_data):
+        """
+        Table of the lines of a CSV file written by the batch panel: a line
+        of details, the header then a line for each row.
+        """
+        table = cls()
+        param_list = csv_data[1].rstrip().split(',')
+        rows = [row.rstrip().split(',') for row in csv_data[2:]]
+        # Each line ends with the separator
+        if param_list and param_list[-1] == "":
+            param_list.pop()
+        for i_col, param in enumerate(param_list):
+            texts = np.array([row[i_col] if i_col < len(row) else "" for row in rows], dtype=str)
+            try:
+                values = np.array([float(text) if text else np.nan for text in texts])
+            except ValueError:
+                values = texts
+            table.addColumn(param, values, texts=texts,
+                            is_error=param.endswith(cls.ERROR_COLUMN_CAPTION))
+        return table
+
+
+class BatchResultsModel(QtCore.QAbstractTableModel):
+    """
+    Read-only model of a BatchResults table, with the rows filtered and sorted
+    """
+    def __init__(self, table, parent=None):
+        super(BatchResultsModel, self).__init__(parent)
+        self.table = table
+        # Rows of the table, in the order shown
+        self.rows = np.arange(table.rowCount)
+        self._filter = ""
+        self._sort = None
+        self._error_font = QtGui.QFont()
+        self._error_font.setItalic(True)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else self.table.columnCount
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == QtCore.Qt.DisplayRole:
+            return self.table.text(self.rows[index.row()], index.column())
+        if role == QtCore.Qt.FontRole and self.table.is_error[index.column()]:
+            return self._error_font
+        return None
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        if orientation == QtCore.Qt.Horizontal:
+            return self.table.names[section]
+        return str(section + 1)
+
+    def sort(self, column, order=QtCore.Qt.AscendingOrder):
+        """
+        Sort the shown rows on the values of *column*
+
+        A negative *column*, as given by a header without a sort indicator,
+        shows the rows in their original order.
+        """
+        self.layoutAboutToBeChanged.emit()
+        if column < 0:
+            self._sort = None
+            self.rows = np.sort(self.rows)
+        else:
+            self._sort = (column, order == QtCore.Qt.DescendingOrder)
+            self.rows = self.table.rowOrder(self.rows, *self._sort)
+        self.layoutChanged.emit()
+
+    def filter(self):
+        """
+        Text of the shown rows, as given to setFilter
+        """
+        return self._filter
+
+    def setFilter(self, pattern):
+        """
+        Only show the rows with *pattern* in their data set name
+        """
+        self._filter = pattern
+        self.beginResetModel()
+        if pattern:
+            self.rows = self.table.matchRows(pattern)
+        else:
+            self.rows = np.arange(self.table.rowCount)
+        if self._sort is not None:
+            self.rows = self.table.rowOrder(self.rows, *self._sort)
+        self.endResetModel()
+
+    def text(self, row, name):
+        """
+        Text of the column *name* in the shown *row*
+        """
+        return self.table.text(self.rows[row], self.table.names.index(name))
+
+    def write(self, fp, separator=","):
+        """
+        Write the shown rows to *fp*
+        """
+        self.table.write(fp, separator=separator, rows=self.rows)
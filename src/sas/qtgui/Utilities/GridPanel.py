@@ -4,10 +4,11 @@ import time
 import logging
 import webbrowser
 
+import numpy as np
+
 from PySide6 import QtCore, QtWidgets, QtGui
 
-import sas.qtgui.Utilities.GuiUtils as GuiUtils
-from sas.qtgui.Plotting.PlotterData import Data1D
+from sas.qtgui.Utilities.BatchResultsModel import BatchResults, BatchResultsModel
 from sas.qtgui.Utilities.UI.GridPanelUI import Ui_GridPanelUI
 
 
@@ -15,7 +16,7 @@ class BatchOutputPanel(QtWidgets.QMainWindow, Ui_GridPanelUI):
     """
     Class for stateless grid-like printout of model parameters for mutiple models
     """
-    ERROR_COLUMN_CAPTION = " (Err)"
+    ERROR_COLUMN_CAPTION = BatchResults.ERROR_COLUMN_CAPTION
     IS_WIN = (sys.platform == 'win32')
     windowClosedSignal = QtCore.Signal()
     def __init__(self, parent=None, output_data=None):
@@ -43,17 +44,20 @@ class BatchOutputPanel(QtWidgets.QMainWindow, Ui_GridPanelUI):
         if not self.IS_WIN:
             self.actionOpen_with_Excel.setVisible(False)
 
-        # list of QTableWidgets, indexed by tab number
+        # list of QTableViews, indexed by tab number
         self.tables = []
         self.tables.append(self.tblParams)
 
         # context menu on the table
         self.tblParams.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
         self.tblParams.customContextMenuRequested.connect(self.showContextMenu)
+        self.tblParams.setSortingEnabled(True)
 
         # Command buttons
         self.cmdHelp.clicked.connect(self.onHelp)
         self.cmdPlot.clicked.connect(self.onPlot)
+        self.txtFilter.textChanged.connect(self.onFilter)
+        self.tabWidget.currentChanged.connect(self.onTabChanged)
 
         # Fill in the table from input data
         self.setupTable(widget=self.tblParams, data=output_data)
@@ -97,10 +101,27 @@ class BatchOutputPanel(QtWidgets.QMainWindow, Ui_GridPanelUI):
 
     def currentTable(self):
         """
-        Returns the currently shown QTabWidget
+        Returns the currently shown QTableView
         """
         return self.tables[self.tabWidget.currentIndex()]
 
+    def onFilter(self, pattern):
+        """
+        Only show the data sets with names containing the filter text
+        """
+        model = self.currentTable().model()
+        if model is not None:
+            model.setFilter(pattern)
+
+    def onTabChanged(self, index):
+        """
+        Show the filter of the selected table
+        """
+        model = self.currentTable().model() if 0 <= index < len(self.tables) else None
+        self.txtFilter.blockSignals(True)
+        self.txtFilter.setText(model.filter() if model is not None else "")
+        self.txtFilter.blockSignals(False)
+
     def showContextMenu(self, position):
         """
         Show context specific menu in the tab table widget.
@@ -129,14 +150,15 @@ class BatchOutputPanel(QtWidgets.QMainWindow, Ui_GridPanelUI):
 
     def addTabPage(self, name=None):
         """
-        Add new tab page with QTableWidget
+        Add new tab page with QTableView
         """
         layout = QtWidgets.QVBoxLayout()
-        tab_widget = QtWidgets.QTableWidget(parent=self)
+        tab_widget = QtWidgets.QTableView(parent=self)
         # Same behaviour as the original tblParams
         tab_widget.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
         tab_widget.setAlternatingRowColors(True)
         tab_widget.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        tab_widget.setSortingEnabled(True)
         tab_widget.setLayout(layout)
         # Simple naming here.
         # One would think naming the tab with current model name would be good.
@@ -195,15 +217,14 @@ class BatchOutputPanel(QtWidgets.QMainWindow, Ui_GridPanelUI):
             msg = "Nothing to plot!"
             self.parent.communicate.statusBarUpdateSignal.emit(msg)
             return
-        data = self.dataFromTable(self.currentTable())
-        # data['Data'] -> ['filename1', 'filename2', ...]
+        model = self.currentTable().model()
         # look for the 'Data' column and extract the filename
         for row in rows:
             try:
-                name = data['Data'][row]
+                name = model.text(row, 'Data')
                 # emit a signal so the plots are being shown
                 self.communicate.plotFromNameSignal.emit(name)
-            except (IndexError, AttributeError):
+            except (IndexError, ValueError, AttributeError):
                 # data messed up.
                 return
 
@@ -212,11 +233,14 @@ class BatchOutputPanel(QtWidgets.QMainWindow, Ui_GridPanelUI):
         """
         Creates a dictionary {<parameter>:[list of values]} from the parameter table
         """
-        assert(isinstance(table, QtWidgets.QTableWidget))
+        assert(isinstance(table, QtWidgets.QTableView))
+        model = table.model()
         params = {}
-        for column in range(table.columnCount()):
-            value = [table.item(row, column).data(0) for row in range(table.rowCount())]
-            key = table.horizontalHeaderItem(column).data(0)
+        if model is None:
+            return params
+        for column in range(model.columnCount()):
+            value = [model.table.text(row, column) for row in model.rows]
+            key = model.headerData(column, QtCore.Qt.Horizontal)
             params[key] = value
         return params
 
@@ -228,7 +252,7 @@ class BatchOutputPanel(QtWidgets.QMainWindow, Ui_GridPanelUI):
             import tempfile
             tmpfile = tempfile.NamedTemporaryFile(delete=False, mode="w+", suffix=".csv")
             self.grid_filename = tmpfile.name
-            data = self.dataFromTable(self.currentTable())
+            data = self.currentTable().model()
             t = time.localtime(time.time())
             time_str = time.strftime("%b %d %H:%M of %Y", t)
             details = "File Generated by SasView "
@@ -266,133 +290,48 @@ class BatchOutputPanel(QtWidgets.QMainWindow, Ui_GridPanelUI):
         # User cancelled.
         if not filename:
             return
-        data = self.dataFromTable(self.currentTable())
+        data = self.currentTable().model()
         details = "File generated by SasView\n"
         with open(filename, 'w') as csv_file:
             self.writeBatchToFile(data=data, tmpfile=csv_file, details=details)
 
     def setupTableFromCSV(self, csv_data):
         """
-        Create tablewidget items and show them, based on params
+        Create the table model and show it, based on params
         """
         # Is this an empty grid?
         if self.has_data:
             # Add a new page
             self.addTabPage()
-            # Access the newly created QTableWidget
+            # Access the newly created QTableView
             current_page = self.tables[-1]
         else:
             current_page = self.tblParams
-        # headers
-        param_list = csv_data[1].rstrip().split(',')
         # need to remove the 2 header rows to get the total data row number
-        rows = len(csv_data) -2
-        assert(rows > -1)
-        columns = len(param_list)
-        current_page.setColumnCount(columns)
-        current_page.setRowCount(rows)
-
-        for i, param in enumerate(param_list):
-            current_page.setHorizontalHeaderItem(i, QtWidgets.QTableWidgetItem(param))
-
-        # first - Chi2 and data filename
-        for i_row, row in enumerate(csv_data[2:]):
-            for i_col, col in enumerate(row.rstrip().split(',')):
-                current_page.setItem(i_row, i_col, QtWidgets.QTableWidgetItem(col))
-
-        current_page.resizeColumnsToContents()
+        assert(len(csv_data) > 1)
+        self.setTableModel(current_page, BatchResults.fromCSV(csv_data))
 
     def setupTable(self, widget=None, data=None):
         """
-        Create tablewidget items and show them, based on params
+        Create the table model and show it, based on params
         """
         # quietly leave is nothing to show
         if data is None or widget is None:
             return
+        self.setTableModel(widget, BatchResults.fromFitResults(data))
 
-        # Figure out the headers
-        model = data[0][0]
-
-        disperse_params = list(model.model.dispersion.keys())
-        magnetic_params = model.model.magnetic_params
-        optimized_params = model.param_list
-        # Create the main parameter list
-        param_list = [m for m in model.model.params.keys() if (m not in model.model.magnetic_params and ".width" not in m)]
-
-        # add fitted polydisp parameters
-        param_list += [m+".width" for m in disperse_params if m+".width" in optimized_params]
-
-        # add fitted magnetic params
-        param_list += [m for m in magnetic_params if m in optimized_params]
-
-        # Check if 2D model. If not, remove theta/phi
-        if isinstance(model.data.sas_data, Data1D):
-            if 'theta' in param_list:
-                param_list.remove('theta')
-            if 'phi' in param_list:
-                param_list.remove('phi')
-
-        rows = len(data)
-        columns = len(param_list)
-
-        widget.setColumnCount(columns+2) # add 2 initial columns defined below
-        widget.setRowCount(rows)
-
-        # Insert two additional columns
-        param_list.insert(0, "Data")
-        param_list.insert(0, "Chi2")
-        for i, param in enumerate(param_list):
-            widget.setHorizontalHeaderItem(i, QtWidgets.QTableWidgetItem(param))
-
-        # dictionary of parameter errors for post-processing
-        # [param_name] = [param_column_nr, error_for_row_1, error_for_row_2,...]
-        error_columns = {}
-        # first - Chi2 and data filename
-        for i_row, row in enumerate(data):
-            # each row corresponds to a single fit
-            chi2 = row[0].fitness
-            name = ""
-            if hasattr(row[0].data, "sas_data"):
-                name = row[0].data.sas_data.name
-            widget.setItem(i_row, 0, QtWidgets.QTableWidgetItem(GuiUtils.formatNumber(chi2, high=True)))
-            widget.setItem(i_row, 1, QtWidgets.QTableWidgetItem(str(name)))
-            # Now, all the parameters
-            for i_col, param in enumerate(param_list[2:]):
-                if param in row[0].param_list:
-                    # parameter is on the to-optimize list - get the optimized value
-                    par_value = row[0].pvec[row[0].param_list.index(param)]
-                    # parse out errors and store them for later use
-                    err_value = row[0].stderr[row[0].param_list.index(param)]
-                    if param in error_columns:
-                        error_columns[param].append(err_value)
-                    else:
-                        error_columns[param] = [i_col, err_value]
-                else:
-                    # parameter was not varied
-                    par_value = row[0].model.params[param]
-
-                widget.setItem(i_row, i_col+2, QtWidgets.QTableWidgetItem(
-                    GuiUtils.formatNumber(par_value, high=True)))
-
-        # Add errors
-        error_list = list(error_columns.keys())
-        for error_param in error_list[::-1]: # must be reverse to keep column indices
-            # the offset for the err column: +2 from the first two extra columns, +1 to append this column
-            error_column = error_columns[error_param][0]+3
-            error_values = error_columns[error_param][1:]
-            widget.insertColumn(error_column)
-
-            column_name = error_param + self.ERROR_COLUMN_CAPTION
-            widget.setHorizontalHeaderItem(error_column, QtWidgets.QTableWidgetItem(column_name))
-
-            for i_row, error in enumerate(error_values):
-                item = QtWidgets.QTableWidgetItem(GuiUtils.formatNumber(error, high=True))
-                # Fancy, italic font for errors
-                font = QtGui.QFont()
-                font.setItalic(True)
-                item.setFont(font)
-                widget.setItem(i_row, error_column, item)
-
+    def setTableModel(self, widget, table):
+        """
+        Show the BatchResults *table* in the QTableView *widget*
+        """
+        old_model = widget.model()
+        widget.setModel(BatchResultsModel(table, parent=widget))
+        if old_model is not None:
+            old_model.deleteLater()
+        # show the rows in their original order until a column is clicked
+        widget.horizontalHeader().setSortIndicator(-1, QtCore.Qt.AscendingOrder)
+        if widget is self.currentTable():
+            self.txtFilter.clear()
         # resize content
         widget.resizeColumnsToContents()
 
@@ -400,6 +339,9 @@ class BatchOutputPanel(QtWidgets.QMainWindow, Ui_GridPanelUI):
     def writeBatchToFile(cls, data, tmpfile, details=""):
         """
         Helper to write result from batch into cvs file
+
+        *data* is either a BatchResultsModel, written as its rows are shown,
+        or a dictionary {<parameter>:[list of values]}
         """
         name = tmpfile.name
         if data is None or name is None or name.strip() == "":
@@ -409,6 +351,9 @@ class BatchOutputPanel(QtWidgets.QMainWindow, Ui_GridPanelUI):
         if ext.lower() == ".csv":
             separator = ","
         tmpfile.write(details)
+        if isinstance(data, BatchResultsModel):
+            data.write(tmpfile, separator=separator)
+            return
         for col_name in data.keys():
             tmpfile.write(col_name)
             tmpfile.write(separator)
@@ -444,51 +389,40 @@ class BatchInversionOutputPanel(BatchOutputPanel):
 
     def setupTable(self, widget=None,  data=None):
         """
-        Create tablewidget items and show them, based on params
+        Create the table model and show it, based on params
         """
         # headers
         param_list = ['Filename', 'Rg [Å]', 'Chi^2/dof', 'I(Q=0)', 'Oscillations',
                       'Background [Å^-1]', 'P+ Fraction', 'P+1-theta Fraction',
                       'Calc. Time [sec]']
+        formats = ["{:.3g}"]*7 + ["{:.2g}"]
 
         if data is None:
             return
-        keys = data.keys()
-        rows = len(keys)
-        columns = len(param_list)
-        self.tblParams.setColumnCount(columns)
-        self.tblParams.setRowCount(rows)
-
-        for i, param in enumerate(param_list):
-            self.tblParams.setHorizontalHeaderItem(i, QtWidgets.QTableWidgetItem(param))
-
-        # first - Chi2 and data filename
+        rows = len(data)
+        values = np.full((rows, len(param_list)-1), np.nan)
+        converged = np.zeros(rows, dtype=bool)
+        filenames = []
         for i_row, (filename, pr) in enumerate(data.items()):
+            filenames.append("{}".format(filename))
             out = pr.out
             cov = pr.cov
             if out is None:
                 logging.warning("P(r) for {} did not converge.".format(filename))
                 continue
-            self.tblParams.setItem(i_row, 0, QtWidgets.QTableWidgetItem(
-                "{}".format(filename)))
-            self.tblParams.setItem(i_row, 1, QtWidgets.QTableWidgetItem(
-                "{:.3g}".format(pr.rg(out))))
-            self.tblParams.setItem(i_row, 2, QtWidgets.QTableWidgetItem(
-                "{:.3g}".format(pr.chi2[0])))
-            self.tblParams.setItem(i_row, 3, QtWidgets.QTableWidgetItem(
-                "{:.3g}".format(pr.iq0(out))))
-            self.tblParams.setItem(i_row, 4, QtWidgets.QTableWidgetItem(
-                "{:.3g}".format(pr.oscillations(out))))
-            self.tblParams.setItem(i_row, 5, QtWidgets.QTableWidgetItem(
-                "{:.3g}".format(pr.background)))
-            self.tblParams.setItem(i_row, 6, QtWidgets.QTableWidgetItem(
-                "{:.3g}".format(pr.get_positive(out))))
-            self.tblParams.setItem(i_row, 7, QtWidgets.QTableWidgetItem(
-                "{:.3g}".format(pr.get_pos_err(out, cov))))
-            self.tblParams.setItem(i_row, 8, QtWidgets.QTableWidgetItem(
-                "{:.2g}".format(pr.elapsed)))
-
-        self.tblParams.resizeColumnsToContents()
+            converged[i_row] = True
+            values[i_row] = [pr.rg(out), pr.chi2[0], pr.iq0(out), pr.oscillations(out),
+                             pr.background, pr.get_positive(out), pr.get_pos_err(out, cov),
+                             pr.elapsed]
+
+        table = BatchResults()
+        # rows which did not converge are left empty
+        table.addColumn(param_list[0], np.array(filenames, dtype=str),
+                        texts=np.where(converged, filenames, ""))
+        for i_col, (param, format) in enumerate(zip(param_list[1:], formats)):
+            texts = [format.format(value) if ok else "" for value, ok in zip(values[:, i_col], converged)]
+            table.addColumn(param, values[:, i_col], texts=texts)
+        self.setTableModel(self.tblParams, table)
 
     def onHelp(self):
         """
@@ -10,7 +10,9 @@ import warnings
 import webbrowser
 import urllib.parse
 import json
+import tempfile
 import types
+import zipfile
 import numpy
 from io import BytesIO
 from pathlib import Path
@@ -41,6 +43,7 @@ from sas.qtgui.MainWindow.DataState import DataState
 
 from sas.sascalc.fit.AbstractFitEngine import FResult
 from sas.sascalc.fit.AbstractFitEngine import FitData1D, FitData2D
+from sas.sascalc.data_util.npy_mmap import map_npy_member
 from sasmodels.sasview_model import SasviewModel
 
 import sas
@@ -1108,6 +1111,15 @@ def saveData(fp, data):
     """
     save content of data to fp (a .write()-supporting file-like object)
     """
+    json.dump(data, fp, indent=2, sort_keys=True, default=_jsonDefault())
+
+def _jsonDefault(store_array=None):
+    """
+    Return the default function of the JSON encoder of project data.
+
+    Numpy arrays are written as lists, unless *store_array* is given: it is
+    then called with the array and returns the JSON content referring to it.
+    """
 
     def add_type(dict, type):
         dict['__type__'] = type.__name__
@@ -1146,8 +1158,11 @@ def saveData(fp, data):
 
         # ndarray
         if isinstance(o, np.ndarray):
-            content = {'data':o.tolist()}
-            return add_type(content, type(o))
+            if store_array is not None and not o.dtype.hasobject:
+                content = store_array(o)
+            else:
+                content = {'data':o.tolist()}
+            return add_type(content, np.ndarray)
 
         if isinstance(o, types.FunctionType):
             # we have a pure function
@@ -1167,13 +1182,34 @@ def saveData(fp, data):
         logging.info("data cannot be serialized to json: %s" % type(o))
         return None
 
-    json.dump(data, fp, indent=2, sort_keys=True, default=jdefault)
+    return jdefault
 
 def readDataFromFile(fp):
     '''
     Reads in Data1D/Data2 datasets from the file.
     Datasets are stored in the JSON format.
     '''
+    generate = _dataGenerator()
+
+    new_stored_data = {}
+    for id, data in json.load(fp).items():
+        try:
+            new_stored_data[id] = generate(data, 0)
+        except TooComplexException:
+            logging.info('unable to load %s' % id)
+
+    return new_stored_data
+
+class TooComplexException(Exception):
+    pass
+
+def _dataGenerator(load_array=None):
+    '''
+    Return the function creating the project objects from their JSON content.
+
+    *load_array* is called with the content of the arrays stored outside
+    of the JSON document, and returns the array.
+    '''
     supported = [
         tuple, set, types.FunctionType,
         Sample, Source, Vector,
@@ -1183,9 +1219,6 @@ def readDataFromFile(fp):
 
     lookup = dict((cls.__name__, cls) for cls in supported)
 
-    class TooComplexException(Exception):
-        pass
-
     def simple_type(cls, data, level):
         class Empty(object):
             def __init__(self):
@@ -1226,6 +1259,9 @@ def readDataFromFile(fp):
 
         # ndarray
         if cls == np.ndarray:
+            if 'file' in data:
+                # project container - binary array
+                return load_array(data)
             o = data['data']
             if isinstance(o, list):
                 # new format - ndarray as ascii list
@@ -1267,15 +1303,94 @@ def readDataFromFile(fp):
 
         return data
 
-    new_stored_data = {}
-    for id, data in json.load(fp).items():
-        try:
-            new_stored_data[id] = generate(data, 0)
-        except TooComplexException:
-            logging.info('unable to load %s' % id)
+    return generate
 
+# Name of the JSON document in a project container
+PROJECT_METADATA = 'project.json'
+# Directory of the arrays in a project container
+PROJECT_ARRAYS = 'arrays'
+# Extension of the project containers
+PROJECT_EXTENSION = 'sasproj'
+
+def saveProjectFile(filename, data, compress=False):
+    """
+    Save the project *data* to a zip container at *filename*.
+
+    The JSON document only holds the metadata. Each numpy array is a
+    separate .npy member, with the raw little-endian values, stored
+    without compression so it can be memory mapped unless *compress*.
+
+    The container is written to a new file which then replaces *filename*,
+    so a failed save leaves the previous project intact.  *filename* must
+    not be memory mapped, which would prevent replacing it on Windows.
+    """
+    fd, temp_name = tempfile.mkstemp(suffix='.' + PROJECT_EXTENSION,
+                                     dir=os.path.dirname(os.path.abspath(filename)))
+    os.close(fd)
+    try:
+        _writeProjectFile(temp_name, data, compress)
+        os.replace(temp_name, filename)
+    except BaseException:
+        os.remove(temp_name)
+        raise
+
+def _writeProjectFile(filename, data, compress):
+    compression = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    with zipfile.ZipFile(filename, 'w', compression=compression) as archive:
+        count = [0]
+
+        def store_array(array):
+            name = '%s/%d.npy' % (PROJECT_ARRAYS, count[0])
+            count[0] += 1
+            if array.dtype.byteorder == '>':
+                array = array.astype(array.dtype.newbyteorder('<'))
+            # the size isn't known before the .npy header and data are written
+            with archive.open(name, 'w', force_zip64=True) as member:
+                np.lib.format.write_array(member, array, allow_pickle=False)
+            return {'file': name}
+
+        metadata = json.dumps(data, indent=2, sort_keys=True,
+                              default=_jsonDefault(store_array))
+        archive.writestr(PROJECT_METADATA, metadata, compress_type=zipfile.ZIP_DEFLATED)
+
+def isProjectContainer(filename):
+    """
+    True if *filename* is a project container written by saveProjectFile
+    """
+    if not zipfile.is_zipfile(filename):
+        return False
+    with zipfile.ZipFile(filename) as archive:
+        return PROJECT_METADATA in archive.namelist()
+
+def readProjectFile(filename, mmap=False):
+    """
+    Read the project container at *filename*, returning the datasets as
+    readDataFromFile does.
+
+    With *mmap*, the uncompressed arrays are mapped copy-on-write from the
+    file rather than read, so their values are only loaded from disk when
+    they are used.  The file then stays open while the arrays are in use,
+    so it can't be replaced by saveProjectFile on Windows.
+    """
+    with zipfile.ZipFile(filename) as archive:
+        generate = _dataGenerator(
+            lambda content: _readProjectArray(filename, archive, content['file'], mmap))
+        new_stored_data = {}
+        for id, data in json.loads(archive.read(PROJECT_METADATA)).items():
+            try:
+                new_stored_data[id] = generate(data, 0)
+            except TooComplexException:
+                logging.info('unable to load %s' % id)
     return new_stored_data
 
+def _readProjectArray(filename, archive, name, mmap):
+    info = archive.getinfo(name)
+    array = map_npy_member(filename, info) if mmap else None
+    if array is None:
+        with archive.open(info) as member:
+            array = np.lib.format.read_array(member, allow_pickle=False)
+    return array
+
 def getConstraints(fit_project):
     """
     Extracts constraints from *fir_project* dict and returns a dict where keys
@@ -0,0 +1,142 @@
+import io
+import numpy as np
+
+import pytest
+
+from PySide6 import QtCore
+
+from sas.sascalc.fit.AbstractFitEngine import FResult
+from sas.sascalc.fit.AbstractFitEngine import FitData1D
+from sasmodels.sasview_model import load_standard_models
+from sas.qtgui.Plotting.PlotterData import Data1D
+
+# Tested module
+from sas.qtgui.Utilities.BatchResultsModel import BatchResults, BatchResultsModel
+
+
+class BatchResultsTest:
+    '''Test the columnar store of the batch results'''
+
+    @pytest.fixture(autouse=True)
+    def table(self):
+        '''Create a small table with missing values'''
+        table = BatchResults()
+        table.addColumn("Chi2", [3.0, 1.0, np.nan, 2.0])
+        table.addColumn("Data", ["b.txt", "A.txt", "c.dat", "a2.txt"])
+        table.addColumn("radius", [10.0, 20.0, 30.0, 40.0])
+        table.addColumn("radius" + BatchResults.ERROR_COLUMN_CAPTION,
+                        [0.1, np.nan, 0.3, 0.4], is_error=True)
+        yield table
+
+    def testText(self, table):
+        '''Test the lazy formatting of the cells'''
+        assert table.rowCount == 4
+        assert table.columnCount == 4
+        assert table.text(0, 0) == "3"
+        assert table.text(1, 1) == "A.txt"
+        assert table.text(2, 0) == ""
+        assert table.text(3, 3) == "0.4"
+
+    def testRowOrder(self, table):
+        '''Test sorting, with the missing values last'''
+        rows = np.arange(4)
+        assert list(table.rowOrder(rows, 0)) == [1, 3, 0, 2]
+        assert list(table.rowOrder(rows, 0, descending=True)) == [0, 3, 1, 2]
+        assert list(table.rowOrder(rows, 1)) == [1, 3, 0, 2]
+        assert list(table.rowOrder(np.array([3, 0]), 2, descending=True)) == [3, 0]
+
+    def testMatchRows(self, table):
+        '''Test filtering on the data names'''
+        assert list(table.matchRows("a.")) == [1]
+        assert list(table.matchRows(".TXT")) == [0, 1, 3]
+        assert list(table.matchRows("")) == [0, 1, 2, 3]
+
+    def testMatchRowsName(self):
+        '''Test only the name column is filtered on'''
+        table = BatchResults()
+        table.addColumn("Filename", ["b.txt", "a.txt"])
+        table.addColumn("model", ["a.txt", "c.txt"])
+        assert list(table.matchRows("a.")) == [1]
+        assert list(table.matchRows("c.")) == []
+        table = BatchResults()
+        table.addColumn("model", ["a.txt"])
+        assert list(table.matchRows("a.")) == []
+
+    def testWrite(self, table):
+        '''Test the CSV export and reading it back'''
+        fp = io.StringIO()
+        table.write(fp, rows=np.array([1, 2]))
+        lines = ["details\n"] + fp.getvalue().splitlines(keepends=True)
+        assert lines[1] == "Chi2,Data,radius,radius (Err),\n"
+        assert lines[2] == "1.0,A.txt,20.0,,\n"
+
+        loaded = BatchResults.fromCSV(lines)
+        assert loaded.names == table.names
+        assert loaded.is_error == [False, False, False, True]
+        assert loaded.rowCount == 2
+        assert np.array_equal(loaded.column("Chi2"), [1.0, np.nan], equal_nan=True)
+        assert loaded.text(0, 2) == "20.0"
+        assert loaded.text(1, 1) == "c.dat"
+
+    def testFromFitResults(self):
+        '''Test the table of batch fit results'''
+        model = [m for m in load_standard_models() if m.name == "core_shell_ellipsoid"][0]()
+        data = Data1D(x=[1,2], y=[3,4], dx=[0.1, 0.1], dy=[0.,0.])
+        fit_data = FitData1D(x=[1,2], y=[3,4], data=data)
+        output = FResult(model=model, data=fit_data, param_list=['sld_shell', 'sld_solvent'])
+        output.pvec = np.array([0.1, 0.02])
+        output.fitness = 9000.0
+        output.stderr = [0.001, 0.001]
+        table = BatchResults.fromFitResults([[output], [output]])
+        assert table.rowCount == 2
+        assert table.names[:2] == ["Chi2", "Data"]
+        # errors follow the fitted parameters
+        index = table.names.index("sld_shell")
+        assert table.names[index+1] == "sld_shell" + BatchResults.ERROR_COLUMN_CAPTION
+        assert table.is_error[index+1]
+        assert np.array_equal(table.column("sld_solvent"), [0.02, 0.02])
+        assert np.array_equal(table.column("sld_solvent (Err)"), [0.001, 0.001])
+        assert "scale (Err)" not in table.names
+        assert table.text(0, 0) == "9000"
+
+
+class BatchResultsModelTest:
+    '''Test the table model of the batch results'''
+
+    @pytest.fixture(autouse=True)
+    def model(self, qapp):
+        '''Create the model of a small table'''
+        table = BatchResults()
+        table.addColumn("Chi2", [3.0, 1.0, 2.0])
+        table.addColumn("Data", ["b.txt", "a.txt", "c.dat"])
+        yield BatchResultsModel(table)
+
+    def testData(self, model):
+        '''Test the cells and headers shown'''
+        assert model.rowCount() == 3
+        assert model.columnCount() == 2
+        assert model.data(model.index(1, 1)) == "a.txt"
+        assert model.headerData(0, QtCore.Qt.Horizontal) == "Chi2"
+
+    def testSortAndFilter(self, model):
+        '''Test the sorted and filtered rows'''
+        model.sort(0, QtCore.Qt.DescendingOrder)
+        assert [model.text(row, "Data") for row in range(3)] == ["b.txt", "c.dat", "a.txt"]
+        model.setFilter("txt")
+        assert model.rowCount() == 2
+        # the sort order is kept
+        assert [model.text(row, "Data") for row in range(2)] == ["b.txt", "a.txt"]
+        model.setFilter("")
+        assert model.rowCount() == 3
+
+    def testNoSort(self, model):
+        '''Test a sort on column -1 shows the rows in their original order'''
+        model.sort(-1)
+        assert [model.text(row, "Data") for row in range(3)] == ["b.txt", "a.txt", "c.dat"]
+        model.sort(1)
+        model.setFilter("txt")
+        model.sort(-1, QtCore.Qt.DescendingOrder)
+        assert [model.text(row, "Data") for row in range(2)] == ["b.txt", "a.txt"]
+        # and stays so when the filter changes
+        model.setFilter("")
+        assert [model.text(row, "Data") for row in range(3)] == ["b.txt", "a.txt", "c.dat"]
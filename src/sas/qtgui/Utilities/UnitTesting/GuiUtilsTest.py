@@ -608,6 +608,78 @@ class GuiUtilsTest:
         with pytest.raises(TypeError):
             toDouble(value)
 
+    @pytest.mark.parametrize("compress", [False, True])
+    @pytest.mark.parametrize("mmap", [False, True])
+    def testProjectFile(self, tmp_path, compress, mmap):
+        """
+        Test the project container against the JSON project file
+        """
+        data = Data2D(image=numpy.arange(12.0), err_image=numpy.full(12, 0.1),
+                      qx_data=numpy.linspace(-0.1, 0.1, 12).astype('>f8'),
+                      qy_data=numpy.zeros(12), q_data=numpy.linspace(0, 0.1, 12),
+                      mask=numpy.arange(12) % 3 > 0)
+        data.filename = "data.txt"
+        project = {'data_id': {'fit_data': data, 'fit_params': [{'model': ['sphere']}]},
+                   'empty': {'values': numpy.empty((0, 3))},
+                   'is_batch': 'False'}
+
+        filename = str(tmp_path / "project.sasproj")
+        saveProjectFile(filename, project, compress=compress)
+        assert isProjectContainer(filename)
+
+        with open(tmp_path / "project.json", 'w') as fp:
+            saveData(fp, project)
+        assert not isProjectContainer(str(tmp_path / "project.json"))
+        with open(tmp_path / "project.json") as fp:
+            expected = readDataFromFile(fp)
+
+        loaded = readProjectFile(filename, mmap=mmap)
+        assert sorted(loaded) == sorted(expected)
+        assert loaded['is_batch'] == 'False'
+
+        result = loaded['data_id']['fit_data']
+        assert isinstance(result, Data2D)
+        assert result.filename == "data.txt"
+        assert loaded['data_id']['fit_params'] == expected['data_id']['fit_params']
+        for name in ('data', 'err_data', 'qx_data', 'qy_data', 'mask'):
+            value = getattr(result, name)
+            assert value.dtype.byteorder in '<=|'
+            assert numpy.array_equal(value, getattr(expected['data_id']['fit_data'], name))
+        assert loaded['empty']['values'].shape == (0, 3)
+
+    def testProjectFileMapped(self, tmp_path, mocker):
+        """
+        Test the arrays of a project container aren't read when it is opened
+        """
+        values = numpy.arange(1000.0)
+        project = {'data_id': {'values': values, 'empty': numpy.empty(0)}}
+        filename = str(tmp_path / "project.sasproj")
+        saveProjectFile(filename, project)
+
+        reader = mocker.patch.object(numpy.lib.format, 'read_array',
+                                     side_effect=numpy.lib.format.read_array)
+        loaded = readProjectFile(filename, mmap=True)
+        # only the empty array, which can't be mapped, is read
+        assert reader.call_count == 1
+        mapped = loaded['data_id']['values']
+        assert isinstance(mapped, numpy.memmap)
+        assert numpy.array_equal(mapped, values)
+
+    def testProjectFileSaveOver(self, tmp_path):
+        """
+        Test a project read without mmap can be saved over its own file
+        """
+        values = numpy.arange(1000.0)
+        filename = str(tmp_path / "project.sasproj")
+        saveProjectFile(filename, {'data_id': {'values': values}})
+
+        loaded = readProjectFile(filename)['data_id']['values']
+        assert not isinstance(loaded, numpy.memmap)
+        saveProjectFile(filename, {'data_id': {'values': -loaded}})
+        assert numpy.array_equal(loaded, values)
+        assert numpy.array_equal(readProjectFile(filename)['data_id']['values'], -values)
+        assert [path.name for path in tmp_path.iterdir()] == ["project.sasproj"]
+
 
 class DoubleValidatorTest:
     """ Test the validator for floats """
@@ -4,7 +4,7 @@ import logging
 import multiprocessing
 import importlib.resources as resources
 from enum import Enum
-from sas.sascalc.calculator.ausaxs.sasview_sans_debye import sasview_sans_debye
+from sas.sascalc.calculator.ausaxs.sasview_sans_debye import sasview_sans_debye_histogram
 
 # we need to be able to differentiate between being uninitialized and failing to load
 class lib_state(Enum):
@@ -95,6 +95,17 @@ def ausaxs_available():
         ausaxs, ausaxs_state = _attach_hooks()
     return ausaxs_state is lib_state.READY
 
+def _default_sans_debye(q, coords, w):
+    """
+    Compute I(q) with the histogram Debye sum when AUSAXS is not available,
+    logging the bound on the binning error relative to the exact sum.
+    """
+    Iq, err = sasview_sans_debye_histogram(q, coords, w)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rel_err = np.nanmax(np.abs(err/Iq)) if len(Iq) else 0.
+    logging.info(f"Debye histogram: relative error bound {rel_err:.3g}")
+    return Iq
+
 first_time = True
 def evaluate_sans_debye(q, coords, w):
     """
@@ -120,7 +131,7 @@ def evaluate_sans_debye(q, coords, w):
         else:
             logging.warning(f"AUSAXS calculator seems to have crashed (exit code \"{p.exitcode}\"). Using default Debye implementation instead.")
             ausaxs_state = lib_state.FAILED
-            return sasview_sans_debye(q, coords, w)
+            return _default_sans_debye(q, coords, w)
 
     # after the first time, we assume that the library is safe to call from the main thread and use it directly
     # to avoid the overhead of creating new processes and hooks every time
@@ -128,11 +139,11 @@ def evaluate_sans_debye(q, coords, w):
         if ausaxs_state is lib_state.UNINITIALIZED:
             ausaxs, ausaxs_state = _attach_hooks()
         if ausaxs_state is lib_state.FAILED:
-            return sasview_sans_debye(q, coords, w)
+            return _default_sans_debye(q, coords, w)
         Iq, status = _invoke(q, coords, w)
 
     if (status != 0):
         logging.warning(f"AUSAXS calculator terminated unexpectedly (error code \"{status}\"). Using default Debye implementation instead.")
-        return sasview_sans_debye(q, coords, w)
+        return _default_sans_debye(q, coords, w)
 
     return Iq
\ No newline at end of file
@@ -1,6 +1,21 @@
+import os
 import numpy as np
 import logging
 
+try:
+    if os.environ.get('SAS_NUMBA', '1').lower() in ('1', 'yes', 'true', 't'):
+        from numba import njit, prange, get_num_threads
+        USE_NUMBA = True
+    else:
+        raise ImportError("fail")
+except ImportError:
+    USE_NUMBA = False
+
+# Default width of the distance bins [A] for the histogram Debye sum.
+DEFAULT_BIN_WIDTH = 0.01
+# Maximum of |d/dx sin(x)/x| = max |j1(x)|, used for the binning error bound.
+_MAX_SINC_SLOPE = 0.43619
+
 def sasview_sans_debye(q, coords, weight, worksize=100000):
     """
     Compute I(q) for a set of points using the full Debye formula.
@@ -36,4 +51,177 @@ def _calc_Iq_batch(Iq, q_pi, coords, weight):
         I_jk = (weight[j:] * weight[j])[None, :] * bes
         # Accumulate terms I(j,j), I(j, k+1..n) and by symmetry I(k+1..n, j).
         # Don't double-count the diagonal.
-        Iq += 2*np.sum(I_jk, axis=1) - I_jk[:, 0]
\ No newline at end of file
+        Iq += 2*np.sum(I_jk, axis=1) - I_jk[:, 0]
+
+def sasview_sans_debye_histogram(q, coords, weight, bin_width=DEFAULT_BIN_WIDTH,
+                                 tile=256, worksize=10000000):
+    """
+    Compute I(q) for a set of points using a binned Debye formula.
+
+    The weighted pair distances are accumulated once into a histogram p(r)
+    with bins of width *bin_width* so that
+    I(q) = sum w_j^2 + 2 sum_b p(r_b) sin(q r_b)/(q r_b), where r_b is the
+    centre of bin b.  The O(n^2) part of the calculation is then independent
+    of the number of q values.
+
+    *q* is the q values for the calculation.
+    *coords* are the sample points.
+    *weight* is the weight associated with each point.
+    *bin_width* is the width of the distance bins in the units of *coords*.
+    *tile* is the number of points per block in the pair distance kernel.
+    *worksize* is the number of sinc terms to evaluate at once.
+
+    Returns *(Iq, err)* where *err* is an upper bound on
+    |I_exact(q) - I(q)| from placing each distance at its bin centre.
+    """
+    q = np.asarray(q, dtype='d')
+    coords = np.ascontiguousarray(coords, dtype='d')
+    weight = np.ascontiguousarray(weight, dtype='d')
+    r, p_r = distance_histogram(coords, weight, bin_width=bin_width, tile=tile)
+    Iq = debye_from_histogram(q, r, p_r, np.sum(weight**2), worksize=worksize)
+    err = debye_histogram_error(q, weight, bin_width)
+    return Iq, err
+
+def distance_histogram(coords, weight, bin_width=DEFAULT_BIN_WIDTH, tile=256):
+    """
+    Compute the weighted pair distance distribution for a set of points.
+
+    *coords* are the sample points as a (3, n) array.
+    *weight* is the weight associated with each point.
+    *bin_width* is the width of the distance bins in the units of *coords*.
+    *tile* is the number of points per block in the pair distance kernel.
+
+    Returns *(r, p_r)* where *r* are the centres of the non-empty bins and
+    *p_r* is the sum of w_j w_k over all pairs j < k with distance in the bin.
+    The self terms j = k are not included.
+    """
+    weight = np.asarray(weight, dtype='d')
+    r, p_r = distance_histograms(coords, weight[None, :], bin_width=bin_width, tile=tile)
+    return r, p_r[0]
+
+def distance_histograms(coords, weights, bin_width=DEFAULT_BIN_WIDTH, tile=256):
+    """
+    Compute the pair distance distributions for several weight channels
+    in a single pass over the pairs.
+
+    *coords* are the sample points as a (3, n) array.
+    *weights* is an (m, n) array with one weight per channel and point.
+    *bin_width* is the width of the distance bins in the units of *coords*.
+    *tile* is the number of points per block in the pair distance kernel.
+
+    Returns *(r, p_r)* where *r* are the centres of the non-empty bins and
+    *p_r* is an (m(m+1)/2, nbins) array with one row for each channel
+    pair u <= v, in the order (0, 0), (0, 1), ..., (1, 1), ....  Row (u, u)
+    sums u_j u_k over pairs j < k, and row (u, v) sums u_j v_k + v_j u_k.
+    """
+    if bin_width <= 0:
+        raise ValueError("bin_width must be positive, got %g" % bin_width)
+    coords = np.ascontiguousarray(coords, dtype='d')
+    weights = np.ascontiguousarray(np.atleast_2d(weights), dtype='d')
+    nprod = weights.shape[0]*(weights.shape[0] + 1)//2
+    if weights.shape[1] < 2:
+        return np.empty(0), np.empty((nprod, 0))
+    # The bounding box diagonal is an upper limit on any pair distance.
+    extent = np.sqrt(np.sum((coords.max(axis=1) - coords.min(axis=1))**2))
+    nbins = int(extent/bin_width) + 2
+    if USE_NUMBA:
+        nblocks = max(1, get_num_threads())
+        hist = _distance_histogram_numba(
+            coords, weights, 1.0/bin_width, nbins, max(1, int(tile)), nblocks)
+    else:
+        hist = _distance_histogram_numpy(coords, weights, bin_width, nbins, max(1, int(tile)))
+    index = np.flatnonzero(np.any(hist != 0, axis=0))
+    return (index + 0.5)*bin_width, hist[:, index]
+
+def _distance_histogram_numpy(coords, weights, bin_width, nbins, tile):
+    """
+    Pure numpy version of the distance histogram, used when numba is not
+    available.  Processes *tile* rows of the upper triangle at a time.
+    """
+    m, n = weights.shape
+    hist = np.zeros((m*(m+1)//2, nbins))
+    for start in range(0, n - 1, tile):
+        stop = min(start + tile, n)
+        for j in range(start, stop):
+            dx = coords[:, j+1:] - coords[:, j:j+1]
+            r = np.sqrt(np.sum(dx**2, axis=0))
+            index = np.minimum((r/bin_width).astype(np.intp), nbins - 1)
+            c = 0
+            for u in range(m):
+                for v in range(u, m):
+                    w = weights[u, j]*weights[v, j+1:]
+                    if u != v:
+                        w += weights[v, j]*weights[u, j+1:]
+                    hist[c] += np.bincount(index, weights=w, minlength=nbins)
+                    c += 1
+    return hist
+
+if USE_NUMBA:
+    @njit('f8[:, :](f8[:, ::1], f8[:, ::1], f8, i8, i8, i8)', parallel=True, fastmath=True)
+    def _distance_histogram_numba(coords, weights, inv_width, nbins, tile, nblocks):
+        m, n = weights.shape
+        ntiles = (n + tile - 1) // tile
+        # One partial histogram per block so that threads never share a bin.
+        partial = np.zeros((nblocks, m*(m+1)//2, nbins))
+        x, y, z = coords[0], coords[1], coords[2]
+        for block in prange(nblocks):
+            hist = partial[block]
+            # Interleave row tiles over blocks to balance the triangular work.
+            for ti in range(block, ntiles, nblocks):
+                i_start = ti*tile
+                i_stop = min(i_start + tile, n)
+                for tj in range(ti, ntiles):
+                    j_start = tj*tile
+                    j_stop = min(j_start + tile, n)
+                    for i in range(i_start, i_stop):
+                        xi, yi, zi = x[i], y[i], z[i]
+                        for j in range(max(i + 1, j_start), j_stop):
+                            dx = x[j] - xi
+                            dy = y[j] - yi
+                            dz = z[j] - zi
+                            k = int(np.sqrt(dx*dx + dy*dy + dz*dz)*inv_width)
+                            if k >= nbins:
+                                k = nbins - 1
+                            c = 0
+                            for u in range(m):
+                                for v in range(u, m):
+                                    if u == v:
+                                        hist[c, k] += weights[u, i]*weights[u, j]
+                                    else:
+                                        hist[c, k] += (weights[u, i]*weights[v, j]
+                                                       + weights[v, i]*weights[u, j])
+                                    c += 1
+        return partial.sum(axis=0)
+
+def debye_from_histogram(q, r, p_r, self_term, worksize=10000000):
+    """
+    Evaluate the Debye sum from a pair distance histogram.
+
+    *q* is the q values for the calculation.
+    *r*, *p_r* are the bin centres and weights from :func:`distance_histogram`.
+    *self_term* is the sum of the squared weights, i.e., the j = k terms.
+    *worksize* is the number of sinc terms to evaluate at once.
+    """
+    q = np.asarray(q, dtype='d')
+    Iq = np.full(q.shape, self_term, dtype='d')
+    if len(r) == 0:
+        return Iq
+    q_pi = q.ravel()/np.pi  # np.sinc = sin(pi x)/(pi x)
+    batch_size = max(1, worksize // len(r))
+    flat = Iq.reshape(-1)
+    for batch in range(0, len(q_pi), batch_size):
+        bes = np.sinc(q_pi[batch:batch+batch_size, None]*r[None, :])
+        flat[batch:batch+batch_size] += 2*(bes @ p_r)
+    return Iq
+
+def debye_histogram_error(q, weight, bin_width=DEFAULT_BIN_WIDTH):
+    """
+    Upper bound on the error of the histogram Debye sum at each *q*.
+
+    Each pair distance is moved by at most *bin_width*/2, so each sinc term
+    changes by at most q bin_width/2 max|j1|.  Summing over all pairs gives
+    |dI(q)| <= q bin_width/2 max|j1| ((sum |w|)^2 - sum w^2).
+    """
+    weight = np.asarray(weight, dtype='d')
+    pair_sum = np.sum(np.abs(weight))**2 - np.sum(weight**2)
+    return _MAX_SINC_SLOPE*0.5*bin_width*np.abs(np.asarray(q, dtype='d'))*pair_sum
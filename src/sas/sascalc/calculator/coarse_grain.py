@@ -0,0 +1,173 @@
+"""
+Coarse-graining of MagSLD point clouds for the generic scattering calculator.
+
+Points are sorted along a Morton (z-order) curve, which makes the cells of
+every level of the octree over the bounding cube contiguous runs of the
+sorted points.  Each level is a candidate reduction: the points in a cell
+are merged into a single point at their volume-weighted centroid carrying
+the summed volume, sld*vol and magnetic sld*vol of the cell.  This conserves
+the scattering amplitude at q = 0 for any solvent SLD.
+
+Replacing the points of a cell by their centroid changes the cell amplitude
+by the factor <exp(i q.d)> over the displacements d from the centroid,
+which is 1 - q^2 sigma^2/2 to leading order for a cell with positional
+variance sigma^2 per axis.  The relative change in intensity is therefore
+estimated as::
+
+    err(q) = q^2 sum_c V_c sigma_c^2 / sum_c V_c
+
+where V_c is the volume of cell c.  The coarsest level with
+err(qmax) <= tol is used.  For a uniformly filled cell of side h,
+sigma^2 = h^2/12.
+"""
+import logging
+
+import numpy as np
+
+from sas.sascalc.calculator.sas_gen import MagSLD
+
+# Default relative intensity error at qmax.
+DEFAULT_TOLERANCE = 1e-2
+# Depth of the octree; 3*MAX_LEVEL bits must fit in a uint64 Morton code.
+MAX_LEVEL = 20
+
+
+class CoarseGrainInfo(object):
+    """
+    Summary of a coarse-graining step.
+
+    *level* is the octree level used, with cells of side *cell_size* [A].
+    *npoints* and *ncells* are the number of points before and after, and
+    *error* is the estimated relative intensity error at *qmax*.
+    """
+    def __init__(self, qmax, tol, level, cell_size, npoints, ncells, error):
+        self.qmax = qmax
+        self.tol = tol
+        self.level = level
+        self.cell_size = cell_size
+        self.npoints = npoints
+        self.ncells = ncells
+        self.error = error
+
+    @property
+    def ratio(self):
+        """Reduction ratio npoints/ncells."""
+        return self.npoints/self.ncells if self.ncells else 1.0
+
+    def __str__(self):
+        return ("coarse grained %d points to %d cells of %.3g A (x%.1f), "
+                "estimated error %.2g at q=%g" % (
+                    self.npoints, self.ncells, self.cell_size, self.ratio,
+                    self.error, self.qmax))
+
+
+def coarse_grain(data, qmax, tol=DEFAULT_TOLERANCE):
+    """
+    Merge the points of *data* into octree cells.
+
+    *data* is a MagSLD of points (not elements) with pixel volumes.
+    *qmax* is the largest q [1/A] of the calculation.
+    *tol* is the largest acceptable estimated relative error in I(qmax).
+
+    Returns *(reduced, info)* where *reduced* is a new MagSLD, or *data*
+    itself if no level reduces the number of points within tolerance, and
+    *info* is a :class:`CoarseGrainInfo`.
+    """
+    if data.is_elements:
+        raise ValueError("coarse graining is not supported for element data")
+    if data.vol_pix is None:
+        raise ValueError("coarse graining needs the pixel volumes")
+    if qmax <= 0 or tol <= 0:
+        raise ValueError("qmax and tol must be positive")
+    pos = np.vstack((data.pos_x, data.pos_y, data.pos_z)).astype('d')
+    npoints = pos.shape[1]
+    vol = np.broadcast_to(np.asarray(data.vol_pix, 'd'), (npoints,))
+    nothing = CoarseGrainInfo(qmax, tol, MAX_LEVEL, 0.0, npoints, npoints, 0.0)
+    if npoints < 2:
+        return data, nothing
+
+    lower = pos.min(axis=1)
+    size = np.max(pos.max(axis=1) - lower)
+    if size == 0:
+        size = 1.0
+    # Integer coordinates on the finest level, then the Morton order.
+    ncell = 2**MAX_LEVEL
+    grid = np.minimum((pos - lower[:, None])*(ncell/size), ncell - 1).astype(np.uint64)
+    code = (_spread_bits(grid[0]) | (_spread_bits(grid[1]) << np.uint64(1))
+            | (_spread_bits(grid[2]) << np.uint64(2)))
+    order = np.argsort(code, kind='stable')
+    code, pos, vol = code[order], pos[:, order], vol[order]
+
+    # Skip levels whose cells are far larger than allowed by the error
+    # estimate for a uniformly filled cell, sigma^2 = h^2/12.
+    max_side = np.sqrt(12*tol)/qmax
+    level = int(np.clip(np.ceil(np.log2(size/max_side)) - 3, 0, MAX_LEVEL))
+    for level in range(level, MAX_LEVEL + 1):
+        shift = np.uint64(3*(MAX_LEVEL - level))
+        key = code >> shift
+        starts = np.flatnonzero(np.concatenate(([True], key[1:] != key[:-1])))
+        if len(starts) == npoints:
+            break
+        error = _cell_error(pos, vol, starts)*qmax**2
+        if error <= tol:
+            reduced = _merge(data, order, pos, vol, starts)
+            info = CoarseGrainInfo(qmax, tol, level, size/2**level,
+                                   npoints, len(starts), error)
+            logging.info(str(info))
+            return reduced, info
+    return data, nothing
+
+
+def _spread_bits(v):
+    """
+    Interleave two zero bits between each of the low 21 bits of *v*.
+    """
+    v = v & np.uint64(0x1fffff)
+    for shift, mask in ((32, 0x1f00000000ffff), (16, 0x1f0000ff0000ff),
+                        (8, 0x100f00f00f00f00f), (4, 0x10c30c30c30c30c3),
+                        (2, 0x1249249249249249)):
+        v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+    return v
+
+
+def _cell_error(pos, vol, starts):
+    """
+    Volume weighted mean positional variance per axis over the cells.
+    """
+    total = np.add.reduceat(vol, starts)
+    counts = np.diff(np.append(starts, len(vol)))
+    # measure from the first point in each cell to avoid cancellation
+    local = pos - np.repeat(pos[:, starts], counts, axis=1)
+    first = np.add.reduceat(vol*local, starts, axis=1)
+    second = np.add.reduceat(vol*np.sum(local**2, axis=0), starts)
+    keep = total > 0
+    variance = second[keep] - np.sum(first[:, keep]**2, axis=0)/total[keep]
+    return max(np.sum(variance), 0.0)/(3*np.sum(total[keep]))
+
+
+def _merge(data, order, pos, vol, starts):
+    """
+    Build the MagSLD with one point per cell.  Cells with no volume do not
+    scatter and are dropped.
+    """
+    total = np.add.reduceat(vol, starts)
+    keep = total > 0
+    total = total[keep]
+
+    def cell_mean(values, in_order=False):
+        if not in_order:
+            values = np.broadcast_to(np.asarray(values, 'd'), order.shape)[order]
+        return np.add.reduceat(values*vol, starts)[keep]/total
+
+    x, y, z = (cell_mean(p, in_order=True) for p in pos)
+    sld_n = cell_mean(data.sld_n)
+    if data.sld_mx is None or data.sld_my is None or data.sld_mz is None:
+        mx = my = mz = None
+    else:
+        mx, my, mz = (cell_mean(m) for m in (data.sld_mx, data.sld_my, data.sld_mz))
+    reduced = MagSLD(x, y, z, sld_n, mx, my, mz, total)
+    reduced.filename = data.filename
+    reduced.pos_unit = data.pos_unit
+    reduced.sld_unit = data.sld_unit
+    reduced.set_pixel_symbols('pixel')
+    return reduced
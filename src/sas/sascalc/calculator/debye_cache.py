@@ -0,0 +1,159 @@
+"""
+Cache of pair distance histograms for the 1D Debye sum in GenSAS.
+
+The Debye sum for contrast w = (sld - solvent_sld)*vol expands as::
+
+    I(q) = H_aa(q) - solvent_sld*H_av(q) + solvent_sld^2*H_vv(q)
+
+where a = sld*vol, v = vol and H_uv is the Debye sum over the pair distance
+histogram weighted by u_j v_k + v_j u_k.  The three histograms depend only
+on the structure, so once they are known a change of q grid, scale,
+background or solvent SLD only needs a sum over the histogram bins.
+"""
+import os
+import hashlib
+import logging
+from collections import OrderedDict
+
+import numpy as np
+
+from sas.sascalc.calculator.ausaxs.sasview_sans_debye import (
+    DEFAULT_BIN_WIDTH, distance_histograms, debye_from_histogram)
+
+# Default memory cap for the cached histograms [bytes].
+DEFAULT_MAX_BYTES = 256*2**20
+CACHE_DIR_NAME = "debye_cache"
+
+
+class DebyeHistograms(object):
+    """
+    Pair distance histograms for one structure.
+
+    *r* holds the bin centres, *p_r* the (3, nbins) histograms for the
+    channel pairs (a, a), (a, v), (v, v) and *self_terms* the matching
+    j = k contributions.
+    """
+    def __init__(self, r, p_r, self_terms):
+        self.r = r
+        self.p_r = p_r
+        self.self_terms = self_terms
+
+    @property
+    def nbytes(self):
+        return self.r.nbytes + self.p_r.nbytes + self.self_terms.nbytes
+
+    def Iq(self, q, solvent_sld=0.0):
+        """
+        Evaluate the Debye sum for the given solvent SLD.
+        """
+        coef = np.array([1.0, -solvent_sld, solvent_sld**2])
+        return debye_from_histogram(q, self.r, coef @ self.p_r, coef @ self.self_terms)
+
+
+class DebyeHistogramCache(object):
+    """
+    LRU cache of :class:`DebyeHistograms` keyed by a hash of the positions,
+    nuclear SLD and pixel volumes.
+
+    *max_bytes* is the memory cap for the cached histograms.  The most
+    recently used entry is always kept even if it is larger than the cap.
+    *bin_width* is the width of the distance bins [A].
+    *persist* stores the histograms in *cache_dir* (by default a directory
+    in the user directory) so that they survive between sessions.
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, bin_width=DEFAULT_BIN_WIDTH,
+                 persist=False, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.bin_width = bin_width
+        self.persist = persist
+        self._cache_dir = cache_dir
+        self._entries = OrderedDict()
+
+    @property
+    def nbytes(self):
+        return sum(entry.nbytes for entry in self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        """
+        Remove all entries from memory.  Files on disk are kept.
+        """
+        self._entries.clear()
+
+    def cache_dir(self):
+        """
+        Directory used for persistent histograms.
+        """
+        if self._cache_dir is None:
+            from sas.system.user import get_user_dir
+            self._cache_dir = os.path.join(get_user_dir(), CACHE_DIR_NAME)
+        return self._cache_dir
+
+    def key(self, coords, sld, vol):
+        """
+        Hash identifying the structure and the bin width.
+        """
+        digest = hashlib.sha1()
+        for v in (coords, sld, vol):
+            digest.update(np.ascontiguousarray(v, dtype='d').tobytes())
+        digest.update(np.float64(self.bin_width).tobytes())
+        return digest.hexdigest()
+
+    def get(self, coords, sld, vol):
+        """
+        Return the histograms for the structure, computing them if needed.
+
+        *coords* are the sample points as a (3, n) array, *sld* the nuclear
+        SLD and *vol* the volume of each point.
+        """
+        key = self.key(coords, sld, vol)
+        entry = self._entries.get(key, None)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+        entry = self._load(key) if self.persist else None
+        if entry is None:
+            entry = self._compute(coords, sld, vol)
+            if self.persist:
+                self._save(key, entry)
+        self._entries[key] = entry
+        self._evict()
+        return entry
+
+    def _compute(self, coords, sld, vol):
+        a = np.asarray(sld, dtype='d')*np.asarray(vol, dtype='d')
+        v = np.asarray(vol, dtype='d')
+        weights = np.vstack((a, v))
+        r, p_r = distance_histograms(coords, weights, bin_width=self.bin_width)
+        self_terms = np.array([np.sum(a*a), 2*np.sum(a*v), np.sum(v*v)])
+        return DebyeHistograms(r, p_r, self_terms)
+
+    def _evict(self):
+        total = self.nbytes
+        while len(self._entries) > 1 and total > self.max_bytes:
+            _, entry = self._entries.popitem(last=False)
+            total -= entry.nbytes
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir(), key + ".npz")
+
+    def _load(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                return DebyeHistograms(data['r'], data['p_r'], data['self_terms'])
+        except Exception as exc:
+            logging.warning(f"Could not read Debye histogram cache {path}: {exc}")
+            return None
+
+    def _save(self, key, entry):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            np.savez(path, r=entry.r, p_r=entry.p_r, self_terms=entry.self_terms)
+        except OSError as exc:
+            logging.warning(f"Could not write Debye histogram cache {path}: {exc}")
@@ -14,7 +14,7 @@ from sas.sascalc.calculator.sas_gen import MagSLD, OMF2SLD
 
 try:
     if os.environ.get('SAS_NUMBA', '1').lower() in ('1', 'yes', 'true', 't'):
-        from numba import njit, prange
+        from numba import njit, prange, config, get_num_threads, set_num_threads
         USE_NUMBA = True
     else:
         raise ImportError("fail")
@@ -51,15 +51,26 @@ def Iq(q, x, y, z, sld, vol, is_avg=False):
         I_out = evaluate_sans_debye(q, coords, w)
     return I_out * (1.0E+8/np.sum(vol))
 
-def Iqxy(qx, qy, x, y, z, sld, vol, mx, my, mz, in_spin, out_spin, s_theta, s_phi, elements=None, is_elements=False):
+def Iqxy(qx, qy, x, y, z, sld, vol, mx, my, mz, in_spin, out_spin, s_theta, s_phi, elements=None, is_elements=False,
+         precision='double', nthreads=None, use_fft=True, rotation=None):
     """
     Computes 2D anisotropic.
     *in_spin* and *out_spin* indicate portion of polarizer and analyzer
     transmission that are spin up.  *s_theta* and *s_phi* are the polarization direction angles.
+    *precision* selects single precision for the non-magnetic point
+    calculation (see *_calc_Iqxy*) and *nthreads* limits the number of threads.
+    If *use_fft* is True and the points lie on a regular grid in (x, y), such
+    as data from OMF2SLD, the sums are evaluated by FFT when that is cheaper
+    than the direct sum (see *_calc_Iqxy_grid*).
+    If *rotation* (a scipy Rotation from sample to beamline coords) is given,
+    the positions and magnetic SLDs are in sample coords and q is rotated
+    into the sample frame instead, so the points do not need transforming.
     All other values must be numpy vectors of the correct size.
     Returns *I(qx, qy)*
     """
     qx, qy = np.broadcast_arrays(qx, qy)
+    if rotation is not None and is_elements:
+        raise ValueError("q rotation is not supported for elements")
     # if the mx provided to SasGen is None then _vec(mx) will be [nan]
     if mx is not None and my is not None and mz is not None:
         magnetic_index = (mx != 0.) | (my != 0.) | (mz != 0.)
@@ -76,11 +87,13 @@ def Iqxy(qx, qy, x, y, z, sld, vol, mx, my, mz, in_spin, out_spin, s_theta, s_ph
                 in_spin, out_spin, s_theta, s_phi)
         else:
             if not index.all():
-                x, y, mx, my, mz, sld, vol \
-                    = (v[index] for v in (x, y, mx, my, mz, sld, vol))
+                x, y, z, mx, my, mz, sld, vol \
+                    = (v[index] for v in (x, y, z, mx, my, mz, sld, vol))
+            grid = _fft_grid(qx.size, x, y, nchannels=4) if use_fft and rotation is None else None
             I_out = _calc_Iqxy_magnetic(
                 qx, qy, x, y, sld, vol, (mx, my, mz),
-                in_spin, out_spin, s_theta, s_phi)
+                in_spin, out_spin, s_theta, s_phi, grid=grid, nthreads=nthreads,
+                z=z, rotation=rotation)
     else:
         index = (sld != 0.)
         if is_elements:
@@ -90,11 +103,64 @@ def Iqxy(qx, qy, x, y, z, sld, vol, mx, my, mz, in_spin, out_spin, s_theta, s_ph
             I_out = I_out.reshape(qx.shape)
         else:
             if not index.all():
-                x, y, sld, vol = (v[index] for v in (x, y, sld, vol))
-            I_out = _calc_Iqxy(sld*vol, x, y, qx.flatten(), qy.flatten())
+                x, y, z, sld, vol = (v[index] for v in (x, y, z, sld, vol))
+            grid = _fft_grid(qx.size, x, y) if use_fft and rotation is None else None
+            if rotation is not None:
+                qsx, qsy, qsz = _rotate_q(qx, qy, rotation)
+                I_out = _calc_Iqxy(sld*vol, x, y, qsx, qsy, precision=precision,
+                                   nthreads=nthreads, z=z, qz=qsz)
+            elif grid is not None:
+                F = _calc_Iqxy_grid(qx.flatten(), qy.flatten(), (sld*vol)[None, :], grid)[0]
+                I_out = abs(F)**2
+            else:
+                I_out = _calc_Iqxy(sld*vol, x, y, qx.flatten(), qy.flatten(),
+                                   precision=precision, nthreads=nthreads)
             I_out = I_out.reshape(qx.shape)
     return I_out * (1.0E+8/np.sum(vol))
 
+def Iqxy_states(qx, qy, x, y, z, sld, vol, mx, my, mz, states, elements=None, is_elements=False,
+                nthreads=None, use_fft=True, rotation=None):
+    """
+    Computes 2D anisotropic for several polarisation states at once.
+    *states* is a sequence of (in_spin, out_spin, s_theta, s_phi) tuples as
+    used by *Iqxy*, e.g., the four spin cross sections ++, --, +- and -+.
+    For magnetic point data the nuclear and magnetic Fourier amplitudes are
+    computed once and combined for each state.  Other inputs are evaluated
+    with *Iqxy*.  See *Iqxy* for *rotation*.
+    Returns an array of shape (len(states),) + qx.shape.
+    """
+    qx, qy = np.broadcast_arrays(qx, qy)
+    states = [tuple(state) for state in states]
+    if not states:
+        return np.empty((0,) + qx.shape)
+    if mx is not None and my is not None and mz is not None:
+        magnetic_index = (mx != 0.) | (my != 0.) | (mz != 0.)
+        is_magnetic = magnetic_index.any()
+    else:
+        is_magnetic = False
+    if not is_magnetic:
+        # the non-magnetic calculation does not depend on the spin state
+        I_out = Iqxy(qx, qy, x, y, z, sld, vol, mx, my, mz, *states[0],
+                     elements, is_elements, nthreads=nthreads, use_fft=use_fft,
+                     rotation=rotation)
+        return np.repeat(I_out[None, ...], len(states), axis=0)
+    if is_elements:
+        # M_perp for elements is not linear in M, so evaluate each state
+        return np.array([
+            Iqxy(qx, qy, x, y, z, sld, vol, mx, my, mz, *state,
+                 elements, is_elements, nthreads=nthreads, use_fft=use_fft,
+                 rotation=rotation)
+            for state in states]).reshape((len(states),) + qx.shape)
+    index = (sld != 0.) | magnetic_index
+    if not index.all():
+        x, y, z, mx, my, mz, sld, vol \
+            = (v[index] for v in (x, y, z, mx, my, mz, sld, vol))
+    grid = _fft_grid(qx.size, x, y, nchannels=4) if use_fft and rotation is None else None
+    I_out = _calc_Iqxy_magnetic_states(
+        qx, qy, x, y, sld, vol, (mx, my, mz), states, grid=grid, nthreads=nthreads,
+        z=z, rotation=rotation)
+    return I_out * (1.0E+8/np.sum(vol))
+
 @njit('(f8[:], f8[:], f8[:])')
 def _calc_Iq_avg(q, r, w):
     Iq = np.zeros_like(q)
@@ -133,27 +199,134 @@ def _calc_Iq_numba(Iq, q, coords, sld, vol):
             # Accumulate terms I(j,j), I(j, k+1..n) and by symmetry I(k+1..n, j)
             Iq[i] += 2*np.sum(I_jk) - I_jk[0] # don't double-count the diagonal
 
-if USE_NUMBA:
-    sig = "f8[:](f8[:],f8[:],f8[:],f8[:],f8[:])"
-    @njit(sig, parallel=True, fastmath=True)
-    def _calc_Iqxy(scale, x, y, qx, qy):
-        #print("calling numba for geni")
-        Iq = np.empty_like(qx)
-        for j in prange(len(Iq)):
-            total = np.sum(scale * np.exp(1j*(qx[j]*x + qy[j]*y)))
-            Iq[j] = abs(total)**2
-        return Iq
-else:
-    def _calc_Iqxy(scale, x, y, qx, qy):
-        Iq = [abs(np.sum(scale*np.exp(1j*(qx_k*x + qy_k*y))))**2
-              for qx_k, qy_k in zip(qx.flat, qy.flat)]
-        return np.asarray(Iq).reshape(qx.shape)
-_calc_Iqxy.__doc__ = """
+# Number of detector pixels and sample points per tile in the 2D kernels.
+# A tile of points (x, y, scale) stays in cache while it is applied to each
+# pixel of the tile of q values.
+Q_BLOCK = 64
+POINT_BLOCK = 4096
+
+def _calc_Iqxy(scale, x, y, qx, qy, precision='double', nthreads=None, z=None, qz=None):
+    """
     Compute I(q) for a set of points (x, y).
-    
-    Uses: I(q) = \|sum V(r) rho(r) e^(1j q.r)\|^2 / sum V(r)
+
+    Uses: I(q) = \\|sum V(r) rho(r) e^(1j q.r)\\|^2 / sum V(r)
     Since qz is zero for SAS, only need 2D vectors q = (qx, qy) and r = (x, y).
+
+    The (q, points) loop is tiled so that no per-pixel temporaries are
+    needed.  With *precision='single'* the phases and partial sums are
+    computed in float32 with Kahan compensation, which is faster on most
+    CPUs at the cost of ~1e-6 relative accuracy.  *nthreads* limits the
+    number of threads used by the numba kernel.
+
+    If *z* and *qz* are given the phase includes qz z, which is needed when
+    q has been rotated into the sample frame.
+    """
+    if precision not in ('double', 'single'):
+        raise ValueError("precision must be 'double' or 'single', got %r" % precision)
+    dtype = 'f' if precision == 'single' else 'd'
+    if qz is None:
+        z, qz = np.zeros_like(x), np.zeros_like(qx)
+    scale, x, y, z, qx, qy, qz = (np.ascontiguousarray(v, dtype=dtype).ravel()
+                                  for v in (scale, x, y, z, qx, qy, qz))
+    if not USE_NUMBA:
+        return _calc_Iqxy_numpy(scale, x, y, z, qx, qy, qz)
+    with _thread_limit(nthreads):
+        # Use smaller q tiles for small detectors so that all threads get work.
+        q_block = int(min(Q_BLOCK, max(1, -(-len(qx) // (4*get_num_threads())))))
+        kernel = _calc_Iqxy_blocked_f4 if precision == 'single' else _calc_Iqxy_blocked
+        return kernel(scale, x, y, z, qx, qy, qz, q_block, POINT_BLOCK)
+
+def _calc_Iqxy_numpy(scale, x, y, z, qx, qy, qz, worksize=4000000):
+    """
+    Blocked numpy version of :func:`_calc_Iqxy` used when numba is not
+    available.  *worksize* is the number of phases evaluated at once.
     """
+    Iq = np.empty(len(qx))
+    block = max(1, worksize // max(1, len(x)))
+    for start in range(0, len(qx), block):
+        phase = (np.outer(qx[start:start+block], x) + np.outer(qy[start:start+block], y)
+                 + np.outer(qz[start:start+block], z))
+        real = np.cos(phase) @ scale
+        imag = np.sin(phase) @ scale
+        Iq[start:start+block] = real**2 + imag**2
+    return Iq
+
+class _thread_limit(object):
+    """
+    Context manager limiting the number of numba threads to *nthreads*.
+    """
+    def __init__(self, nthreads):
+        self.nthreads = nthreads
+        self.saved = None
+
+    def __enter__(self):
+        if USE_NUMBA and self.nthreads is not None:
+            self.saved = get_num_threads()
+            set_num_threads(max(1, min(int(self.nthreads), config.NUMBA_NUM_THREADS)))
+        return self
+
+    def __exit__(self, *args):
+        if self.saved is not None:
+            set_num_threads(self.saved)
+
+if USE_NUMBA:
+    @njit("f8[:](f8[:],f8[:],f8[:],f8[:],f8[:],f8[:],f8[:],i8,i8)", parallel=True, fastmath=True)
+    def _calc_Iqxy_blocked(scale, x, y, z, qx, qy, qz, q_block, p_block):
+        nq, npoints = len(qx), len(x)
+        Iq = np.empty(nq)
+        for b in prange((nq + q_block - 1) // q_block):
+            q_start = b*q_block
+            q_stop = min(q_start + q_block, nq)
+            real = np.zeros(q_stop - q_start)
+            imag = np.zeros(q_stop - q_start)
+            for p_start in range(0, npoints, p_block):
+                p_stop = min(p_start + p_block, npoints)
+                for k in range(q_start, q_stop):
+                    qxk, qyk, qzk = qx[k], qy[k], qz[k]
+                    re, im = 0., 0.
+                    for j in range(p_start, p_stop):
+                        phase = qxk*x[j] + qyk*y[j] + qzk*z[j]
+                        re += scale[j]*np.cos(phase)
+                        im += scale[j]*np.sin(phase)
+                    real[k - q_start] += re
+                    imag[k - q_start] += im
+            for k in range(q_start, q_stop):
+                Iq[k] = real[k - q_start]**2 + imag[k - q_start]**2
+        return Iq
+
+    # No fastmath here since it would allow the compiler to drop the Kahan
+    # compensation terms.
+    @njit("f8[:](f4[:],f4[:],f4[:],f4[:],f4[:],f4[:],f4[:],i8,i8)", parallel=True)
+    def _calc_Iqxy_blocked_f4(scale, x, y, z, qx, qy, qz, q_block, p_block):
+        nq, npoints = len(qx), len(x)
+        Iq = np.empty(nq)
+        for b in prange((nq + q_block - 1) // q_block):
+            q_start = b*q_block
+            q_stop = min(q_start + q_block, nq)
+            real = np.zeros(q_stop - q_start)
+            imag = np.zeros(q_stop - q_start)
+            for p_start in range(0, npoints, p_block):
+                p_stop = min(p_start + p_block, npoints)
+                for k in range(q_start, q_stop):
+                    qxk, qyk, qzk = qx[k], qy[k], qz[k]
+                    re, im = np.float32(0.), np.float32(0.)
+                    re_c, im_c = np.float32(0.), np.float32(0.)
+                    for j in range(p_start, p_stop):
+                        phase = qxk*x[j] + qyk*y[j] + qzk*z[j]
+                        t = scale[j]*np.cos(phase) - re_c
+                        total = re + t
+                        re_c = (total - re) - t
+                        re = total
+                        t = scale[j]*np.sin(phase) - im_c
+                        total = im + t
+                        im_c = (total - im) - t
+                        im = total
+                    # Tiles are combined in double precision.
+                    real[k - q_start] += re
+                    imag[k - q_start] += im
+            for k in range(q_start, q_stop):
+                Iq[k] = real[k - q_start]**2 + imag[k - q_start]**2
+        return Iq
 
 def _calc_Iqxy_elements(sld, x, y, z, elements, vol, qx, qy):
     """
@@ -175,26 +348,37 @@ def _calc_Iqxy_elements(sld, x, y, z, elements, vol, qx, qy):
 
 def _calc_Iqxy_magnetic(
         qx, qy, x, y, rho, vol, rho_m,
-        up_frac_i=1, up_frac_f=1, up_theta=0., up_phi=0.):
+        up_frac_i=1, up_frac_f=1, up_theta=0., up_phi=0., grid=None, nthreads=None,
+        z=None, rotation=None):
     """Compute I(q) for a set of points (x, y), with magnetism on each point.
 
-    Uses: I(q) = sum_xs w_xs \|sum V(r) rho(q, r, xs) e^(1j q.r)\|^2 / sum V(r)
+    Uses: I(q) = sum_xs w_xs \\|sum V(r) rho(q, r, xs) e^(1j q.r)\\|^2 / sum V(r)
     where rho is adjusted for the particular q and polarization cross section.
     The cross section weights depends on the polarizer and analyzer
     efficiency of the measurement.  For example, with polarization up at 100%
     efficiency and no analyzer, (up_frac_i=1, up_frac_f=0.5), then uu and ud
     will both be 0.5.
     Since qz is zero for SAS, only need 2D vectors q = (qx, qy) and r = (x, y).
+    If *grid* is given by *_fft_grid* the Fourier amplitudes are computed
+    by *_calc_Iqxy_grid* instead of the direct sum.  If *rotation* is given
+    then (x, y, *z*) and *rho_m* are in sample coords (see *Iqxy*).
     """
-    # Determine contribution from each cross section
-    dd, du, ud, uu = _spin_weights(up_frac_i, up_frac_f)
+    states = [(up_frac_i, up_frac_f, up_theta, up_phi)]
+    return _calc_Iqxy_magnetic_states(
+        qx, qy, x, y, rho, vol, rho_m, states, grid=grid, nthreads=nthreads,
+        z=z, rotation=rotation)[0]
 
-    # Precompute helper values
-    up_theta = np.radians(up_theta)
-    cos_spin, sin_spin = np.cos(up_theta), np.sin(up_theta)
+def _calc_Iqxy_magnetic_states(qx, qy, x, y, rho, vol, rho_m, states, grid=None, nthreads=None,
+                               z=None, rotation=None):
+    """
+    Compute I(q) for a set of points (x, y) with magnetism for several
+    polarisation *states*, each given as (up_frac_i, up_frac_f, up_theta, up_phi).
 
-    up_phi = np.radians(up_phi)
-    cos_phi, sin_phi = np.cos(up_phi), np.sin(up_phi)
+    The nuclear amplitude and the three magnetic amplitudes are computed
+    once per pixel, and each state is a combination of these four sums
+    (see *_magnetic_intensity*).
+    Returns an array of shape (len(states),) + qx.shape.
+    """
     mx, my, mz = rho_m
     ## NOTE: sasview calculator uses the opposite sign for mx, my, mz.
     ## Uncomment the following to match its output.
@@ -203,60 +387,267 @@ def _calc_Iqxy_magnetic(
     # Flatten arrays so everything is 1D
     shape = qx.shape
     qx, qy = (np.asarray(v, 'd').flatten() for v in (qx, qy))
-    Iq = np.zeros(shape=qx.shape, dtype='d')
-    M = np.array([mx, my, mz])
-    #print("mag", [v.shape for v in (x, y, rho, vol, mx, my, mz)])
-    _calc_Iqxy_magnetic_helper(
-        Iq, qx, qy, x, y, rho, vol, M,
-        cos_spin, sin_spin, cos_phi, sin_phi, dd, du, ud, uu)
-    return Iq.reshape(shape)
+    weights = np.array([rho, mx, my, mz])*vol
+    if rotation is not None:
+        qsx, qsy, qsz = _rotate_q(qx, qy, rotation)
+        F = _calc_Iqxy_amplitudes(weights, x, y, qsx, qsy, nthreads=nthreads, z=z, qz=qsz)
+        # the magnetic amplitudes are vectors in sample coords
+        F[1:] = rotation.as_matrix() @ F[1:]
+    elif grid is not None:
+        F = _calc_Iqxy_grid(qx, qy, weights, grid)
+    else:
+        F = _calc_Iqxy_amplitudes(weights, x, y, qx, qy, nthreads=nthreads)
+
+    Iq = np.empty((len(states), len(qx)), dtype='d')
+    for k, (up_frac_i, up_frac_f, up_theta, up_phi) in enumerate(states):
+        # Determine contribution from each cross section
+        dd, du, ud, uu = _spin_weights(up_frac_i, up_frac_f)
+
+        # Precompute helper values
+        up_theta = np.radians(up_theta)
+        cos_spin, sin_spin = np.cos(up_theta), np.sin(up_theta)
+
+        up_phi = np.radians(up_phi)
+        cos_phi, sin_phi = np.cos(up_phi), np.sin(up_phi)
+
+        Iq[k] = _magnetic_intensity(
+            qx, qy, F[0], F[1:], cos_spin, sin_spin, cos_phi, sin_phi, dd, du, ud, uu)
+    return Iq.reshape((len(states),) + shape)
+
+def _rotate_q(qx, qy, rotation):
+    """
+    Rotate detector q = (qx, qy, 0) into sample coords, where *rotation*
+    takes sample coords to beamline coords.  Since q.(R r) = (R^T q).r,
+    this gives the same phases as rotating every point.
+    Returns (qx, qy, qz) in sample coords as flat arrays.
+    """
+    q = np.column_stack((np.ravel(qx), np.ravel(qy), np.zeros(np.size(qx))))
+    return rotation.inv().apply(q).T
+
+def _calc_Iqxy_amplitudes(weights, x, y, qx, qy, nthreads=None, z=None, qz=None):
+    """
+    Compute the Fourier amplitudes F_c(q) = sum w_c(r) e^(1j q.r) for each
+    row c of the (m, npoints) array *weights*, using the same tiling as
+    *_calc_Iqxy*.  Returns an (m, npix) complex array.
+    """
+    weights = np.ascontiguousarray(weights, dtype='d')
+    if qz is None:
+        z, qz = np.zeros_like(x), np.zeros_like(qx)
+    x, y, z, qx, qy, qz = (np.ascontiguousarray(v, dtype='d').ravel()
+                           for v in (x, y, z, qx, qy, qz))
+    if not USE_NUMBA:
+        return _calc_Iqxy_amplitudes_numpy(weights, x, y, z, qx, qy, qz)
+    with _thread_limit(nthreads):
+        q_block = int(min(Q_BLOCK, max(1, -(-len(qx) // (4*get_num_threads())))))
+        return _calc_Iqxy_amplitudes_blocked(
+            weights, x, y, z, qx, qy, qz, q_block, POINT_BLOCK)
+
+def _calc_Iqxy_amplitudes_numpy(weights, x, y, z, qx, qy, qz, worksize=4000000):
+    """
+    Blocked numpy version of :func:`_calc_Iqxy_amplitudes` used when numba
+    is not available.  *worksize* is the number of phases evaluated at once.
+    """
+    F = np.empty((weights.shape[0], len(qx)), dtype='D')
+    block = max(1, worksize // max(1, len(x)))
+    for start in range(0, len(qx), block):
+        phase = (np.outer(qx[start:start+block], x) + np.outer(qy[start:start+block], y)
+                 + np.outer(qz[start:start+block], z))
+        F[:, start:start+block] = weights @ np.exp(1j*phase).T
+    return F
+
+if USE_NUMBA:
+    @njit("c16[:, :](f8[:, ::1], f8[:], f8[:], f8[:], f8[:], f8[:], f8[:], i8, i8)",
+          parallel=True, fastmath=True)
+    def _calc_Iqxy_amplitudes_blocked(weights, x, y, z, qx, qy, qz, q_block, p_block):
+        m = weights.shape[0]
+        nq, npoints = len(qx), len(x)
+        F = np.empty((m, nq), dtype=np.complex128)
+        for b in prange((nq + q_block - 1) // q_block):
+            q_start = b*q_block
+            q_stop = min(q_start + q_block, nq)
+            real = np.zeros((m, q_stop - q_start))
+            imag = np.zeros((m, q_stop - q_start))
+            re = np.empty(m)
+            im = np.empty(m)
+            for p_start in range(0, npoints, p_block):
+                p_stop = min(p_start + p_block, npoints)
+                for k in range(q_start, q_stop):
+                    qxk, qyk, qzk = qx[k], qy[k], qz[k]
+                    re[:] = 0.
+                    im[:] = 0.
+                    for j in range(p_start, p_stop):
+                        phase = qxk*x[j] + qyk*y[j] + qzk*z[j]
+                        cos_phase, sin_phase = np.cos(phase), np.sin(phase)
+                        for c in range(m):
+                            re[c] += weights[c, j]*cos_phase
+                            im[c] += weights[c, j]*sin_phase
+                    for c in range(m):
+                        real[c, k - q_start] += re[c]
+                        imag[c, k - q_start] += im[c]
+            for c in range(m):
+                for k in range(q_start, q_stop):
+                    F[c, k] = real[c, k - q_start] + 1j*imag[c, k - q_start]
+        return F
 
 @njit
 def orth(A, b): # A = 3 x n, and b_hat unit vector
     return A - np.outer(b, b)@A
- 
-
-@njit("(" + "f8[:], "*7 + "f8[:,::1], "+ "f8, "*8 + ")")
-def _calc_Iqxy_magnetic_helper(
-        Iq, qx, qy, x, y, rho, vol, M, cos_spin, sin_spin, cos_phi, sin_phi,
-        dd, du, ud, uu):
-    # Process each qx, qy
-    # Note: enumerating a pair is slower than direct indexing in numba
-
-    p_hat = np.array([sin_spin * cos_phi, sin_spin * sin_phi, cos_spin ])
-    #two unit vectors spanning up the plane perpendicular to polarisation for SF scattering
-    perpy_hat = np.array([-sin_phi, cos_phi, 0 ])
-    perpz_hat = np.array([-cos_spin * cos_phi, -cos_spin * sin_phi, sin_spin ])    
 
-    for k in range(len(qx)):
-        qxk, qyk = qx[k], qy[k]
+def _magnetic_intensity(qx, qy, FN, FM, cos_spin, sin_spin, cos_phi, sin_phi, dd, du, ud, uu):
+    """
+    Combine the nuclear amplitude *FN* and the magnetic amplitudes
+    *FM* = (F_mx, F_my, F_mz) into the spin weighted intensity.
 
-        if abs(qxk) > 1.e-16 or abs(qyk) > 1.e-16:
-            norm = 1/np.sqrt(qxk**2 + qyk**2)
-            q_hat = np.array([qxk, qyk, 0]) * norm
-        else:
-            # For homogeneously magnetised disc Mperp can be associated to the
-            # magnetsation corrected for demag factorfield q->0, i.e. M-Nij M
-            # with Nij the demagnetisation tensor (Belleggia JMMM 263, L1, 2003).
-            q_hat = np.sqrt(np.array([0.5, 0.5, 0]))
+    M_perp and its projections are linear in M so they can be applied to
+    the Fourier amplitudes rather than to each point.
+    """
+    p_hat = np.array([sin_spin * cos_phi, sin_spin * sin_phi, cos_spin])
+    perpy_hat = np.array([-sin_phi, cos_phi, 0])
+    perpz_hat = np.array([-cos_spin * cos_phi, -cos_spin * sin_phi, sin_spin])
+
+    # q = 0 uses the direction (1, 1, 0)/sqrt(2), see below
+    is_zero = (abs(qx) <= 1.e-16) & (abs(qy) <= 1.e-16)
+    norm = np.sqrt(qx**2 + qy**2)
+    norm[is_zero] = 1.
+    q_hat = np.array([qx/norm, qy/norm, np.zeros_like(qx)])
+    q_hat[:2, is_zero] = np.sqrt(0.5)
+
+    # For homogeneously magnetised disc Mperp can be associated to the
+    # magnetsation corrected for demag factorfield q->0, i.e. M-Nij M
+    # with Nij the demagnetisation tensor (Belleggia JMMM 263, L1, 2003).
+    M_perp = FM - q_hat * np.sum(q_hat * FM, axis=0)
+    perpx = p_hat @ M_perp
+    perpy = perpy_hat @ M_perp
+    perpz = perpz_hat @ M_perp
+
+    Iq = np.zeros(qx.shape, dtype='d')
+    if dd > 1e-10:
+        Iq += dd * abs(FN - perpx)**2
+    if uu > 1e-10:
+        Iq += uu * abs(FN + perpx)**2
+    if du > 1e-10:
+        Iq += du * abs(perpy - 1j * perpz)**2
+    if ud > 1e-10:
+        Iq += ud * abs(perpy + 1j * perpz)**2
+    return Iq
 
-        M_perp = orth(M, q_hat)
+# Oversampling ratio and half width (in grid points) of the Gaussian
+# interpolation kernel used by _calc_Iqxy_grid.  With these values the
+# interpolation error is ~1e-12 relative to sum |w|.
+FFT_OVERSAMPLE = 2
+FFT_SPREAD = 12
+# Largest padded FFT grid to consider [points].
+FFT_MAX_SIZE = 2**24
 
-        perpx = p_hat @ M_perp
-        # einsum is faster than sumsq in numpy but not supported in numba
-        #perpy = np.sqrt(np.einsum('ji,ji->i', M_perpP_perpQ, M_perpP_perpQ))
-        perpy = perpy_hat @ M_perp
-        perpz = perpz_hat @ M_perp
+def _regular_axis(v, rtol=1e-6):
+    """
+    Return *(index, start, step, n)* if the values *v* lie on an evenly
+    spaced set of positions, or None if they do not.
+    """
+    u = np.unique(v)
+    if len(u) == 1:
+        return np.zeros(len(v), dtype=np.intp), u[0], 1.0, 1
+    span = u[-1] - u[0]
+    diff = np.diff(u)
+    # ignore rounding noise when picking the step size
+    diff = diff[diff > rtol*span]
+    if len(diff) == 0:
+        return None
+    step = diff.min()
+    index = np.rint((v - u[0])/step)
+    if np.max(np.abs(u[0] + index*step - v)) > rtol*step:
+        return None
+    return index.astype(np.intp), u[0], step, int(index.max()) + 1
+
+def _fft_grid(npix, x, y, nchannels=1):
+    """
+    Check whether points (x, y) lie on a regular grid and whether the FFT
+    evaluation is expected to be cheaper than the direct sum over *npix*
+    detector pixels.  Returns the grid description for *_calc_Iqxy_grid*,
+    or None if the direct sum should be used.
+    """
+    npoints = len(x)
+    # Avoid the cost of detecting the grid for small problems.
+    if npoints < 2 or npix*npoints < 10**7:
+        return None
+    x_axis = _regular_axis(x)
+    if x_axis is None:
+        return None
+    y_axis = _regular_axis(y)
+    if y_axis is None:
+        return None
+    size = (max(FFT_OVERSAMPLE*x_axis[3], 2*FFT_SPREAD)
+            * max(FFT_OVERSAMPLE*y_axis[3], 2*FFT_SPREAD))
+    if size > FFT_MAX_SIZE:
+        return None
+    fft_cost = nchannels*(size*np.log2(size) + npix*(2*FFT_SPREAD)**2) + npoints
+    if 4*fft_cost > npix*npoints:
+        return None
+    return x_axis, y_axis
+
+def _gaussian_plan(k, n):
+    """
+    Plan the interpolation along one axis for *_calc_Iqxy_grid*.
 
-        ephase = vol * np.exp(1j * (qxk * x + qyk * y))
-        if dd > 1e-10:
-            Iq[k] += dd * abs(np.sum((rho - perpx) * ephase))**2
-        if uu > 1e-10:
-            Iq[k] += uu * abs(np.sum((rho + perpx) * ephase))**2
-        if du > 1e-10:
-            Iq[k] += du * abs(np.sum((perpy - 1j * perpz) * ephase))**2
-        if ud > 1e-10:
-            Iq[k] += ud * abs(np.sum((perpy + 1j * perpz) * ephase))**2
+    *k* is the phase step q*step for each pixel and *n* the number of grid
+    points.  Returns the deconvolution factors for grid index
+    -n//2 <= j < n - n//2, the padded size and the (index, weight) of the
+    fine grid points used for each pixel.
+    """
+    size = max(FFT_OVERSAMPLE*n, 2*FFT_SPREAD)
+    ratio = size/n
+    tau = np.pi*FFT_SPREAD/(n**2*ratio*(ratio - 0.5))
+    j = np.arange(n) - n//2
+    deconvolve = np.sqrt(np.pi/tau)*np.exp(j**2*tau)
+    # nearest fine grid points to each k in [0, 2 pi)
+    k = np.mod(k, 2*np.pi)
+    start = np.floor(k*size/(2*np.pi)).astype(np.intp) - FFT_SPREAD + 1
+    m = start[:, None] + np.arange(2*FFT_SPREAD)[None, :]
+    delta = k[:, None] - 2*np.pi*m/size
+    weight = np.exp(-delta**2/(4*tau))/size
+    return deconvolve, size, np.mod(m, size), weight
+
+def _calc_Iqxy_grid(qx, qy, weights, grid, chunk=1024):
+    """
+    Compute the Fourier amplitudes F(q) = sum w(r) e^(1j q.r) for points
+    on a regular grid.
+
+    *weights* is an (m, npoints) array of real weights and *grid* is from
+    *_fft_grid*.  Since qz is zero, the density is first projected along z
+    onto the (x, y) grid.  The 2D transform is computed by a zero padded
+    FFT and evaluated at each detector pixel with Gaussian interpolation
+    after deconvolution (a type 2 non-uniform FFT, Greengard and Lee,
+    SIAM Review 46, 443, 2004).  The sum over the grid is periodic in q
+    with period 2 pi/step so any q can be evaluated.
+    Returns an (m, npix) complex array.
+    """
+    (ix, x0, dx, nx), (iy, y0, dy, ny) = grid
+    nchannels = weights.shape[0]
+    # project along z onto the 2D grid
+    flat = ix*ny + iy
+    rho = np.array([np.bincount(flat, weights=w, minlength=nx*ny) for w in weights])
+    rho = rho.reshape(nchannels, nx, ny)
+
+    kx, ky = qx*dx, qy*dy
+    decon_x, size_x, mx, wx = _gaussian_plan(kx, nx)
+    decon_y, size_y, my, wy = _gaussian_plan(ky, ny)
+    # deconvolve and pad, with grid index j stored at j mod size
+    jx = np.mod(np.arange(nx) - nx//2, size_x)
+    jy = np.mod(np.arange(ny) - ny//2, size_y)
+    padded = np.zeros((nchannels, size_x, size_y), dtype='D')
+    padded[:, jx[:, None], jy[None, :]] = rho * (decon_x[:, None]*decon_y[None, :])
+    # h(k_m) = sum_j padded_j e^(1j j k_m) for k_m = 2 pi m / size
+    h = np.fft.ifft2(padded, axes=(1, 2)) * (size_x*size_y)
+
+    F = np.empty((nchannels, len(qx)), dtype='D')
+    for start in range(0, len(qx), chunk):
+        stop = start + chunk
+        local = h[:, mx[start:stop, :, None], my[start:stop, None, :]]
+        F[:, start:stop] = np.einsum('cpab,pa,pb->cp', local, wx[start:stop], wy[start:stop])
+    # shift the origin back from the grid centre to (0, 0)
+    xc = x0 + (nx//2)*dx
+    yc = y0 + (ny//2)*dy
+    return F * np.exp(1j*(qx*xc + qy*yc))
 
 def _get_normal_vec(geometry):
     """return array of normal vectors of elements
@@ -10,6 +10,8 @@ from __future__ import print_function
 import os
 import sys
 import logging
+import itertools
+from collections import OrderedDict
 
 import numpy as np
 from scipy.spatial.transform import Rotation
@@ -28,6 +30,13 @@ METER2ANG = 1.0E+10
 # Avogadro constant [1/mol]
 NA = 6.02214129e+23
 
+# Number of orientations for which the transformed data is kept.
+TRANSFORM_CACHE_SIZE = 4
+# Rotations with a smaller angle [rad] are treated as the identity.
+ROTATION_TOL = 1e-12
+# Number of lines the readers parse at a time.
+READ_CHUNK_LINES = 100000
+
 def _vec(v):
     return np.ascontiguousarray(v, 'd') if v is not None else None
 
@@ -45,6 +54,28 @@ def mag2sld(mag, v_unit=None):
         raise ValueError("Invalid magnetism unit %r" % v_unit)
     return factor * mag
 
+def _read_line_chunks(path, size=READ_CHUNK_LINES, raw=False):
+    """
+    Yield the decoded lines of a file, *size* lines at a time.
+    If *raw* then the lines are returned as bytes.
+    """
+    with open(path, 'rb') as input_f:
+        while True:
+            chunk = list(itertools.islice(input_f, size))
+            if not chunk:
+                return
+            yield chunk if raw else [decode(line) for line in chunk]
+
+def _read_values(lines, count, dtype='d'):
+    """
+    Read at least *count* whitespace separated values from the iterator
+    *lines* and return them as an array.
+    """
+    tokens = []
+    while len(tokens) < count:
+        tokens += next(lines).split()
+    return np.array(tokens).astype(dtype)
+
 def transform_center(pos_x, pos_y, pos_z):
     """
     re-center
@@ -94,6 +125,13 @@ class GenSAS(object):
         self.transformed_positions = None
         self.transformed_magnetic_slds = None
         self.transformed_angles = None
+        ## Transformed positions and magnetic SLDs for recent orientations
+        self._transform_cache = OrderedDict()
+        ## Summary of the coarse graining done by set_sld_data, if any
+        self.coarse_grain_info = None
+        ## Pair distance histograms for the binned 1D Debye sum, if set to a
+        ## DebyeHistogramCache; None uses the exact sum
+        self.histogram_cache = None
         self.description = 'GenSAS'
         ## Parameter details [units, min, max]
         self.details = {}
@@ -130,45 +168,93 @@ class GenSAS(object):
         self.transformed_magnetic_slds = None
         self.transformed_angles = None
     
+    def _cached_transform(self, name, transform):
+        """Return the transformed data *name* for the current orientation
+
+        Results are kept for the last TRANSFORM_CACHE_SIZE orientations, so
+        returning to a previous orientation does not redo the transformation.
+        """
+        key = tuple(np.round(self.xyz_to_UVW.as_quat(canonical=True), 12))
+        entry = self._transform_cache.get(key, None)
+        if entry is None:
+            entry = self._transform_cache[key] = {}
+            while len(self._transform_cache) > TRANSFORM_CACHE_SIZE:
+                self._transform_cache.popitem(last=False)
+        else:
+            self._transform_cache.move_to_end(key)
+        if name not in entry:
+            entry[name] = transform()
+        return entry[name]
+
     def transform_positions(self):
         """Transform position data"""
         if self.transformed_positions is not None:
             return self.transformed_positions
-        position_data = np.column_stack((self.data_x, self.data_y, self.data_z))
-        self.transformed_positions = np.transpose(self.xyz_to_UVW.apply(position_data))
+        def transform():
+            position_data = np.column_stack((self.data_x, self.data_y, self.data_z))
+            return np.transpose(self.xyz_to_UVW.apply(position_data))
+        self.transformed_positions = self._cached_transform('positions', transform)
         return self.transformed_positions
-    
+
+    def sample_magnetic_slds(self):
+        """Magnetic SLDs in sample coords with missing components set to zero"""
+        # MagSLD can have sld_m = None, although in practice usually a zero array
+        # if all are None can continue as normal, otherwise set None to array of zeroes to allow rotations
+        slds = (self.data_mx, self.data_my, self.data_mz)
+        if all(sld is None for sld in slds):
+            return None, None, None
+        data_len = next(len(sld) for sld in slds if sld is not None)
+        return [sld if sld is not None else np.zeros(data_len) for sld in slds]
+
     def transform_magnetic_slds(self):
         if self.transformed_magnetic_slds is not None:
             return self.transformed_magnetic_slds
-        if self.data_mx is None and self.data_my is None and self.data_mz is None:
+        sld_mx, sld_my, sld_mz = self.sample_magnetic_slds()
+        if sld_mx is None:
             return None, None, None
-        else:
-            if self.data_mx is not None:
-                data_len = len(self.data_mx)
-            elif self.data_mx is not None:
-                data_len = len(self.data_my)
-            else:
-                data_len = len(self.data_mz)
-            sld_mx, sld_my, sld_mz = [sld if sld is not None else np.zeros(data_len) for sld in (self.data_mx, self.data_my, self.data_mz)]
+        def transform():
             # apply transformation from sample coords to beamline coords
             magnetic_data = np.column_stack((sld_mx, sld_my, sld_mz))
-            self.transformed_magnetic_slds = np.transpose(self.xyz_to_UVW.apply(magnetic_data))
-            return self.transformed_magnetic_slds
+            return np.transpose(self.xyz_to_UVW.apply(magnetic_data))
+        self.transformed_magnetic_slds = self._cached_transform('magnetic', transform)
+        return self.transformed_magnetic_slds
+
+    def _Iqxy_inputs(self):
+        """Positions, magnetic SLDs and q rotation for the 2D calculation
+
+        Rotating the detector q into the sample frame costs O(nq) rather
+        than O(npoints), so unless the data are elements the sample coords
+        are returned along with the rotation, which is None if the sample
+        is not rotated.
+        """
+        if self.is_elements:
+            return (*self.transform_positions(), *self.transform_magnetic_slds(), None)
+        mx, my, mz = self.sample_magnetic_slds()
+        rotation = self.xyz_to_UVW if self.xyz_to_UVW.magnitude() > ROTATION_TOL else None
+        return self.data_x, self.data_y, self.data_z, mx, my, mz, rotation
     
     def transform_angles(self):
         if self.transformed_angles is not None:
             return self.transformed_angles
-        s_theta = np.radians(self.params['Up_theta'])
-        s_phi = np.radians(self.params['Up_phi'])
+        self.transformed_angles = self.beamline_angles(self.params['Up_theta'], self.params['Up_phi'])
+        return self.transformed_angles
+
+    def beamline_angles(self, theta, phi):
+        """Transform polarisation angles from environment to beamline coords
+
+        :Param theta: polarisation angle from the beam axis [deg]
+        :Param phi: polarisation azimuthal angle [deg]
+        :return: (theta, phi) in beamline coords [deg]
+        """
+        s_theta = np.radians(theta)
+        s_phi = np.radians(phi)
         p_hat = np.array([np.sin(s_theta) * np.cos(s_phi), np.sin(s_theta) * np.sin(s_phi), np.cos(s_theta)])
         p_hat = self.uvw_to_UVW.apply(p_hat)
         # remove floating point errors in rotation giving |value| > 1 with max and min
         s_theta = np.degrees(np.arccos(max( min( p_hat[2] , 1), -1)))
         # do not require special values for atan2 as numpy uses C standard values for cases such as (0,0)
         s_phi = np.degrees(np.arctan2(p_hat[1], p_hat[0]))
-        self.transformed_angles = (s_theta, s_phi)
-        return self.transformed_angles
+        return (s_theta, s_phi)
 
     def calculate_Iq(self, qx, qy=None):
         """
@@ -178,16 +264,12 @@ class GenSAS(object):
         :return: function value
         """
         from .geni import Iq, Iqxy
-        # transform position data from sample to beamline coords
-        x, y, z = self.transform_positions()
         sld = self.data_sldn - self.params['solvent_SLD']
         vol = self.data_vol
         if qy is not None and len(qy) > 0:
             # 2-D calculation
             qx, qy = _vec(qx), _vec(qy)
-            # MagSLD can have sld_m = None, although in practice usually a zero array
-            # if all are None can continue as normal, otherwise set None to array of zeroes to allow rotations
-            mx, my, mz = self.transform_magnetic_slds()
+            x, y, z, mx, my, mz, rotation = self._Iqxy_inputs()
             in_spin = self.params['Up_frac_in']
             out_spin = self.params['Up_frac_out']
             # transform angles from environment to beamline coords
@@ -202,19 +284,72 @@ class GenSAS(object):
                 I_out = Iqxy(
                     qx, qy, x, y, z, sld, vol, mx, my, mz,
                     in_spin, out_spin, s_theta, s_phi,
-                    )
+                    rotation=rotation)
         else:
             # 1-D calculation
             q = _vec(qx)
             if self.is_avg:
-                x, y, z = transform_center(x, y, z)
-            I_out = Iq(q, x, y, z, sld, vol, is_avg=self.is_avg)
+                # transform position data from sample to beamline coords
+                x, y, z = transform_center(*self.transform_positions())
+                I_out = Iq(q, x, y, z, sld, vol, is_avg=self.is_avg)
+            elif self.histogram_cache is not None:
+                I_out = self.calculate_Iq_histogram(q)
+            else:
+                # the Debye sum does not depend on the orientation
+                x, y, z = self.data_x, self.data_y, self.data_z
+                I_out = Iq(q, x, y, z, sld, vol, is_avg=self.is_avg)
+
+        vol_correction = self.data_total_volume / self.params['total_volume']
+        result = ((self.params['scale'] * vol_correction) * I_out
+                  + self.params['background'])
+        return result
+
+    def calculate_Iqxy_states(self, qx, qy, states):
+        """
+        Evaluate the 2D function for several polarisation states at once,
+        computing the nuclear and magnetic amplitudes only once.
+        :Param qx: array of qx-values
+        :Param qy: array of qy-values
+        :Param states: sequence of (Up_frac_in, Up_frac_out, Up_theta, Up_phi)
+            in environment coords, as in *params*
+        :return: array of function values with one row per state
+        """
+        from .geni import Iqxy_states
+        x, y, z, mx, my, mz, rotation = self._Iqxy_inputs()
+        sld = self.data_sldn - self.params['solvent_SLD']
+        vol = self.data_vol
+        qx, qy = _vec(qx), _vec(qy)
+        beam_states = [(in_spin, out_spin) + self.beamline_angles(theta, phi)
+                       for in_spin, out_spin, theta, phi in states]
+        elements = self.data_elements if self.is_elements else None
+        I_out = Iqxy_states(
+            qx, qy, x, y, z, sld, vol, mx, my, mz, beam_states,
+            elements, self.is_elements, rotation=rotation)
 
         vol_correction = self.data_total_volume / self.params['total_volume']
         result = ((self.params['scale'] * vol_correction) * I_out
                   + self.params['background'])
         return result
 
+    def calculate_Iq_histogram(self, q):
+        """
+        Evaluate the 1D Debye sum from the cached pair distance histograms.
+
+        The histograms only depend on the positions, nuclear SLD and volumes,
+        so they are reused when q or the solvent SLD change.  The orientation
+        does not enter the 1D calculation, so the untransformed positions
+        are used as the key.
+        :Param q: array of q-values
+        :return: I(q) without scale and background
+        """
+        vol = np.broadcast_to(np.asarray(self.data_vol, 'd'), self.data_sldn.shape)
+        coords = np.vstack((self.data_x, self.data_y, self.data_z))
+        histograms = self.histogram_cache.get(coords, self.data_sldn, vol)
+        solvent_sld = self.params['solvent_SLD']
+        I_out = histograms.Iq(q, solvent_sld)
+        # match geni.Iq which ignores points with no contrast
+        return I_out * (1.0E+8/np.sum(vol[self.data_sldn != solvent_sld]))
+
     def set_rotations(self, uvw_to_UVW=Rotation.from_rotvec([0,0,0]), xyz_to_UVW=Rotation.from_rotvec([0,0,0])):
         """Set the rotations for the coordinate systems
 
@@ -227,11 +362,21 @@ class GenSAS(object):
         self.reset_transformations()
 
     # TODO: rename set_sld_data() since it does more than set sld
-    def set_sld_data(self, sld_data=None):
+    def set_sld_data(self, sld_data=None, qmax=None, tol=None):
         """
         Sets sld_data
+
+        If *qmax* [1/A] is given then point data is merged into octree cells
+        for the calculation, keeping the estimated relative error in I(qmax)
+        below *tol*.  See :func:`coarse_grain.coarse_grain`; the reduction
+        achieved is reported in *coarse_grain_info*.
         """
         self.sld_data = sld_data
+        self.coarse_grain_info = None
+        if qmax is not None and not sld_data.is_elements:
+            from .coarse_grain import coarse_grain, DEFAULT_TOLERANCE
+            sld_data, self.coarse_grain_info = coarse_grain(
+                sld_data, qmax, DEFAULT_TOLERANCE if tol is None else tol)
         self.is_elements = sld_data.is_elements
         if self.is_elements:
             self.data_elements = sld_data.elements
@@ -246,6 +391,7 @@ class GenSAS(object):
         self.data_vol = _vec(sld_data.vol_pix)
         self.data_total_volume = np.sum(sld_data.vol_pix)
         self.params['total_volume'] = self.data_total_volume
+        self._transform_cache.clear()
         self.reset_transformations()
 
     def getProfile(self):
@@ -506,6 +652,8 @@ class VTKReader:
     type = ["vtk files (*.VTK, *.vtk)|*.vtk"]
     ## List of allowed extensions
     ext = ['.vtk', '.VTK']
+    ## Cache of parsed files (an SLDFileCache); None to parse every read
+    cache = None
 
     def read(self, path):
         """This function reads in a vtk file
@@ -515,6 +663,11 @@ class VTKReader:
         :return: A MagSLD instance containing the loaded data or None if loading failed
         :rtype: MagSLD or None
         """
+        if self.cache is None:
+            return self._read(path)
+        return self.cache.read(path, self._read, self.type_name)
+
+    def _read(self, path):
         try:
             #load in the file
             # for standard see https://vtk.org/wp-content/uploads/2015/04/file-formats.pdf
@@ -573,11 +726,7 @@ class VTKReader:
         num_points = int(point_data[1])
         # ignore datatype  - all can be read as float in python
         # cannot read in with np as data not guaranteed to be on a grid with new lines after each point - although this is standard
-        points = []
-        while len(points) < 3*num_points:
-            #casting to int and float can handle whitespace - shouldn't need to strip()
-            points += [float(item) for item in next(lines).split()]
-        points = np.array(points).reshape((num_points, 3))
+        points = _read_values(lines, 3*num_points).reshape((num_points, 3))
         pos_x, pos_y, pos_z = np.hsplit(points, 3)
         # read in the element data
         element_data = next(lines).split()
@@ -587,9 +736,7 @@ class VTKReader:
         len_elements = int(element_data[2])
         # must load and store carfeully: filetype does not guarantee that elements are line by line
         # or all of the same type, cannot immediately cast to np array as cannot support potential jagged arrays
-        elements_raw = []
-        while len(elements_raw) < len_elements:
-            elements_raw += [int(item) for item in next(lines).split()]
+        elements_raw = _read_values(lines, len_elements, int).tolist()
         # convert element data from a list of integers into a list of lists of element vertices 
         elements_sorted = []
         elements_sizes = []
@@ -612,9 +759,7 @@ class VTKReader:
         if num_element_types != num_elements:
             logging.error("error while reading cell types - specified number is inconsistent with cells")
             return None
-        element_types = []
-        while len(element_types) < num_element_types:
-            element_types += [int(item) for item in next(lines).split()]
+        element_types = _read_values(lines, num_element_types, int).tolist()
         # rewrite elements as list of faces with vertices
         # elements has form elements x faces x vertex_indices
         elements = [self.get_faces(elements_sorted[i], element_types[i]) for i in range(num_elements)]
@@ -792,9 +937,9 @@ class VTKReader:
             else:
                 logging.error("Data type " + nextLineSplit[0].strip() + " is not currently accepted")
                 return None, None
-            while len(attribute) < size*components:
-                #casting to int and float can handle whitespace - shouldn't need to strip()
-                attribute += [float(item) for item in next(lines).split()]
+            remaining = size*components - len(attribute)
+            if remaining > 0:
+                attribute = np.concatenate((attribute, _read_values(lines, remaining)))
             attribute = np.reshape(np.array(attribute), (size, components))
             data.append([attribute, dataName, components])
     
@@ -1022,6 +1167,8 @@ class OMFReader(object):
     type = ["OMF files (*.OMF, *.omf)|*.omf"]
     ## List of allowed extensions
     ext = ['.omf', '.OMF']
+    ## Cache of parsed files (an SLDFileCache); None to parse every read
+    cache = None
 
     def read(self, path):
         """
@@ -1029,125 +1176,114 @@ class OMFReader(object):
         :param path: file path
         :return: x, y, z, sld_n, sld_mx, sld_my, sld_mz
         """
+        if self.cache is None:
+            return self._read(path)
+        return self.cache.read(path, self._read, self.type_name)
+
+    def _read(self, path):
         desc = ""
-        mx = []
-        my = []
-        mz = []
+        blocks = []
         try:
-            input_f = open(path, 'rb')
-            buff = decode(input_f.read())
-            lines = buff.split('\n')
-            input_f.close()
             output = OMFData()
             valueunit = None
-            for line in lines:
-                line = line.strip()
-                # Read data
-                if line and not line.startswith('#'):
-                    try:
-                        toks = line.split()
-                        _mx = float(toks[0])
-                        _my = float(toks[1])
-                        _mz = float(toks[2])
-                        _mx = mag2sld(_mx, valueunit)
-                        _my = mag2sld(_my, valueunit)
-                        _mz = mag2sld(_mz, valueunit)
-                        mx.append(_mx)
-                        my.append(_my)
-                        mz.append(_mz)
-                    except Exception as exc:
-                        # Skip non-data lines
-                        logging.error(str(exc)+" when processing %r"%line)
-                elif line:
-                # Reading Header; Segment count ignored
-                    s_line = line.split(":", 1)
-                    if s_line[0].lower().count("oommf") > 0:
-                        if len(s_line) < 2: s_line = line.split(" ",1)
-                        oommf = s_line[1].strip()                               
-
-                    if s_line[0].lower().count("title") > 0:
-                        title = s_line[1].strip()
-                    if s_line[0].lower().count("desc") > 0:
-                        desc += s_line[1].strip()
-                        desc += '\n'
-                    if s_line[0].lower().count("meshtype") > 0:
-                        meshtype = s_line[1].strip()
-                    if s_line[0].lower().count("meshunit") > 0:
-                        meshunit = s_line[1].strip()
-                        if meshunit.count("m") < 1:
-                            msg = "Error: \n"
-                            msg += "We accept only m as meshunit"
-                            logging.error(msg)
-                            return None
-                    if s_line[0].lower().count("xbase") > 0:
-                        xbase = s_line[1].strip()
-                    if s_line[0].lower().count("ybase") > 0:
-                        ybase = s_line[1].strip()
-                    if s_line[0].lower().count("zbase") > 0:
-                        zbase = s_line[1].strip()
-                    if s_line[0].lower().count("xstepsize") > 0:
-                        xstepsize = s_line[1].strip() 
-                    if s_line[0].lower().count("ystepsize") > 0:
-                        ystepsize = s_line[1].strip()   
-                    if s_line[0].lower().count("zstepsize") > 0:
-                        zstepsize = s_line[1].strip()
-                    if s_line[0].lower().count("xnodes") > 0:
-                        xnodes = s_line[1].strip()   
-                    if s_line[0].lower().count("ynodes") > 0:
-                        ynodes = s_line[1].strip()
-                    if s_line[0].lower().count("znodes") > 0:
-                        znodes = s_line[1].strip()  
-                    if s_line[0].lower().count("xmin") > 0:
-                        xmin = s_line[1].strip()
-                    if s_line[0].lower().count("ymin") > 0:
-                        ymin = s_line[1].strip()
-                    if s_line[0].lower().count("zmin") > 0:
-                        zmin = s_line[1].strip()
-                    if s_line[0].lower().count("xmax") > 0:
-                        xmax = s_line[1].strip()
-                    if s_line[0].lower().count("ymax") > 0:
-                        ymax = s_line[1].strip()
-                    if s_line[0].lower().count("zmax") > 0:
-                        zmax = s_line[1].strip()
-                    if s_line[0].lower().count("valueunit") > 0:
-                        valueunit = s_line[1].strip()
-                        if valueunit.count("mT") < 1 and valueunit.count("A/m") < 1: 
-                            msg = "Error: \n"
-                            msg += "We accept only mT or A/m as valueunit"
-                            logging.error(msg)    
-                            return None
-                        elif "mT" in valueunit or "A/m" in valueunit:    
-                            valueunit = valueunit.split(" ", 1)
-                            valueunit = valueunit[0].strip()
-                    if s_line[0].lower().count("valuemultiplier") > 0:
-                        valuemultiplier = s_line[1].strip()
-                    else: 
-                        valuemultiplier = 1
-                    if s_line[0].lower().count("end") > 0:
-                        output.filename = os.path.basename(path)
-                        output.oommf = oommf
-                        output.title = title
-                        output.desc = desc
-                        output.meshtype = meshtype
-                        output.xbase = float(xbase) * METER2ANG
-                        output.ybase = float(ybase) * METER2ANG
-                        output.zbase = float(zbase) * METER2ANG
-                        output.xstepsize = float(xstepsize) * METER2ANG
-                        output.ystepsize = float(ystepsize) * METER2ANG
-                        output.zstepsize = float(zstepsize) * METER2ANG
-                        output.xnodes = float(xnodes)
-                        output.ynodes = float(ynodes)
-                        output.znodes = float(znodes)
-                        output.xmin = float(xmin) * METER2ANG
-                        output.ymin = float(ymin) * METER2ANG
-                        output.zmin = float(zmin) * METER2ANG
-                        output.xmax = float(xmax) * METER2ANG
-                        output.ymax = float(ymax) * METER2ANG
-                        output.zmax = float(zmax) * METER2ANG
-                        output.valuemultiplier = valuemultiplier
-            mx = np.reshape(mx, (len(mx),))
-            my = np.reshape(my, (len(my),))
-            mz = np.reshape(mz, (len(mz),))
+            for chunk in _read_line_chunks(path):
+                data_lines = []
+                for line in chunk:
+                    line = line.strip()
+                    # Read data
+                    if line and not line.startswith('#'):
+                        data_lines.append(line)
+                    elif line:
+                    # Reading Header; Segment count ignored
+                        s_line = line.split(":", 1)
+                        if s_line[0].lower().count("oommf") > 0:
+                            if len(s_line) < 2: s_line = line.split(" ",1)
+                            oommf = s_line[1].strip()                               
+
+                        if s_line[0].lower().count("title") > 0:
+                            title = s_line[1].strip()
+                        if s_line[0].lower().count("desc") > 0:
+                            desc += s_line[1].strip()
+                            desc += '\n'
+                        if s_line[0].lower().count("meshtype") > 0:
+                            meshtype = s_line[1].strip()
+                        if s_line[0].lower().count("meshunit") > 0:
+                            meshunit = s_line[1].strip()
+                            if meshunit.count("m") < 1:
+                                msg = "Error: \n"
+                                msg += "We accept only m as meshunit"
+                                logging.error(msg)
+                                return None
+                        if s_line[0].lower().count("xbase") > 0:
+                            xbase = s_line[1].strip()
+                        if s_line[0].lower().count("ybase") > 0:
+                            ybase = s_line[1].strip()
+                        if s_line[0].lower().count("zbase") > 0:
+                            zbase = s_line[1].strip()
+                        if s_line[0].lower().count("xstepsize") > 0:
+                            xstepsize = s_line[1].strip() 
+                        if s_line[0].lower().count("ystepsize") > 0:
+                            ystepsize = s_line[1].strip()   
+                        if s_line[0].lower().count("zstepsize") > 0:
+                            zstepsize = s_line[1].strip()
+                        if s_line[0].lower().count("xnodes") > 0:
+                            xnodes = s_line[1].strip()   
+                        if s_line[0].lower().count("ynodes") > 0:
+                            ynodes = s_line[1].strip()
+                        if s_line[0].lower().count("znodes") > 0:
+                            znodes = s_line[1].strip()  
+                        if s_line[0].lower().count("xmin") > 0:
+                            xmin = s_line[1].strip()
+                        if s_line[0].lower().count("ymin") > 0:
+                            ymin = s_line[1].strip()
+                        if s_line[0].lower().count("zmin") > 0:
+                            zmin = s_line[1].strip()
+                        if s_line[0].lower().count("xmax") > 0:
+                            xmax = s_line[1].strip()
+                        if s_line[0].lower().count("ymax") > 0:
+                            ymax = s_line[1].strip()
+                        if s_line[0].lower().count("zmax") > 0:
+                            zmax = s_line[1].strip()
+                        if s_line[0].lower().count("valueunit") > 0:
+                            valueunit = s_line[1].strip()
+                            if valueunit.count("mT") < 1 and valueunit.count("A/m") < 1: 
+                                msg = "Error: \n"
+                                msg += "We accept only mT or A/m as valueunit"
+                                logging.error(msg)    
+                                return None
+                            elif "mT" in valueunit or "A/m" in valueunit:    
+                                valueunit = valueunit.split(" ", 1)
+                                valueunit = valueunit[0].strip()
+                        if s_line[0].lower().count("valuemultiplier") > 0:
+                            valuemultiplier = s_line[1].strip()
+                        else: 
+                            valuemultiplier = 1
+                        if s_line[0].lower().count("end") > 0:
+                            output.filename = os.path.basename(path)
+                            output.oommf = oommf
+                            output.title = title
+                            output.desc = desc
+                            output.meshtype = meshtype
+                            output.xbase = float(xbase) * METER2ANG
+                            output.ybase = float(ybase) * METER2ANG
+                            output.zbase = float(zbase) * METER2ANG
+                            output.xstepsize = float(xstepsize) * METER2ANG
+                            output.ystepsize = float(ystepsize) * METER2ANG
+                            output.zstepsize = float(zstepsize) * METER2ANG
+                            output.xnodes = float(xnodes)
+                            output.ynodes = float(ynodes)
+                            output.znodes = float(znodes)
+                            output.xmin = float(xmin) * METER2ANG
+                            output.ymin = float(ymin) * METER2ANG
+                            output.zmin = float(zmin) * METER2ANG
+                            output.xmax = float(xmax) * METER2ANG
+                            output.ymax = float(ymax) * METER2ANG
+                            output.zmax = float(zmax) * METER2ANG
+                            output.valuemultiplier = valuemultiplier
+                if data_lines:
+                    blocks.append(self._parse_data(data_lines, valueunit))
+            m = np.concatenate(blocks) if blocks else np.empty((0, 3))
+            mx, my, mz = (np.ascontiguousarray(v) for v in m.T)
             output.set_m(mx, my, mz)
             omf2sld = OMF2SLD()
             omf2sld.set_data(output)
@@ -1159,6 +1295,29 @@ class OMFReader(object):
             logging.warning(msg)
             return None
 
+    def _parse_data(self, lines, valueunit):
+        """
+        Convert a block of data lines to magnetic SLDs as an (n, 3) array.
+        Lines which are not data are skipped.
+        """
+        try:
+            values = np.loadtxt(lines, usecols=(0, 1, 2), ndmin=2)
+        except ValueError:
+            # find and skip the bad lines
+            values = []
+            for line in lines:
+                try:
+                    toks = line.split()
+                    values.append([float(toks[0]), float(toks[1]), float(toks[2])])
+                except Exception as exc:
+                    logging.error(str(exc)+" when processing %r"%line)
+            values = np.reshape(values, (-1, 3))
+        try:
+            return mag2sld(values, valueunit)
+        except ValueError as exc:
+            logging.error(str(exc)+" when processing data")
+            return np.empty((0, 3))
+
 class PDBReader(object):
     """
     PDB reader class: limited for reading the lines starting with 'ATOM'
@@ -1171,6 +1330,8 @@ class PDBReader(object):
     type = ["pdb files (*.PDB, *.pdb)|*.pdb"]
     ## List of allowed extensions
     ext = ['.pdb', '.PDB']
+    ## Cache of parsed files (an SLDFileCache); None to parse every read
+    cache = None
 
     def read(self, path):
         """
@@ -1180,106 +1341,57 @@ class PDBReader(object):
         :return: MagSLD
         :raise RuntimeError: when the file can't be opened
         """
-        pos_x = []
-        pos_y = []
-        pos_z = []
-        sld_n = []
-        sld_mx = []
-        sld_my = []
-        sld_mz = []
-        vol_pix = []
-        pix_symbol = []
-        connected_pairs = set()
+        if self.cache is None:
+            return self._read(path)
+        return self.cache.read(path, self._read, self.type_name)
 
-        atom_value_dict = {}
+    def _read(self, path):
+        pos_blocks = []
+        symbol_blocks = []
+        connected_pairs = set()
 
         try:
-            input_f = open(path, 'rb')
-            buff = decode(input_f.read())
-            lines = buff.split('\n')
-            input_f.close()
-            num = 0
-            for line in lines:
-                try:
+            for chunk in _read_line_chunks(path, raw=True):
+                atom_lines = []
+                for line in chunk:
                     # check if line starts with "ATOM"
-                    if line[0:6] in ('ATM   ', 'ATOM  '):
-                        # define fields of interest
-                        atom_name = line[12:16].strip()
-                        try:
-                            float(line[12])
-                            atom_name = atom_name[1].upper()
-                        except Exception:
-                            if len(atom_name) == 4:
-                                atom_name = atom_name[0].upper()
-                            elif line[12] != ' ':
-                                atom_name = atom_name[0].upper() + \
-                                        atom_name[1].lower()
-                            else:
-                                atom_name = atom_name[0].upper()
-                        _pos_x = float(line[30:38].strip())
-                        _pos_y = float(line[38:46].strip())
-                        _pos_z = float(line[46:54].strip())
-                        pos_x.append(_pos_x)
-                        pos_y.append(_pos_y)
-                        pos_z.append(_pos_z)
+                    if line[0:6] in (b'ATM   ', b'ATOM  '):
+                        atom_lines.append(line)
+                    elif line[0:6] == b'CONECT':
+                        line = decode(line).rstrip('\n')
                         try:
-                            if atom_name in atom_value_dict:
-                                sld_n.append(atom_value_dict[atom_name][0])
-                                vol_pix.append(atom_value_dict[atom_name][1])
-                            else:
-                                val = nsf.neutron_sld(atom_name)[0]
-                                # sld in Ang^-2 unit
-                                val *= 1.0e-6
-                                sld_n.append(val)
-                                atom = formula(atom_name)
-                                # # cm to A units
-                                vol = 1.0e+24 * atom.mass / atom.density / NA
-                                vol_pix.append(vol)
-                                atom_value_dict[atom_name] = [val, vol]
-
-                        except Exception:
-                            self.logger.warning("Warning: set the sld of %s to zero"% atom_name)
-                            sld_n.append(0.0)
-
-                        sld_mx.append(0)
-                        sld_my.append(0)
-                        sld_mz.append(0)
-                        pix_symbol.append(atom_name)
-
-                    elif line[0:6] == 'CONECT':
-                        # Interpret the bonding section of the PDB
-
-                        # split remainder of line into 5 character sections
-                        rest = line[6:]
-                        parts = [rest[i:i+5] for i in range(0, len(rest), 5)]
-
-                        # Convert to indices
-                        bonded_indices = []
-                        for part in parts:
-
-                            try:
-                                index = int(part) - 1
-                                bonded_indices.append(index)
-
-                            except ValueError as ve:
-                                pass
-
-                        # Store pairs in canonical order
-                        a = bonded_indices[0]
-                        for b in bonded_indices[1:]:
-                            if a > b:
-                                a, b = b, a
-                            connected_pairs.add((a, b))
-
-                except Exception as exc:
-                    self.logger.error(f"Failed to read line: {line}")
-                    self.logger.exception(exc)
-
-            # Reshape stuff for file
-
-            pos_x = np.reshape(pos_x, (-1, ))
-            pos_y = np.reshape(pos_y, (-1, ))
-            pos_z = np.reshape(pos_z, (-1, ))
+                            self._read_conect(line, connected_pairs)
+                        except Exception as exc:
+                            self.logger.error(f"Failed to read line: {line}")
+                            self.logger.exception(exc)
+                if atom_lines:
+                    pos, symbols = self._read_atoms(atom_lines)
+                    pos_blocks.append(pos)
+                    symbol_blocks.append(symbols)
+
+            pos = np.concatenate(pos_blocks) if pos_blocks else np.empty((0, 3))
+            pix_symbol = (np.concatenate(symbol_blocks) if symbol_blocks
+                          else np.empty(0, dtype='U2'))
+            pos_x, pos_y, pos_z = (np.ascontiguousarray(v) for v in pos.T)
+
+            # look up the sld and volume once for each element
+            names, index = np.unique(pix_symbol, return_inverse=True)
+            values = []
+            for atom_name in names:
+                try:
+                    val = nsf.neutron_sld(atom_name)[0]
+                    # sld in Ang^-2 unit
+                    val *= 1.0e-6
+                    atom = formula(atom_name)
+                    # # cm to A units
+                    vol = 1.0e+24 * atom.mass / atom.density / NA
+                    values.append([val, vol])
+                except Exception:
+                    self.logger.warning("Warning: set the sld of %s to zero"% atom_name)
+                    values.append([0.0, 0.0])
+            values = np.reshape(values, (-1, 2))
+            sld_n = np.ascontiguousarray(values[index.ravel(), 0])
+            vol_pix = np.ascontiguousarray(values[index.ravel(), 1])
 
             n_atoms = len(pos_x)
             ordered_pairs = sorted([(a, b) for a, b in connected_pairs if a < n_atoms and b < n_atoms])  # Why *not* sort
@@ -1287,14 +1399,9 @@ class PDBReader(object):
             y_lines = [(pos_y[a], pos_y[b]) for a, b in ordered_pairs]
             z_lines = [(pos_z[a], pos_z[b]) for a, b in ordered_pairs]
 
-            sld_n = np.reshape(sld_n, (-1, ))
-
-            sld_mx = np.reshape(sld_mx, (-1, ))
-            sld_my = np.reshape(sld_my, (-1, ))
-            sld_mz = np.reshape(sld_mz, (-1, ))
-
-            vol_pix = np.reshape(vol_pix, (-1, ))
-            pix_symbol = np.reshape(pix_symbol, (-1, ))
+            sld_mx = np.zeros(n_atoms)
+            sld_my = np.zeros(n_atoms)
+            sld_mz = np.zeros(n_atoms)
 
             output = MagSLD(pos_x, pos_y, pos_z, sld_n, sld_mx, sld_my, sld_mz)
             output.set_conect_lines(x_lines, y_lines, z_lines)
@@ -1310,6 +1417,86 @@ class PDBReader(object):
             self.logger.exception(e)
             return None
 
+    def _read_atoms(self, lines):
+        """
+        Return the positions as an (n, 3) array and the element symbols
+        for a block of ATOM records given as bytes.  Records which can't be
+        read are skipped.
+        """
+        try:
+            # fixed width records, so parse the columns of a byte array
+            records = np.array(lines, dtype='S80').view(np.uint8).reshape(len(lines), 80)
+            pos = np.ascontiguousarray(records[:, 30:54]).view('S8').astype('d')
+            # the element only depends on the atom name field
+            fields, index = np.unique(
+                np.ascontiguousarray(records[:, 12:16]).view('S4'), return_inverse=True)
+            names = [self._atom_name(decode(field).ljust(4)) for field in fields]
+            return pos, np.array(names)[index.ravel()]
+        except Exception:
+            pass
+        # find and skip the bad lines
+        pos, symbols = [], []
+        for line in lines:
+            line = decode(line)
+            try:
+                atom_name = self._atom_name(line[12:16])
+                pos.append((float(line[30:38].strip()),
+                            float(line[38:46].strip()),
+                            float(line[46:54].strip())))
+                symbols.append(atom_name)
+            except Exception as exc:
+                self.logger.error(f"Failed to read line: {line}")
+                self.logger.exception(exc)
+        return np.reshape(pos, (-1, 3)), np.array(symbols, dtype='U2')
+
+    @staticmethod
+    def _atom_name(field):
+        """
+        Element symbol from the atom name field (columns 13-16) of an ATOM record.
+        """
+        atom_name = field.strip()
+        try:
+            float(field[0])
+            atom_name = atom_name[1].upper()
+        except Exception:
+            if len(atom_name) == 4:
+                atom_name = atom_name[0].upper()
+            elif field[0] != ' ':
+                atom_name = atom_name[0].upper() + \
+                        atom_name[1].lower()
+            else:
+                atom_name = atom_name[0].upper()
+        return atom_name
+
+    @staticmethod
+    def _read_conect(line, connected_pairs):
+        """
+        Add the bonds from a CONECT record to *connected_pairs*.
+        """
+        # Interpret the bonding section of the PDB
+
+        # split remainder of line into 5 character sections
+        rest = line[6:]
+        parts = [rest[i:i+5] for i in range(0, len(rest), 5)]
+
+        # Convert to indices
+        bonded_indices = []
+        for part in parts:
+
+            try:
+                index = int(part) - 1
+                bonded_indices.append(index)
+
+            except ValueError as ve:
+                pass
+
+        # Store pairs in canonical order
+        a = bonded_indices[0]
+        for b in bonded_indices[1:]:
+            if a > b:
+                a, b = b, a
+            connected_pairs.add((a, b))
+
     def write(self, path, data):
         """
         Write
@@ -1338,6 +1525,8 @@ class SLDReader(object):
             "all files (*.*)|*.*"]
     ## List of allowed extensions
     ext = ['.sld', '.SLD', '.txt', '.TXT', '.*']
+    ## Cache of parsed files (an SLDFileCache); None to parse every read
+    cache = None
 
     def read(self, path):
         """
@@ -1346,6 +1535,11 @@ class SLDReader(object):
         :return MagSLD: x, y, z, sld_n, sld_mx, sld_my, sld_mz
         :raise RuntimeError: when the file can't be loaded
         """
+        if self.cache is None:
+            return self._read(path)
+        return self.cache.read(path, self._read, self.type_name)
+
+    def _read(self, path):
         try:
             data = np.loadtxt(path, dtype='float', skiprows=1,
                               ndmin=1, unpack=True)
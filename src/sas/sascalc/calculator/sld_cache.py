@@ -0,0 +1,236 @@
+"""
+Binary cache of coordinate files parsed by the sas_gen readers.
+
+Parsing a large PDB, OMF, SLD or VTK text file takes far longer than reading
+the resulting arrays back, so the :class:`MagSLD` produced by a reader is
+stored as an uncompressed .npz file.  The cache entry records the modification
+time and size of the source file and is ignored once the source changes.
+The cache directory is kept below a total size by removing the least recently
+used entries when a new one is written.
+
+The members of an uncompressed .npz are plain .npy files inside the zip
+archive, so they are memory-mapped directly rather than read into memory.
+The maps are copy-on-write, so the arrays can still be modified in memory
+without changing the cache.
+"""
+import os
+import json
+import hashlib
+import logging
+import zipfile
+
+import numpy as np
+
+from sas.sascalc.data_util.npy_mmap import map_npy_member
+
+# Bump when the layout of the cached arrays changes.
+CACHE_VERSION = 1
+CACHE_DIR_NAME = "sld_cache"
+# Files smaller than this [bytes] parse quickly and are not cached.
+DEFAULT_MIN_SIZE = 2**20
+# Total size [bytes] of the cache directory above which old entries are removed.
+DEFAULT_MAX_BYTES = 2**30
+
+# Array attributes of MagSLD, stored when not None.
+_ARRAYS = ('pos_x', 'pos_y', 'pos_z', 'sld_n', 'sld_mx', 'sld_my', 'sld_mz',
+           'vol_pix', 'pix_symbol')
+# Scalar attributes of MagSLD, stored in the json metadata.
+_SCALARS = ('filename', 'pos_unit', 'sld_unit', 'pix_type', 'is_data',
+            'is_elements', 'are_elements_array', 'has_stepsize', 'has_conect',
+            'xstepsize', 'ystepsize', 'zstepsize', 'xnodes', 'ynodes', 'znodes',
+            'data_length')
+# Bond lines from the PDB CONECT records.
+_LINES = ('line_x', 'line_y', 'line_z')
+
+
+class SLDFileCache(object):
+    """
+    Cache of parsed coordinate files.
+
+    *min_size* is the smallest source file [bytes] that is cached.
+    *max_bytes* is the total size [bytes] of the cached files above which
+    the least recently used entries are removed.
+    *cache_dir* is the cache directory, by default a directory in the user
+    directory.
+    """
+    def __init__(self, min_size=DEFAULT_MIN_SIZE, max_bytes=DEFAULT_MAX_BYTES,
+                 cache_dir=None):
+        self.min_size = min_size
+        self.max_bytes = max_bytes
+        self._cache_dir = cache_dir
+
+    def cache_dir(self):
+        """
+        Directory holding the cached files.
+        """
+        if self._cache_dir is None:
+            from sas.system.user import get_user_dir
+            self._cache_dir = os.path.join(get_user_dir(), CACHE_DIR_NAME)
+        return self._cache_dir
+
+    def read(self, path, reader, kind):
+        """
+        Return the :class:`MagSLD` for *path*, using the cache if it is current.
+
+        *reader* parses the file, returning a MagSLD or None on failure.
+        *kind* names the reader so that different readers of the same file
+        do not share an entry.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return reader(path)
+        if stat.st_size < self.min_size:
+            return reader(path)
+        source = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        cache_path = self._path(kind, source[0])
+        data = self._load(cache_path, source)
+        if data is None:
+            data = reader(path)
+            if data is not None:
+                self._save(cache_path, source, data)
+        return data
+
+    def _path(self, kind, source_path):
+        digest = hashlib.sha1((kind + '\n' + source_path).encode('utf-8'))
+        return os.path.join(self.cache_dir(), digest.hexdigest() + ".npz")
+
+    def _load(self, cache_path, source):
+        if not os.path.exists(cache_path):
+            return None
+        try:
+            arrays = load_npz_mmap(cache_path)
+            meta = json.loads(str(arrays.pop('meta')))
+            if (meta['version'] != CACHE_VERSION
+                    or tuple(meta['source']) != source):
+                return None
+            data = _arrays_to_magsld(arrays, meta['attrs'])
+        except Exception as exc:
+            logging.warning(f"Could not read SLD cache {cache_path}: {exc}")
+            return None
+        # the modification time orders the entries for pruning
+        try:
+            os.utime(cache_path)
+        except OSError:
+            pass
+        return data
+
+    def _save(self, cache_path, source, data):
+        stored = _magsld_to_arrays(data)
+        if stored is None:
+            return
+        arrays, attrs = stored
+        meta = {'version': CACHE_VERSION, 'source': source, 'attrs': attrs}
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            # write to a temporary file so a partial entry is never read
+            tmp_path = cache_path + ".tmp.npz"
+            np.savez(tmp_path, meta=np.array(json.dumps(meta)), **arrays)
+            os.replace(tmp_path, cache_path)
+        except OSError as exc:
+            logging.warning(f"Could not write SLD cache {cache_path}: {exc}")
+            return
+        self._prune(keep=cache_path)
+
+    def _prune(self, keep):
+        """
+        Remove the least recently used entries until the cache fits in
+        *max_bytes*.  The entry *keep*, which was just written, is never removed.
+        """
+        entries = []
+        total = 0
+        try:
+            with os.scandir(self.cache_dir()) as it:
+                for item in it:
+                    if not item.name.endswith(".npz") or item.path == keep:
+                        continue
+                    try:
+                        stat = item.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime_ns, stat.st_size, item.path))
+                    total += stat.st_size
+            total += os.path.getsize(keep)
+        except OSError as exc:
+            logging.warning(f"Could not prune SLD cache {self.cache_dir()}: {exc}")
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+
+def load_npz_mmap(path):
+    """
+    Memory-map the members of an uncompressed .npz file.
+
+    Returns a dict of arrays.  Compressed members and empty or 0-d arrays
+    are read into memory instead.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as fid:
+        for info in archive.infolist():
+            name = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+            array = map_npy_member(path, info, fid)
+            if array is None:
+                with archive.open(info) as member:
+                    array = np.lib.format.read_array(member, allow_pickle=False)
+            arrays[name] = array
+    return arrays
+
+
+def _magsld_to_arrays(data):
+    """
+    Split a MagSLD into arrays and json metadata, or None if it can't be stored.
+    """
+    arrays = {}
+    for name in _ARRAYS:
+        value = getattr(data, name, None)
+        if value is not None:
+            value = np.asarray(value)
+            if value.dtype.hasobject:
+                return None
+            arrays[name] = value
+    if data.has_conect:
+        for name in _LINES:
+            arrays[name] = np.asarray(getattr(data, name), dtype='d').reshape(-1, 2)
+    if data.is_elements:
+        # jagged elements are lists of lists, which are not cached
+        if not data.are_elements_array:
+            return None
+        arrays['elements'] = np.asarray(data.elements)
+    attrs = {}
+    for name in _SCALARS:
+        value = getattr(data, name, None)
+        if isinstance(value, np.generic):
+            value = value.item()
+        if value is not None and not isinstance(value, (bool, int, float, str)):
+            return None
+        attrs[name] = value
+    return arrays, attrs
+
+
+def _arrays_to_magsld(arrays, attrs):
+    """
+    Rebuild the MagSLD from *_magsld_to_arrays* output without copying the arrays.
+    """
+    from .sas_gen import MagSLD
+    data = MagSLD(arrays['pos_x'], arrays['pos_y'], arrays['pos_z'],
+                  arrays.get('sld_n', None), arrays.get('sld_mx', None),
+                  arrays.get('sld_my', None), arrays.get('sld_mz', None),
+                  arrays.get('vol_pix', None))
+    data.pix_symbol = arrays.get('pix_symbol', None)
+    data.vol_pix = arrays.get('vol_pix', None)
+    if 'elements' in arrays:
+        data.elements = arrays['elements']
+    for name, value in attrs.items():
+        setattr(data, name, value)
+    if data.has_conect:
+        for name in _LINES:
+            setattr(data, name, [tuple(v) for v in arrays[name].tolist()])
+    return data
@@ -0,0 +1,282 @@
+"""
+Corfunc analysis of a series of frames measured on the same q grid,
+such as a kinetics experiment.
+
+The frames are processed together: the Guinier and Porod fits are solved
+for all the frames at once, the extrapolation is evaluated on the shared
+extrapolated q grid and the transforms are computed along the frame axis.
+Only the extraction of the lamellar parameters, which depends on the shape
+of each correlation function, is done frame by frame.
+"""
+
+from dataclasses import fields
+from typing import Optional, Tuple
+
+import numpy as np
+
+from sas.sascalc.corfunc.calculation_data import (LamellarParameters,
+                                                  LongPeriodMethod,
+                                                  SettableExtrapolationParameters,
+                                                  TangentMethod)
+from sas.sascalc.corfunc.corfunc_calculator import (CalculationError,
+                                                    CorfuncCalculator,
+                                                    calculate_lamellar_parameters)
+from sas.sascalc.corfunc.transform_thread import correlation_transforms
+
+# Number of frames transformed together, which bounds the memory used by
+# the extrapolated intensities.
+CHUNK_FRAMES = 64
+# Number of Porod sigma values searched before refining the best one.
+POROD_SIGMA_STEPS = 200
+# Largest Porod sigma searched, as a multiple of 1/q at the start of the fit.
+POROD_SIGMA_RANGE = 4.0
+# Golden section iterations refining the Porod sigma.
+POROD_SIGMA_ITERATIONS = 60
+
+LAMELLAR_DTYPE = np.dtype([(f.name, np.float64) for f in fields(LamellarParameters)])
+
+
+def fit_guinier(q: np.ndarray, iq: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fit log(I) = A + B q^2 to each frame using linear least squares,
+    as CorfuncCalculator.calculate_guinier_parameters.
+
+    :param q: q values of the fit region
+    :param iq: background subtracted intensities, of shape (nframes, len(q))
+
+    :returns: A, B for each frame
+    """
+    x = q * q
+    with np.errstate(invalid='ignore', divide='ignore'):
+        y = np.log(iq)
+    n = len(x)
+    s_x, s_xx = np.sum(x), np.sum(x * x)
+    s_y, s_xy = np.sum(y, axis=-1), np.sum(x * y, axis=-1)
+    det = n * s_xx - s_x * s_x
+    return (s_xx * s_y - s_x * s_xy) / det, (n * s_xy - s_x * s_y) / det
+
+
+def _porod_linear(q: np.ndarray, observed: np.ndarray, sigma: np.ndarray):
+    """
+    Least squares K and background of the Porod function with the given
+    sigma for each frame, and the sum of the squared residuals.
+    """
+    # q^2 I = background q^2 + K q^-2 exp(-q^2 sigma^2)
+    a = q * q
+    b = np.exp(-np.outer(sigma * sigma, a)) / a
+    s_aa = np.sum(a * a)
+    s_ab = np.sum(a * b, axis=-1)
+    s_bb = np.sum(b * b, axis=-1)
+    s_ay = np.sum(a * observed, axis=-1)
+    s_by = np.sum(b * observed, axis=-1)
+    det = s_aa * s_bb - s_ab * s_ab
+    background = (s_bb * s_ay - s_ab * s_by) / det
+    K = (s_aa * s_by - s_ab * s_ay) / det
+    resid = observed - background[:, None] * a - K[:, None] * b
+    return K, background, np.sum(resid * resid, axis=-1)
+
+
+def fit_porod(q: np.ndarray, iq: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Fit the Porod function to each frame, as
+    CorfuncCalculator.calculate_porod_parameters.
+
+    The function is linear in K and the background, which are solved in
+    closed form for a given sigma.  The sigma >= 0 with the smallest
+    residuals is found by a search on a grid followed by a golden section
+    refinement, all frames at once.
+
+    :param q: q values of the fit region
+    :param iq: intensities, of shape (nframes, len(q))
+
+    :returns: K, sigma, background for each frame
+    """
+    observed = CorfuncCalculator.porod_fitting_function_observed(q, iq)
+    nframes = observed.shape[0]
+    grid = np.linspace(0, POROD_SIGMA_RANGE / q[0], POROD_SIGMA_STEPS)
+    cost = np.empty((POROD_SIGMA_STEPS, nframes))
+    for k, sigma in enumerate(grid):
+        cost[k] = _porod_linear(q, observed, np.full(nframes, sigma))[2]
+    best = np.argmin(cost, axis=0)
+    lower = grid[np.maximum(best - 1, 0)]
+    upper = grid[np.minimum(best + 1, POROD_SIGMA_STEPS - 1)]
+
+    ratio = (np.sqrt(5) - 1) / 2
+    x1 = upper - ratio * (upper - lower)
+    x2 = lower + ratio * (upper - lower)
+    f1 = _porod_linear(q, observed, x1)[2]
+    f2 = _porod_linear(q, observed, x2)[2]
+    for _ in range(POROD_SIGMA_ITERATIONS):
+        left = f1 < f2
+        upper = np.where(left, x2, upper)
+        lower = np.where(left, lower, x1)
+        x_new = np.where(left, upper - ratio * (upper - lower),
+                         lower + ratio * (upper - lower))
+        f_new = _porod_linear(q, observed, x_new)[2]
+        x1, x2, f1, f2 = (np.where(left, x_new, x2), np.where(left, x1, x_new),
+                          np.where(left, f_new, f2), np.where(left, f1, f_new))
+    sigma = 0.5 * (lower + upper)
+    K, background, _ = _porod_linear(q, observed, sigma)
+    return K, sigma, background
+
+
+def _smooth_join(nframes, x, left, right, start, stop):
+    """
+    Stacked version of SmoothJoin, with *left* and *right* returning the
+    values of the *nframes* frames at the given x.
+    """
+    left_indices = x <= start
+    right_indices = x >= stop
+    mid_indices = ~(left_indices | right_indices)
+    x_mid = x[mid_indices]
+    h = 1.0 / (1.0 + ((x_mid - stop) / (start - x_mid)) ** 2)
+
+    y = np.empty((nframes, len(x)))
+    y[..., left_indices] = left(x[left_indices])
+    y[..., right_indices] = right(x[right_indices])
+    y[..., mid_indices] = h * right(x_mid) + (1 - h) * left(x_mid)
+    return y
+
+
+class BatchCorfuncCalculator:
+
+    def __init__(self,
+                 q: np.ndarray,
+                 iq: np.ndarray,
+                 extrapolation_parameters: SettableExtrapolationParameters,
+                 long_period_method: Optional[LongPeriodMethod] = None,
+                 tangent_method: Optional[TangentMethod] = None,
+                 background: Optional[np.ndarray] = None):
+        """
+        Back-end for corfunc calculations on a series of frames
+
+        :param q: evenly spaced q values shared by the frames
+        :param iq: intensities of shape (nframes, len(q))
+        :param extrapolation_parameters: SettableExtrapolationParameters object containing the q values use to extrapolate
+        :param long_period_method: LongPeriodMethod enum value specifying how to calculate the long period (None autodetects)
+        :param tangent_method: TangentMethod enum value specifying how to calculate the tangent (None autodetects)
+        :param background: background of each frame, or None to fit it with the Porod region
+        """
+        self.q = np.asarray(q, dtype=np.float64)
+        self.iq = np.atleast_2d(np.asarray(iq, dtype=np.float64))
+        if self.iq.shape[-1] != len(self.q):
+            raise ValueError("Frames must have one intensity for each q value")
+        self.extrapolation_parameters = extrapolation_parameters
+        self.long_period_method = long_period_method
+        self.tangent_method = tangent_method
+
+        self.background: Optional[np.ndarray] = (
+            None if background is None
+            else np.broadcast_to(np.asarray(background, dtype=np.float64), (self.nframes,)))
+        self._fit_background = background is None
+
+        # Fitted parameters, one value per frame
+        self.porod_K: Optional[np.ndarray] = None
+        self.porod_sigma: Optional[np.ndarray] = None
+        self.guinier_A: Optional[np.ndarray] = None
+        self.guinier_B: Optional[np.ndarray] = None
+
+        # Frames for which the lamellar parameters could not be extracted
+        self.errors = {}
+
+    @property
+    def nframes(self) -> int:
+        return self.iq.shape[0]
+
+    @property
+    def q_range(self) -> Tuple[float, float]:
+        return self.q[0], self.q[-1]
+
+    @property
+    def extrapolated_q(self) -> np.ndarray:
+        q = self.q
+        return np.arange(0, q[-1]*100, (q[1]-q[0]))
+
+    def run(self) -> np.ndarray:
+        """
+        Execute the calculation
+
+        :returns: a structured array with the LamellarParameters fields for
+            each frame, with NaN for the frames listed in *errors*
+        """
+        self.fit()
+        table = np.full(self.nframes, np.nan, dtype=LAMELLAR_DTYPE)
+        self.errors = {}
+        for start in range(0, self.nframes, CHUNK_FRAMES):
+            frames = np.arange(start, min(start + CHUNK_FRAMES, self.nframes))
+            z, gamma1, _, idf = self.transforms(frames)
+            for frame, gamma, interface in zip(frames, gamma1, idf):
+                try:
+                    lamellar, _ = calculate_lamellar_parameters(
+                        z, gamma, interface, self.q_range,
+                        long_period_method=self.long_period_method,
+                        tangent_method=self.tangent_method)
+                except (CalculationError, IndexError) as exc:
+                    self.errors[int(frame)] = str(exc)
+                    continue
+                table[frame] = tuple(getattr(lamellar, name) for name in LAMELLAR_DTYPE.names)
+        return table
+
+    def fit(self):
+        """
+        Fit the background, Porod and Guinier parameters of every frame
+        """
+        q = self.q
+        params = self.extrapolation_parameters
+        mask = np.logical_and(q > params.point_2, q < params.point_3)
+        K, sigma, background = fit_porod(q[mask], self.iq[:, mask])
+        self.porod_K, self.porod_sigma = K, sigma
+        if self._fit_background:
+            self.background = background
+
+        mask = np.logical_and(q < params.point_1, 0 < q)
+        self.guinier_A, self.guinier_B = fit_guinier(
+            q[mask], self.iq[:, mask] - self.background[:, None])
+
+    def extrapolate(self, frames=slice(None)) -> np.ndarray:
+        """
+        Evaluate the extrapolated intensity of the given frames on
+        extrapolated_q, as CorfuncCalculator.
+
+        :param frames: index of the frames
+        """
+        if self.guinier_A is None:
+            self.fit()
+        q = self.q
+        params = self.extrapolation_parameters
+        iq = self.iq[frames]
+        background = self.background[frames][:, None]
+        K, sigma = self.porod_K[frames][:, None], self.porod_sigma[frames][:, None]
+        A, B = self.guinier_A[frames][:, None], self.guinier_B[frames][:, None]
+
+        def data_function(x):
+            # linear interpolation, as interp1d; still has background values
+            index = np.clip(np.searchsorted(q, x, side='right') - 1, 0, len(q) - 2)
+            fraction = (x - q[index]) / (q[index + 1] - q[index])
+            return iq[:, index] * (1 - fraction) + iq[:, index + 1] * fraction
+
+        def porod_function(x):
+            return CorfuncCalculator.porod_fitting_function(x, K, sigma, background)
+
+        def guinier_function(x):
+            return np.exp(A + B*x*x) + background
+
+        def data_porod(x):
+            return _smooth_join(len(iq), x, data_function, porod_function,
+                                params.point_2, params.point_3)
+
+        return _smooth_join(len(iq), self.extrapolated_q, guinier_function, data_porod,
+                            q[0], params.point_1)
+
+    def transforms(self, frames=slice(None)):
+        """
+        Compute the correlation functions of the given frames
+
+        :param frames: index of the frames
+
+        :returns: distances, 1D correlation functions, 3D correlation
+            functions and interface distribution functions, with one row
+            per frame
+        """
+        return correlation_transforms(self.extrapolated_q, self.extrapolate(frames),
+                                      self.background[frames], self.q[1] - self.q[0])
@@ -11,8 +11,6 @@ import numpy as np
 import scipy.optimize
 from scipy.interpolate import interp1d
 from scipy.signal import argrelextrema
-from scipy.fftpack import dct
-from scipy.integrate import trapezoid, cumulative_trapezoid
 
 from sas.sascalc.corfunc.calculation_data import (TransformedData,
                                                   LamellarParameters,
@@ -29,6 +27,7 @@ from sas.sascalc.corfunc.calculation_data import (TransformedData,
 from sasdata.dataloader.data_info import Data1D
 from sas.sascalc.corfunc.transform_thread import FourierThread
 from sas.sascalc.corfunc.transform_thread import HilbertThread
+from sas.sascalc.corfunc.transform_thread import correlation_transforms
 from sas.sascalc.corfunc.smoothing import SmoothJoin
 
 
@@ -404,32 +403,7 @@ class CorfuncCalculator:
         q = self.data.x
         background = self._background.data
 
-        xs = np.pi * np.arange(len(qs), dtype=np.float32) / (q[1] - q[0]) / len(qs)
-
-        # 1D Correlation Function
-        gamma1 = dct((iqs - background) * (qs ** 2))
-        Q = np.max(gamma1)
-        gamma1 /= Q
-
-        # 3D Correlation Function
-        # gamma3(R) = 1/R int_{0}^{R} gamma1(x) dx
-        # numerical approximation for increasing R using the trapezium rule
-        # Note: SasView 4.x series limited the range to xs <= 1000.0
-
-        gamma3 = cumulative_trapezoid(gamma1, xs) / xs[1:]
-        gamma3 = np.hstack((1.0, gamma3))  # gamma3(0) is defined as 1
-
-        # Interface Distribution function
-        idf = dct(-qs ** 4 * (iqs - background))
-
-        # Manually calculate IDF(0.0), since scipy DCT tends to give us a
-        # very large negative value.
-
-        #    IDF(x) = int_0^inf q^4 * I(q) * cos(q*x) * dq
-        # => IDF(0) = int_0^inf q^4 * I(q) * dq
-
-        idf[0] = trapezoid(-qs ** 4 * (iqs - background), qs)
-        idf /= Q  # Normalise using scattering invariant
+        xs, gamma1, gamma3, idf = correlation_transforms(qs, iqs, background, q[1] - q[0])
 
         transform1d = Data1D(xs, gamma1)
         transform3d = Data1D(xs, gamma3)
@@ -446,140 +420,11 @@ class CorfuncCalculator:
         gamma_1 = self._transformed_data.gamma_1  # 1D transform
         idf = self._transformed_data.idf
 
-        # Calculate indexes of maxima and minima
-        z = gamma_1.x
-        gamma = gamma_1.y
-        gamma_fun = interp1d(z, gamma)
-
-        maxs = argrelextrema(gamma, np.greater)[0]
-        mins = argrelextrema(gamma, np.less)[0]
-
-        # If there are no maxima, return None
-        if len(maxs) == 0:
-            raise CalculationError("No maxima found in data")
-
-        max_values = gamma[maxs]
-        largest_max = np.argmax(max_values)
-
-        gamma_min = gamma[mins[0]]  # The value at the first minimum
-        z_at_min = z[mins[0]]
-
-        dgamma_dz = (gamma[2:]-gamma[:-2])/(z[2:]-z[:-2])  # 1st derivative of y
-
-
-        # Find where the second derivative goes to zero
-        #  * the IDF is the second derivative of gamma_1
-        #  * ... but has a large DC component that needs to be ignored
-
-        above_zero = idf.y[1:] > 0
-
-        zero_crossings = \
-            np.argwhere(
-                np.logical_xor(
-                    above_zero[1:],
-                    above_zero[:-1]))[:, 0]
-
-        inflection_point_index = zero_crossings[0] + 1 # +1 for ignoring DC, left side of crossing, not right
-
-        #
-        # Work out the tangent index based on the method specified
-        #
-
-        tangent_method = self.tangent_method
-
-        if tangent_method is None:
-            if inflection_point_index < mins[0]:
-                tangent_method = TangentMethod.INFLECTION
-            else:
-                tangent_method = TangentMethod.HALF_MIN
-
-        if tangent_method == TangentMethod.INFLECTION:
-            tangent_index = inflection_point_index
-        elif tangent_method == TangentMethod.HALF_MIN:
-            tangent_index = mins[0] // 2
-        else:
-            raise ValueError(f"Unknown tangent calculation method: '{tangent_method}', options are {TangentMethod.options}")
-
-        #
-        # Work out the long period index based on the method specified
-        #
-
-        long_period_method = self.long_period_method
-
-        if long_period_method is None:
-            if len(maxs) > 0:
-                long_period_method = LongPeriodMethod.MAX
-            else:
-                long_period_method = LongPeriodMethod.DOUBLE_MIN
-
-        if long_period_method == LongPeriodMethod.MAX:
-            long_period = z[maxs[largest_max]]
-        elif long_period_method == LongPeriodMethod.DOUBLE_MIN:
-            long_period = z_at_min * 2
-        else:
-            raise ValueError(f"Unknown long period calculation method: '{long_period_method}', options are {LongPeriodMethod.options}")
-
-        # Try to calculate slope around linear_point using 80 data points
-        tangent_region_lower = tangent_index - 40
-        tangent_region_upper = tangent_index + 40
-
-        # If too few data points to the left, use linear_point*2 data points
-        if tangent_region_lower < 0:
-            tangent_region_lower = 0
-            tangent_region_upper = inflection_point_index * 2
-
-        # If too few to right, use 2*(dy.size - linear_point) data points
-        elif tangent_region_upper > len(dgamma_dz):
-            tangent_region_upper = len(dgamma_dz)
-            tangent_region_lower = 2*inflection_point_index - dgamma_dz.size
-
-        # Slope at inflection point calculated by mean over inflection region
-        tangent_slope = np.mean(dgamma_dz[tangent_region_lower:tangent_region_upper])  # Linear slope
-        tangent_intercept = gamma[1:-1][tangent_index]-tangent_slope*z[1:-1][tangent_index]  # Linear intercept
-
-        hard_block_thickness = (gamma_min - tangent_intercept) / tangent_slope  # Hard block thickness
-        soft_block_thickness = long_period - hard_block_thickness
-
-        # Find the data points where the graph is linear to within 1%
-        mask = np.where(np.abs((gamma-(tangent_slope*z+tangent_intercept))/gamma) < 0.01)[0]
-
-        if len(mask) == 0:  # Return garbage for bad fits
-            raise CalculationError("No tangent values found")
-
-        interface_thickness = z[mask[0]]  # Beginning of Linear Section
-        core_thickness = z[mask[-1]]  # End of Linear Section
-
-        local_crystallinity = hard_block_thickness / long_period
-
-        gamma_max = gamma[mask[-1]]
-
-        polydispersity_ryan = np.abs(gamma_min / gamma_max)  # Normalized depth of minimum
-        polydispersity_stribeck = np.abs(local_crystallinity / ((local_crystallinity - 1) * gamma_max))  # Normalized depth of minimum
-
-        self._supplementary_parameters = SupplementaryParameters(
-            tangent_point_z=z[tangent_index],
-            tangent_point_gamma=gamma[tangent_index],
-            tangent_gradient=float(tangent_slope),
-            first_minimum_z=z_at_min,
-            first_minimum_gamma=gamma_min,
-            first_maximum_z=long_period,
-            first_maximum_gamma=gamma_fun(long_period),
-            hard_block_z=hard_block_thickness,
-            hard_block_gamma=gamma_min,
-            interface_z=interface_thickness,
-            core_z=core_thickness,
-            z_range=(1 / self.data.x[-1], 1 / self.data.x[0]),
-            gamma_range=(np.min(gamma), np.max(gamma)))
-
-        self._lamellar_parameters = LamellarParameters(
-            long_period=long_period,
-            interface_thickness=interface_thickness,
-            hard_block_thickness=hard_block_thickness,
-            soft_block_thickness=soft_block_thickness,
-            core_thickness=core_thickness,
-            polydispersity_ryan=polydispersity_ryan,
-            polydispersity_stribeck=polydispersity_stribeck,
-            local_crystallinity=local_crystallinity)
+        self._lamellar_parameters, self._supplementary_parameters = \
+            calculate_lamellar_parameters(
+                gamma_1.x, gamma_1.y, idf.y, self.q_range,
+                long_period_method=self.long_period_method,
+                tangent_method=self.tangent_method)
 
 
     #
@@ -667,4 +512,156 @@ def extract_lamellar_parameters(
 
     calculator.run()
 
-    return calculator.lamellar_parameters
\ No newline at end of file
+    return calculator.lamellar_parameters
+
+
+def calculate_lamellar_parameters(
+    z: np.ndarray,
+    gamma: np.ndarray,
+    idf: np.ndarray,
+    q_range: Tuple[float, float],
+    long_period_method: Optional[LongPeriodMethod]=None,
+    tangent_method: Optional[TangentMethod]=None) -> Tuple[LamellarParameters, SupplementaryParameters]:
+    """
+    Extract the interesting measurements from a correlation function
+
+    :param z: distances of the correlation function
+    :param gamma: 1D correlation function
+    :param idf: interface distribution function
+    :param q_range: q range of the data
+    :param long_period_method: LongPeriodMethod enum value specifying how to calculate the long period (None autodetects)
+    :param tangent_method: TangentMethod enum value specifying how to calculate the tangent (None autodetects)
+
+    :returns: LamellarParameters and SupplementaryParameters objects
+    """
+
+    # Calculate indexes of maxima and minima
+    gamma_fun = interp1d(z, gamma)
+
+    maxs = argrelextrema(gamma, np.greater)[0]
+    mins = argrelextrema(gamma, np.less)[0]
+
+    # If there are no maxima, return None
+    if len(maxs) == 0:
+        raise CalculationError("No maxima found in data")
+
+    max_values = gamma[maxs]
+    largest_max = np.argmax(max_values)
+
+    gamma_min = gamma[mins[0]]  # The value at the first minimum
+    z_at_min = z[mins[0]]
+
+    dgamma_dz = (gamma[2:]-gamma[:-2])/(z[2:]-z[:-2])  # 1st derivative of y
+
+
+    # Find where the second derivative goes to zero
+    #  * the IDF is the second derivative of gamma_1
+    #  * ... but has a large DC component that needs to be ignored
+
+    above_zero = idf[1:] > 0
+
+    zero_crossings = \
+        np.argwhere(
+            np.logical_xor(
+                above_zero[1:],
+                above_zero[:-1]))[:, 0]
+
+    inflection_point_index = zero_crossings[0] + 1 # +1 for ignoring DC, left side of crossing, not right
+
+    #
+    # Work out the tangent index based on the method specified
+    #
+
+    if tangent_method is None:
+        if inflection_point_index < mins[0]:
+            tangent_method = TangentMethod.INFLECTION
+        else:
+            tangent_method = TangentMethod.HALF_MIN
+
+    if tangent_method == TangentMethod.INFLECTION:
+        tangent_index = inflection_point_index
+    elif tangent_method == TangentMethod.HALF_MIN:
+        tangent_index = mins[0] // 2
+    else:
+        raise ValueError(f"Unknown tangent calculation method: '{tangent_method}', options are {TangentMethod.options}")
+
+    #
+    # Work out the long period index based on the method specified
+    #
+
+    if long_period_method is None:
+        if len(maxs) > 0:
+            long_period_method = LongPeriodMethod.MAX
+        else:
+            long_period_method = LongPeriodMethod.DOUBLE_MIN
+
+    if long_period_method == LongPeriodMethod.MAX:
+        long_period = z[maxs[largest_max]]
+    elif long_period_method == LongPeriodMethod.DOUBLE_MIN:
+        long_period = z_at_min * 2
+    else:
+        raise ValueError(f"Unknown long period calculation method: '{long_period_method}', options are {LongPeriodMethod.options}")
+
+    # Try to calculate slope around linear_point using 80 data points
+    tangent_region_lower = tangent_index - 40
+    tangent_region_upper = tangent_index + 40
+
+    # If too few data points to the left, use linear_point*2 data points
+    if tangent_region_lower < 0:
+        tangent_region_lower = 0
+        tangent_region_upper = inflection_point_index * 2
+
+    # If too few to right, use 2*(dy.size - linear_point) data points
+    elif tangent_region_upper > len(dgamma_dz):
+        tangent_region_upper = len(dgamma_dz)
+        tangent_region_lower = 2*inflection_point_index - dgamma_dz.size
+
+    # Slope at inflection point calculated by mean over inflection region
+    tangent_slope = np.mean(dgamma_dz[tangent_region_lower:tangent_region_upper])  # Linear slope
+    tangent_intercept = gamma[1:-1][tangent_index]-tangent_slope*z[1:-1][tangent_index]  # Linear intercept
+
+    hard_block_thickness = (gamma_min - tangent_intercept) / tangent_slope  # Hard block thickness
+    soft_block_thickness = long_period - hard_block_thickness
+
+    # Find the data points where the graph is linear to within 1%
+    mask = np.where(np.abs((gamma-(tangent_slope*z+tangent_intercept))/gamma) < 0.01)[0]
+
+    if len(mask) == 0:  # Return garbage for bad fits
+        raise CalculationError("No tangent values found")
+
+    interface_thickness = z[mask[0]]  # Beginning of Linear Section
+    core_thickness = z[mask[-1]]  # End of Linear Section
+
+    local_crystallinity = hard_block_thickness / long_period
+
+    gamma_max = gamma[mask[-1]]
+
+    polydispersity_ryan = np.abs(gamma_min / gamma_max)  # Normalized depth of minimum
+    polydispersity_stribeck = np.abs(local_crystallinity / ((local_crystallinity - 1) * gamma_max))  # Normalized depth of minimum
+
+    supplementary_parameters = SupplementaryParameters(
+        tangent_point_z=z[tangent_index],
+        tangent_point_gamma=gamma[tangent_index],
+        tangent_gradient=float(tangent_slope),
+        first_minimum_z=z_at_min,
+        first_minimum_gamma=gamma_min,
+        first_maximum_z=long_period,
+        first_maximum_gamma=gamma_fun(long_period),
+        hard_block_z=hard_block_thickness,
+        hard_block_gamma=gamma_min,
+        interface_z=interface_thickness,
+        core_z=core_thickness,
+        z_range=(1 / q_range[1], 1 / q_range[0]),
+        gamma_range=(np.min(gamma), np.max(gamma)))
+
+    lamellar_parameters = LamellarParameters(
+        long_period=long_period,
+        interface_thickness=interface_thickness,
+        hard_block_thickness=hard_block_thickness,
+        soft_block_thickness=soft_block_thickness,
+        core_thickness=core_thickness,
+        polydispersity_ryan=polydispersity_ryan,
+        polydispersity_stribeck=polydispersity_stribeck,
+        local_crystallinity=local_crystallinity)
+
+    return lamellar_parameters, supplementary_parameters
@@ -4,6 +4,67 @@ from scipy.fftpack import dct
 from scipy.integrate import trapezoid, cumulative_trapezoid
 import numpy as np
 
+
+def correlation_transforms(qs, iqs, background, dq, is_cancelled=None):
+    """
+    Correlation functions of the extrapolated intensity.
+
+    The transforms are computed along the last axis, so *iqs* may be a stack
+    of frames of shape (nframes, len(qs)), with *background* a value or one
+    value per frame.
+
+    :param qs: evenly spaced q values of the extrapolation, starting at 0
+    :param iqs: extrapolated intensity, including the background
+    :param background: background of the intensity
+    :param dq: q spacing of the data, which sets the spacing of the distances
+    :param is_cancelled: optional function called between the transforms,
+        which stops the calculation when it returns True
+
+    :returns: distances, 1D correlation function, 3D correlation function
+        and interface distribution function, or None if cancelled
+    """
+    if is_cancelled is None:
+        is_cancelled = lambda: False
+
+    background = np.asarray(background, dtype=np.float64)
+    if background.ndim:
+        background = background[..., None]
+    iqs = np.asarray(iqs) - background
+
+    xs = np.pi*np.arange(len(qs), dtype=np.float32)/dq/len(qs)
+
+    # ----- 1D Correlation Function -----
+    gamma1 = dct(iqs*(qs**2), axis=-1)
+    Q = gamma1.max(axis=-1, keepdims=True)
+    gamma1 /= Q
+
+    if is_cancelled(): return None
+
+    # ----- 3D Correlation Function -----
+    # gamma3(R) = 1/R int_{0}^{R} gamma1(x) dx
+    # numerical approximation for increasing R using the trapezium rule
+    # Note: SasView 4.x series limited the range to xs <= 1000.0
+    gamma3 = cumulative_trapezoid(gamma1, xs, axis=-1)/xs[1:]
+    # gamma3(0) is defined as 1
+    gamma3 = np.concatenate((np.ones(gamma3.shape[:-1] + (1,)), gamma3), axis=-1)
+
+    if is_cancelled(): return None
+
+    # ----- Interface Distribution function -----
+    idf = dct(-qs**4 * iqs, axis=-1)
+
+    if is_cancelled(): return None
+
+    # Manually calculate IDF(0.0), since scipy DCT tends to give us a
+    # very large negative value.
+    # IDF(x) = int_0^inf q^4 * I(q) * cos(q*x) * dq
+    # => IDF(0) = int_0^inf q^4 * I(q) * dq
+    idf[..., 0] = trapezoid(-qs**4 * iqs, qs, axis=-1)
+    idf /= Q # Normalise using scattering invariant
+
+    return xs, gamma1, gamma3, idf
+
+
 class FourierThread(CalcThread):
     def __init__(self, raw_data, extrapolated_data, bg, updatefn=None,
                  completefn=None):
@@ -25,41 +86,16 @@ class FourierThread(CalcThread):
         q = self.data.x
         background = self.background
 
-        xs = np.pi*np.arange(len(qs),dtype=np.float32)/(q[1]-q[0])/len(qs)
-
         self.ready(delay=0.0)
         self.update(msg="Fourier transform in progress.")
         self.ready(delay=0.0)
 
         if self.check_if_cancelled(): return
         try:
-            # ----- 1D Correlation Function -----
-            gamma1 = dct((iqs-background)*(qs**2))
-            Q = gamma1.max()
-            gamma1 /= Q
-
-            if self.check_if_cancelled(): return
-
-            # ----- 3D Correlation Function -----
-            # gamma3(R) = 1/R int_{0}^{R} gamma1(x) dx
-            # numerical approximation for increasing R using the trapezium rule
-            # Note: SasView 4.x series limited the range to xs <= 1000.0
-            gamma3 = cumulative_trapezoid(gamma1, xs)/xs[1:]
-            gamma3 = np.hstack((1.0, gamma3)) # gamma3(0) is defined as 1
-
-            if self.check_if_cancelled(): return
-
-            # ----- Interface Distribution function -----
-            idf = dct(-qs**4 * (iqs-background))
-
-            if self.check_if_cancelled(): return
-
-            # Manually calculate IDF(0.0), since scipy DCT tends to give us a
-            # very large negative value.
-            # IDF(x) = int_0^inf q^4 * I(q) * cos(q*x) * dq
-            # => IDF(0) = int_0^inf q^4 * I(q) * dq
-            idf[0] = trapezoid(-qs**4 * (iqs-background), qs)
-            idf /= Q # Normalise using scattering invariant
+            transforms = correlation_transforms(qs, iqs, background, q[1]-q[0],
+                                                is_cancelled=self.check_if_cancelled)
+            if transforms is None: return
+            xs, gamma1, gamma3, idf = transforms
 
         except Exception as e:
             import logging
@@ -0,0 +1,55 @@
+"""
+Memory-map the .npy members of zip files.
+
+An uncompressed zip member is stored as is after its local header, so the
+values of a .npy member can be mapped directly from the zip file once the
+local header and the .npy header have been read.  The maps are copy-on-write,
+so the arrays can be modified in memory without changing the file.
+"""
+import struct
+import zipfile
+
+import numpy as np
+
+__all__ = ['map_npy_member']
+
+# Fixed part of a zip local file header: signature, ..., name and extra
+# field lengths.
+_ZIP_HEADER = struct.Struct('<4s22xHH')
+_ZIP_SIGNATURE = b'PK\x03\x04'
+
+
+def map_npy_member(path, info, fid=None):
+    """
+    Memory-map the .npy member *info* of the zip file at *path*.
+
+    *fid* is the zip file opened for binary reading, if the caller already
+    has it open.  Returns None for the members which can't be mapped, which
+    are compressed members and empty, 0-d or object arrays; those must be
+    read with :func:`numpy.lib.format.read_array` instead.
+    """
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+    if fid is None:
+        with open(path, 'rb') as fid:
+            return map_npy_member(path, info, fid)
+    # the local header can have a different extra field from the central
+    # directory, so read its lengths to find the data
+    fid.seek(info.header_offset)
+    signature, name_len, extra_len = _ZIP_HEADER.unpack(fid.read(_ZIP_HEADER.size))
+    if signature != _ZIP_SIGNATURE:
+        raise ValueError("bad zip member %r in %s" % (info.filename, path))
+    fid.seek(info.header_offset + _ZIP_HEADER.size + name_len + extra_len)
+    version = np.lib.format.read_magic(fid)
+    if version == (1, 0):
+        header = np.lib.format.read_array_header_1_0(fid)
+    elif version == (2, 0):
+        header = np.lib.format.read_array_header_2_0(fid)
+    else:
+        # version 3.0 headers have no public reader
+        return None
+    shape, fortran_order, dtype = header
+    if dtype.hasobject or shape == () or np.prod(shape) == 0:
+        return None
+    return np.memmap(path, dtype=dtype, mode='c', offset=fid.tell(), shape=shape,
+                     order='F' if fortran_order else 'C')
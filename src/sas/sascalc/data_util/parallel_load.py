@@ -0,0 +1,108 @@
+"""
+Read data files with the sasdata Loader in a pool of worker processes.
+
+The sasdata readers are shared by every Loader in a process and keep the
+state of the file being read, so files can't be read by several threads at
+once.  Each worker process has its own Loader, and returns the data sets of
+one file at a time.  The data sets are returned in the order of the files, as
+soon as each file is read, so the caller can show the progress and add the
+data while the rest of the files are being read.
+"""
+import os
+import pickle
+import logging
+import traceback
+import multiprocessing
+
+from sasdata.dataloader.loader import Loader
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks for cancellation while waiting for the workers.
+POLL_INTERVAL = 0.1
+# Fewer files are read in this process, as starting the workers takes longer.
+MIN_PARALLEL_FILES = 16
+# Files sent to a worker at a time.
+CHUNK_SIZE = 4
+# Loader of a worker process, created on its first file.
+_LOADER = None
+
+
+def load_workers(nfiles, max_workers=0):
+    """
+    Number of worker processes to read *nfiles* files.
+
+    *max_workers* <= 0 uses all the cores.  Files are read in this process if
+    there are fewer than MIN_PARALLEL_FILES of them.
+    """
+    if nfiles < MIN_PARALLEL_FILES:
+        return 1
+    limit = os.cpu_count() or 1
+    if max_workers > 0:
+        limit = min(limit, max_workers)
+    return max(1, min(nfiles, limit))
+
+
+def load_files(paths, loader=None, max_workers=0, is_cancelled=None):
+    """
+    Read each of *paths*.
+
+    Yields *(index, path, data, error)* for each file in the order of *paths*,
+    where *data* is the list of data sets read by the sasdata Loader and
+    *error* is None, or the description of the exception raised when reading
+    the file, in which case *data* is empty.  *loader* reads the files when
+    they are read in this process.  *is_cancelled* is called between files,
+    and stops the reading, terminating the workers, when it returns True.
+    """
+    paths = list(paths)
+    nworkers = load_workers(len(paths), max_workers)
+    if nworkers == 1:
+        yield from _serial_load(paths, loader, is_cancelled)
+        return
+
+    # Fork is unsafe once the GUI threads are running
+    context = multiprocessing.get_context('spawn')
+    pool = context.Pool(nworkers)
+    try:
+        results = pool.imap(_load_worker, paths, chunksize=CHUNK_SIZE)
+        for index, path in enumerate(paths):
+            while True:
+                if is_cancelled is not None and is_cancelled():
+                    return
+                try:
+                    payload, error = results.next(timeout=POLL_INTERVAL)
+                    break
+                except multiprocessing.TimeoutError:
+                    pass
+            data = pickle.loads(payload) if error is None else []
+            yield index, path, data, error
+        pool.close()
+    finally:
+        # Stops reading the remaining files after an error or cancellation.
+        pool.terminate()
+        pool.join()
+
+
+def _serial_load(paths, loader, is_cancelled):
+    if loader is None:
+        loader = Loader()
+    for index, path in enumerate(paths):
+        if is_cancelled is not None and is_cancelled():
+            return
+        try:
+            data, error = loader.load(path), None
+        except Exception:
+            logger.debug("Failed to read %s", path, exc_info=True)
+            data, error = [], traceback.format_exc()
+        yield index, path, data, error
+
+
+def _load_worker(path):
+    global _LOADER
+    if _LOADER is None:
+        _LOADER = Loader()
+    try:
+        # Pickled here so a data set which can't be sent fails on its own file
+        return pickle.dumps(_LOADER.load(path), protocol=pickle.HIGHEST_PROTOCOL), None
+    except Exception:
+        return None, traceback.format_exc()
@@ -8,6 +8,8 @@ import numpy as np
 
 from sasdata.dataloader.data_info import Data1D
 from sasdata.dataloader.data_info import Data2D
+
+from sas.sascalc.fit.centrosymmetry import half_plane, eval_half_plane
 _SMALLVALUE = 1.0e-10
 
 class FitHandler(object):
@@ -277,6 +279,8 @@ class FitData2D(Data2D):
         self.smearer = None
         self.radius = 0
         self.res_err_data = []
+        # (idx, qx_data, qy_data, plan) of the mirror points within the fit range
+        self._half_plane = None
         self.sas_data = sas_data2d
         self.set_data(sas_data2d)
 
@@ -289,6 +293,7 @@ class FitData2D(Data2D):
         self.qx_data = sas_data2d.qx_data
         self.qy_data = sas_data2d.qy_data
         self.mask = sas_data2d.mask
+        self._half_plane = None
 
         x_max = max(math.fabs(sas_data2d.xmin), math.fabs(sas_data2d.xmax))
         y_max = max(math.fabs(sas_data2d.ymin), math.fabs(sas_data2d.ymax))
@@ -353,13 +358,20 @@ class FitData2D(Data2D):
         """
         return np.sum(self.idx)
 
-    def residuals(self, fn):
+    def residuals(self, fn, symmetric=False):
         """
         return the residuals
+
+        If *symmetric* is True, the model is assumed to be centrosymmetric,
+        I(qx, qy) = I(-qx, -qy), and is evaluated for one pixel of each
+        pair of mirror pixels in the fit range.
         """
         if self.smearer is not None:
             fn.set_index(self.idx)
             gn = fn.get_value()
+        elif symmetric:
+            gn = eval_half_plane(fn, self.qx_data[self.idx],
+                                 self.qy_data[self.idx], self._get_half_plane())
         else:
             gn = fn([self.qx_data[self.idx],
                      self.qy_data[self.idx]])
@@ -368,6 +380,20 @@ class FitData2D(Data2D):
 
         return res, gn
 
+    def _get_half_plane(self):
+        """
+        Mirror points of the fit range, recomputed when the range or the
+        q arrays change.
+        """
+        idx = np.asarray(self.idx, dtype=bool)
+        cached = self._half_plane
+        if (cached is None or cached[1] is not self.qx_data
+                or cached[2] is not self.qy_data
+                or not np.array_equal(cached[0], idx)):
+            plan = half_plane(self.qx_data[idx], self.qy_data[idx])
+            self._half_plane = idx.copy(), self.qx_data, self.qy_data, plan
+        return self._half_plane[3]
+
     def residuals_deriv(self, model, pars=[]):
         """
         :return: residuals derivatives .
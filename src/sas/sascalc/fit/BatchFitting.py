@@ -0,0 +1,224 @@
+"""
+BatchFitting module runs independent fits in a pool of worker processes.
+
+Each fitter of a batch (one BumpsFit per data set, as prepared by the fitting
+perspective) is pickled and fitted in a separate process, and the FResult
+lists are returned in completion order.  Chain fits, where each fit starts
+from the previous result, must be run serially.
+
+sasmodels builds its model classes at run time, so they can't be pickled by
+reference.  Models are sent as their model id or plugin file name together
+with their parameter values, dispersion and limits, and the model is created
+again in the worker and set up through setParam.
+"""
+import io
+import os
+import pickle
+import logging
+import traceback
+import multiprocessing
+
+import sasmodels.models
+from sasmodels.core import load_model_info
+from sasmodels.sasview_model import SasviewModel, make_model_from_info, load_custom_model
+from sasmodels.weights import ArrayDispersion
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks for cancellation while waiting for the workers.
+POLL_INTERVAL = 0.1
+# Standard sasmodels models are rebuilt from their id, plugins from their file.
+_SASMODELS_DIR = os.path.dirname(os.path.abspath(sasmodels.models.__file__))
+# Model classes rebuilt in this process, keyed by (id, filename).
+_MODEL_CLASSES = {}
+
+
+def batch_workers(nfits, max_workers=0):
+    """
+    Number of worker processes for *nfits* independent fits.
+
+    *max_workers* <= 0 uses all the cores.  When OMP_NUM_THREADS is set above
+    one, each sasmodels kernel may use that many threads, so the number of
+    workers is reduced to avoid oversubscribing the cores.
+    """
+    cores = os.cpu_count() or 1
+    try:
+        omp_threads = int(os.environ.get('OMP_NUM_THREADS', '0'))
+    except ValueError:
+        omp_threads = 0
+    limit = cores // omp_threads if omp_threads > 1 else cores
+    if max_workers > 0:
+        limit = min(limit, max_workers)
+    return max(1, min(nfits, limit))
+
+
+def batch_fit(fitters, handler=None, curr_thread=None, reset_flag=False,
+              max_workers=0):
+    """
+    Fit each of *fitters* in a pool of worker processes.
+
+    Yields *(index, results)* as each fit completes, where *results* is the
+    list of FResult returned by *fitters[index].fit()*.  *handler* receives
+    the last result and the number of completed fits.  *curr_thread* is
+    polled through its *isquit()* method, and the workers are terminated
+    if it raises KeyboardInterrupt.
+
+    Fits are run serially in this process if there is only one worker or if
+    the fitters can't be pickled.
+    """
+    nworkers = batch_workers(len(fitters), max_workers)
+    tasks = None
+    if nworkers > 1:
+        try:
+            config = _fitter_config()
+            tasks = [(index, _dumps(fitter), config, reset_flag)
+                     for index, fitter in enumerate(fitters)]
+        except Exception as exc:
+            logger.warning("Batch fit: running serially, could not send the fits "
+                           "to worker processes: %s", exc)
+    if tasks is None:
+        yield from _serial_fit(fitters, handler, curr_thread, reset_flag)
+        return
+
+    # Share the cores between the workers, one OpenMP thread each at least.
+    threads = max(1, (os.cpu_count() or 1) // nworkers)
+    # Fork is unsafe once the OpenMP runtime or GUI threads are running
+    context = multiprocessing.get_context('spawn')
+    pool = context.Pool(nworkers, initializer=_init_worker, initargs=(threads,))
+    try:
+        results = pool.imap_unordered(_fit_worker, tasks)
+        for done in range(1, len(tasks) + 1):
+            while True:
+                if curr_thread is not None:
+                    curr_thread.isquit()
+                try:
+                    index, payload, error = results.next(timeout=POLL_INTERVAL)
+                    break
+                except multiprocessing.TimeoutError:
+                    pass
+            if error is not None:
+                raise RuntimeError("Fit of data set %d failed:\n%s" % (index, error))
+            fit_results = pickle.loads(payload)
+            _restore_inputs(fitters[index], fit_results)
+            _report(handler, fit_results, done, len(tasks))
+            yield index, fit_results
+        pool.close()
+    finally:
+        # Stops any running fits after an error or cancellation.
+        pool.terminate()
+        pool.join()
+
+
+def _serial_fit(fitters, handler, curr_thread, reset_flag):
+    for index, fitter in enumerate(fitters):
+        fit_results = fitter.fit(handler=handler, curr_thread=curr_thread,
+                                 reset_flag=reset_flag)
+        yield index, fit_results
+
+
+def _report(handler, fit_results, done, total):
+    if handler is None:
+        return
+    if fit_results:
+        handler.set_result(fit_results[0])
+    handler.progress(done, total)
+    handler.update_fit(last=True)
+
+
+def _fitter_config():
+    """
+    The bumps fitter selected in this process, which is set from the GUI.
+    """
+    try:
+        from bumps.options import FIT_CONFIG
+    except ImportError:
+        return None
+    # importing BumpsFitting sets the sasview default fitter
+    from sas.sascalc.fit import BumpsFitting
+    return FIT_CONFIG.selected_id, dict(FIT_CONFIG.selected_values)
+
+
+def _init_worker(threads):
+    # Must be set before the first sasmodels kernel loads the OpenMP runtime
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    # Pool workers are daemonic and can't start the MPMapper processes, even
+    # if OMP_NUM_THREADS=1 would select it.
+    from sas.sascalc.fit import BumpsFitting
+    BumpsFitting.SERIAL_MAPPER = True
+
+
+def _fit_worker(task):
+    index, payload, config, reset_flag = task
+    try:
+        fitter = pickle.loads(payload)
+        if config is not None:
+            from bumps.options import FIT_CONFIG
+            fitter_id, values = config
+            FIT_CONFIG.selected_id = fitter_id
+            FIT_CONFIG.values[fitter_id].update(values)
+        fit_results = fitter.fit(reset_flag=reset_flag)
+        # The caller still has the model and data, so don't send them back
+        for result in fit_results:
+            result.model = result.data = None
+            result.inputs = []
+        return index, _dumps(fit_results), None
+    except Exception:
+        return index, None, traceback.format_exc()
+
+
+def _restore_inputs(fitter, fit_results):
+    """
+    Attach the caller's model and data to the results, as for a serial fit.
+    """
+    datasets = [d for d in fitter.fit_arrange_dict.values() if d.get_to_fit()]
+    for dataset, result in zip(datasets, fit_results):
+        result.model = dataset.get_model().model
+        result.data = dataset.get_data()
+        result.inputs = [(result.model, result.data)]
+
+
+class _FitPickler(pickle.Pickler):
+    """
+    Pickler which sends sasmodels models by id and parameter state.
+    """
+    def reducer_override(self, obj):
+        if isinstance(obj, SasviewModel):
+            filename = obj.filename
+            # compositions of standard models have no file
+            if (filename is not None
+                    and os.path.dirname(os.path.abspath(filename)) == _SASMODELS_DIR):
+                filename = None
+            return _load_model, (obj.id, filename, obj.multiplicity,
+                                 obj.params, obj.dispersion, obj.details)
+        return NotImplemented
+
+
+def _dumps(obj):
+    buffer = io.BytesIO()
+    _FitPickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(obj)
+    return buffer.getvalue()
+
+
+def _load_model(model_id, filename, multiplicity, params, dispersion, details):
+    key = (model_id, filename)
+    cls = _MODEL_CLASSES.get(key, None)
+    if cls is None:
+        if filename is not None:
+            cls = load_custom_model(filename)
+        else:
+            cls = make_model_from_info(load_model_info(model_id))
+        _MODEL_CLASSES[key] = cls
+    model = cls(multiplicity=multiplicity)
+    for name, value in params.items():
+        model.setParam(name, value)
+    for name, pars in dispersion.items():
+        if pars.get('type') == 'array':
+            disperser = ArrayDispersion(pars['npts'], pars['width'], pars['nsigmas'])
+            disperser.set_weights(pars['values'], pars['weights'])
+            model.set_dispersion(name, disperser)
+        else:
+            for par, value in pars.items():
+                model.setParam(name + '.' + par, value)
+    # limits of the fitted parameters
+    model.details.update(details)
+    return model
@@ -3,6 +3,10 @@ BumpsFitting module runs the bumps optimizer.
 """
 import logging
 import os
+import pickle
+import shutil
+import hashlib
+import inspect
 from datetime import timedelta, datetime
 import traceback
 import uncertainties
@@ -31,9 +35,14 @@ from bumps import parameter
 from bumps.fitproblem import FitProblem
 
 
+from sasmodels.sasview_model import SasviewModel
+
 from sas.sascalc.fit.AbstractFitEngine import FitEngine
 from sas.sascalc.fit.AbstractFitEngine import FResult
+from sas.sascalc.fit.AbstractFitEngine import FitData2D
 from sas.sascalc.fit.expression import compile_constraints
+from sas.sascalc.fit.kernel_binding import KernelBinding, layout_supported
+from sas.sascalc.fit.centrosymmetry import is_centrosymmetric
 
 class Progress(object):
     def __init__(self, history, max_step, pars, dof):
@@ -98,6 +107,193 @@ class ConvergenceMonitor(object):
         except Exception:
             self.convergence.append((best, best, best, best, best, best))
 
+# Set in the batch fit worker processes, which are daemonic and so can't
+# start the MPMapper processes.
+SERIAL_MAPPER = False
+
+# Seconds between checkpoints of a long fit.
+CHECKPOINT_INTERVAL = 600
+# Directory in the user directory holding the fit checkpoints.
+CHECKPOINT_DIR_NAME = 'fit_checkpoints'
+CHECKPOINT_VERSION = 1
+# Fitters whose resumable state is the fit history rather than fitter.state.
+_HISTORY_STATE_FITTERS = ('de',)
+# Prefix of the fitter state files in the state directory of a checkpoint.
+_STATE_FILE_PREFIX = 'fit'
+
+def _resumes_fit_state(fitdriver):
+    # CRUFT: bumps < 1.0 resumes only from the files written by fitter.save
+    return 'fit_state' in inspect.signature(fitdriver.fit).parameters
+
+def checkpoint_path(problem):
+    """
+    Default checkpoint file for *problem* in the user directory.
+
+    The name depends on the parameters, their ranges and initial values,
+    and the data, so a fit is only resumed by an identical fit.
+    """
+    from sas.system.user import get_user_dir
+    lower, upper = problem.bounds()
+    key = repr((problem.labels(), lower.tolist(), upper.tolist(),
+                problem.getp().tolist()))
+    digest = hashlib.sha1(key.encode('utf-8'))
+    for model in problem.models:
+        data = getattr(getattr(model, 'fitness', model), 'data', None)
+        values = getattr(data, 'y', getattr(data, 'data', None))
+        if values is not None:
+            digest.update(np.ascontiguousarray(values, dtype='d').tobytes())
+    name = digest.hexdigest() + '.pickle'
+    return os.path.join(get_user_dir(), CHECKPOINT_DIR_NAME, name)
+
+def load_checkpoint(path, problem, fitter_id):
+    """
+    Return the checkpoint saved in *path* by :class:`CheckpointMonitor`, or
+    None if there is none for this problem and fitter.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as fid:
+            saved = pickle.load(fid)
+    except Exception as exc:
+        logging.warning("Could not read fit checkpoint %s: %s", path, exc)
+        return None
+    if (saved.get('version') != CHECKPOINT_VERSION
+            or saved['labels'] != problem.labels()
+            or saved['fitter'] != fitter_id):
+        logging.info("Ignoring fit checkpoint %s from a different fit", path)
+        return None
+    return saved
+
+class CheckpointMonitor(object):
+    """
+    CheckpointMonitor saves the state of the fit to *path* every *interval*
+    seconds: the best point, the fitter state (population and history),
+    the convergence history and the random number generator state.
+
+    Versions of bumps which can't resume from a fitter state object load
+    it with fitter.load instead, so the state is written by fitter.save to
+    the directory *path*.state.
+
+    *driver* is the bumps FitDriver running the fit and *convergence* the
+    ConvergenceMonitor of the fit.
+    """
+    def __init__(self, path, interval, fitter_id, convergence):
+        self.path = path
+        self.interval = interval
+        self.fitter_id = fitter_id
+        self.convergence = convergence
+        self.driver = None
+        self.history = None
+        self._last = 0.0
+
+    @property
+    def state_dir(self):
+        return self.path + '.state'
+
+    def state_files(self):
+        """
+        Path given to fitter.load to resume from the saved state files.
+        """
+        return os.path.join(self.state_dir, _STATE_FILE_PREFIX)
+
+    def config_history(self, history):
+        history.requires(time=1, step=1, point=1, value=1)
+
+    def __call__(self, history):
+        # the latest history is saved if the fit is cancelled
+        self.history = history
+        if history.time[0] - self._last < self.interval:
+            return
+        self._last = history.time[0]
+        self.save(history)
+
+    def save(self, history):
+        fitter = getattr(self.driver, 'fitter', None)
+        state_files = False
+        if not _resumes_fit_state(self.driver):
+            fit_state = None
+            state_files = self._save_state_files(fitter)
+        elif self.fitter_id in _HISTORY_STATE_FITTERS:
+            fit_state = history.snapshot()
+        else:
+            fit_state = getattr(fitter, 'state', None)
+        saved = {
+            'version': CHECKPOINT_VERSION,
+            'fitter': self.fitter_id,
+            'labels': self.driver.problem.labels(),
+            'step': history.step[0],
+            'point': np.array(history.point[0]),
+            'value': history.value[0],
+            'fit_state': fit_state,
+            'state_files': state_files,
+            'convergence': list(self.convergence.convergence),
+            'random_state': np.random.get_state(),
+        }
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # write then rename so a kill during the write keeps the old file
+            partial = self.path + '.part'
+            with open(partial, 'wb') as fid:
+                pickle.dump(saved, fid, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(partial, self.path)
+        except Exception as exc:
+            logging.warning("Could not save fit checkpoint %s: %s", self.path, exc)
+
+    def _save_state_files(self, fitter):
+        """
+        Write the fitter state with fitter.save, returning True if it was
+        saved.
+        """
+        if fitter is None or not hasattr(fitter, 'save'):
+            return False
+        partial = self.state_dir + '.part'
+        try:
+            shutil.rmtree(partial, ignore_errors=True)
+            os.makedirs(partial)
+            fitter.save(os.path.join(partial, _STATE_FILE_PREFIX))
+            # the previous state stays until the new one is complete
+            shutil.rmtree(self.state_dir, ignore_errors=True)
+            os.replace(partial, self.state_dir)
+        except Exception as exc:
+            logging.warning("Could not save fit state %s: %s", self.state_dir, exc)
+            return False
+        return True
+
+    def remove(self):
+        """
+        Remove the checkpoint once the fit is complete.
+        """
+        for path in (self.path, self.path + '.part'):
+            if os.path.exists(path):
+                os.remove(path)
+        for path in (self.state_dir, self.state_dir + '.part'):
+            shutil.rmtree(path, ignore_errors=True)
+
+class PlateauMonitor(object):
+    """
+    PlateauMonitor flags the fit as converged when the best chisq improved
+    by less than the relative tolerance *tol* over the last *steps* steps.
+    """
+    def __init__(self, steps, tol):
+        self.steps = steps
+        self.tol = tol
+        self.converged = False
+        self._values = []
+
+    def config_history(self, history):
+        history.requires(step=1, value=1)
+
+    def __call__(self, history):
+        step, value = history.step[0], history.value[0]
+        self._values.append((step, value))
+        # keep the last value from at least *steps* steps ago
+        while len(self._values) > 1 and self._values[1][0] <= step - self.steps:
+            self._values.pop(0)
+        old_step, old_value = self._values[0]
+        if step - old_step >= self.steps > 0:
+            self.converged = old_value - value <= self.tol*abs(old_value)
+
 
 # Note: currently using bumps parameters for each parameter object so that
 # a SasFitness can be used directly in bumps with the usual semantics.
@@ -106,6 +302,10 @@ class ConvergenceMonitor(object):
 # define reference parameters for each sas parameter, but then we would not
 # be able to express constraints using python expressions in the usual way
 # from bumps, and would instead need to use string expressions.
+# For sasmodels models the copy goes through a KernelBinding, which writes
+# only the parameters that changed and updates the kernel arguments in place,
+# unless the sasmodels argument layout isn't the one it expects.
+
 class SasFitness(object):
     """
     Wrap SAS model as a bumps fitness object
@@ -123,6 +323,10 @@ class SasFitness(object):
             self._reset_pars(fitted, initial_values)
         self.constraints = dict(constraints)
         self.set_fitted(fitted)
+        self._binding = (KernelBinding(self.model, self._pars.keys())
+                         if isinstance(self.model, SasviewModel)
+                         and layout_supported(self.model) else None)
+        self._dirty = True
         self.update()
 
     def _reset_pars(self, names, values):
@@ -181,6 +385,14 @@ class SasFitness(object):
         return self._pars
 
     def update(self):
+        if self._binding is not None:
+            try:
+                if self._binding.update([p.value for p in self._pars.values()]):
+                    self._dirty = True
+                return
+            except TypeError:
+                # Values holding uncertainties after the fit are set as is
+                self._binding.reset()
         for k, v in self._pars.items():
             #print "updating",k,v,v.value
             self.model.setParam(k, v.value)
@@ -188,10 +400,28 @@ class SasFitness(object):
 
     def _recalculate(self):
         if self._dirty:
-            self._residuals, self._theory \
-                = self.data.residuals(self.model.evalDistribution)
+            if self._binding is None:
+                self._residuals, self._theory \
+                    = self.data.residuals(self.model.evalDistribution)
+            else:
+                self._residuals, self._theory = self._evaluate(self._binding)
             self._dirty = False
 
+    def _evaluate(self, model):
+        # the smearer evaluates the model beyond the data range
+        smearer = self.data.smearer
+        if smearer is not None:
+            smearer.model = model
+        try:
+            if isinstance(self.data, FitData2D):
+                # symmetry of the sas model, which sets the parameters
+                symmetric = is_centrosymmetric(self.model)
+                return self.data.residuals(model.evalDistribution, symmetric=symmetric)
+            return self.data.residuals(model.evalDistribution)
+        finally:
+            if smearer is not None:
+                smearer.model = self.model
+
     def numpoints(self):
         return np.sum(self.data.idx) # number of fitted points
 
@@ -248,6 +478,29 @@ class BumpsFit(FitEngine):
         """
         FitEngine.__init__(self)
         self.curr_thread = None
+        self.checkpoint = None
+        self.checkpoint_interval = CHECKPOINT_INTERVAL
+        self.resume = False
+        self.early_stop = None
+
+    def set_checkpoint(self, path='', interval=CHECKPOINT_INTERVAL, resume=True):
+        """
+        Save the fit state every *interval* seconds to *path*, or to a file
+        in the user directory named for the fit if *path* is empty, so that
+        a killed fit can be resumed.  If *resume* is True, the fit continues
+        from the checkpoint left by an identical fit.  *path* None turns off
+        checkpointing.
+        """
+        self.checkpoint = path
+        self.checkpoint_interval = interval
+        self.resume = resume
+
+    def set_early_stop(self, steps, tol=1e-4):
+        """
+        Stop the fit when the best chisq improves by less than the relative
+        tolerance *tol* over *steps* steps.  *steps* = 0 turns this off.
+        """
+        self.early_stop = (steps, tol) if steps > 0 else None
 
     def fit(self, msg_q=None,
             q=None, handler=None, curr_thread=None,
@@ -272,12 +525,14 @@ class BumpsFit(FitEngine):
         problem.setp_hook = ParameterExpressions(models)
 
         # Run the fit
-        result = run_bumps(problem, handler, curr_thread)
+        result = run_bumps(problem, handler, curr_thread,
+                           checkpoint=self.checkpoint,
+                           checkpoint_interval=self.checkpoint_interval,
+                           resume=self.resume, early_stop=self.early_stop)
         if handler is not None:
             handler.update_fit(last=True)
 
-        # TODO: shouldn't reference internal parameters of fit problem
-        varying = problem._parameters
+        varying = _fitted_parameters(problem)
 
         values, errs, cov = result['value'], result['stderr'], result[
             'covariance']
@@ -363,49 +618,124 @@ class BumpsFit(FitEngine):
         else:
             return all_results
 
-def run_bumps(problem, handler, curr_thread):
+def _fitnesses(problem):
+    # CRUFT: older bumps wrap the fitness objects
+    return [getattr(model, 'fitness', model) for model in problem.models]
+
+def _fitted_parameters(problem):
+    """
+    Return the fitted parameters of *problem*, in the order of its points.
+    """
+    pars = dict((p.name, p) for fitness in _fitnesses(problem)
+                for p in fitness.parameters().values())
+    return [pars[label] for label in problem.labels()]
+
+def select_mapper(problem):
+    """
+    Return the bumps mapper for *problem*.
+
+    Populations are evaluated in worker processes when OMP_NUM_THREADS=1,
+    unless SERIAL_MAPPER is set, and in this process otherwise.
+    """
+    omp_threads = int(os.environ.get('OMP_NUM_THREADS', '0'))
+    if omp_threads == 1 and not SERIAL_MAPPER:
+        return MPMapper
+    return SerialMapper
+
+def run_bumps(problem, handler, curr_thread, checkpoint=None,
+              checkpoint_interval=CHECKPOINT_INTERVAL, resume=False,
+              early_stop=None):
+    """
+    Run the selected bumps fitter on *problem*.
+
+    If *checkpoint* is not None, the fit state is saved to that file, or to
+    :func:`checkpoint_path` if it is empty, every *checkpoint_interval*
+    seconds, and the file is removed when the fit ends.  A fit cancelled by
+    the user saves its latest state and keeps the file.  With *resume*, a
+    fit which was killed or cancelled continues from its checkpoint.  *early_stop* is
+    an optional (steps, tol) pair which stops the fit when the best chisq
+    improves by less than the relative tolerance *tol* over *steps* steps.
+    """
     def abort_test():
+        nonlocal cancelled
+        if plateau is not None and plateau.converged:
+            return True
         if curr_thread is None: return False
         try: curr_thread.isquit()
         except KeyboardInterrupt:
             if handler is not None:
                 handler.stop("Fitting: Terminated!!!")
+            cancelled = True
             return True
         return False
 
+    cancelled = False
+
     errors = []
     fitclass, options = get_fitter()
     steps = options.get('steps', 0)
     if steps == 0:
-        pop = options.get('pop', 0)*len(problem._parameters)
+        pop = options.get('pop', 0)*len(problem.getp())
         samples = options.get('samples', 0)
         steps = (samples+pop-1)/pop if pop != 0 else samples
     max_step = steps + options.get('burn', 0)
-    pars = [p.name for p in problem._parameters]
-    #x0 = np.asarray([p.value for p in problem._parameters])
+    pars = problem.labels()
+    convergence_monitor = ConvergenceMonitor()
     options['monitors'] = [
         BumpsMonitor(handler, max_step, pars, problem.dof),
-        ConvergenceMonitor(),
+        convergence_monitor,
         ]
+    plateau = None
+    if early_stop is not None:
+        plateau = PlateauMonitor(*early_stop)
+        options['monitors'].append(plateau)
+    saver = None
+    if checkpoint is not None:
+        if not checkpoint:
+            checkpoint = checkpoint_path(problem)
+        saver = CheckpointMonitor(checkpoint, checkpoint_interval,
+                                  fitclass.id, convergence_monitor)
+        options['monitors'].append(saver)
     fitdriver = fitters.FitDriver(fitclass, problem=problem,
                                   abort_test=abort_test, **options)
+    if saver is not None:
+        saver.driver = fitdriver
     clipped = fitdriver.clip()
     if clipped:
         errors.append(f"The initial value for {clipped} was outside the fitting range and was coerced.")
-    omp_threads = int(os.environ.get('OMP_NUM_THREADS', '0'))
-    mapper = MPMapper if omp_threads == 1 else SerialMapper
+    fit_kw = {}
+    saved = load_checkpoint(checkpoint, problem, fitclass.id) if saver is not None and resume else None
+    if saved is not None:
+        logging.info("Resuming fit from step %d of %s", saved['step'], checkpoint)
+        problem.setp(saved['point'])
+        np.random.set_state(saved['random_state'])
+        convergence_monitor.convergence.extend(saved['convergence'])
+        if saved['fit_state'] is not None and _resumes_fit_state(fitdriver):
+            fit_kw['fit_state'] = saved['fit_state']
+        elif saved.get('state_files') and os.path.isdir(saver.state_dir):
+            fit_kw['resume'] = saver.state_files()
+    mapper = select_mapper(problem)
     fitdriver.mapper = mapper.start_mapper(problem, None)
     #import time; T0 = time.time()
     try:
-        best, fbest = fitdriver.fit()
+        best, fbest = fitdriver.fit(**fit_kw)
+        if saver is not None:
+            if not cancelled:
+                # finished or stopped early: nothing left to resume
+                saver.remove()
+            elif saver.history is not None:
+                saver.save(saver.history)
     except Exception as exc:
         best, fbest = None, np.NaN
         errors.extend([str(exc), traceback.format_exc()])
     finally:
         mapper.stop_mapper(fitdriver.mapper)
+    if plateau is not None and plateau.converged:
+        logging.info("Fit stopped: chisq improved by less than %g over %d steps",
+                     plateau.tol, plateau.steps)
 
 
-    convergence_list = options['monitors'][-1].convergence
+    convergence_list = convergence_monitor.convergence
     convergence = (2*np.asarray(convergence_list)/problem.dof
                    if convergence_list else np.empty((0, 1), 'd'))
 
@@ -0,0 +1,124 @@
+"""
+Evaluation of centrosymmetric 2D models on half of the detector.
+
+The scattering of a real scattering length density obeys Friedel's law,
+I(qx, qy) = I(-qx, -qy).  For a detector which is symmetric about the beam
+centre, each pixel then has the same intensity as its mirror pixel, so the
+model only needs to be evaluated for one pixel of each pair.
+
+The law does not hold for a magnetic sample measured with a polarized beam
+or a polarization analyzer, where the spin dependent cross sections are not
+symmetric, and can't be assumed for models which define their own Iqxy.
+:func:`is_centrosymmetric` checks the model and its current parameter values
+before :func:`eval_half_plane` is used.
+"""
+import weakref
+
+import numpy as np
+
+from sasmodels import generate
+from sasmodels.sasview_model import SasviewModel
+
+# Relative distance, as a fraction of the largest |q|, between the points
+# of a pixel and of the mirror of its partner.
+SYMMETRY_TOLERANCE = 1e-9
+# Polarization of an unpolarized beam and of a detector without analyzer.
+UNPOLARIZED = 0.5
+
+# xy mode of the model sources, keyed by model info.
+_XY_MODES = weakref.WeakKeyDictionary()
+
+
+def is_centrosymmetric(model):
+    """
+    Return True if I(qx, qy) = I(-qx, -qy) for *model* with its current
+    parameter values.
+
+    Only sasmodels models are checked.  Models which define Iqxy directly,
+    rather than in the particle frame through Iqac or Iqabc, and magnetic
+    models with a polarized beam or analyzer are not centrosymmetric.
+    """
+    if not isinstance(model, SasviewModel):
+        return False
+    info = model._model_info
+    if _xy_mode(info) == 'qxy':
+        return False
+    parameters = info.parameters
+    if not parameters.nmagnetic:
+        return True
+    magnetic = any(model.params.get(name, 0.0) != 0.0
+                   for name in model.magnetic_params if name.endswith('_M0'))
+    return (not magnetic
+            or (model.params.get('up_frac_i', UNPOLARIZED) == UNPOLARIZED
+                and model.params.get('up_frac_f', UNPOLARIZED) == UNPOLARIZED))
+
+
+def _xy_mode(info):
+    mode = _XY_MODES.get(info, None)
+    if mode is None:
+        if info.Iqxy is not None:
+            # python function or C body for Iqxy
+            mode = 'qxy'
+        elif info.composition is not None:
+            # product and mixture models are built from symmetric parts
+            parts = info.composition[1]
+            modes = [_xy_mode(part) for part in parts]
+            mode = 'qxy' if 'qxy' in modes else 'qa'
+        elif not info.compiled:
+            mode = 'qa'
+        else:
+            try:
+                source = [generate.read_text(f) for f in generate.model_sources(info)]
+            except (IOError, OSError):
+                # can't tell, so don't assume the symmetry
+                source = ["double Iqxy("]
+            if info.c_code:
+                source.append(info.c_code)
+            mode = generate.find_xy_mode(source)
+        _XY_MODES[info] = mode
+    return mode
+
+
+def half_plane(qx, qy):
+    """
+    Pair the points (qx, qy) with their mirror points (-qx, -qy).
+
+    Returns *(index, inverse)* where *index* selects one point of each pair
+    and each point without a partner, and *values[inverse]* expands the
+    values at *qx[index], qy[index]* to all the points.  Returns None if no
+    point has a partner.
+    """
+    qx, qy = np.asarray(qx, dtype=np.float64), np.asarray(qy, dtype=np.float64)
+    if not len(qx):
+        return None
+    qmax = max(np.max(np.abs(qx)), np.max(np.abs(qy)))
+    if not qmax > 0 or not np.isfinite(qmax):
+        return None
+    step = qmax * SYMMETRY_TOLERANCE
+    kx = np.rint(qx / step).astype(np.int64)
+    ky = np.rint(qy / step).astype(np.int64)
+    # canonical half plane: ky > 0, or ky = 0 and kx >= 0
+    flip = (ky < 0) | ((ky == 0) & (kx < 0))
+    kx[flip] = -kx[flip]
+    ky[flip] = -ky[flip]
+    # |kx| and ky are below 2**30, so the key fits in 62 bits
+    key = kx * (1 << 31) + ky
+    _, index, inverse = np.unique(key, return_index=True, return_inverse=True)
+    if len(index) == len(key):
+        return None
+    return index, inverse
+
+
+def eval_half_plane(fn, qx, qy, plan=None):
+    """
+    Return *fn([qx, qy])*, evaluating *fn* only at the points of
+    :func:`half_plane`.  *plan* is the result of *half_plane(qx, qy)*
+    if it is already known.
+    """
+    if plan is None:
+        plan = half_plane(qx, qy)
+    if plan is None:
+        return fn([qx, qy])
+    index, inverse = plan
+    value = np.asarray(fn([qx[index], qy[index]]))
+    return value[inverse]
@@ -0,0 +1,250 @@
+"""
+Binding of fit parameter values directly onto the sasmodels kernel arguments.
+
+SasviewModel.evalDistribution builds a new kernel for the q points and
+rebuilds the complete kernel argument vector (dispersity and weights of
+every parameter) each time it is called.  During a fit the q points never
+change and only a few parameters change between evaluations, so
+:class:`KernelBinding` keeps the kernels and the arguments built by
+make_kernel_args, and rewrites only the entries of the parameters that
+changed, at the offsets given by the CallDetails of the arguments.  A change
+in the length of a dispersity, or in a magnetic parameter (which
+make_kernel_args converts to rectangular form), builds the arguments again.
+The values are written to the model through setParam, so the model keeps
+the state of the last update.
+
+The argument layout is internal to sasmodels, so :func:`layout_supported`
+checks that make_kernel_args still lays out a probe set of parameters as
+expected, and callers fall back to setParam and evalDistribution if not.
+"""
+import logging
+
+import numpy as np
+
+from sasmodels import core, weights
+from sasmodels.details import NUM_COMMON_PARS, NUM_MAGNETIC_PARS, make_kernel_args
+from sasmodels.sasview_model import calculation_lock
+
+# Number of q vectors (data, resolution tails, ...) which keep a kernel.
+KERNEL_CACHE_SIZE = 4
+# Warn only once about an unsupported sasmodels argument layout.
+_LAYOUT_WARNED = False
+
+
+class _ProbeKernel(object):
+    """
+    Stand-in for the kernel given to make_kernel_args by layout_supported.
+    """
+    dtype = np.dtype('d')
+
+    def __init__(self, model_info):
+        self.info = model_info
+
+
+def layout_supported(model):
+    """
+    Return True if the kernel arguments of *model* have the layout that
+    :class:`KernelBinding` writes into.
+
+    A probe set of values, with a two point dispersity for the dispersity
+    parameters, is converted with make_kernel_args, and each value,
+    dispersity and weight must be found where :meth:`KernelBinding._refresh`
+    would write it.
+    """
+    global _LAYOUT_WARNED
+    try:
+        parameters = model._model_info.parameters
+        call_pars = parameters.call_parameters
+        npars = parameters.npars
+        magnetic = parameters.nvalues - NUM_MAGNETIC_PARS*parameters.nmagnetic
+        pairs = [(k + 0.5, [k + 0.5], [1.0]) for k in range(len(call_pars))]
+        dispersed = [j + NUM_COMMON_PARS for j in range(npars)
+                     if call_pars[j + NUM_COMMON_PARS].polydisperse]
+        for k in dispersed[:parameters.max_pd]:
+            pairs[k] = (k + 0.5, [k + 0.25, k + 0.75], [k + 1.25, k + 1.75])
+        call_details, data, _ = make_kernel_args(_ProbeKernel(model._model_info), pairs)
+        nvalues, total = len(call_pars), call_details.num_weights
+        supported = (np.array_equal(data[:magnetic], [v for v, _, _ in pairs[:magnetic]])
+                     and len(call_details.length) == npars)
+        for j in range(npars if supported else 0):
+            _, dispersity, weight = pairs[j + NUM_COMMON_PARS]
+            start = nvalues + call_details.offset[j]
+            supported = (call_details.length[j] == len(weight)
+                         and np.array_equal(data[start:start+len(weight)], dispersity)
+                         and np.array_equal(data[start+total:start+total+len(weight)], weight))
+            if not supported:
+                break
+    except Exception:
+        supported = False
+    if not supported and not _LAYOUT_WARNED:
+        _LAYOUT_WARNED = True
+        logging.warning("The sasmodels kernel arguments have changed; fits use "
+                        "setParam and evalDistribution for each evaluation")
+    return supported
+
+
+class KernelBinding(object):
+    """
+    Evaluate *model* from a vector of parameter values.
+
+    *names* are the parameter names accepted by *model.setParam*, in the
+    order of the values given to :meth:`update`.  *model* must pass
+    :func:`layout_supported`.
+    """
+    def __init__(self, model, names):
+        self.model = model
+        self.names = list(names)
+        self.values = np.full(len(self.names), np.nan)
+        parameters = model._model_info.parameters
+        self._call_pars = parameters.call_parameters
+        # the values from here on are converted to rectangular form
+        self._magnetic = parameters.nvalues - NUM_MAGNETIC_PARS*parameters.nmagnetic
+        index = dict((p.name, k) for k, p in enumerate(self._call_pars))
+        # call parameter index of each name, or -1 if it isn't one
+        self._slots = [index.get(name.partition('.')[0], -1) for name in self.names]
+        self._kernels = []
+        self._compiled = None
+        self._reset_args()
+
+    def _reset_args(self):
+        self._args = None
+        self._stale = set(range(len(self._call_pars)))
+
+    def reset(self):
+        """
+        Forget the current values, for example after the model parameters
+        were set directly.  The next :meth:`update` writes every value.
+        """
+        self.values[:] = np.nan
+        self._reset_args()
+
+    def update(self, values):
+        """
+        Write the entries of *values* which differ from the current values
+        into the model.  Returns True if any value changed.
+
+        Raises TypeError if the values can't be converted to float.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        # NaN != NaN, so the first update writes everything
+        changed = np.flatnonzero(values != self.values)
+        if not len(changed):
+            return False
+        for k in changed:
+            # keep the python type that setParam would have stored
+            self.model.setParam(self.names[k], values[k].item())
+            slot = self._slots[k]
+            if slot < 0:
+                self._reset_args()
+            else:
+                self._stale.add(slot)
+        self.values[changed] = values[changed]
+        return True
+
+    def evalDistribution(self, qdist):
+        """
+        Evaluate the model at *qdist*, which is q or [qx, qy], as
+        SasviewModel.evalDistribution.
+        """
+        if isinstance(qdist, (list, tuple)):
+            qx, qy = qdist
+            q_vectors = [np.asarray(qx), np.asarray(qy)]
+        elif isinstance(qdist, np.ndarray):
+            q_vectors = [qdist]
+        else:
+            raise TypeError("evalDistribution expects q or [qx, qy], not %r"
+                            % type(qdist))
+        with calculation_lock:
+            kernel = self._get_kernel(q_vectors)
+            call_details, data, is_magnetic = self._get_args(kernel)
+            return kernel(call_details, data, cutoff=self.model.cutoff,
+                          magnetic=is_magnetic)
+
+    def release(self):
+        """
+        Release the kernels.
+        """
+        for _, kernel in self._kernels:
+            kernel.release()
+        self._kernels = []
+
+    def _get_kernel(self, q_vectors):
+        if self._compiled is None:
+            self._compiled = core.build_model(self.model._model_info)
+        for k, (q, kernel) in enumerate(self._kernels):
+            if (len(q) == len(q_vectors)
+                    and all(np.array_equal(a, b) for a, b in zip(q, q_vectors))):
+                if k:
+                    self._kernels.insert(0, self._kernels.pop(k))
+                return kernel
+        kernel = self._compiled.make_kernel(q_vectors)
+        # keep our own copy in case the caller reuses its arrays
+        self._kernels.insert(0, ([np.array(q) for q in q_vectors], kernel))
+        while len(self._kernels) > KERNEL_CACHE_SIZE:
+            self._kernels.pop()[1].release()
+        return kernel
+
+    def _get_args(self, kernel):
+        if self._args is not None and self._stale:
+            self._refresh()
+        if self._args is None:
+            pairs = [self._weights(p) for p in self._call_pars]
+            self._args = make_kernel_args(kernel, pairs)
+        self._stale.clear()
+        return self._args
+
+    def _refresh(self):
+        """
+        Write the stale entries into the kernel arguments, which are laid
+        out as [values, dispersity, weights] as shown by CallDetails.show.
+        Drops the arguments if they need to be built again.
+        """
+        call_details, data, _ = self._args
+        nvalues, total = len(self._call_pars), call_details.num_weights
+        for slot in self._stale:
+            if slot >= self._magnetic:
+                self._args = None
+                return
+            value, dispersity, weight = self._weights(self._call_pars[slot])
+            data[slot] = value
+            j = slot - NUM_COMMON_PARS
+            if not 0 <= j < len(call_details.length):
+                continue
+            if len(weight) != call_details.length[j]:
+                self._args = None
+                return
+            start = nvalues + call_details.offset[j]
+            data[start:start+len(weight)] = dispersity
+            data[start+total:start+total+len(weight)] = weight
+
+    def _weights(self, par):
+        """
+        Return the (value, dispersity, weight) of *par* for the kernel, as
+        used by SasviewModel.evalDistribution.
+        """
+        model = self.model
+        if par.name not in model.params:
+            if par.id == model.multiplicity_info.control:
+                return model.multiplicity, [model.multiplicity], [1.0]
+            # hidden parameters, such as the scale of a structure factor
+            value = model._model_info.parameters.defaults.get(par.name, np.nan)
+            return value, [value], [1.0]
+        value = model.getParam(par.name)
+        if not par.polydisperse:
+            return value, [value], [1.0]
+        dispersion = model.dispersion[par.name]
+        if dispersion['type'] == 'array':
+            return value, dispersion['values'], dispersion['weights']
+        dispersity, weight = weights.get_weights(
+            dispersion['type'], dispersion['npts'], dispersion['width'],
+            dispersion['nsigmas'], value, par.limits, par.relative_pd)
+        return value, dispersity, weight
+
+    def __getstate__(self):
+        # kernels hold compiled code and device memory; rebuild them on use
+        state = self.__dict__.copy()
+        state['_kernels'] = []
+        state['_compiled'] = None
+        state['_args'] = None
+        state['_stale'] = set(range(len(self._call_pars)))
+        return state
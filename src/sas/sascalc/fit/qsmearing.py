@@ -11,9 +11,13 @@
 import math
 import logging
 import sys
+import hashlib
+import threading
+from collections import OrderedDict
 
 import numpy as np  # type: ignore
 from numpy import pi, exp # type:ignore
+from scipy import sparse
 
 from sasmodels.resolution import Slit1D, Pinhole1D
 from sasmodels.sesans import SesansTransform
@@ -21,6 +25,90 @@ from sasmodels.resolution2d import Pinhole2D
 
 from sasdata.data_util.nxsunit import Converter
 
+# Number of 1D resolution functions kept by the resolution cache.
+RESOLUTION_CACHE_SIZE = 8
+# Weight matrices with a larger fraction of nonzeros are applied dense.
+SPARSE_DENSITY = 0.25
+# Largest 2D sampling plan kept between evaluations, in bytes.
+PLAN_MEMORY_LIMIT = 512*2**20
+
+
+class ResolutionCache(object):
+    """
+    Least recently used cache of 1D resolution functions.
+
+    Building the weight matrix of a slit or pinhole resolution is expensive
+    for large data sets, and the same resolution is requested whenever the
+    smearing, model or q range of a fit page changes.  The entries are keyed
+    by the resolution type and the q and resolution arrays, and hold the
+    resolution with its transposed weight matrix in CSR form.
+    """
+    def __init__(self, size=RESOLUTION_CACHE_SIZE):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, build):
+        """
+        Return the value for *key*, calling *build()* to create it if needed.
+        """
+        with self._lock:
+            value = self._items.get(key, None)
+            if value is not None:
+                self._items.move_to_end(key)
+                return value
+        value = build()
+        with self._lock:
+            self._items[key] = value
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+_resolution_cache = ResolutionCache()
+
+
+def _array_key(*arrays):
+    """
+    Key for the contents of *arrays*, which may be scalars or None.
+    """
+    key = []
+    for a in arrays:
+        a = np.ascontiguousarray(0 if a is None else a, dtype=np.float64)
+        key.append((a.shape, hashlib.sha1(a.tobytes()).hexdigest()))
+    return tuple(key)
+
+
+def resolution_weights(resolution):
+    """
+    Return the transpose of the weight matrix of *resolution*, so that the
+    smeared theory is *weights @ theory*, as a CSR matrix if it is sparse
+    enough, or None if the resolution has no weight matrix.
+    """
+    matrix = getattr(resolution, 'weight_matrix', None)
+    if matrix is None:
+        return None
+    weights = sparse.csr_matrix(np.asarray(matrix).T)
+    if weights.nnz > SPARSE_DENSITY*np.prod(weights.shape):
+        return np.ascontiguousarray(np.asarray(matrix).T)
+    return weights
+
+
+def _cached_resolution(key, build):
+    """
+    Return (resolution, weights) for *key* from the resolution cache.
+    """
+    def build_weights():
+        resolution = build()
+        return resolution, resolution_weights(resolution)
+    return _resolution_cache.get(key, build_weights)
+
 
 def smear_selection(data, model=None):
     """
@@ -95,12 +183,14 @@ class PySmear(object):
     """
     Wrapper for pure python sasmodels resolution functions.
     """
-    def __init__(self, resolution, model, offset=None):
+    def __init__(self, resolution, model, offset=None, weights=None):
         self.model = model
         self.resolution = resolution
         if offset is None:
             offset = np.searchsorted(self.resolution.q_calc, self.resolution.q[0])
         self.offset = offset
+        # Transposed weight matrix, see resolution_weights
+        self.weights = resolution_weights(resolution) if weights is None else weights
 
     def apply(self, iq_in, first_bin=0, last_bin=None):
         """
@@ -121,8 +211,9 @@ class PySmear(object):
         if end+1 < len(q_calc):
             iq_calc[end+1:] = self.model.evalDistribution(q_calc[end+1:])
         iq_calc[start:end+1] = iq_in[first_bin:last_bin+1]
-        smeared = self.resolution.apply(iq_calc)
-        return smeared
+        if self.weights is None:
+            return self.resolution.apply(iq_calc)
+        return self.weights @ iq_calc
     __call__ = apply
 
     def get_bin_range(self, q_min=None, q_max=None):
@@ -144,12 +235,19 @@ def slit_smear(data, model=None):
     width = data.dxw if data.dxw is not None else 0
     height = data.dxl if data.dxl is not None else 0
     # TODO: width and height seem to be reversed
-    return PySmear(Slit1D(q, height, width), model)
+    resolution, weights = _cached_resolution(
+        ('slit',) + _array_key(q, height, width),
+        # copies, since the cached resolution outlives the data arrays
+        lambda: Slit1D(np.array(q), np.array(height), np.array(width)))
+    return PySmear(resolution, model, weights=weights)
 
 def pinhole_smear(data, model=None):
     q = data.x
     width = data.dx if data.dx is not None else 0
-    return PySmear(Pinhole1D(q, width), model)
+    resolution, weights = _cached_resolution(
+        ('pinhole',) + _array_key(q, width),
+        lambda: Pinhole1D(np.array(q), np.array(width)))
+    return PySmear(resolution, model, weights=weights)
 
 
 class PySmear2D(object):
@@ -165,6 +263,12 @@ class PySmear2D(object):
         self.index = None
         self.coords = 'polar'
         self.smearer = True
+        # Store the q points of the sampling plan in float32
+        self.single = False
+        self._plan = None
+        self._plan_data = None
+        self._plan_key = None
+        self._plan_index = None
 
     def set_accuracy(self, accuracy='Low'):
         """
@@ -174,6 +278,16 @@ class PySmear2D(object):
         """
         self.accuracy = accuracy
 
+    def set_single(self, single=True):
+        """
+        Store the oversampled q points in single precision, halving the
+        memory held between evaluations at the cost of a relative error
+        of about 1e-7 in q.
+
+        :param single: bool
+        """
+        self.single = single
+
     def set_smearer(self, smearer=True):
         """
         Set whether or not smearer will be used
@@ -190,6 +304,7 @@ class PySmear2D(object):
         :param data: DataLoader.Data_info type
         """
         self.data = data
+        self._plan = self._plan_data = None
 
     def set_model(self, model=None):
         """
@@ -213,9 +328,7 @@ class PySmear2D(object):
         then find smeared intensity
         """
         if self.smearer:
-            res = Pinhole2D(data=self.data, index=self.index,
-                            nsigma=3.0, accuracy=self.accuracy,
-                            coords=self.coords)
+            res = self.get_plan()
             val = self.model.evalDistribution(res.q_calc)
             return res.apply(val)
         else:
@@ -226,3 +339,35 @@ class PySmear2D(object):
             val = self.model.evalDistribution(q_calc)
             return val
 
+    def get_plan(self):
+        """
+        Return the Pinhole2D sampling plan (oversampled q points and
+        Gaussian weights) for the data, index, accuracy and coordinates.
+
+        The plan only depends on the data, so it is kept and reused until one
+        of these changes, unless it is larger than PLAN_MEMORY_LIMIT.
+        """
+        key = (self.accuracy, self.coords, self.single)
+        index = self.index
+        # self.data may be assigned directly, so check it is the same object
+        if (self._plan is not None and self._plan_data is self.data
+                and self._plan_key == key and _same_index(self._plan_index, index)):
+            return self._plan
+        plan = Pinhole2D(data=self.data, index=index,
+                         nsigma=3.0, accuracy=self.accuracy,
+                         coords=self.coords)
+        if self.single:
+            plan.q_calc = [np.asarray(q, dtype=np.float32) for q in plan.q_calc]
+        if sum(np.asarray(q).nbytes for q in plan.q_calc) <= PLAN_MEMORY_LIMIT:
+            self._plan, self._plan_data, self._plan_key = plan, self.data, key
+            self._plan_index = None if index is None else np.array(index)
+        else:
+            self._plan = self._plan_data = None
+        return plan
+
+
+def _same_index(a, b):
+    if a is None or b is None:
+        return a is None and b is None
+    b = np.asarray(b)
+    return a.shape == b.shape and np.array_equal(a, b)
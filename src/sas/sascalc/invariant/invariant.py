@@ -31,6 +31,54 @@ Q_MAXIMUM = 10
 # Number of steps in the extrapolation
 INTEGRATION_NSTEPS = 1000
 
+def integration_widths(x):
+    """
+    Width of the q bin of each point for the trapezoid rule, along the last
+    axis of x: ::
+
+        dx0 = (x1 - x0)/2
+        dxi = (xi+1 - xi-1)/2
+        dxn = (xn - xn-1)/2
+
+    :param x: q values, of shape (nq,) or (nframes, nq) with nq > 1
+    """
+    x = np.asarray(x, dtype=float)
+    dx = np.empty_like(x)
+    dx[..., 1:-1] = 0.5 * (x[..., 2:] - x[..., :-2])
+    dx[..., 0] = 0.5 * (x[..., 1] - x[..., 0])
+    dx[..., -1] = 0.5 * (x[..., -1] - x[..., -2])
+    return dx
+
+def integrate_qstar(x, y, dy=None, dxl=None):
+    """
+    Invariant of each frame of y and its uncertainty, integrated with the
+    trapezoid rule: ::
+
+        q_star = sum xi**2 *yi *dxi           for pinhole data
+        q_star = sum dxli *xi *yi *dxi        for slit smeared data
+        dq_star = sqrt(sum (xi**2 *dyi *dxi)**2)
+
+    :param x: q values, of shape (nq,) or (nframes, nq)
+    :param y: intensities, of shape (nq,) or (nframes, nq)
+    :param dy: optional uncertainty on y
+    :param dxl: slit height for smeared data, None for pinhole data
+
+    :return: q_star, dq_star with one value per frame; dq_star is None
+        if dy is None
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if x.shape[-1] <= 1 or x.shape[-1] != y.shape[-1]:
+        msg = "Length x and y must be equal"
+        msg += " and greater than 1; got x=%s, y=%s" % (x.shape[-1], y.shape[-1])
+        raise ValueError(msg)
+    gx = x * x if dxl is None else dxl * x
+    weight = gx * integration_widths(x)
+    qstar = np.sum(weight * y, axis=-1)
+    if dy is None:
+        return qstar, None
+    return qstar, np.sqrt(np.sum((weight * dy) ** 2, axis=-1))
+
 class Transform(object):
     """
     Define interface that need to compute a function or an inverse
@@ -132,18 +180,16 @@ class Guinier(Transform):
     def extract_model_parameters(self, constant, slope, dconstant=0, dslope=0):
         """
 	    assign new value to the scale and the radius
+
+        The fit results may be arrays with one value per frame.
     	"""
-        self.scale = math.exp(constant)
-        if slope > 0:
-            slope = 0.0
-        self.radius = math.sqrt(-3 * slope)
+        self.scale = np.exp(constant)
+        slope = np.minimum(slope, 0.0)
+        self.radius = np.sqrt(-3 * slope)
         # Errors
-        self.dscale = math.exp(constant) * dconstant
-        if slope == 0.0:
-            n_zero = -1.0e-24
-            self.dradius = -3.0 / 2.0 / math.sqrt(-3 * n_zero) * dslope
-        else:
-            self.dradius = -3.0 / 2.0 / math.sqrt(-3 * slope) * dslope
+        self.dscale = np.exp(constant) * dconstant
+        n_zero = -1.0e-24
+        self.dradius = -3.0 / 2.0 / np.sqrt(-3 * np.where(slope == 0.0, n_zero, slope)) * dslope
 
         return [self.radius, self.scale], [self.dradius, self.dscale]
 
@@ -162,12 +208,11 @@ class Guinier(Transform):
 
         :param x: array of q-values
         """
-        p1 = np.array([self.dscale * math.exp(-((self.radius * q) ** 2 / 3)) \
-                          for q in x])
-        p2 = np.array([self.scale * math.exp(-((self.radius * q) ** 2 / 3))\
-                     * (-(q ** 2 / 3)) * 2 * self.radius * self.dradius for q in x])
-        diq2 = p1 * p1 + p2 * p2
-        return np.array([math.sqrt(err) for err in diq2])
+        x = np.asarray(x)
+        guinier = np.exp(-((self.radius * x) ** 2 / 3))
+        p1 = self.dscale * guinier
+        p2 = self.scale * guinier * (-(x ** 2 / 3)) * 2 * self.radius * self.dradius
+        return np.sqrt(p1 * p1 + p2 * p2)
 
     def _guinier(self, x):
         r"""
@@ -181,14 +226,17 @@ class Guinier(Transform):
          - self.scale: $s$, the scale value
          - self.radius: $r$, the guinier radius value
 
+        The parameters may be arrays of shape (nframes, 1) for an x of
+        shape (nframes, nq).
+
         :return: F(x)
         """
         # transform the radius of coming from the inverse guinier function to a
         # a radius of a guinier function
-        if self.radius <= 0:
+        if np.any(self.radius <= 0):
             msg = "Rg expected positive value, but got %s" % self.radius
             raise ValueError(msg)
-        value = np.array([math.exp(-((self.radius * i) ** 2 / 3)) for i in x])
+        value = np.exp(-((self.radius * np.asarray(x)) ** 2 / 3))
         return self.scale * value
 
 class PowerLaw(Transform):
@@ -218,10 +266,10 @@ class PowerLaw(Transform):
         Assign new value to the scale and the power
         """
         self.power = -slope
-        self.scale = math.exp(constant)
+        self.scale = np.exp(constant)
 
         # Errors
-        self.dscale = math.exp(constant) * dconstant
+        self.dscale = np.exp(constant) * dconstant
         self.dpower = -dslope
 
         return [self.power, self.scale], [self.dpower, self.dscale]
@@ -238,11 +286,10 @@ class PowerLaw(Transform):
         Returns the error on I(q) for the given array of q-values
         :param x: array of q-values
         """
-        p1 = np.array([self.dscale * math.pow(q, -self.power) for q in x])
-        p2 = np.array([self.scale * self.power * math.pow(q, -self.power - 1)\
-                           * self.dpower for q in x])
-        diq2 = p1 * p1 + p2 * p2
-        return np.array([math.sqrt(err) for err in diq2])
+        x = np.asarray(x)
+        p1 = self.dscale * x ** -self.power
+        p2 = self.scale * self.power * x ** (-self.power - 1) * self.dpower
+        return np.sqrt(p1 * p1 + p2 * p2)
 
     def _power_law(self, x):
         """
@@ -257,15 +304,15 @@ class PowerLaw(Transform):
         :param x: array
         :return: F(x)
         """
-        if self.power <= 0:
+        if np.any(self.power <= 0):
             msg = "Power_law function expected positive power,"
             msg += " but got %s" % self.power
             raise ValueError(msg)
-        if self.scale <= 0:
+        if np.any(self.scale <= 0):
             msg = "scale expected positive value, but got %s" % self.scale
             raise ValueError(msg)
 
-        value = np.array([math.pow(i, -self.power) for i in x])
+        value = np.asarray(x, dtype=float) ** -self.power
         return self.scale * value
 
 class Extrapolator(object):
@@ -513,32 +560,10 @@ class InvariantCalculator(object):
             msg = "Length x and y must be equal"
             msg += " and greater than 1; got x=%s, y=%s" % (len(data.x), len(data.y))
             raise ValueError(msg)
-        else:
-            # Take care of smeared data
-            if self._smeared is None:
-                gx = data.x * data.x
-            # assumes that len(x) == len(dxl).
-            else:
-                gx = data.dxl * data.x
-
-            n = len(data.x) - 1
-            #compute the first delta q
-            dx0 = (data.x[1] - data.x[0]) / 2
-            #compute the last delta q
-            dxn = (data.x[n] - data.x[n - 1]) / 2
-            total = 0
-            total += gx[0] * data.y[0] * dx0
-            total += gx[n] * data.y[n] * dxn
-
-            if len(data.x) == 2:
-                return total
-            else:
-                #iterate between for element different
-                #from the first and the last
-                for i in range(1, n - 1):
-                    dxi = (data.x[i + 1] - data.x[i - 1]) / 2
-                    total += gx[i] * data.y[i] * dxi
-                return total
+        # Take care of smeared data, assumes that len(x) == len(dxl).
+        dxl = None if self._smeared is None else data.dxl
+        qstar, _ = integrate_qstar(data.x, data.y, dxl=dxl)
+        return float(qstar)
 
     def _get_qstar_uncertainty(self, data):
         """
@@ -570,31 +595,10 @@ class InvariantCalculator(object):
             # None instead
             if data.dy is None:
                 return None
-            dy = data.dy
-            # Take care of smeared data
-            if self._smeared is None:
-                gx = data.x * data.x
-            # assumes that len(x) == len(dxl).
-            else:
-                gx = data.dxl * data.x
-
-            n = len(data.x) - 1
-            #compute the first delta
-            dx0 = (data.x[1] - data.x[0]) / 2
-            #compute the last delta
-            dxn = (data.x[n] - data.x[n - 1]) / 2
-            total = 0
-            total += (gx[0] * dy[0] * dx0) ** 2
-            total += (gx[n] * dy[n] * dxn) ** 2
-            if len(data.x) == 2:
-                return math.sqrt(total)
-            else:
-                #iterate between for element different
-                #from the first and the last
-                for i in range(1, n - 1):
-                    dxi = (data.x[i + 1] - data.x[i - 1]) / 2
-                    total += (gx[i] * dy[i] * dxi) ** 2
-                return math.sqrt(total)
+            # Take care of smeared data, assumes that len(x) == len(dxl).
+            dxl = None if self._smeared is None else data.dxl
+            _, dqstar = integrate_qstar(data.x, data.y, dy=data.dy, dxl=dxl)
+            return float(dqstar)
 
     def _get_extrapolated_data(self, model, npts=INTEGRATION_NSTEPS,
                                q_start=Q_MINIMUM, q_end=Q_MAXIMUM):
@@ -1053,3 +1057,303 @@ class InvariantCalculator(object):
         #                 dcontrast)**2 / (4 * math.pi**2 * constrast**6))
    
         return s, ds
+
+def _fit_lines(x, y, weight, power=None):
+    """
+    Weighted least squares fit of y = slope * x + constant for each frame,
+    as Extrapolator.fit does for a single data set.  Points with zero weight
+    are ignored.
+
+    :param x: linearized q values of shape (nframes, npts)
+    :param y: linearized intensities of shape (nframes, npts)
+    :param weight: 1/dy**2 for the linearized intensities
+    :param power: if given, the slope is fixed to -power
+
+    :return: [slope, constant], [dslope, dconstant] with one value per frame
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s_1 = np.sum(weight, axis=-1)
+        s_x = np.sum(weight * x, axis=-1)
+        s_y = np.sum(weight * y, axis=-1)
+        if power is not None:
+            slope = np.full(s_1.shape, -power, dtype=float)
+            constant = (s_y - slope * s_x) / s_1
+            deltas = slope[..., None] * x + constant[..., None] - y
+            residuals = np.sum(weight * deltas * deltas, axis=-1)
+            return [slope, constant], [np.zeros_like(slope), np.sqrt(residuals / s_1)]
+        s_xx = np.sum(weight * x * x, axis=-1)
+        s_xy = np.sum(weight * x * y, axis=-1)
+        det = s_1 * s_xx - s_x * s_x
+        slope = (s_1 * s_xy - s_x * s_y) / det
+        constant = (s_xx * s_y - s_x * s_xy) / det
+        deltas = slope[..., None] * x + constant[..., None] - y
+        residuals = np.sum(weight * deltas * deltas, axis=-1)
+        dslope = np.sqrt(residuals * s_1 / det)
+        dconstant = np.sqrt(residuals * s_xx / det)
+    # numpy.linalg.lstsq doesn't return the residuals of an exact fit
+    exact = np.sum(weight > 0, axis=-1) <= 2
+    dslope[exact] = dconstant[exact] = -1.0
+    return [slope, constant], [dslope, dconstant]
+
+class BatchInvariantCalculator(object):
+    """
+    Compute the invariant, volume fraction and specific surface of a series
+    of frames, for example a time resolved measurement, all at once.
+
+    The results are arrays with one value per frame and are the same as those
+    of an InvariantCalculator for each frame.  Where InvariantCalculator
+    raises an error because the extrapolation or the volume fraction can't
+    be computed, the value for the frame is NaN.
+    """
+    def __init__(self, q, iq, diq=None, dxl=None, background=0, scale=1):
+        """
+        :param q: q values of shape (nq,), or (nframes, nq) if the frames
+            have different q values
+        :param iq: intensities of shape (nframes, nq)
+        :param diq: optional uncertainties on iq
+        :param dxl: slit height for smeared data, None for pinhole data
+        :param background: background subtracted from each frame, a value or
+            one value per frame
+        :param scale: scaling factor applied to each frame, a value or one
+            value per frame
+        """
+        iq = np.asarray(iq, dtype=float)
+        if iq.ndim == 1:
+            iq = iq[None, :]
+        self._x = np.broadcast_to(np.asarray(q, dtype=float), iq.shape)
+        background = self._per_frame(background)
+        scale = self._per_frame(scale)
+        self._y = scale * iq - background
+        if diq is None:
+            dy = np.zeros(iq.shape)
+        else:
+            dy = np.abs(scale) * np.broadcast_to(np.asarray(diq, dtype=float), iq.shape)
+        # As InvariantCalculator, frames without errors use unit errors
+        dy[np.all(dy == 0, axis=-1)] = 1.0
+        self._dy = dy
+        self._dxl = None if dxl is None else np.broadcast_to(
+            np.asarray(dxl, dtype=float), iq.shape)
+
+        # Extrapolation parameters, as InvariantCalculator
+        self._low_extrapolation_npts = 4
+        self._low_extrapolation_function = 'guinier'
+        self._low_extrapolation_power = None
+        self._low_extrapolation_power_fitted = None
+
+        self._high_extrapolation_npts = 4
+        self._high_extrapolation_power = None
+        self._high_extrapolation_power_fitted = None
+
+        self._low_q_limit = Q_MINIMUM
+
+    @staticmethod
+    def _per_frame(value):
+        value = np.asarray(value, dtype=float)
+        return value[:, None] if value.ndim == 1 else value
+
+    @property
+    def nframes(self):
+        return self._y.shape[0]
+
+    def set_extrapolation(self, range, npts=4, function=None, power=None):
+        """
+        Set the extrapolation parameters for the high or low Q-range,
+        as InvariantCalculator.set_extrapolation.
+        """
+        range = range.lower()
+        if range not in ['high', 'low']:
+            raise ValueError("Extrapolation range should be 'high' or 'low'")
+        function = function.lower()
+        if function not in ['power_law', 'guinier']:
+            msg = "Extrapolation function should be 'guinier' or 'power_law'"
+            raise ValueError(msg)
+
+        if range == 'high':
+            if function != 'power_law':
+                msg = "Extrapolation only allows a power law at high Q"
+                raise ValueError(msg)
+            self._high_extrapolation_npts = npts
+            self._high_extrapolation_power = power
+            self._high_extrapolation_power_fitted = power
+        else:
+            self._low_extrapolation_function = function
+            self._low_extrapolation_npts = npts
+            self._low_extrapolation_power = power
+            self._low_extrapolation_power_fitted = power
+
+    def get_extrapolation_power(self, range='high'):
+        """
+        :return: the fitted power of each frame for the power law
+            extrapolation of a given range
+        """
+        if range == 'low':
+            return self._low_extrapolation_power_fitted
+        return self._high_extrapolation_power_fitted
+
+    def _fit(self, model, qmin, qmax, power=None):
+        """
+        Fit *model* to the points of each frame between qmin and qmax.
+        """
+        x, y = self._x, self._y
+        # As Extrapolator.fit, frames with missing errors are fitted unweighted
+        sigma = np.where(np.all(self._dy > 0, axis=-1)[:, None], self._dy, 1.0)
+        select = ((x >= qmin[:, None]) & (x <= qmax[:, None])
+                  & (x > 0) & (y > 0) & (sigma > 0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if isinstance(model, Guinier):
+                lin_x = x * x
+            else:
+                lin_x = np.log(x)
+            lin_x = np.where(select, lin_x, 0.0)
+            lin_y = np.where(select, np.log(y), 0.0)
+            weight = np.where(select, (y / sigma) ** 2, 0.0)
+        p, dp = _fit_lines(lin_x, lin_y, weight, power=power)
+        return model.extract_model_parameters(constant=p[1], slope=p[0],
+                                              dconstant=dp[1], dslope=dp[0])
+
+    def _get_extrapolated_qstar(self, model, q_start, q_end):
+        """
+        Invariant of the extrapolated I(q) of each frame between q_start
+        and q_end, with INTEGRATION_NSTEPS points per frame.
+        """
+        # model parameters as columns, for the q values of each frame
+        for name in ('scale', 'dscale', 'radius', 'dradius', 'power', 'dpower'):
+            if hasattr(model, name):
+                setattr(model, name, np.asarray(getattr(model, name))[:, None])
+        # invalid fits give NaN rather than an error for the whole series
+        if isinstance(model, Guinier):
+            model.radius = np.where(model.radius > 0, model.radius, np.nan)
+        else:
+            model.power = np.where(model.power > 0, model.power, np.nan)
+        q = np.linspace(q_start, q_end, INTEGRATION_NSTEPS, axis=-1)
+        iq = model.evaluate_model(q)
+        diq = model.evaluate_model_errors(q)
+        dxl = None if self._dxl is None else self._dxl[:, :1]
+        qstar, dqstar = integrate_qstar(q, iq, dy=diq, dxl=dxl)
+        return qstar, dqstar, iq
+
+    def get_qstar_low(self):
+        """
+        Compute the invariant of the low q extrapolation of each frame.
+
+        :return: q_star, dq_star
+        """
+        x = self._x
+        qmax = x[:, int(self._low_extrapolation_npts - 1)]
+        qmin = x[:, 0]
+        if self._low_extrapolation_function == 'guinier':
+            model = Guinier()
+        else:
+            model = PowerLaw()
+        p, _ = self._fit(model, qmin=qmin, qmax=qmax,
+                         power=self._low_extrapolation_power)
+        self._low_extrapolation_power_fitted = p[0]
+        qstar, dqstar, iq = self._get_extrapolated_qstar(
+            model, q_start=np.full(self.nframes, self._low_q_limit), q_end=qmin)
+        # Systematic error, as InvariantCalculator.get_qstar_low
+        err = qmin * qmin * np.fabs((qmin - self._low_q_limit) * (iq[:, 0] - iq[:, -1]))
+        return qstar, dqstar + err
+
+    def get_qstar_high(self):
+        """
+        Compute the invariant of the high q extrapolation of each frame.
+
+        :return: q_star, dq_star
+        """
+        x = self._x
+        qmin = x[:, int(x.shape[-1] - 1 - self._high_extrapolation_npts)]
+        qmax = x[:, -1]
+        model = PowerLaw()
+        p, _ = self._fit(model, qmin=qmin, qmax=qmax,
+                         power=self._high_extrapolation_power)
+        self._high_extrapolation_power_fitted = p[0]
+        qstar, dqstar, _ = self._get_extrapolated_qstar(
+            model, q_start=qmax, q_end=np.full(self.nframes, Q_MAXIMUM))
+        return qstar, dqstar
+
+    def get_qstar_with_error(self, extrapolation=None):
+        """
+        Compute the invariant of each frame and its uncertainty.
+
+        :param extrapolation: None, 'low', 'high' or 'both'
+
+        :return: q_star, dq_star
+        """
+        qstar, dqstar = integrate_qstar(self._x, self._y, dy=self._dy, dxl=self._dxl)
+        if extrapolation is None:
+            return qstar, dqstar
+        extrapolation = extrapolation.lower()
+        variance = dqstar * dqstar
+        if extrapolation in ('low', 'both'):
+            qs_low, dqs_low = self.get_qstar_low()
+            qstar = qstar + qs_low
+            variance = variance + dqs_low * dqs_low
+        if extrapolation in ('high', 'both'):
+            qs_high, dqs_high = self.get_qstar_high()
+            qstar = qstar + qs_high
+            variance = variance + dqs_high * dqs_high
+        return qstar, np.sqrt(variance)
+
+    def get_qstar(self, extrapolation=None):
+        """
+        Compute the invariant of each frame.
+
+        :param extrapolation: None, 'low', 'high' or 'both'
+        """
+        return self.get_qstar_with_error(extrapolation)[0]
+
+    def get_volume_fraction_with_error(self, contrast, extrapolation=None):
+        """
+        Compute the volume fraction of each frame and its uncertainty, as
+        InvariantCalculator.get_volume_fraction_with_error.  Frames for which
+        the volume fraction can't be computed are NaN, and their uncertainty
+        is -1 if it can't be computed.
+
+        :param contrast: contrast value
+        :param extrapolation: string to apply optional extrapolation
+
+        :return: V, dV = volume fraction, error on volume fraction
+        """
+        if contrast <= 0:
+            raise ValueError("The contrast parameter must be greater than zero")
+        qstar, dqstar = self.get_qstar_with_error(extrapolation)
+        k = 1.e-8 * qstar / (2 * (math.pi * math.fabs(float(contrast))) ** 2)
+        discrim = 1 - 4 * k
+        with np.errstate(invalid='ignore', divide='ignore'):
+            root = np.sqrt(discrim)
+            volume1 = 0.5 * (1 - root)
+            volume2 = 0.5 * (1 + root)
+            volume = np.where((volume1 >= 0) & (volume1 <= 1), volume1,
+                              np.where((volume2 >= 0) & (volume2 <= 1), volume2, np.nan))
+            volume = np.where(discrim == 0, 0.5, volume)
+            volume[(qstar <= 0) | ~(discrim >= 0)] = np.nan
+            uncertainty = np.fabs((k * dqstar) / (qstar * root))
+        # Same validity check as InvariantCalculator
+        uncertainty[~(1 - k * qstar > 0)] = -1
+        return volume, uncertainty
+
+    def get_volume_fraction(self, contrast, extrapolation=None):
+        """
+        Compute the volume fraction of each frame.
+        """
+        return self.get_volume_fraction_with_error(contrast, extrapolation)[0]
+
+    def get_surface_with_error(self, contrast, porod_const, extrapolation=None):
+        """
+        Compute the specific surface of each frame from the contrast and the
+        Porod constant, which may be given for each frame, as
+        InvariantCalculator.get_surface_with_error.  No uncertainty is
+        computed until the inputs have uncertainties.
+
+        :return s, ds: the surface, with its uncertainty
+        """
+        # porod_const in cm^-1 A^-4 to A^-5, so s is in 1/A
+        _porod_const = 1.0e-8 * np.asarray(porod_const, dtype=float)
+        s = _porod_const / (2 * math.pi * np.fabs(contrast) ** 2)
+        return np.broadcast_to(s, (self.nframes,)).copy(), None
+
+    def get_surface(self, contrast, porod_const, extrapolation=None):
+        """
+        Compute the specific surface of each frame.
+        """
+        return self.get_surface_with_error(contrast, porod_const, extrapolation)[0]
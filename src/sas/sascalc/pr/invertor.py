@@ -136,7 +136,8 @@ class Invertor(Pinvertor):
         Overwrite the __reduce_ex__
         """
 
-        state = (self.__dict__,
+        # the matrix cache is rebuilt on demand
+        state = (dict((k, v) for k, v in self.__dict__.items() if k != '_matrix_cache'),
                  self.alpha, self.d_max,
                  self.q_min, self.q_max,
                  self.x, self.y,
@@ -258,6 +259,8 @@ class Invertor(Pinvertor):
         invertor.slit_width = self.slit_width
 
         invertor.info = copy.deepcopy(self.info)
+        # the blocks are keyed on the data, so the clone can share the cache
+        invertor.__dict__['_matrix_cache'] = self.get_matrix_cache()
 
         return invertor
 
@@ -467,34 +470,40 @@ class Invertor(Pinvertor):
             nfunc_0 = nfunc
             nfunc += 1
 
-        a = np.zeros([npts + nq, nfunc])
-        b = np.zeros(npts + nq)
         err = np.zeros([nfunc, nfunc])
 
-        # Construct the a matrix and b vector that represent the problem
+        # Get the blocks of the a matrix that represent the problem.  The
+        # data block and its QR factors are cached, so a change of alpha
+        # only rescales the regularization block.
         t_0 = time.time()
         try:
-            a, b = self._get_matrix(nfunc, nq)
+            accept, a_data, q_data, r_data = self._get_data_block(nfunc)
+            a_reg = np.sqrt(self.alpha) * self._get_reg_block(nfunc, nq)
         except Exception as exc:
             raise RuntimeError("Invertor: could not invert I(Q)\n  %s" % str(exc))
+        b_data = self.y[accept] / self.err[accept]
 
-        # Perform the inversion (least square fit)
+        # With a_data = Q R the least square fit of the full problem has the
+        # same solution as the small problem [R; a_reg] x = [Q^T b; 0].
+        a = np.vstack((r_data, a_reg))
+        b = np.concatenate((np.dot(q_data.T, b_data), np.zeros(nq)))
         # CRUFT: numpy>=1.14.0 allows rcond=None for the following default
-        rcond = np.finfo(float).eps * max(a.shape)
-        c, chi2, _, _ = lstsq(a, b, rcond=rcond)
-        # Sanity check
-        try:
-            float(chi2)
-        except:
+        rcond = np.finfo(float).eps * max(npts + nq, nfunc)
+        c, _, rank, _ = lstsq(a, b, rcond=rcond)
+        # The residuals are only defined for a full rank, overdetermined problem
+        if rank == nfunc and npts + nq > nfunc:
+            chi2 = np.array([np.sum((np.dot(a_data, c) - b_data)**2)
+                             + np.sum(np.dot(a_reg, c)**2)])
+        else:
             chi2 = -1.0
         self.chi2 = chi2
 
-        inv_cov = np.zeros([nfunc, nfunc])
-
-        # Get the covariance matrix, defined as inv_cov = a_transposed * a
-        inv_cov = self._get_invcov_matrix(nfunc, nr, a)
+        # Get the covariance matrix, defined as inv_cov = a_transposed * a,
+        # which is the same for the small problem
+        inv_cov = np.dot(a.T, a)
         # Compute the reg term size for the output
-        sum_sig, sum_reg = self._get_reg_size(nfunc, nr, a)
+        sum_sig = np.sum(r_data ** 2)
+        sum_reg = np.sum(a_reg ** 2)
 
         if math.fabs(self.alpha) > 0:
             new_alpha = sum_sig / (sum_reg / self.alpha)
@@ -567,55 +576,46 @@ class Invertor(Pinvertor):
         message is a message for the user,
         elapsed is the computation time
         """
-        #import time
         try:
-            pr = self.clone()
-
             # T_0 for computation time
             starttime = time.time()
             elapsed = 0
 
+            # Solve for all the trial values of alpha at once
+            path = self.regularization_path(nfunc)
+
             # If the current alpha is zero, try
             # another value
-            if pr.alpha <= 0:
-                pr.alpha = 0.0001
-
-            # Perform inversion to find the largest alpha
-            out, _ = pr.invert(nfunc)
+            initial_alpha = self.alpha
+            if initial_alpha <= 0:
+                initial_alpha = 0.0001
+
+            # The suggested alpha does not depend on the alpha used for
+            # the inversion.  Look at it and at smaller values: we assume
+            # that for the suggested alpha we have 1 peak, if not, send a
+            # message to change parameters
+            suggested_alpha = path.suggested_alpha
+            trials = [(0.33) ** (i + 1) * suggested_alpha for i in range(10)]
+            peaks = path.peaks([initial_alpha, suggested_alpha] + trials)
+            initial_peaks, npeaks, peaks = peaks[0], peaks[1], peaks[2:]
 
             elapsed = time.time() - starttime
-            initial_alpha = pr.alpha
-            initial_peaks = pr.get_peaks(out)
 
-            # Try the inversion with the estimated alpha
-            pr.alpha = pr.suggested_alpha
-            out, _ = pr.invert(nfunc)
-
-            npeaks = pr.get_peaks(out)
             # if more than one peak to start with
             # just return the estimate
             if npeaks > 1:
                 #message = "Your P(r) is not smooth,
                 #please check your inversion parameters"
                 message = None
-                return pr.suggested_alpha, message, elapsed
+                return suggested_alpha, message, elapsed
             else:
-
-                # Look at smaller values
-                # We assume that for the suggested alpha, we have 1 peak
-                # if not, send a message to change parameters
-                alpha = pr.suggested_alpha
-                best_alpha = pr.suggested_alpha
+                best_alpha = suggested_alpha
                 found = False
-                for i in range(10):
-                    pr.alpha = (0.33) ** (i + 1) * alpha
-                    out, _ = pr.invert(nfunc)
-
-                    peaks = pr.get_peaks(out)
-                    if peaks > 1:
+                for alpha, peak in zip(trials, peaks):
+                    if peak > 1:
                         found = True
                         break
-                    best_alpha = pr.alpha
+                    best_alpha = alpha
 
                 # If we didn't find a turning point for alpha and
                 # the initial alpha already had only one peak,
@@ -629,7 +629,7 @@ class Invertor(Pinvertor):
 
                 if not found:
                     message = None
-                elif best_alpha >= 0.5 * pr.suggested_alpha:
+                elif best_alpha >= 0.5 * suggested_alpha:
                     # best alpha is too big, return a
                     # reasonable value
                     message = "The estimated alpha for your system is too "
@@ -642,6 +642,19 @@ class Invertor(Pinvertor):
             message = "Invertor.estimate_alpha: %s" % exc
             return 0, message, elapsed
 
+    def regularization_path(self, nfunc, nr=20):
+        """
+        Returns the solutions of the inversion for any set of alpha
+        values, from a single decomposition of the problem.
+
+        :param nfunc: number of terms to use in the expansion.
+        :param nr: number of r points to evaluate the 2nd derivative at for the reg. term.
+
+        :return: sas.sascalc.pr.reg_path.RegularizationPath
+        """
+        from .reg_path import RegularizationPath
+        return RegularizationPath(self, nfunc, nr=nr)
+
     def to_file(self, path, npts=100):
         """
         Save the state to a file that will be readable
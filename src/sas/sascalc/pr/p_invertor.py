@@ -6,11 +6,54 @@ and provides the underlying computations.
 import math
 import logging
 import timeit
+import hashlib
+import threading
+from collections import OrderedDict
 
 import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# Number of matrix blocks kept by an invertor and its clones, enough for
+# the D_max values of an explorer scan.
+MATRIX_CACHE_SIZE = 16
+
+
+class MatrixCache(object):
+    """
+    Least recently used cache of the blocks of the least squares problem.
+
+    The cache is shared between an invertor and its clones, which may run
+    in different threads.
+    """
+    def __init__(self, size=MATRIX_CACHE_SIZE):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, build):
+        """
+        Return the value for *key*, calling *build()* to create it if needed.
+        """
+        with self._lock:
+            value = self._items.get(key, None)
+            if value is not None:
+                self._items.move_to_end(key)
+                return value
+        value = build()
+        with self._lock:
+            self._items[key] = value
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
 
 class Pinvertor(object):
     #q data
@@ -561,20 +604,56 @@ class Pinvertor(object):
 
         :return: 0
         """
-        from . import calc
         nfunc = int(nfunc)
         nr = int(nr)
         a_obj = np.zeros([self.npoints + nr, nfunc])
         b_obj = np.zeros(self.npoints + nr)
 
-        sqrt_alpha = np.sqrt(self.alpha)
-        pi = np.pi
-        offset = (1, 0)[self.est_bck == 1]
+        q_accept_x, a_data, _, _ = self._get_data_block(nfunc)
+        a_obj[0:self.npoints, :][q_accept_x] = a_data
+        a_obj[self.npoints:self.npoints+nr, :] = np.sqrt(self.alpha) * self._get_reg_block(nfunc, nr)
+
+        #Compute B
+        b_obj[0:self.npoints][q_accept_x] = self.y[q_accept_x] / self.err[q_accept_x]
+
+        return a_obj, b_obj
+
+    def get_matrix_cache(self):
+        """
+        Return the cache of matrix blocks used by this invertor.
+        """
+        cache = self.__dict__.get('_matrix_cache', None)
+        if cache is None:
+            cache = self.__dict__['_matrix_cache'] = MatrixCache()
+        return cache
+
+    def _get_data_block(self, nfunc):
+        """
+        Returns the rows of A for the accepted q points, with their QR factors.
+
+        The data block depends on q, dI(q), d_max, the slit geometry, the
+        q range and whether the background is estimated, but not on alpha
+        or I(q), so it is cached for scans over alpha.
 
+        :param nfunc: number of base functions.
+
+        :return: (q_accept, a_data, q_fac, r_fac) where q_accept is the
+            boolean mask of accepted points and a_data = q_fac r_fac.
+        """
         if self.check_for_zero(self.err):
             raise RuntimeError("Pinvertor.get_matrix: Some I(Q) points have no error.")
+        digest = hashlib.sha1()
+        for value in (self.x, self.err):
+            digest.update(np.ascontiguousarray(value, dtype=np.float64).tobytes())
+        key = ('data', digest.hexdigest(), int(nfunc), float(self.d_max), self.est_bck,
+               float(self.slit_height), float(self.slit_width),
+               float(self.get_qmin()), float(self.get_qmax()))
+        return self.get_matrix_cache().get(key, lambda: self._calc_data_block(int(nfunc)))
+
+    def _calc_data_block(self, nfunc):
+        from . import calc
+        offset = (1, 0)[self.est_bck == 1]
 
-        #Compute A
         #Whether or not to use ortho_transformed_smeared.
         smeared = False
         if self.slit_width > 0 or self.slit_height > 0:
@@ -587,39 +666,45 @@ class Pinvertor(object):
         if isinstance(q_accept_x, bool):
             #In the case of q_min and q_max <= 0, so returns scalar, and returns True
             q_accept_x = np.ones(self.npoints, dtype=bool)
-        #The x and a that will be used for the first part of 'a' calculation, given to ortho_transformed
+        #The x and err that will be used for the first part of 'a' calculation, given to ortho_transformed
         x_use = self.x[q_accept_x]
-        a_use = a_obj[0:self.npoints, :]
+        err_use = self.err[q_accept_x]
+        a_use = np.zeros([len(x_use), nfunc])
 
         for j in range(nfunc):
             if self.est_bck == 1 and j == 0:
-                a_use[q_accept_x, j] = 1.0/self.err[q_accept_x]
+                a_use[:, j] = 1.0/err_use
             elif smeared:
-                a_use[q_accept_x, j] = calc.ortho_transformed_smeared(x_use, self.d_max, j+offset,
-                                                                      self.slit_height, self.slit_width, npts)/self.err[q_accept_x]
+                a_use[:, j] = calc.ortho_transformed_smeared(x_use, self.d_max, j+offset,
+                                                             self.slit_height, self.slit_width, npts)/err_use
             else:
-                a_use[q_accept_x, j] = calc.ortho_transformed(x_use, self.d_max, j+offset)/self.err[q_accept_x]
+                a_use[:, j] = calc.ortho_transformed(x_use, self.d_max, j+offset)/err_use
+
+        q_fac, r_fac = np.linalg.qr(a_use)
+        return q_accept_x, a_use, q_fac, r_fac
+
+    def _get_reg_block(self, nfunc, nr):
+        """
+        Returns the regularisation rows of A for alpha = 1.
 
-        a_obj[0:self.npoints, :] = a_use
+        :param nfunc: number of base functions.
+        :param nr: number of r-points used when evaluating reg term.
+        """
+        key = ('reg', int(nfunc), int(nr), float(self.d_max), self.est_bck)
+        return self.get_matrix_cache().get(key, lambda: self._calc_reg_block(int(nfunc), int(nr)))
 
+    def _calc_reg_block(self, nfunc, nr):
+        pi = np.pi
+        offset = (1, 0)[self.est_bck == 1]
+        reg = np.zeros([nr, nfunc])
         for j in range(nfunc):
             i_r = np.arange(nr, dtype=np.float64)
 
             #Implementing second stage A as a python vector operation with shape = [nr]
             r = (self.d_max / nr) * i_r
             tmp = pi * (j+offset) / self.d_max
-            res = (2.0 * sqrt_alpha * self.d_max/nr * tmp) * (2.0 * np.cos(tmp*r) + tmp * r * np.sin(tmp*r))
-            #Res should now be np vector size i_r.
-            a_obj[self.npoints:self.npoints+nr, j] = res
-
-        #Compute B
-        x_accept_index = self.accept_q(self.x)
-        #The part of b used for the vector operations, of the accepted q values.
-        b_used = b_obj[0:self.npoints]
-        b_used[x_accept_index] = self.y[x_accept_index] / self.err[x_accept_index]
-        b_obj[0:self.npoints] = b_used
-
-        return a_obj, b_obj
+            reg[:, j] = (2.0 * self.d_max/nr * tmp) * (2.0 * np.cos(tmp*r) + tmp * r * np.sin(tmp*r))
+        return reg
 
     def _get_invcov_matrix(self, nfunc, nr, a_obj):
         """
@@ -0,0 +1,174 @@
+"""
+Regularization path of the P(r) inversion.
+
+The inversion minimizes ::
+
+    chi2(alpha) = |A x - b|^2 + alpha |L x|^2
+
+where A holds the transformed base functions for the data points and L the
+second derivative of P(r) at the regularization points.  Both matrices are
+simultaneously diagonalized by the generalized singular value decomposition
+of (A, L), which is computed here from the SVD of the stacked matrix
+[A; L] = U S V^T followed by the eigen decomposition of the A part of U::
+
+    U_A^T U_A = W diag(c^2) W^T,   U_L^T U_L = W diag(1 - c^2) W^T
+
+With x = V S^-1 W y the problem separates into one equation per generalized
+singular value, y_i = g_i/(c_i^2 + alpha s_i^2) with g = W^T U_A^T b and
+s_i^2 = 1 - c_i^2.  After the decomposition, the solution, chi2, the
+regularization term and the number of P(r) peaks are evaluated for a whole
+grid of alpha values at once.
+
+Directions in the null space of [A; L] are dropped, as numpy.linalg.lstsq
+does, so the solutions match those of :meth:`Invertor.lstsq`.
+"""
+import numpy as np
+
+# Number of slices used to count the P(r) peaks, as in Pinvertor.get_peaks.
+PEAK_SLICES = 100
+
+
+class RegularizationPath(object):
+    """
+    Solutions of the P(r) inversion of *invertor* for any set of alpha.
+
+    :param invertor: Invertor holding the data, d_max and q range.
+    :param nfunc: number of base functions.
+    :param nr: number of r points used for the regularization term.
+    """
+    def __init__(self, invertor, nfunc, nr=20):
+        if invertor.is_valid() < 0:
+            raise RuntimeError("Invertor: invalid data; incompatible data lengths.")
+        self.nfunc = int(nfunc)
+        self.nr = int(nr)
+        self.d_max = invertor.d_max
+        self.est_bck = bool(invertor.est_bck)
+        # Total number of points, including those outside the q range
+        self.npoints = len(invertor.x)
+
+        ncoef = self.nfunc + 1 if self.est_bck else self.nfunc
+        accept, a_data, _, _ = invertor._get_data_block(ncoef)
+        a_reg = invertor._get_reg_block(ncoef, self.nr)
+        y = invertor.y[accept]
+        if not self.est_bck:
+            y = y - invertor.background
+        b_data = y / invertor.err[accept]
+        self.ndata = len(b_data)
+        self._a, self._b, self._reg = a_data, b_data, a_reg
+
+        # Same cut-off as Invertor.lstsq
+        stacked = np.vstack((a_data, a_reg))
+        rcond = np.finfo(float).eps * max(self.npoints + self.nr, ncoef)
+        u, s, vt = np.linalg.svd(stacked, full_matrices=False)
+        keep = s > rcond * s[0] if len(s) and s[0] > 0 else np.zeros(len(s), dtype=bool)
+        u_a = u[:self.ndata, keep]
+        c2, w = np.linalg.eigh(np.dot(u_a.T, u_a))
+        self.c2 = np.clip(c2, 0.0, 1.0)
+        self.s2 = 1.0 - self.c2
+        self._g = np.dot(w.T, np.dot(u_a.T, b_data))
+        self._t = np.dot(vt[keep].T / s[keep], w)
+        # The suggested alpha of Invertor.lstsq balances the two terms
+        # and does not depend on alpha
+        self.suggested_alpha = np.sum(a_data ** 2) / np.sum(a_reg ** 2)
+
+    def alpha_grid(self, npts=200):
+        """
+        Log spaced alpha values covering the generalized singular values.
+        """
+        active = (self.c2 > 0) & (self.s2 > 0)
+        if not active.any():
+            return np.full(1, self.suggested_alpha)
+        gamma2 = self.c2[active] / self.s2[active]
+        return np.logspace(np.log10(gamma2.min()), np.log10(gamma2.max()), npts)
+
+    def solve(self, alpha):
+        """
+        Return the coefficients, with the background first when it is
+        estimated, as an array of shape (len(alpha), ncoef).
+        """
+        alpha = np.atleast_1d(np.asarray(alpha, dtype=np.float64))
+        denom = self.c2[None, :] + alpha[:, None] * self.s2[None, :]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            y = np.where(denom > 0, self._g / denom, 0.0)
+        return np.dot(y, self._t.T)
+
+    def out(self, alpha):
+        """
+        Return (out, background) for each alpha, with out in the layout of
+        Invertor.out.
+        """
+        coef = self.solve(alpha)
+        if not self.est_bck:
+            return coef, None
+        out = np.zeros_like(coef)
+        out[:, :-1] = coef[:, 1:]
+        return out, coef[:, 0]
+
+    def residual(self, alpha):
+        """
+        Return |A x - b|^2 for each alpha.
+        """
+        resid = np.dot(self.solve(alpha), self._a.T) - self._b
+        return np.sum(resid ** 2, axis=1)
+
+    def reg_norm(self, alpha):
+        """
+        Return |L x|^2 for each alpha.
+        """
+        return np.sum(np.dot(self.solve(alpha), self._reg.T) ** 2, axis=1)
+
+    def chi2(self, alpha):
+        """
+        Return chi2 as reported by Invertor.lstsq for each alpha.
+        """
+        alpha = np.atleast_1d(np.asarray(alpha, dtype=np.float64))
+        return self.residual(alpha) + alpha * self.reg_norm(alpha)
+
+    def peaks(self, alpha, nslice=PEAK_SLICES):
+        """
+        Return the number of P(r) peaks for each alpha, as Invertor.get_peaks.
+        """
+        out, _ = self.out(alpha)
+        dx = self.d_max / nslice
+        r = np.linspace(0., self.d_max - dx, nslice)
+        n = np.arange(1, out.shape[1] + 1)
+        basis = (2.0 * r[:, None]) * np.sin((np.pi / self.d_max) * n[None, :] * r[:, None])
+        values = np.dot(out, basis.T)
+        pos = values[:, :-1] < values[:, 1:]
+        count = np.sum((pos[:, :-1] != pos[:, 1:]) & pos[:, :-1], axis=1)
+        return count + 1 - pos[:, 0] + pos[:, -1]
+
+    def gcv(self, alpha):
+        """
+        Return the generalized cross validation function for each alpha.
+        """
+        alpha = np.atleast_1d(np.asarray(alpha, dtype=np.float64))
+        denom = self.c2[None, :] + alpha[:, None] * self.s2[None, :]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            influence = np.sum(np.where(denom > 0, self.c2 / denom, 0.0), axis=1)
+        return self.residual(alpha) / (self.ndata - influence) ** 2
+
+    def gcv_alpha(self, alpha=None):
+        """
+        Return the alpha of *alpha*, by default :meth:`alpha_grid`, that
+        minimizes the generalized cross validation function.
+        """
+        alpha = self.alpha_grid() if alpha is None else np.asarray(alpha, dtype=np.float64)
+        return alpha[np.argmin(self.gcv(alpha))]
+
+    def lcurve_alpha(self, alpha=None):
+        """
+        Return the alpha of *alpha*, by default :meth:`alpha_grid`, at the
+        corner of the L-curve, the point of largest curvature of
+        log |L x| against log |A x - b|.
+        """
+        alpha = self.alpha_grid() if alpha is None else np.sort(np.asarray(alpha, dtype=np.float64))
+        if len(alpha) < 3:
+            return alpha[0]
+        t = np.log(alpha)
+        rho = 0.5 * np.log(self.residual(alpha))
+        eta = 0.5 * np.log(self.reg_norm(alpha))
+        drho, deta = np.gradient(rho, t), np.gradient(eta, t)
+        ddrho, ddeta = np.gradient(drho, t), np.gradient(deta, t)
+        curvature = (drho * ddeta - ddrho * deta) / (drho ** 2 + deta ** 2) ** 1.5
+        return alpha[np.nanargmax(curvature)]
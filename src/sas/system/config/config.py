@@ -208,6 +208,35 @@ class Config(ConfigBase, metaclass=ConfigMeta):
         # Default fitting optimizer
         self.FITTING_DEFAULT_OPTIMIZER = 'lm'
 
+        # Worker processes for batch fits of independent data sets,
+        # 1 to fit them one after another or 0 for one per core
+        self.FITTING_BATCH_WORKERS = 1
+
+        # Seconds between checkpoints of a fit in the user directory, so that
+        # a killed fit resumes when it is run again, or 0 for no checkpoints
+        self.FITTING_CHECKPOINT_INTERVAL = 0
+
+        # Stop a fit when chisq improves by less than the relative tolerance
+        # over this number of steps, or 0 to always run all the steps
+        self.FITTING_EARLY_STOP_STEPS = 0
+        self.FITTING_EARLY_STOP_TOLERANCE = 1e-4
+
+        # Keep the pair distance histograms of the structures in the Generic
+        # Scattering Calculator, so that a change of q, scale, background or
+        # solvent SLD doesn't repeat the full 1D Debye sum.  The binned sum is
+        # approximate, and the exact sum is used if False.
+        self.GSC_DEBYE_HISTOGRAM_CACHE = False
+
+        # Also keep the histograms in the user directory, between sessions
+        self.GSC_DEBYE_HISTOGRAM_PERSIST = False
+
+        # Keep a binary copy of the large coordinate files loaded in the
+        # Generic Scattering Calculator in the user directory, so that they
+        # load quickly the next time.  The oldest copies are removed once the
+        # total size is above GSC_SLD_FILE_CACHE_MAX_MB.
+        self.GSC_SLD_FILE_CACHE = False
+        self.GSC_SLD_FILE_CACHE_MAX_MB = 1024
+
         # What's New variables
         self.LAST_WHATS_NEW_HIDDEN_VERSION = "5.0.0"
 
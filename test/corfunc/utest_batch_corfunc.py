@@ -0,0 +1,96 @@
+"""
+Unit Tests for BatchCorfuncCalculator class
+"""
+
+import os.path
+import unittest
+from dataclasses import astuple
+
+import numpy as np
+
+from sas.sascalc.corfunc.batch_calculator import BatchCorfuncCalculator, fit_porod
+from sas.sascalc.corfunc.calculation_data import SettableExtrapolationParameters
+from sas.sascalc.corfunc.corfunc_calculator import CorfuncCalculator
+from sas.sascalc.corfunc.transform_thread import correlation_transforms
+from sasdata.dataloader.data_info import Data1D
+
+
+def find(filename):
+    return os.path.join(os.path.dirname(__file__), 'data', filename)
+
+
+class TestBatchCalculator(unittest.TestCase):
+
+    def setUp(self):
+        data = np.loadtxt(find("98929.txt"), dtype=np.float64)
+        self.q = data[:, 0]
+        rng = np.random.default_rng(0)
+        self.iq = (data[None, :, 1] * rng.uniform(0.8, 1.2, (5, 1))
+                   * (1 + 0.01 * rng.standard_normal((5, len(self.q)))))
+        self.parameters = SettableExtrapolationParameters(0.013, 0.15, 0.24)
+
+    def test_matches_calculator(self):
+        batch = BatchCorfuncCalculator(self.q, self.iq, self.parameters)
+        table = batch.run()
+        self.assertEqual(batch.errors, {})
+        z, gamma1, gamma3, idf = batch.transforms([1, 3])
+        for k, frame in enumerate(self.iq):
+            calculator = CorfuncCalculator(Data1D(x=self.q, y=frame), self.parameters)
+            calculator.run()
+            self.assertAlmostEqual(batch.background[k], calculator.background, places=6)
+            self.assertAlmostEqual(batch.guinier_A[k], calculator.guinier.A, places=6)
+            np.testing.assert_allclose(batch.porod_K[k], calculator.porod.K, rtol=1e-6)
+            np.testing.assert_allclose(list(table[k]), astuple(calculator.lamellar_parameters),
+                                       rtol=1e-6)
+            if k == 3:
+                np.testing.assert_array_equal(z, calculator.transformed.gamma_1.x)
+                np.testing.assert_allclose(gamma1[1], calculator.transformed.gamma_1.y,
+                                           atol=1e-8)
+                np.testing.assert_allclose(gamma3[1], calculator.transformed.gamma_3.y,
+                                           atol=1e-8)
+
+    def test_failed_frame(self):
+        # a frame below the background can't be extrapolated
+        iq = np.vstack((self.iq[:2], np.full(len(self.q), 0.1)))
+        batch = BatchCorfuncCalculator(self.q, iq, self.parameters, background=0.3)
+        table = batch.run()
+        self.assertTrue(np.all(np.isfinite(table['long_period'][:2])))
+        self.assertTrue(np.isnan(table['long_period'][2]))
+        self.assertEqual(list(batch.errors), [2])
+        self.assertIs(type(next(iter(batch.errors))), int)
+
+    def test_porod_fit(self):
+        q = np.linspace(0.15, 0.24, 40)
+        K, sigma, background = np.array([1e-5, 2e-5]), np.array([0.0, 3.0]), np.array([0.3, 0.1])
+        iq = CorfuncCalculator.porod_fitting_function(
+            q[None, :], K[:, None], sigma[:, None], background[:, None])
+        fitted = fit_porod(q, iq)
+        np.testing.assert_allclose(fitted[0], K, rtol=1e-6)
+        np.testing.assert_allclose(fitted[1], sigma, atol=1e-4)
+        np.testing.assert_allclose(fitted[2], background, rtol=1e-6)
+
+    def test_stacked_transforms(self):
+        qs = np.arange(0, 1, 0.002)
+        iqs = np.exp(-qs[None, :] * np.array([[100.], [150.]])) + 0.2
+        xs, gamma1, gamma3, idf = correlation_transforms(qs, iqs, [0.2, 0.1], 0.002)
+        for k in range(2):
+            single = correlation_transforms(qs, iqs[k], [0.2, 0.1][k], 0.002)
+            np.testing.assert_array_equal(single[0], xs)
+            for result, expected in zip(single[1:], (gamma1[k], gamma3[k], idf[k])):
+                np.testing.assert_allclose(result, expected, rtol=1e-12)
+
+    def test_cancelled_transforms(self):
+        qs = np.arange(0, 1, 0.002)
+        iqs = np.exp(-qs * 100.) + 0.2
+        calls = []
+        def is_cancelled():
+            calls.append(1)
+            return len(calls) == 2
+        self.assertIsNone(correlation_transforms(qs, iqs, 0.2, 0.002, is_cancelled=is_cancelled))
+        self.assertEqual(len(calls), 2)
+        self.assertIsNotNone(correlation_transforms(qs, iqs, 0.2, 0.002,
+                                                    is_cancelled=lambda: False))
+
+
+if __name__ == '__main__':
+    unittest.main()
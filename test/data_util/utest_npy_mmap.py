@@ -0,0 +1,59 @@
+"""
+Unit Tests for memory mapping the .npy members of zip files
+"""
+
+import os.path
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import numpy as np
+
+from sas.sascalc.data_util.npy_mmap import map_npy_member
+
+
+class TestNpyMmap(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "arrays.zip")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, arrays, compression=zipfile.ZIP_STORED, version=None):
+        with zipfile.ZipFile(self.path, 'w', compression=compression) as archive:
+            for name, array in arrays.items():
+                with archive.open(name + '.npy', 'w', force_zip64=True) as member:
+                    np.lib.format.write_array(member, array, version=version)
+
+    def map(self, name):
+        with zipfile.ZipFile(self.path) as archive:
+            return map_npy_member(self.path, archive.getinfo(name + '.npy'))
+
+    def test_mapped(self):
+        values = np.arange(60.0).reshape(3, 20)
+        arrays = {'c': values, 'f': np.asfortranarray(values), 'i': np.arange(5)}
+        for version in ((1, 0), (2, 0)):
+            self.write(arrays, version=version)
+            for name, expected in arrays.items():
+                mapped = self.map(name)
+                self.assertIsInstance(mapped, np.memmap)
+                np.testing.assert_array_equal(mapped, expected)
+                self.assertEqual(mapped.flags.c_contiguous, name != 'f')
+            # the maps are copy-on-write
+            mapped[0] = -1
+            self.assertEqual(self.map('i')[0], 0)
+
+    def test_not_mapped(self):
+        self.write({'empty': np.empty((0, 3)), 'scalar': np.array(2.0),
+                    'objects': np.array([None, 1], dtype=object)})
+        for name in ('empty', 'scalar', 'objects'):
+            self.assertIsNone(self.map(name))
+        self.write({'values': np.arange(10.0)}, compression=zipfile.ZIP_DEFLATED)
+        self.assertIsNone(self.map('values'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+Unit Tests for the parallel reading of data files
+"""
+
+import os.path
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from sas.sascalc.data_util import parallel_load
+from sas.sascalc.data_util.parallel_load import load_files, load_workers
+
+
+class TestParallelLoad(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.paths = []
+        q = np.linspace(0.01, 0.3, 50)
+        for k in range(parallel_load.MIN_PARALLEL_FILES + 3):
+            path = os.path.join(self.folder, "frame_%02d.txt" % k)
+            np.savetxt(path, np.column_stack((q, np.full(len(q), k + 1.0), np.full(len(q), 0.1))))
+            self.paths.append(path)
+        self.paths.insert(5, os.path.join(self.folder, "missing.txt"))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def check_results(self, results, paths):
+        self.assertEqual([index for index, _, _, _ in results], list(range(len(paths))))
+        self.assertEqual([path for _, path, _, _ in results], paths)
+        for index, path, data, error in results:
+            if path.endswith("missing.txt"):
+                self.assertEqual(data, [])
+                self.assertIsNotNone(error)
+            else:
+                self.assertIsNone(error)
+                self.assertEqual(len(data), 1)
+                k = int(os.path.basename(path)[6:8])
+                np.testing.assert_array_equal(data[0].y, k + 1.0)
+
+    def test_serial(self):
+        self.check_results(list(load_files(self.paths[:8])), self.paths[:8])
+
+    def test_parallel(self):
+        self.check_results(list(load_files(self.paths, max_workers=2)), self.paths)
+
+    def test_cancel(self):
+        calls = []
+        def is_cancelled():
+            calls.append(None)
+            return len(calls) > 3
+        results = list(load_files(self.paths[:8], is_cancelled=is_cancelled))
+        self.assertEqual(len(results), 3)
+
+    def test_workers(self):
+        self.assertEqual(load_workers(parallel_load.MIN_PARALLEL_FILES - 1), 1)
+        self.assertEqual(load_workers(100, max_workers=1), 1)
+        self.assertLessEqual(load_workers(100), os.cpu_count())
+
+
+if __name__ == '__main__':
+    unittest.main()
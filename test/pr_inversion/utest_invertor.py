@@ -409,6 +409,70 @@ class TestBasicComponent(unittest.TestCase):
         for i in range(len(self.x_in)):
             self.assertEqual(self.x_in[i], clone.x[i])
 
+    def test_matrix_cache(self):
+        """
+            Check the cached matrix blocks against the full least square problem
+        """
+        x, y, err = load(find("sphere_80.txt"))
+        self.invertor.d_max = 160.0
+        self.invertor.x = x
+        self.invertor.y = y
+        self.invertor.err = err
+        self.invertor.slit_height = 0.005
+        for alpha in (0.0007, 0.007):
+            self.invertor.alpha = alpha
+            out, cov = self.invertor.lstsq(10)
+            a, b = self.invertor._get_matrix(10, 20)
+            c, chi2, _, _ = numpy.linalg.lstsq(a, b, rcond=None)
+            numpy.testing.assert_allclose(out, c, rtol=1e-10)
+            numpy.testing.assert_allclose(self.invertor.chi2, chi2, rtol=1e-10)
+        cache = self.invertor.get_matrix_cache()
+        self.assertEqual(len(cache), 2)
+
+        # Clones share the cache, and alpha or I(q) changes reuse the blocks
+        clone = self.invertor.clone()
+        self.assertIs(clone.get_matrix_cache(), cache)
+        clone.y = 2*clone.y
+        clone.lstsq(10)
+        self.assertEqual(len(cache), 2)
+        numpy.testing.assert_allclose(clone.out, 2*out, rtol=1e-10)
+
+        # Changing the errors, even in place, invalidates the data block
+        err = self.invertor.err
+        err[0] *= 2
+        self.invertor.err = err
+        out_err, _ = self.invertor.lstsq(10)
+        self.assertEqual(len(cache), 3)
+        self.assertFalse(numpy.allclose(out_err, out))
+
+    def test_regularization_path(self):
+        """
+            Compare the regularization path with inversions at fixed alpha
+        """
+        x, y, err = load(find("sphere_80.txt"))
+        self.invertor.d_max = 160.0
+        self.invertor.x = x
+        self.invertor.y = y
+        self.invertor.err = err
+        self.invertor.est_bck = True
+        path = self.invertor.regularization_path(10)
+        alphas = numpy.array([1e-6, 0.0007, 0.1])
+        out, bck = path.out(alphas)
+        chi2 = path.chi2(alphas)
+        peaks = path.peaks(alphas)
+        for i, alpha in enumerate(alphas):
+            self.invertor.alpha = alpha
+            self.invertor.invert(10)
+            numpy.testing.assert_allclose(out[i], self.invertor.out, rtol=1e-8, atol=1e-12)
+            self.assertAlmostEqual(bck[i]/self.invertor.background, 1.0, 8)
+            self.assertAlmostEqual(chi2[i]/self.invertor.chi2[0], 1.0, 8)
+            self.assertEqual(peaks[i], self.invertor.get_peaks(self.invertor.out))
+            self.assertAlmostEqual(path.suggested_alpha/self.invertor.suggested_alpha, 1.0, 8)
+
+        grid = path.alpha_grid()
+        self.assertTrue(grid[0] <= path.gcv_alpha() <= grid[-1])
+        self.assertTrue(grid[0] <= path.lcurve_alpha() <= grid[-1])
+
     def test_save(self):
         x, y, err = load(find("sphere_80.txt"))
 
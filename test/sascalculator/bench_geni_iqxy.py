@@ -0,0 +1,108 @@
+"""
+Benchmark the tiled 2D kernel in geni against the previous per-pixel kernel.
+
+Each kernel runs in a separate process so that the peak resident set size
+can be measured independently.  Usage::
+
+    python bench_geni_iqxy.py [--npix 128] [--points 10000 100000 1000000]
+"""
+import os
+import sys
+import time
+import argparse
+import resource
+import subprocess
+from importlib.machinery import SourceFileLoader
+from os.path import abspath, dirname, join as joinpath
+
+import numpy as np
+
+KERNELS = ('pixelwise', 'blocked', 'blocked-single')
+
+
+def _pixelwise_kernel():
+    """
+    The kernel used before the tiled version: a complex temporary over all
+    points is allocated for every detector pixel.
+    """
+    from numba import njit, prange
+
+    @njit("f8[:](f8[:],f8[:],f8[:],f8[:],f8[:])", parallel=True, fastmath=True)
+    def _calc_Iqxy(scale, x, y, qx, qy):
+        Iq = np.empty_like(qx)
+        for j in prange(len(Iq)):
+            total = np.sum(scale * np.exp(1j*(qx[j]*x + qy[j]*y)))
+            Iq[j] = abs(total)**2
+        return Iq
+    return _calc_Iqxy
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on linux and bytes on mac
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*scale/2**20
+
+
+def run_one(kernel, npoints, npix):
+    """
+    Time a single kernel, printing the wall time in seconds and the peak
+    resident set size of the process in MB.
+    """
+    run_py = joinpath(dirname(dirname(dirname(abspath(__file__)))), 'run.py')
+    SourceFileLoader('sasview_run', run_py).load_module().prepare()
+    from sas.sascalc.calculator import geni
+
+    rng = np.random.default_rng(1984)
+    x, y = rng.uniform(-500, 500, size=(2, npoints))
+    scale = rng.uniform(0.5, 1.5, size=npoints)
+    qx, qy = (v.flatten() for v in np.meshgrid(
+        np.linspace(-0.3, 0.3, npix), np.linspace(-0.3, 0.3, npix)))
+
+    if kernel == 'pixelwise':
+        fn = _pixelwise_kernel()
+        call = lambda: fn(scale, x, y, qx, qy)
+    else:
+        precision = 'single' if kernel == 'blocked-single' else 'double'
+        call = lambda: geni._calc_Iqxy(scale, x, y, qx, qy, precision=precision)
+    # Warm up the jit with a small problem so compile time is not counted.
+    small = slice(0, 16)
+    if kernel == 'pixelwise':
+        fn(scale[small], x[small], y[small], qx[small], qy[small])
+    else:
+        geni._calc_Iqxy(scale[small], x[small], y[small], qx[small], qy[small],
+                        precision=precision)
+    start = time.perf_counter()
+    call()
+    print(time.perf_counter() - start, _peak_rss_mb())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--npix', type=int, default=128,
+                        help="detector size is npix x npix")
+    parser.add_argument('--points', type=int, nargs='+',
+                        default=[10**4, 10**5, 10**6])
+    parser.add_argument('--run', nargs=2, metavar=('KERNEL', 'NPOINTS'),
+                        help=argparse.SUPPRESS)
+    opts = parser.parse_args()
+
+    if opts.run:
+        run_one(opts.run[0], int(opts.run[1]), opts.npix)
+        return
+
+    print("%10s %16s %12s %14s" % ("points", "kernel", "time [s]", "peak RSS [MB]"))
+    for npoints in opts.points:
+        for kernel in KERNELS:
+            result = subprocess.run(
+                [sys.executable, __file__, '--npix', str(opts.npix),
+                 '--run', kernel, str(npoints)],
+                capture_output=True, text=True, env=os.environ)
+            if result.returncode != 0:
+                print(result.stderr)
+                continue
+            wall, rss = (float(v) for v in result.stdout.strip().splitlines()[-1].split())
+            print("%10d %16s %12.3f %14.1f" % (npoints, kernel, wall, rss))
+
+
+if __name__ == "__main__":
+    main()
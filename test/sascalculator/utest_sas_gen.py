@@ -7,12 +7,14 @@ import warnings
 warnings.simplefilter("ignore")
 
 import unittest
+from unittest.mock import patch
 import numpy as np
 import math
 from scipy.spatial.transform import Rotation
 
 
 from sas.sascalc.calculator import sas_gen
+from sas.sascalc.calculator.debye_cache import DebyeHistogramCache
 
 MFACTOR_AM = 2.90636E-12
 
@@ -143,6 +145,77 @@ class sas_gen_test(unittest.TestCase):
         self.assertEqual(f.sld_n[0], 1)
         self.assertTrue(np.array_equal(f.elements[0], element_0))
 
+    def test_reader_cache(self):
+        """
+        Test that parsed files are cached, memory mapped and refreshed when the file changes
+        """
+        import shutil
+        import tempfile
+        from sas.sascalc.calculator.sld_cache import SLDFileCache
+        tmpdir = tempfile.mkdtemp()
+        try:
+            cache = SLDFileCache(min_size=0, cache_dir=os.path.join(tmpdir, 'cache'))
+            for reader, filename in ((self.pdbloader, "c60.pdb"),
+                                     (self.omfloader, "isolated_skyrmion_V2.omf"),
+                                     (self.vtkloader, "five_tetrahedra_cube.vtk")):
+                path = os.path.join(tmpdir, filename)
+                shutil.copy(find(filename), path)
+                reader.cache = None
+                expected = reader.read(path)
+                reader.cache = cache
+                reader.read(path)
+                cached = reader.read(path)
+                self.assertIsInstance(cached.pos_x.base, np.memmap)
+                for name in ('pos_x', 'pos_y', 'pos_z', 'sld_n', 'sld_mx', 'sld_my', 'sld_mz',
+                             'vol_pix', 'pix_symbol', 'elements'):
+                    np.testing.assert_array_equal(getattr(cached, name), getattr(expected, name))
+                for name in ('pix_type', 'xnodes', 'xstepsize', 'has_conect', 'is_elements',
+                             'filename', 'line_x'):
+                    self.assertEqual(getattr(cached, name), getattr(expected, name))
+            # changing the file invalidates the cached copy
+            with open(path, 'a') as fid:
+                fid.write("\n")
+            os.utime(path, ns=(0, 0))
+            self.assertNotIsInstance(reader.read(path).pos_x.base, np.memmap)
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def test_reader_cache_prune(self):
+        """
+        Test that the least recently used cache entries are removed when the cache is full
+        """
+        import shutil
+        import tempfile
+        from sas.sascalc.calculator.sld_cache import SLDFileCache
+        tmpdir = tempfile.mkdtemp()
+        try:
+            cache_dir = os.path.join(tmpdir, 'cache')
+            self.pdbloader.cache = SLDFileCache(min_size=0, cache_dir=cache_dir)
+            paths = []
+            for k in range(3):
+                paths.append(os.path.join(tmpdir, "c60_%d.pdb" % k))
+                shutil.copy(find("c60.pdb"), paths[-1])
+                self.pdbloader.read(paths[-1])
+            entries = sorted(os.listdir(cache_dir))
+            self.assertEqual(len(entries), 3)
+            entry_size = os.path.getsize(os.path.join(cache_dir, entries[0]))
+            # give the entries distinct ages, oldest first, then use the oldest
+            for k, name in enumerate(entries):
+                os.utime(os.path.join(cache_dir, name), ns=(k*10**9, k*10**9))
+            used = self.pdbloader.cache._path("PDB", os.path.abspath(paths[0]))
+            os.utime(used, ns=(0, 0))
+            self.assertIsInstance(self.pdbloader.read(paths[0]).pos_x.base, np.memmap)
+            self.pdbloader.cache.max_bytes = 2.5*entry_size
+            paths.append(os.path.join(tmpdir, "c60_3.pdb"))
+            shutil.copy(find("c60.pdb"), paths[-1])
+            self.pdbloader.read(paths[-1])
+            cached = [os.path.exists(self.pdbloader.cache._path("PDB", os.path.abspath(path)))
+                      for path in paths]
+            self.assertEqual(cached, [True, False, False, True])
+        finally:
+            self.pdbloader.cache = None
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
     def get_box_transform(self, sld, qx, qy, x, y, z):
         """Return the fourier transform of a box at qx, qy with dimensions x by y by z
 
@@ -275,6 +348,205 @@ class sas_gen_test(unittest.TestCase):
         for val in np.abs(errs):
             self.assertLessEqual(val, 0.01)
 
+    def test_debye_histogram(self):
+        """
+        Test that the histogram Debye sum agrees with the full sum to within its error bound.
+        """
+        from sas.sascalc.calculator.ausaxs import sasview_sans_debye
+
+        rng = np.random.default_rng(1984)
+        f = self.pdbloader.read(find("c60.pdb"))
+        coords = np.vstack([f.pos_x, f.pos_y, f.pos_z])
+        q = np.linspace(0.001, 5, 100)
+        w = rng.random(coords.shape[1]) # random weights
+
+        exact = sasview_sans_debye.sasview_sans_debye(q, coords, w)
+        binned, err = sasview_sans_debye.sasview_sans_debye_histogram(q, coords, w, bin_width=0.01)
+        self.assertTrue(np.all(np.abs(binned - exact) <= err + 1e-10*exact))
+
+        # the pure numpy kernel should give the same histogram as the default kernel
+        r, p_r = sasview_sans_debye.distance_histogram(coords, w, bin_width=0.01)
+        extent = np.sqrt(np.sum((coords.max(axis=1) - coords.min(axis=1))**2))
+        nbins = int(extent/0.01) + 2
+        hist = sasview_sans_debye._distance_histogram_numpy(coords, w[None, :], 0.01, nbins, 16)[0]
+        index = np.flatnonzero(hist)
+        np.testing.assert_allclose((index + 0.5)*0.01, r)
+        np.testing.assert_allclose(hist[index], p_r)
+
+    def test_debye_histogram_cache(self):
+        """
+        Test that GenSAS reuses the cached histograms when the solvent SLD and q change.
+        """
+        from sas.sascalc.calculator.ausaxs import sasview_sans_debye
+
+        f = self.pdbloader.read(find("c60.pdb"))
+        model = sas_gen.GenSAS()
+        model.histogram_cache = DebyeHistogramCache()
+        model.set_sld_data(f)
+        coords = np.vstack([f.pos_x, f.pos_y, f.pos_z])
+        for solvent_sld, q in ((0.0, np.linspace(0.01, 1, 50)), (1e-6, np.linspace(0.02, 2, 30))):
+            model.params['solvent_SLD'] = solvent_sld
+            output = model.run([q, []])
+            w = (f.sld_n - solvent_sld) * f.vol_pix
+            exact = sasview_sans_debye.sasview_sans_debye(q, coords, w) * 1.0E+8/np.sum(f.vol_pix)
+            np.testing.assert_allclose(output, exact, rtol=1e-3, atol=1e-3*exact.max())
+        self.assertEqual(len(model.histogram_cache), 1)
+
+    def test_debye_default(self):
+        """
+        Test that GenSAS uses the exact Debye sum unless the histograms are enabled.
+        """
+        from sas.sascalc.calculator.ausaxs import ausaxs_sans_debye, sasview_sans_debye
+
+        f = self.pdbloader.read(find("c60.pdb"))
+        model = sas_gen.GenSAS()
+        model.set_sld_data(f)
+        self.assertIsNone(model.histogram_cache)
+        coords = np.vstack([f.pos_x, f.pos_y, f.pos_z])
+        w = f.sld_n*f.vol_pix
+        q = np.linspace(0.01, 1, 50)
+        # the exact sum stands in for AUSAXS, which may not be available
+        with patch.object(ausaxs_sans_debye, 'evaluate_sans_debye',
+                          side_effect=sasview_sans_debye.sasview_sans_debye) as evaluate:
+            output = model.run([q, []])
+        evaluate.assert_called_once()
+        exact = sasview_sans_debye.sasview_sans_debye(q, coords, w) * 1.0E+8/np.sum(f.vol_pix)
+        np.testing.assert_allclose(output, exact, rtol=1e-12)
+
+    def test_Iqxy_blocked(self):
+        """
+        Test that the tiled 2D kernels agree with a direct sum in double and single precision.
+        """
+        from sas.sascalc.calculator import geni
+
+        rng = np.random.default_rng(1984)
+        x, y = rng.uniform(-50, 50, size=(2, 5000))
+        scale = rng.uniform(0.5, 1.5, size=5000)
+        qx, qy = (v.flatten() for v in np.meshgrid(np.linspace(-0.3, 0.3, 21), np.linspace(-0.3, 0.3, 21)))
+        direct = np.abs(np.exp(1j*(np.outer(qx, x) + np.outer(qy, y))) @ scale)**2
+
+        output = geni._calc_Iqxy(scale, x, y, qx, qy)
+        np.testing.assert_allclose(output, direct, rtol=1e-10, atol=1e-10*direct.max())
+        output = geni._calc_Iqxy(scale, x, y, qx, qy, nthreads=1)
+        np.testing.assert_allclose(output, direct, rtol=1e-10, atol=1e-10*direct.max())
+        output = geni._calc_Iqxy(scale, x, y, qx, qy, precision='single')
+        np.testing.assert_allclose(output, direct, rtol=1e-4, atol=1e-5*direct.max())
+        with self.assertRaises(ValueError):
+            geni._calc_Iqxy(scale, x, y, qx, qy, precision='half')
+
+    def test_Iqxy_fft(self):
+        """
+        Test that the FFT evaluation for regular grids agrees with the direct sum.
+        """
+        from sas.sascalc.calculator import geni
+
+        rng = np.random.default_rng(1984)
+        x, y, z = (v.flatten() for v in np.meshgrid(
+            np.arange(20)*2.0 - 17, np.arange(20)*3.0 + 5, np.arange(20)*1.5, indexing='ij'))
+        npoints = len(x)
+        sld = rng.random(npoints)
+        vol = np.full(npoints, 9.0)
+        mx, my, mz = rng.random((3, npoints)) - 0.5
+        qx, qy = (v.flatten() for v in np.meshgrid(np.linspace(-0.5, 0.5, 41), np.linspace(-0.5, 0.5, 41)))
+        self.assertIsNotNone(geni._fft_grid(len(qx), x, y))
+        # irregular points must use the direct sum
+        self.assertIsNone(geni._fft_grid(len(qx), x + rng.random(npoints), y))
+        for m in ((None, None, None), (mx, my, mz)):
+            fft = geni.Iqxy(qx, qy, x, y, z, sld, vol, *m, 0.3, 0.8, 40.0, 20.0)
+            direct = geni.Iqxy(qx, qy, x, y, z, sld, vol, *m, 0.3, 0.8, 40.0, 20.0, use_fft=False)
+            np.testing.assert_allclose(fft, direct, rtol=1e-8, atol=1e-10*direct.max())
+
+    def test_calculator_spin_states(self):
+        """
+        Test that a batch of polarisation states matches separate calculations of each state.
+        """
+        rng = np.random.default_rng(1984)
+        npoints = 500
+        x, y, z = rng.uniform(-30, 30, size=(3, npoints))
+        data = sas_gen.MagSLD(x, y, z, sld_n=rng.random(npoints)*1e-6,
+                              vol_pix=np.full(npoints, 8.0))
+        data.set_sldms(*(rng.random((3, npoints)) - 0.5)*1e-6)
+        model = sas_gen.GenSAS()
+        model.set_sld_data(data)
+        model.set_rotations(uvw_to_UVW=Rotation.from_rotvec([0.2, -0.1, 0.3]))
+        qx, qy = (v.flatten() for v in np.meshgrid(np.linspace(-0.2, 0.2, 11), np.linspace(-0.2, 0.2, 11)))
+        states = [(1, 1, 90, 0), (0, 0, 90, 0), (1, 0, 90, 0), (0, 1, 90, 0), (0.8, 0.5, 30, 45)]
+        batch = model.calculate_Iqxy_states(qx, qy, states)
+        self.assertEqual(batch.shape, (len(states), len(qx)))
+        for state, output in zip(states, batch):
+            for key, value in zip(('Up_frac_in', 'Up_frac_out', 'Up_theta', 'Up_phi'), state):
+                model.params[key] = value
+            model.transformed_angles = None
+            np.testing.assert_allclose(output, model.runXY([qx, qy]), rtol=1e-10)
+
+    def test_calculator_rotated_q(self):
+        """
+        Test that rotating q into the sample frame matches rotating the sample points.
+        """
+        from sas.sascalc.calculator import geni
+        rng = np.random.default_rng(2024)
+        npoints = 400
+        x, y, z = rng.uniform(-30, 30, size=(3, npoints))
+        data = sas_gen.MagSLD(x, y, z, sld_n=rng.random(npoints)*1e-6,
+                              vol_pix=np.full(npoints, 8.0))
+        data.set_sldms(*(rng.random((3, npoints)) - 0.5)*1e-6)
+        model = sas_gen.GenSAS()
+        model.set_sld_data(data)
+        model.params['Up_frac_in'] = 0.8
+        model.params['Up_frac_out'] = 0.3
+        model.params['Up_theta'] = 40
+        qx, qy = (v.flatten() for v in np.meshgrid(np.linspace(-0.2, 0.2, 9), np.linspace(-0.2, 0.2, 9)))
+        for rotvec in ([0.3, -0.2, 0.5], [0, 0, 0], [0.3, -0.2, 0.5]):
+            rotation = Rotation.from_rotvec(rotvec)
+            model.set_rotations(xyz_to_UVW=rotation)
+            pos = rotation.apply(np.column_stack((x, y, z))).T
+            mag = rotation.apply(np.column_stack((data.sld_mx, data.sld_my, data.sld_mz))).T
+            sld = model.data_sldn - model.params['solvent_SLD']
+            expected = geni.Iqxy(qx, qy, *pos, sld, model.data_vol, *mag,
+                                 0.8, 0.3, 40, 0, use_fft=False)
+            np.testing.assert_allclose(model.runXY([qx, qy]), expected, rtol=1e-10)
+        # the transformed data is kept for the orientations already seen
+        self.assertEqual(len(model._transform_cache), 0)
+        positions = model.transform_positions()
+        model.set_rotations(xyz_to_UVW=Rotation.from_rotvec([0, 0, 0]))
+        model.set_rotations(xyz_to_UVW=Rotation.from_rotvec([0.3, -0.2, 0.5]))
+        self.assertIs(model.transform_positions(), positions)
+
+    def test_coarse_grain(self):
+        """
+        Test that coarse graining a dense sphere reduces the points within the error estimate.
+        """
+        from sas.sascalc.calculator.coarse_grain import coarse_grain
+        grid = np.arange(-15, 15.1, 1.0)
+        x, y, z = (v.flatten() for v in np.meshgrid(grid, grid, grid))
+        inside = x**2 + y**2 + z**2 <= 15**2
+        x, y, z = x[inside], y[inside], z[inside]
+        data = sas_gen.MagSLD(x, y, z, sld_n=np.where(z > 0, 2e-6, 1e-6),
+                              vol_pix=np.ones(len(x)))
+        data.set_sldms(np.full(len(x), 1e-7), np.zeros(len(x)), np.zeros(len(x)))
+        qmax, tol = 0.1, 1e-2
+        reduced, info = coarse_grain(data, qmax, tol)
+        self.assertGreater(info.ratio, 5)
+        self.assertLessEqual(info.error, tol)
+        self.assertEqual(len(reduced.pos_x), info.ncells)
+        # amplitude at q=0 is conserved
+        self.assertAlmostEqual(np.sum(reduced.vol_pix), np.sum(data.vol_pix))
+        np.testing.assert_allclose(np.sum(reduced.sld_n*reduced.vol_pix), np.sum(data.sld_n*data.vol_pix))
+        np.testing.assert_allclose(np.sum(reduced.sld_mx*reduced.vol_pix), np.sum(data.sld_mx*data.vol_pix))
+
+        full, coarse = sas_gen.GenSAS(), sas_gen.GenSAS()
+        full.set_sld_data(data)
+        coarse.set_sld_data(data, qmax=qmax, tol=tol)
+        self.assertEqual(coarse.coarse_grain_info.ncells, info.ncells)
+        self.assertIs(coarse.getProfile(), data)
+        q = np.linspace(0.005, qmax, 20)
+        np.testing.assert_allclose(coarse.calculate_Iq(q), full.calculate_Iq(q), rtol=2*tol)
+        qx, qy = (v.flatten() for v in np.meshgrid(np.linspace(-qmax, qmax, 9), np.linspace(-qmax, qmax, 9)))
+        for model in (full, coarse):
+            model.params['Up_frac_in'] = 0.0
+            model.params['Up_theta'] = 90.0
+        np.testing.assert_allclose(coarse.runXY([qx, qy]), full.runXY([qx, qy]), rtol=2*tol)
+
     def test_calculator_elements(self):
         """
         Test that the calculator correctly calculates scattering for element type data.
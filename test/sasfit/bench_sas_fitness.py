@@ -0,0 +1,97 @@
+"""
+Benchmark SasFitness evaluations with and without the kernel binding.
+
+Without the binding, every evaluation copies all parameters into the model
+with setParam and rebuilds the kernel and its arguments.  With the binding,
+only the changed parameters are written into the kernel arguments.  Each
+evaluation perturbs the fitted parameters, as an optimizer would.  Usage::
+
+    python bench_sas_fitness.py [--points 100] [--seconds 2]
+"""
+import time
+import argparse
+from importlib.machinery import SourceFileLoader
+from os.path import abspath, dirname, join as joinpath
+
+import numpy as np
+
+# (model, fitted parameters, initial values)
+CASES = (
+    ('sphere', ['radius', 'scale'], {}),
+    ('cylinder', ['radius', 'length', 'radius.width'],
+     {'radius.width': 0.1, 'length.width': 0.1, 'radius.npts': 5, 'length.npts': 5}),
+    ('core_shell_ellipsoid', ['radius_equat_core', 'thick_shell', 'sld_shell',
+                              'background', 'radius_equat_core.width'],
+     {'radius_equat_core.width': 0.1, 'radius_equat_core.npts': 15}),
+)
+
+
+def make_fitness(name, fitted, setup, npoints, smear):
+    from sasdata.dataloader.data_info import Data1D
+    from sasmodels.sasview_model import _make_standard_model
+    from sas.sascalc.fit.AbstractFitEngine import FitData1D, Model
+    from sas.sascalc.fit.BumpsFitting import SasFitness
+    from sas.sascalc.fit.qsmearing import smear_selection
+
+    model = _make_standard_model(name)()
+    for k, v in setup.items():
+        model.setParam(k, v)
+    q = np.logspace(-3, -0.5, npoints)
+    y, dy, dq = np.ones_like(q), 0.1*np.ones_like(q), 0.05*q
+    data = FitData1D(x=q, y=y, dy=dy, dx=dq if smear else None)
+    if smear:
+        data.smearer = smear_selection(Data1D(x=q, y=y, dx=dq, dy=dy), model)
+    data.set_fit_range(q[0], q[-1])
+    return SasFitness(Model(model), data, fitted=fitted)
+
+
+def evals_per_second(fitness, seconds, use_binding):
+    binding = fitness._binding
+    if not use_binding:
+        fitness._binding = None
+    pars = fitness.fitted_pars
+    start_values = np.array([p.value for p in pars])
+    rng = np.random.default_rng(1984)
+    try:
+        nevals = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            step = 1 + 0.05*rng.standard_normal(len(pars))
+            for p, v in zip(pars, start_values*step):
+                p.value = v
+            fitness.update()
+            fitness.nllf()
+            nevals += 1
+        return nevals/(time.perf_counter() - start)
+    finally:
+        for p, v in zip(pars, start_values):
+            p.value = v
+        fitness._binding = binding
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--points', type=int, default=100,
+                        help="number of q points")
+    parser.add_argument('--seconds', type=float, default=2.0,
+                        help="time spent on each case")
+    opts = parser.parse_args()
+
+    run_py = joinpath(dirname(dirname(dirname(abspath(__file__)))), 'run.py')
+    SourceFileLoader('sasview_run', run_py).load_module().prepare()
+
+    print("%22s %6s %6s %14s %14s %8s" % (
+        "model", "npars", "smear", "setParam [1/s]", "binding [1/s]", "speedup"))
+    for name, fitted, setup in CASES:
+        for smear in (False, True):
+            fitness = make_fitness(name, fitted, setup, opts.points, smear)
+            # warm up: compile the model and build the kernels
+            evals_per_second(fitness, 0.1, True)
+            before = evals_per_second(fitness, opts.seconds, False)
+            after = evals_per_second(fitness, opts.seconds, True)
+            print("%22s %6d %6s %14.0f %14.0f %8.2f" % (
+                name, len(fitness.parameters()), smear, before, after, after/before))
+
+
+if __name__ == "__main__":
+    main()
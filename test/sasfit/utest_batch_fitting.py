@@ -0,0 +1,303 @@
+"""
+    Unit tests for batch fits run in worker processes
+"""
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+import bumps
+from bumps.options import FIT_CONFIG
+from sasdata.dataloader.data_info import Data1D
+from sasmodels.sasview_model import _make_standard_model
+from sasmodels.weights import ArrayDispersion
+
+from bumps.fitproblem import FitProblem
+from bumps.mapper import SerialMapper
+
+from sas.sascalc.fit import BumpsFitting
+from sas.sascalc.fit.BatchFitting import batch_fit, batch_workers, _dumps, _init_worker
+from sas.sascalc.fit.AbstractFitEngine import FitEngine, FResult
+from sas.sascalc.fit.BumpsFitting import BumpsFit, SasFitness
+
+# BumpsFit collects the results with the bumps 0.x FitProblem interface
+FITS_RUN = int(bumps.__version__.split('.')[0]) < 1
+
+PLUGIN = '''
+import numpy as np
+name = "batch_plugin"
+title = "Sphere with a python kernel"
+description = "Sphere with a python kernel"
+category = "plugin"
+parameters = [["radius", "Ang", 50, [0, np.inf], "volume", "Radius"]]
+def form_volume(radius):
+    return 4/3*np.pi*radius**3
+def Iq(q, radius):
+    qr = q*radius
+    f = 3*(np.sin(qr) - qr*np.cos(qr))/qr**3
+    return 1e-4*form_volume(radius)*f**2
+Iq.vectorized = True
+'''
+
+
+class Cancel(object):
+    """
+    Fit thread which is stopped after *n* checks.
+    """
+    def __init__(self, n):
+        self.n = n
+
+    def isquit(self):
+        self.n -= 1
+        if self.n < 0:
+            raise KeyboardInterrupt("Fitting: terminated by the user.")
+
+
+class StubFit(FitEngine):
+    """
+    Fit engine which returns the parameter values as the result, so the
+    pool can be tested without bumps.
+
+    The fit waits for the file *wait* to exist, if set, then creates the
+    file *signal*, if set.
+    """
+    def __init__(self):
+        FitEngine.__init__(self)
+        self.wait = None
+        self.signal = None
+
+    def fit(self, msg_q=None, q=None, handler=None, curr_thread=None,
+            ftol=1.49012e-8, reset_flag=False):
+        if self.wait is not None:
+            deadline = time.time() + 60
+            while not os.path.exists(self.wait) and time.time() < deadline:
+                time.sleep(0.01)
+        if self.signal is not None:
+            open(self.signal, 'w').close()
+        results = []
+        for fit_arrange in self.fit_arrange_dict.values():
+            if fit_arrange.get_to_fit():
+                model = fit_arrange.get_model()
+                result = FResult(model=model.model, data=fit_arrange.get_data(),
+                                 param_list=model.model.getParamList())
+                result.pvec = [model.model.getParam(p) for p in result.param_list]
+                result.info = {'reset_flag': reset_flag, 'pid': os.getpid()}
+                results.append(result)
+        return results
+
+
+class Handler(object):
+    """
+    Fit handler which records the progress of a batch.
+    """
+    def __init__(self):
+        self.results = []
+        self.progress_calls = []
+
+    def set_result(self, result):
+        self.results.append(result)
+
+    def progress(self, done, total):
+        self.progress_calls.append((done, total))
+
+    def update_fit(self, last=False):
+        pass
+
+
+class TestBatchFitting(unittest.TestCase):
+
+    def setUp(self):
+        self.selected = FIT_CONFIG.selected_id
+        FIT_CONFIG.selected_id = 'lm'
+
+    def tearDown(self):
+        FIT_CONFIG.selected_id = self.selected
+
+    def make_fitters(self, radii):
+        q = np.linspace(0.005, 0.3, 100)
+        fitters = []
+        for radius in radii:
+            model = _make_standard_model('sphere')()
+            model.setParam('radius', radius)
+            model.setParam('radius.width', 0.05)
+            model.setParam('radius.npts', 15)
+            y = model.evalDistribution(q)
+            data = Data1D(x=q, y=y, dy=0.02*y)
+            data.name = "sphere %g" % radius
+            model = _make_standard_model('sphere')()
+            model.setParam('radius', 0.9*radius)
+            model.setParam('radius.width', 0.05)
+            model.setParam('radius.npts', 15)
+            model.details['radius'][1:3] = [10, 200]
+            fitter = BumpsFit()
+            fitter.set_model(model, 0, ['radius', 'scale'], data=data)
+            fitter.set_data(data=data, id=0, qmin=q[0], qmax=q[-1])
+            fitter.select_problem_for_fit(id=0, value=1)
+            fitter.set_weight_increase(0, 1)
+            fitters.append(fitter)
+        return fitters
+
+    def make_stub_fitters(self, radii):
+        q = np.linspace(0.005, 0.3, 10)
+        fitters = []
+        for radius in radii:
+            model = _make_standard_model('sphere')()
+            model.setParam('radius', radius)
+            data = Data1D(x=q, y=np.ones_like(q), dy=0.1*np.ones_like(q))
+            data.name = "sphere %g" % radius
+            fitter = StubFit()
+            fitter.set_model(model, 0, ['radius'], data=data)
+            fitter.set_data(data=data, id=0, qmin=q[0], qmax=q[-1])
+            fitter.select_problem_for_fit(id=0, value=1)
+            fitters.append(fitter)
+        return fitters
+
+    def check_stub_pool(self, reset_flag):
+        radii = [30, 45, 60, 75]
+        fitters = self.make_stub_fitters(radii)
+        path = tempfile.mkdtemp()
+        try:
+            # the first fit waits for the last one, so it completes last
+            fitters[0].wait = fitters[-1].signal = os.path.join(path, 'done')
+            handler = Handler()
+            with patch('os.cpu_count', return_value=2):
+                pooled = list(batch_fit(fitters, handler=handler, max_workers=2,
+                                        reset_flag=reset_flag))
+        finally:
+            shutil.rmtree(path)
+        # the results are yielded in completion order with their own index
+        self.assertEqual([index for index, _ in pooled], [1, 2, 3, 0])
+        self.assertEqual(handler.progress_calls, [(1, 4), (2, 4), (3, 4), (4, 4)])
+        self.assertEqual(handler.results, [results[0] for _, results in pooled])
+        for index, results in pooled:
+            result, = results
+            self.assertNotEqual(result.info['pid'], os.getpid())
+            self.assertEqual(result.info['reset_flag'], reset_flag)
+            self.assertEqual(result.pvec[result.param_list.index('radius')], radii[index])
+            # results refer to the caller's model and data
+            model = fitters[index].get_model(0).model
+            data = fitters[index].fit_arrange_dict[0].get_data()
+            self.assertIs(result.model, model)
+            self.assertIs(result.data, data)
+            self.assertEqual(result.inputs, [(model, data)])
+            self.assertEqual(result.data.sas_data.name, "sphere %g" % radii[index])
+
+    def test_stub_pool(self):
+        self.check_stub_pool(reset_flag=False)
+
+    def test_stub_pool_reset(self):
+        self.check_stub_pool(reset_flag=True)
+
+    def test_workers(self):
+        with patch.dict(os.environ, {'OMP_NUM_THREADS': '1'}), \
+                patch('os.cpu_count', return_value=8):
+            self.assertEqual(batch_workers(20), 8)
+            self.assertEqual(batch_workers(3), 3)
+            self.assertEqual(batch_workers(20, max_workers=2), 2)
+            self.assertEqual(batch_workers(20, max_workers=1), 1)
+        with patch.dict(os.environ, {'OMP_NUM_THREADS': '4'}), \
+                patch('os.cpu_count', return_value=8):
+            self.assertEqual(batch_workers(20), 2)
+
+    def test_worker_mapper(self):
+        """
+        Fits in the pool workers don't use MPMapper, which can't start its
+        processes from a daemonic worker, even with OMP_NUM_THREADS=1.
+        """
+        fitter, = self.make_fitters([30])
+        dataset = fitter.fit_arrange_dict[0]
+        problem = FitProblem([SasFitness(model=dataset.get_model(),
+                                         data=dataset.get_data(),
+                                         fitted=['radius'])])
+        with patch.dict(os.environ), \
+                patch.object(BumpsFitting, 'SERIAL_MAPPER', False):
+            _init_worker(1)
+            self.assertEqual(os.environ['OMP_NUM_THREADS'], '1')
+            self.assertIs(BumpsFitting.select_mapper(problem), SerialMapper)
+
+    def test_model_state(self):
+        model = _make_standard_model('core_multi_shell')(multiplicity=2)
+        model.setParam('sld_core', 2.5)
+        model.setParam('thickness2', 30)
+        model.setParam('radius.width', 0.1)
+        model.setParam('sld_core_M0', 1.5)
+        disperser = ArrayDispersion()
+        disperser.set_weights([20, 30, 40], [0.2, 0.5, 0.3])
+        model.set_dispersion('thickness1', disperser)
+        model.details['radius'][2] = 500
+        copy = pickle.loads(_dumps(model))
+        self.assertIsNot(copy, model)
+        self.assertEqual(copy.multiplicity, 2)
+        self.assertEqual(copy.params, model.params)
+        self.assertEqual(copy.details['radius'], model.details['radius'])
+        self.assertEqual(copy.dispersion['thickness1']['type'], 'array')
+        q = np.linspace(0.001, 0.5, 50)
+        np.testing.assert_array_equal(copy.evalDistribution(q),
+                                      model.evalDistribution(q))
+
+    def test_plugin_state(self):
+        from sasmodels.sasview_model import load_custom_model
+        path = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(path, 'batch_plugin.py')
+            with open(filename, 'w') as fp:
+                fp.write(PLUGIN)
+            model = load_custom_model(filename)()
+            model.setParam('radius', 75)
+            model.setParam('radius.width', 0.1)
+            copy = pickle.loads(_dumps(model))
+            self.assertEqual(copy.filename, model.filename)
+            self.assertEqual(copy.params, model.params)
+            q = np.linspace(0.001, 0.5, 50)
+            np.testing.assert_array_equal(copy.evalDistribution(q),
+                                          model.evalDistribution(q))
+        finally:
+            shutil.rmtree(path)
+
+    def check_pool(self, reset_flag):
+        radii = [30, 45, 60, 75]
+        serial = list(batch_fit(self.make_fitters(radii), max_workers=1,
+                                reset_flag=reset_flag))
+        fitters = self.make_fitters(radii)
+        with patch('os.cpu_count', return_value=2):
+            pooled = list(batch_fit(fitters, max_workers=2, reset_flag=reset_flag))
+        # the serial fits are in order, the pool returns them as they complete
+        self.assertEqual([index for index, _ in serial], list(range(len(radii))))
+        self.assertEqual(sorted(index for index, _ in pooled), list(range(len(radii))))
+        pooled = dict(pooled)
+        for index, expected in serial:
+            result, = pooled[index]
+            expected, = expected
+            self.assertEqual(result.param_list, expected.param_list)
+            np.testing.assert_allclose(result.pvec, expected.pvec, rtol=1e-10)
+            np.testing.assert_allclose(result.fitness, expected.fitness, rtol=1e-10)
+            self.assertAlmostEqual(result.pvec[0], radii[index], places=2)
+            # results refer to the caller's model and data
+            self.assertIs(result.model, fitters[index].get_model(0).model)
+            self.assertEqual(result.data.sas_data.name, "sphere %g" % radii[index])
+
+    @unittest.skipUnless(FITS_RUN, "BumpsFit needs bumps 0.x")
+    def test_pool(self):
+        self.check_pool(reset_flag=False)
+
+    @unittest.skipUnless(FITS_RUN, "BumpsFit needs bumps 0.x")
+    def test_pool_reset(self):
+        self.check_pool(reset_flag=True)
+
+    def test_cancel(self):
+        fitters = self.make_fitters([30, 45, 60, 75])
+        done = []
+        with patch('os.cpu_count', return_value=2), \
+                self.assertRaises(KeyboardInterrupt):
+            for index, _ in batch_fit(fitters, curr_thread=Cancel(0), max_workers=2):
+                done.append(index)
+        self.assertEqual(done, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
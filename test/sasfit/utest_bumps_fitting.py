@@ -0,0 +1,140 @@
+"""
+    Unit tests for checkpointing and early stopping of bumps fits
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from bumps.fitproblem import FitProblem
+from bumps.options import FIT_CONFIG
+from sasmodels.sasview_model import _make_standard_model
+
+from sas.sascalc.fit.AbstractFitEngine import FitData1D, Model
+from sas.sascalc.fit.BumpsFitting import (SasFitness, PlateauMonitor,
+                                          load_checkpoint, run_bumps)
+
+
+class History(object):
+    def __init__(self, step, value):
+        self.step, self.value = [step], [value]
+
+
+class Killed(Exception):
+    pass
+
+
+class KillAfter(object):
+    """
+    Fit thread which fails after *n* checks, as a killed fit would.
+    """
+    def __init__(self, n):
+        self.n = n
+
+    def isquit(self):
+        self.n -= 1
+        if self.n < 0:
+            raise Killed()
+
+
+class CancelAfter(KillAfter):
+    """
+    Fit thread which the user cancels after *n* checks.
+    """
+    def isquit(self):
+        self.n -= 1
+        if self.n < 0:
+            raise KeyboardInterrupt("Fitting: terminated by the user.")
+
+
+class TestBumpsFit(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.selected = FIT_CONFIG.selected_id
+        FIT_CONFIG.selected_id = 'de'
+        self.dream_values = dict(FIT_CONFIG.values['dream'])
+
+    def tearDown(self):
+        FIT_CONFIG.selected_id = self.selected
+        FIT_CONFIG.values['dream'] = self.dream_values
+        shutil.rmtree(self.dir)
+
+    def make_problem(self):
+        q = np.linspace(0.005, 0.3, 100)
+        model = _make_standard_model('sphere')()
+        model.setParam('radius', 45)
+        y = model.evalDistribution(q)
+        data = FitData1D(x=q, y=y, dy=0.02*y)
+        data.set_fit_range(q[0], q[-1])
+        fitness = SasFitness(Model(_make_standard_model('sphere')()), data,
+                             fitted=['radius', 'scale'])
+        fitness.parameters()['radius'].range(5, 100)
+        fitness.parameters()['scale'].range(0, 2)
+        return FitProblem([fitness])
+
+    def test_plateau(self):
+        monitor = PlateauMonitor(steps=3, tol=1e-3)
+        for step, value in enumerate([10, 5, 4, 3.999, 3.998, 3.998, 3.998]):
+            monitor(History(step, value))
+            self.assertEqual(monitor.converged, step >= 5)
+
+    def test_resume(self):
+        path = os.path.join(self.dir, 'fit.pickle')
+        result = run_bumps(self.make_problem(), None, KillAfter(20),
+                           checkpoint=path, checkpoint_interval=0, resume=True)
+        self.assertFalse(result['success'])
+        problem = self.make_problem()
+        saved = load_checkpoint(path, problem, 'de')
+        self.assertIsNotNone(saved)
+        self.assertIsNone(load_checkpoint(path, problem, 'dream'))
+
+        result = run_bumps(problem, None, None, checkpoint=path,
+                           checkpoint_interval=0, resume=True)
+        self.assertTrue(result['success'])
+        # the convergence history continues from the checkpoint
+        self.assertGreater(len(result['convergence']), len(saved['convergence']))
+        self.assertFalse(os.path.exists(path))
+        radius = result['value'][problem.labels().index('sphere.radius')]
+        self.assertAlmostEqual(radius, 45, places=3)
+
+    def test_resume_dream(self):
+        """
+        A resumed DREAM fit continues its chains rather than starting again
+        with a new burn-in.
+        """
+        FIT_CONFIG.selected_id = 'dream'
+        FIT_CONFIG.values['dream'].update(samples=2000, burn=20)
+        # 2 parameters with pop=10 give 20 chains, so 100 steps after burn-in
+        steps = 20 + 2000//20
+        path = os.path.join(self.dir, 'fit.pickle')
+        run_bumps(self.make_problem(), None, KillAfter(30),
+                  checkpoint=path, checkpoint_interval=0, resume=True)
+        saved = load_checkpoint(path, self.make_problem(), 'dream')
+        self.assertGreater(saved['step'], 0)
+
+        result = run_bumps(self.make_problem(), None, None, checkpoint=path,
+                           checkpoint_interval=0, resume=True)
+        self.assertTrue(result['success'])
+        self.assertEqual(result['uncertainty'].generation, steps)
+        # the steps before the checkpoint are not run again
+        self.assertEqual(len(result['convergence']), steps)
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_cancel(self):
+        """
+        A cancelled fit keeps its latest state, so it can be resumed.
+        """
+        path = os.path.join(self.dir, 'fit.pickle')
+        result = run_bumps(self.make_problem(), None, CancelAfter(20),
+                           checkpoint=path, checkpoint_interval=3600, resume=True)
+        saved = load_checkpoint(path, self.make_problem(), 'de')
+        self.assertIsNotNone(saved)
+        # saved on cancel, although the interval has not passed
+        self.assertEqual(len(saved['convergence']), len(result['convergence']))
+
+
+if __name__ == '__main__':
+    unittest.main()
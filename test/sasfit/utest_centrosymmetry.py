@@ -0,0 +1,143 @@
+"""
+    Unit tests for the half detector evaluation of centrosymmetric models
+"""
+import unittest
+
+import numpy as np
+
+from sasdata.dataloader.data_info import Data2D
+from sasmodels.sasview_model import _make_standard_model
+
+from sas.sascalc.fit.AbstractFitEngine import FitData2D, Model
+from sas.sascalc.fit.BumpsFitting import SasFitness
+from sas.sascalc.fit.centrosymmetry import (
+    is_centrosymmetric, half_plane, eval_half_plane)
+
+
+class CountingModel(object):
+    """
+    Record the number of points evaluated by *model*.
+    """
+    def __init__(self, model):
+        self.model = model
+        self.npoints = 0
+
+    def evalDistribution(self, qdist):
+        self.npoints += len(qdist[0])
+        return self.model.evalDistribution(qdist)
+
+
+class TestCentrosymmetry(unittest.TestCase):
+
+    def setUp(self):
+        # odd number of pixels, so the beam centre is a pixel
+        self.qx, self.qy = (v.flatten() for v in np.meshgrid(
+            np.linspace(-0.2, 0.2, 31), np.linspace(-0.15, 0.15, 25)))
+
+    def test_half_plane(self):
+        index, inverse = half_plane(self.qx, self.qy)
+        # each pixel but the centre has a mirror pixel
+        self.assertEqual(len(index), (len(self.qx) + 1) // 2)
+        np.testing.assert_allclose(np.abs(self.qx[index][inverse]), np.abs(self.qx),
+                                   atol=1e-12)
+        np.testing.assert_allclose(np.abs(self.qy[index][inverse]), np.abs(self.qy),
+                                   atol=1e-12)
+        # no mirror pixels on one side of the beam
+        self.assertIsNone(half_plane(self.qx[self.qx > 0], self.qy[self.qx > 0]))
+        self.assertIsNone(half_plane(self.qx[:0], self.qy[:0]))
+
+    def test_eval_half_plane(self):
+        model = _make_standard_model('cylinder')()
+        model.setParam('theta', 30.0)
+        model.setParam('phi', 20.0)
+        model.setParam('radius.width', 0.1)
+        self.assertTrue(is_centrosymmetric(model))
+        counter = CountingModel(model)
+        value = eval_half_plane(counter.evalDistribution, self.qx, self.qy)
+        self.assertEqual(counter.npoints, (len(self.qx) + 1) // 2)
+        np.testing.assert_allclose(value, model.evalDistribution([self.qx, self.qy]),
+                                   rtol=1e-10)
+
+    def test_magnetic(self):
+        model = _make_standard_model('sphere')()
+        model.setParam('up_frac_i', 0.8)
+        # no magnetism, whatever the polarization
+        self.assertTrue(is_centrosymmetric(model))
+        model.setParam('sld_M0', 2.0)
+        self.assertFalse(is_centrosymmetric(model))
+        # unpolarized beam without analyzer
+        model.setParam('up_frac_i', 0.5)
+        model.setParam('up_frac_f', 0.5)
+        self.assertTrue(is_centrosymmetric(model))
+        model.setParam('up_frac_f', 0.0)
+        self.assertFalse(is_centrosymmetric(model))
+
+    def test_not_symmetric(self):
+        # Iqxy defined by the model
+        self.assertFalse(is_centrosymmetric(_make_standard_model('line')()))
+        self.assertFalse(is_centrosymmetric(object()))
+
+    def test_fit_data(self):
+        q = np.sqrt(self.qx**2 + self.qy**2)
+        sas_data = Data2D(data=np.ones_like(q), err_data=0.1*np.ones_like(q),
+                          qx_data=self.qx, qy_data=self.qy, q_data=q,
+                          mask=np.ones_like(q, dtype=bool))
+        sas_data.xmin, sas_data.xmax = self.qx.min(), self.qx.max()
+        sas_data.ymin, sas_data.ymax = self.qy.min(), self.qy.max()
+        data = FitData2D(sas_data2d=sas_data, data=sas_data.data)
+        data.set_fit_range(0.02, 0.18)
+        model = _make_standard_model('ellipsoid')()
+        model.setParam('theta', 60.0)
+        expected = data.residuals(model.evalDistribution)
+
+        fitness = SasFitness(Model(model), data, fitted=['theta', 'scale'])
+        residuals, theory = fitness.residuals(), fitness.theory()
+        np.testing.assert_allclose(theory, expected[1], rtol=1e-10)
+        np.testing.assert_allclose(residuals, expected[0], rtol=1e-10)
+
+        counter = CountingModel(model)
+        data.residuals(counter.evalDistribution, symmetric=True)
+        self.assertEqual(counter.npoints, np.sum(data.idx) // 2)
+        # the pairs follow the fit range
+        data.set_fit_range(0.05, 0.18)
+        residuals, theory = data.residuals(model.evalDistribution, symmetric=True)
+        np.testing.assert_allclose(theory, model.evalDistribution(
+            [self.qx[data.idx], self.qy[data.idx]]), rtol=1e-10)
+
+    def make_data(self, qx, qy):
+        q = np.sqrt(qx**2 + qy**2)
+        sas_data = Data2D(data=np.ones_like(q), err_data=0.1*np.ones_like(q),
+                          qx_data=qx, qy_data=qy, q_data=q,
+                          mask=np.ones_like(q, dtype=bool))
+        sas_data.xmin, sas_data.xmax = qx.min(), qx.max()
+        sas_data.ymin, sas_data.ymax = qy.min(), qy.max()
+        return sas_data
+
+    def test_set_data(self):
+        """
+        The mirror points follow the q arrays when the data is replaced,
+        even if the fit range selects the same number of pixels.
+        """
+        model = _make_standard_model('ellipsoid')()
+        model.setParam('theta', 60.0)
+        data = FitData2D(sas_data2d=self.make_data(self.qx, self.qy),
+                         data=np.ones_like(self.qx))
+        # the same pixels in a different order, so the mirror pairs differ
+        order = np.random.default_rng(1).permutation(len(self.qx))
+        for qx, qy in ((self.qx, self.qy), (self.qx[order], self.qy[order])):
+            data.set_data(self.make_data(qx, qy))
+            # all but the beam centre, for both grids
+            data.set_fit_range(0.0, 1.0)
+            self.assertEqual(np.sum(data.idx), len(qx) - 1)
+            _, theory = data.residuals(model.evalDistribution, symmetric=True)
+            np.testing.assert_allclose(theory, model.evalDistribution(
+                [qx[data.idx], qy[data.idx]]), rtol=1e-10)
+        # and when the q arrays are assigned directly
+        data.qx_data, data.qy_data = self.qx[::-1].copy(), 0.5*self.qy[::-1]
+        _, theory = data.residuals(model.evalDistribution, symmetric=True)
+        np.testing.assert_allclose(theory, model.evalDistribution(
+            [data.qx_data[data.idx], data.qy_data[data.idx]]), rtol=1e-10)
+
+
+if __name__ == '__main__':
+    unittest.main()
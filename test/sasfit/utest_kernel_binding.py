@@ -0,0 +1,202 @@
+"""
+    Unit tests for the kernel parameter binding used by SasFitness
+"""
+import unittest
+
+import numpy as np
+
+from sasdata.dataloader.data_info import Data1D
+from sasmodels.details import make_kernel_args
+from sasmodels.sasview_model import _make_standard_model
+
+from sas.sascalc.fit.AbstractFitEngine import FitData1D, Model
+from sas.sascalc.fit.BumpsFitting import SasFitness
+from sas.sascalc.fit.kernel_binding import KernelBinding, layout_supported
+from sas.sascalc.fit.qsmearing import smear_selection
+
+
+class TestKernelBinding(unittest.TestCase):
+
+    def setUp(self):
+        self.q = np.linspace(0.005, 0.3, 150)
+        qx, qy = np.meshgrid(np.linspace(-0.2, 0.2, 20), np.linspace(-0.2, 0.2, 20))
+        self.qxy = [qx.flatten(), qy.flatten()]
+
+    def check_updates(self, name, changes, setup=None, qdist=None):
+        """
+        Evaluate the binding for a sequence of parameter changes and compare
+        to evalDistribution on a separate model.
+        """
+        qdist = self.q if qdist is None else qdist
+        cls = _make_standard_model(name)
+        model, ref = cls(), cls()
+        for k, v in (setup or {}).items():
+            model.setParam(k, v)
+            ref.setParam(k, v)
+        names = model.getParamList()
+        binding = KernelBinding(model, names)
+        for step in range(6):
+            for k, v in changes.items():
+                ref.setParam(k, v[step % len(v)])
+            values = [ref.getParam(k) for k in names]
+            self.assertEqual(binding.update(values), True)
+            self.assertEqual(binding.update(values), False)
+            np.testing.assert_array_equal(binding.evalDistribution(qdist),
+                                          ref.evalDistribution(qdist))
+            # the model has the values of the last update
+            self.assertEqual(model.params, ref.params)
+            self.assertEqual(model.dispersion, ref.dispersion)
+        return binding
+
+    def test_polydisperse(self):
+        self.check_updates('sphere', {
+            'radius': [40, 50, 60], 'scale': [1, 2], 'background': [0.1, 0.2],
+            'radius.width': [0.1, 0.1, 0.2], 'radius.npts': [35, 35, 35, 20],
+        }, setup={'radius.width': 0.1})
+
+    def test_magnetic(self):
+        self.check_updates('sphere', {
+            'sld_M0': [1, 2, 3], 'up_frac_i': [0.1, 0.5], 'radius': [30, 40, 50],
+        }, setup={'sld_M0': 2.0})
+
+    def test_multiplicity(self):
+        self.check_updates('core_multi_shell', {
+            'n': [2, 3, 1], 'thickness1': [10, 20],
+        })
+
+    def test_2d_updates(self):
+        self.check_updates('cylinder', {
+            'radius': [20, 30, 40], 'theta': [10, 40, 70], 'scale': [1, 2],
+            'radius.width': [0.1, 0.1, 0.2], 'radius.npts': [35, 35, 35, 20],
+            'theta.width': [0, 5, 10], 'sld_M0': [1, 2, 3], 'sld_mtheta': [0, 45],
+            'up_frac_i': [0.1, 0.5],
+        }, setup={'radius.width': 0.1, 'sld_M0': 2.0}, qdist=self.qxy)
+
+    def test_structure_factor(self):
+        # scale and background are hidden
+        self.check_updates('hayter_msa', {
+            'radius_effective': [20, 30], 'charge': [10, 20, 30],
+            'volfraction': [0.1, 0.2],
+        })
+
+    def test_2d(self):
+        cls = _make_standard_model('cylinder')
+        model, ref = cls(), cls()
+        names = model.getParamList()
+        binding = KernelBinding(model, names)
+        qx, qy = (v.flatten() for v in np.meshgrid(
+            np.linspace(-0.2, 0.2, 20), np.linspace(-0.2, 0.2, 20)))
+        for theta in (10, 40, 70):
+            ref.setParam('theta', theta)
+            binding.update([ref.getParam(k) for k in names])
+            np.testing.assert_array_equal(binding.evalDistribution([qx, qy]),
+                                          ref.evalDistribution([qx, qy]))
+        self.assertEqual(len(binding._kernels), 1)
+
+    def test_layout(self):
+        for name in ('sphere', 'cylinder', 'core_multi_shell', 'hayter_msa'):
+            self.assertTrue(layout_supported(_make_standard_model(name)()))
+
+    def test_unsupported_layout(self):
+        """
+        SasFitness falls back to setParam and evalDistribution when the
+        kernel arguments aren't laid out as KernelBinding expects.
+        """
+        from unittest.mock import patch
+        from sas.sascalc.fit import kernel_binding
+
+        def swapped(kernel, mesh):
+            # weights before dispersity
+            return make_kernel_args(kernel, [(v, w, d) for v, d, w in mesh])
+
+        q = self.q
+        model = _make_standard_model('sphere')()
+        model.setParam('radius.width', 0.1)
+        data = FitData1D(x=q, y=np.ones_like(q), dy=0.1*np.ones_like(q))
+        data.set_fit_range(q[0], q[-1])
+        with patch.object(kernel_binding, 'make_kernel_args', swapped), \
+                patch.object(kernel_binding, '_LAYOUT_WARNED', True):
+            self.assertFalse(layout_supported(model))
+            fitness = SasFitness(Model(model), data, fitted=['radius', 'scale'])
+        self.assertIsNone(fitness._binding)
+        fitness._pars['radius'].value = 45
+        fitness._pars['scale'].value = 2
+        fitness.update()
+        ref = _make_standard_model('sphere')()
+        for k, p in fitness.parameters().items():
+            ref.setParam(k, p.value)
+        np.testing.assert_array_equal(fitness.theory(), ref.evalDistribution(q))
+
+    def test_sas_fitness_smeared(self):
+        """
+        The smeared theory matches the setParam/evalDistribution path.
+        """
+        q = self.q
+        cls = _make_standard_model('sphere')
+        model, ref = cls(), cls()
+        data = FitData1D(x=q, y=np.ones_like(q), dy=0.1*np.ones_like(q), dx=0.05*q)
+        data.smearer = smear_selection(
+            Data1D(x=q, y=np.ones_like(q), dx=0.05*q, dy=0.1*np.ones_like(q)), model)
+        data.set_fit_range(0.01, 0.28)
+        fitness = SasFitness(Model(model), data, fitted=['radius', 'radius.width'])
+        for radius, width in ((40, 0.0), (50, 0.1), (50, 0.2)):
+            fitness._pars['radius'].value = radius
+            fitness._pars['radius.width'].value = width
+            fitness.update()
+            theory = fitness.theory()
+            for k, p in fitness.parameters().items():
+                ref.setParam(k, p.value)
+            data.smearer.model = ref
+            _, expected = data.residuals(ref.evalDistribution)
+            data.smearer.model = model
+            np.testing.assert_allclose(theory, expected, rtol=1e-14)
+        self.assertIs(data.smearer.model, model)
+
+        # only scale and background change
+        fitness._pars['scale'].value = 2.0
+        fitness._pars['background'].value = 0.5
+        fitness.update()
+        theory = fitness.theory()
+        for k, p in fitness.parameters().items():
+            ref.setParam(k, p.value)
+        data.smearer.model = ref
+        residuals, expected = data.residuals(ref.evalDistribution)
+        data.smearer.model = model
+        np.testing.assert_allclose(theory, expected, rtol=1e-14)
+        np.testing.assert_allclose(fitness.residuals(), residuals, rtol=1e-12)
+
+    def make_problem(self, fitted, constraints={}):
+        from bumps.fitproblem import FitProblem
+        from sas.sascalc.fit.BumpsFitting import ParameterExpressions
+
+        q = self.q
+        model = _make_standard_model('sphere')()
+        model.setParam('radius.width', 0.1)
+        y = model.evalDistribution(q)
+        data = FitData1D(x=q, y=y, dy=0.05*y)
+        data.set_fit_range(q[0], q[-1])
+        fitness = SasFitness(Model(model), data, fitted=fitted,
+                             constraints=constraints)
+        bounds = {'radius': (10, 100), 'scale': (0, 10), 'background': (0, 1),
+                  'sld': (0, 10)}
+        for name in fitted:
+            fitness.parameters()[name].range(*bounds[name])
+        problem = FitProblem([fitness])
+        problem.setp_hook = ParameterExpressions([fitness])
+        return problem
+
+    def test_select_mapper(self):
+        from unittest.mock import patch
+        from bumps.mapper import SerialMapper, MPMapper
+        from sas.sascalc.fit import BumpsFitting
+
+        problem = self.make_problem(['radius', 'scale'])
+        with patch.dict('os.environ', {'OMP_NUM_THREADS': '4'}):
+            self.assertIs(BumpsFitting.select_mapper(problem), SerialMapper)
+        with patch.dict('os.environ', {'OMP_NUM_THREADS': '1'}):
+            self.assertIs(BumpsFitting.select_mapper(problem), MPMapper)
+            with patch.object(BumpsFitting, 'SERIAL_MAPPER', True):
+                self.assertIs(BumpsFitting.select_mapper(problem), SerialMapper)
+
+if __name__ == '__main__':
+    unittest.main()
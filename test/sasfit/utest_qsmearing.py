@@ -0,0 +1,126 @@
+"""
+    Unit tests for the cached 1D resolution functions
+"""
+import copy
+import unittest
+
+import numpy as np
+from scipy import sparse
+
+from sasdata.dataloader.data_info import Data1D, Data2D
+from sasmodels.resolution2d import Pinhole2D
+from sasmodels.sasview_model import _make_standard_model
+
+from sas.sascalc.fit import qsmearing
+from sas.sascalc.fit.qsmearing import PySmear, PySmear2D, smear_selection
+
+
+class TestResolutionCache(unittest.TestCase):
+
+    def setUp(self):
+        qsmearing._resolution_cache.clear()
+        self.model = _make_standard_model('sphere')()
+        self.q = np.logspace(-3, -0.5, 200)
+
+    def pinhole_data(self, fraction=0.1):
+        q = self.q
+        return Data1D(x=q.copy(), y=np.ones_like(q), dx=fraction*q, dy=np.ones_like(q))
+
+    def slit_data(self):
+        q = self.q
+        data = Data1D(x=q.copy(), y=np.ones_like(q), dy=np.ones_like(q))
+        data.dxl = np.full_like(q, 0.05)
+        data.dxw = np.zeros_like(q)
+        return data
+
+    def check_apply(self, smearer):
+        """
+        The cached weights smear as the sasmodels resolution does.
+        """
+        reference = PySmear(smearer.resolution, self.model)
+        reference.weights = None
+        iq = self.model.evalDistribution(self.q)
+        last = len(self.q) - 1
+        np.testing.assert_allclose(smearer(iq.copy(), 0, last),
+                                   reference(iq.copy(), 0, last), rtol=1e-13)
+
+    def test_pinhole(self):
+        first = smear_selection(self.pinhole_data(), self.model)
+        second = smear_selection(self.pinhole_data(), self.model)
+        self.assertIs(first.resolution, second.resolution)
+        self.assertTrue(sparse.issparse(first.weights))
+        self.check_apply(first)
+        other = smear_selection(self.pinhole_data(0.2), self.model)
+        self.assertIsNot(other.resolution, first.resolution)
+        self.assertEqual(len(qsmearing._resolution_cache), 2)
+
+    def test_slit(self):
+        first = smear_selection(self.slit_data(), self.model)
+        second = smear_selection(self.slit_data(), self.model)
+        self.assertIs(first.resolution, second.resolution)
+        self.check_apply(first)
+
+    def test_lru(self):
+        for k in range(qsmearing.RESOLUTION_CACHE_SIZE + 2):
+            smear_selection(self.pinhole_data(0.05 + 0.01*k), self.model)
+        self.assertEqual(len(qsmearing._resolution_cache),
+                         qsmearing.RESOLUTION_CACHE_SIZE)
+
+
+class TestPySmear2D(unittest.TestCase):
+
+    def setUp(self):
+        self.model = _make_standard_model('cylinder')()
+        qx, qy = (v.flatten() for v in np.meshgrid(np.linspace(-0.2, 0.2, 30),
+                                                   np.linspace(-0.2, 0.2, 30)))
+        q = np.sqrt(qx**2 + qy**2)
+        self.data = Data2D(data=np.ones_like(q), err_data=np.ones_like(q),
+                           qx_data=qx, qy_data=qy, q_data=q,
+                           mask=np.ones_like(q, dtype=bool),
+                           dqx_data=0.05*q + 1e-3, dqy_data=0.02*q + 1e-3)
+        self.index = q > 0.02
+
+    def reference(self, index):
+        res = Pinhole2D(data=self.data, index=index, nsigma=3.0,
+                        accuracy='Low', coords='polar')
+        return res.apply(self.model.evalDistribution(res.q_calc))
+
+    def test_plan_reuse(self):
+        smearer = PySmear2D(self.data, self.model)
+        smearer.set_index(self.index.copy())
+        first = smearer.get_value()
+        plan = smearer._plan
+        np.testing.assert_array_equal(first, self.reference(self.index))
+
+        # new parameters and an equal index reuse the plan
+        self.model.setParam('radius', 30)
+        smearer.set_index(self.index.copy())
+        np.testing.assert_array_equal(smearer.get_value(), self.reference(self.index))
+        self.assertIs(smearer._plan, plan)
+
+        # a new index or accuracy rebuilds it
+        smearer.set_index(~self.index)
+        np.testing.assert_array_equal(smearer.get_value(), self.reference(~self.index))
+        self.assertIsNot(smearer._plan, plan)
+        plan = smearer._plan
+        smearer.set_accuracy('Med')
+        smearer.get_value()
+        self.assertIsNot(smearer._plan, plan)
+
+        # so does other data assigned directly
+        plan = smearer._plan
+        smearer.data = copy.deepcopy(self.data)
+        smearer.get_value()
+        self.assertIsNot(smearer._plan, plan)
+
+    def test_single(self):
+        smearer = PySmear2D(self.data, self.model)
+        smearer.set_index(self.index)
+        smearer.set_single()
+        value = smearer.get_value()
+        self.assertEqual(smearer._plan.q_calc[0].dtype, np.float32)
+        np.testing.assert_allclose(value, self.reference(self.index), rtol=1e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()
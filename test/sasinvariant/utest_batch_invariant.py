@@ -0,0 +1,93 @@
+"""
+    Unit tests for the invariant of a series of frames
+"""
+import unittest
+
+import numpy as np
+from sasdata.dataloader.data_info import Data1D
+
+from sas.sascalc.invariant import invariant
+
+
+class TestIntegration(unittest.TestCase):
+
+    def test_trapezoid(self):
+        x = np.sort(np.random.default_rng(1).uniform(0.01, 0.5, 50))
+        y = np.exp(-x[None, :] * np.array([[10.], [20.], [30.]]))
+        qstar, dqstar = invariant.integrate_qstar(x, y, dy=0.1*y)
+        np.testing.assert_allclose(qstar, np.trapz(x * x * y, x, axis=-1), rtol=1e-12)
+        self.assertEqual(dqstar.shape, (3,))
+        self.assertRaises(ValueError, invariant.integrate_qstar, x[:1], y[:, :1])
+
+
+class TestBatchInvariantCalculator(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.q = np.linspace(0.01, 0.3, 150)
+        radius = rng.uniform(20, 40, 12)[:, None]
+        self.iq = (100 / (1 + (self.q * radius) ** 2 / 3) ** 2
+                   * (1 + 0.01 * rng.standard_normal((12, 150))) + 1e-3)
+        self.diq = 0.01 * self.iq
+        self.contrast = 2e-5
+
+    def calculators(self, low='guinier', power=None):
+        batch = invariant.BatchInvariantCalculator(
+            self.q, self.iq, self.diq, background=1e-3, scale=2)
+        batch.set_extrapolation('low', npts=10, function=low, power=power)
+        batch.set_extrapolation('high', npts=10, function='power_law', power=power)
+        singles = []
+        for iq, diq in zip(self.iq, self.diq):
+            single = invariant.InvariantCalculator(
+                Data1D(x=self.q, y=iq, dy=diq), background=1e-3, scale=2)
+            single.set_extrapolation('low', npts=10, function=low, power=power)
+            single.set_extrapolation('high', npts=10, function='power_law', power=power)
+            singles.append(single)
+        return batch, singles
+
+    def check(self, extrapolation, low='guinier', power=None):
+        batch, singles = self.calculators(low, power)
+        qstar, dqstar = batch.get_qstar_with_error(extrapolation)
+        volume, dvolume = batch.get_volume_fraction_with_error(self.contrast, extrapolation)
+        for k, single in enumerate(singles):
+            expected = single.get_qstar_with_error(extrapolation)
+            np.testing.assert_allclose((qstar[k], dqstar[k]), expected, rtol=1e-10)
+            expected = single.get_volume_fraction_with_error(self.contrast, extrapolation)
+            np.testing.assert_allclose((volume[k], dvolume[k]), expected, rtol=1e-10)
+        if extrapolation in ('high', 'both'):
+            np.testing.assert_allclose(
+                batch.get_extrapolation_power('high'),
+                [single.get_extrapolation_power('high') for single in singles])
+
+    def test_no_extrapolation(self):
+        self.check(None)
+
+    def test_guinier_power_law(self):
+        self.check('both')
+
+    def test_power_law(self):
+        self.check('both', low='power_law')
+
+    def test_fixed_power(self):
+        self.check('high', power=4)
+
+    def test_surface(self):
+        batch, singles = self.calculators()
+        surface, dsurface = batch.get_surface_with_error(self.contrast, 1e-6)
+        self.assertIsNone(dsurface)
+        np.testing.assert_allclose(
+            surface, [s.get_surface(self.contrast, 1e-6) for s in singles])
+
+    def test_invalid_frame(self):
+        # the high q extrapolation of the last frame rises with q
+        iq = self.iq.copy()
+        iq[-1, -20:] = np.linspace(1, 2, 20)
+        batch = invariant.BatchInvariantCalculator(self.q, iq, self.diq)
+        qstar = batch.get_qstar('high')
+        self.assertTrue(np.all(np.isfinite(qstar[:-1])))
+        self.assertTrue(np.isnan(qstar[-1]))
+        self.assertRaises(ValueError, batch.get_volume_fraction, 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()